@@ -0,0 +1,289 @@
+"""
+准入控制 - 按用户限流，并用公平队列限制同时进行的上游调用
+
+每个需要调用工作流的请求（缓存和相似研究方向都未命中，也没有相同研究方向的调用正在进行）：
+1. 先经过该用户的令牌桶：每分钟补充 rate_per_minute 个令牌，最多攒 burst 个，没有令牌时立即返回429
+2. 再进入公平队列：同时最多 max_concurrent 个上游调用，其余排队；队列按用户轮转，
+   一个用户连续提交很多请求也只会每轮得到一个名额，不会挡住其他用户
+3. 队列已满、该用户排队的请求已达上限、或排队超过 queue_timeout 时立即返回429，而不是一直挂起
+
+批量请求整体消耗一个令牌；其中的研究方向以 bounded=False 进入公平队列：不受队列长度和每个用户排队数的限制，
+一直等到轮到或批量请求的超时（并发由批量请求自己的线程池或信号量限制），同样按用户轮转，不会挡住其他用户。
+
+被拒绝时抛出 AdmissionRejected，retry_after 是建议的重试等待秒数（用于 Retry-After 响应头）。
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class AdmissionRejected(Exception):
+    """请求被限流或排队已满"""
+
+    MESSAGES = {
+        'rate_limited': "请求过于频繁",
+        'queue_full': "当前请求过多，排队已满",
+        'user_queue_full': "您已有多个请求在排队",
+        'queue_timeout': "排队等待超时",
+        'save_buffer_full': "保存请求过多",
+    }
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"{self.MESSAGES.get(reason, reason)}，请在 {math.ceil(retry_after)} 秒后重试")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """按用户的令牌桶限流（线程安全）"""
+
+    def __init__(self, rate_per_minute=6, burst=3, max_clients=10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = {}  # 用户 -> [令牌数, 更新时间]
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.allowed = 0
+        self.limited = 0
+
+    def _refill(self, bucket, now):
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+
+    def check(self, client):
+        """取一个令牌，成功时返回0，否则返回还要等待的秒数（不消耗令牌）"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    self._prune(now)
+                bucket = self._buckets[client] = [float(self.burst), now]
+            else:
+                self._refill(bucket, now)
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                return 0.0
+            self.limited += 1
+            return (1 - bucket[0]) / self.rate
+
+    def _prune(self, now):
+        """去掉已经补满的令牌桶（与新建的桶等价），调用方需持有锁"""
+        for client in [c for c, b in self._buckets.items()
+                       if b[0] + (now - b[1]) * self.rate >= self.burst]:
+            del self._buckets[client]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate_per_minute": round(self.rate * 60, 2),
+                "burst": self.burst,
+                "clients": len(self._buckets),
+                "allowed": self.allowed,
+                "limited": self.limited,
+            }
+
+
+class FairQueue:
+    """
+    同时进行的上游调用数上限 + 按用户轮转的等待队列（线程安全）
+
+    with queue.slot(user): ...  占用一个名额，排队或被拒绝由 acquire 决定
+    """
+
+    def __init__(self, max_concurrent=8, max_queue=32, max_per_user=2, timeout=60):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.timeout = timeout
+
+        self.active = 0
+        self.queued = 0
+        self._waiting = OrderedDict()  # 用户 -> deque(等待者)，按轮转顺序排列
+        self._unbounded = set()        # 不受排队数限制的等待者（批量请求的研究方向）
+        self._lock = threading.Lock()
+        self._avg_hold = None  # 每个名额平均占用时长（指数移动平均），用于估算 Retry-After
+
+        # 统计计数
+        self.admitted = 0
+        self.waited = 0
+        self.rejected = 0
+
+    def retry_after(self):
+        """估算排到的等待时间：前面的请求数 / 并发数 × 平均占用时长"""
+        hold = self._avg_hold or 10.0
+        return max(1.0, hold * (self.queued + 1) / self.max_concurrent)
+
+    def _enqueue(self, user, make_waiter, bounded=True):
+        """
+        有空闲名额时直接占用并返回None，否则排队并返回等待者（调用方需持有锁）
+
+        bounded 为False的等待者不受 max_queue 和 max_per_user 限制，也不计入这两个限制
+        """
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+            self.admitted += 1
+            return None
+        user_queue = self._waiting.get(user)
+        if bounded and self.queued - len(self._unbounded) >= self.max_queue:
+            reason = 'queue_full'
+        elif bounded and user_queue is not None and \
+                sum(waiter not in self._unbounded for waiter in user_queue) >= self.max_per_user:
+            reason = 'user_queue_full'
+        else:
+            waiter = make_waiter()
+            if user_queue is None:
+                user_queue = self._waiting[user] = deque()
+            user_queue.append(waiter)
+            if not bounded:
+                self._unbounded.add(waiter)
+            self.queued += 1
+            self.waited += 1
+            return waiter
+        self.rejected += 1
+        raise AdmissionRejected(reason, self.retry_after())
+
+    def _next_waiter(self):
+        """轮到的下一个等待者：取队首用户的第一个请求，再把该用户移到队尾（调用方需持有锁）"""
+        if not self._waiting:
+            return None
+        user, user_queue = next(iter(self._waiting.items()))
+        waiter = user_queue.popleft()
+        self._unbounded.discard(waiter)
+        self.queued -= 1
+        if user_queue:
+            self._waiting.move_to_end(user)
+        else:
+            del self._waiting[user]
+        return waiter
+
+    def _withdraw(self, user, waiter):
+        """放弃排队；已经分到名额时返回False（调用方需持有锁）"""
+        user_queue = self._waiting.get(user)
+        if user_queue is None or waiter not in user_queue:
+            return False
+        user_queue.remove(waiter)
+        self._unbounded.discard(waiter)
+        self.queued -= 1
+        if not user_queue:
+            del self._waiting[user]
+        self.rejected += 1
+        return True
+
+    @staticmethod
+    def _grant(waiter):
+        waiter.set()
+
+    def acquire(self, user, timeout=None, bounded=True):
+        """
+        占用一个名额，排队超时或队列已满时抛出 AdmissionRejected
+
+        timeout: 最长排队秒数，默认 self.timeout；bounded: 是否受队列长度和每个用户排队数的限制
+        """
+        with self._lock:
+            waiter = self._enqueue(user, threading.Event, bounded)
+        if waiter is None or waiter.wait(self.timeout if timeout is None else timeout):
+            return time.monotonic()
+        with self._lock:
+            if self._withdraw(user, waiter):
+                raise AdmissionRejected('queue_timeout', self.retry_after())
+        # 超时的同时分到了名额
+        return time.monotonic()
+
+    def release(self, acquired_at=None):
+        """归还名额：有人排队时直接转交给轮到的下一个用户"""
+        with self._lock:
+            if acquired_at is not None:
+                held = time.monotonic() - acquired_at
+                self._avg_hold = held if self._avg_hold is None else 0.8 * self._avg_hold + 0.2 * held
+            waiter = self._next_waiter()
+            if waiter is None:
+                self.active -= 1
+            else:
+                self.admitted += 1
+                self._grant(waiter)
+
+    def slot(self, user, timeout=None, bounded=True):
+        """with queue.slot(user): ... 占用名额直到 with 块结束（参数同 acquire）"""
+        return _Slot(self, user, timeout, bounded)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "active": self.active,
+                "queued": self.queued,
+                "queued_users": len(self._waiting),
+                "queued_unbounded": len(self._unbounded),
+                "max_queue": self.max_queue,
+                "max_per_user": self.max_per_user,
+                "avg_hold_seconds": round(self._avg_hold, 2) if self._avg_hold is not None else None,
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "rejected": self.rejected,
+            }
+
+
+class _Slot:
+    def __init__(self, queue, user, timeout=None, bounded=True):
+        self.queue = queue
+        self.user = user
+        self.timeout = timeout
+        self.bounded = bounded
+        self.acquired_at = None
+
+    def __enter__(self):
+        self.acquired_at = self.queue.acquire(self.user, self.timeout, self.bounded)
+        return self
+
+    def __exit__(self, *exc):
+        self.queue.release(self.acquired_at)
+
+
+class AsyncFairQueue(FairQueue):
+    """FairQueue 的异步版本（只在事件循环线程中使用），等待者是 Future"""
+
+    @staticmethod
+    def _grant(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    async def acquire(self, user, timeout=None, bounded=True):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            waiter = self._enqueue(user, loop.create_future, bounded)
+        if waiter is None:
+            return time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if self._withdraw(user, waiter):
+                    raise AdmissionRejected('queue_timeout', self.retry_after())
+        except asyncio.CancelledError:
+            with self._lock:
+                withdrawn = self._withdraw(user, waiter)
+            if not withdrawn:
+                # 取消的同时分到了名额，转交给下一个
+                self.release()
+            raise
+        return time.monotonic()
+
+    def slot(self, user, timeout=None, bounded=True):
+        return _AsyncSlot(self, user, timeout, bounded)
+
+
+class _AsyncSlot(_Slot):
+    async def __aenter__(self):
+        self.acquired_at = await self.queue.acquire(self.user, self.timeout, self.bounded)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.queue.release(self.acquired_at)
@@ -0,0 +1,814 @@
+"""
+异步（ASGI）服务模式 - 与 backend.py 提供相同的API接口
+
+Flask模式下每个请求在等待星火工作流响应期间都会占用一个线程（最长 API_TIMEOUT 秒）。
+这里用asyncio处理请求，上游调用不阻塞线程，单个进程可以同时挂起数百个慢请求。
+
+启动方式：
+    python asgi_backend.py
+    或 uvicorn asgi_backend:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import io
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import batch
+import library_io
+import log
+import metrics
+from backend import (
+    ADMISSION_CONFIG, API_CONFIG, API_HOST, API_ENDPOINT, API_TIMEOUT,
+    BATCH_CONFIG, BATCH_MAX_TOPICS, BATCH_TIMEOUT, CACHE_ENABLED, PREFETCH_ENABLED, WorkflowError,
+    build_workflow_request, cached_events, check_rate_limit, handle_pooled_response, lookup_similar, paper_count, paper_library, paper_store, recommendation_cache,
+    candidate_pool, pool_fetch_failed, pool_fetch_key, pool_needs_fetch, pool_page_size, pool_response,
+    personalize, read_pool_page, with_cursor, export_headers, log_import,
+    prefetch_scheduler, rate_limiter, runtime_gauges, too_many_requests, topic_index, topic_tracker,
+    upstream_guard, upstream_idle, upstream_unavailable, index_response, response_encoder,
+    readiness, worker_flight, worker_state, library_ranker, response_recorder,
+    save_buffer, save_request_key, save_selected, services_started, start_services,
+    replay_papers, stream_papers,
+)
+from admission import AdmissionRejected, AsyncFairQueue
+from cache import normalize_topic
+from candidate_pool import decode_cursor
+from http_pool import AsyncConnectionPool
+from resilience import CircuitOpenError
+from settings import settings
+from singleflight import AsyncSingleFlight
+
+
+# 异步连接池不占用线程，可以比Flask模式保持更多并发连接
+workflow_pool = AsyncConnectionPool(
+    API_HOST,
+    API_CONFIG.get('port'),
+    timeout=API_TIMEOUT,
+    max_connections=API_CONFIG.get('async_max_connections', 100),
+    use_tls=API_CONFIG.get('use_tls', True),
+)
+
+# 进行中的上游请求（相同研究方向的并发请求共享一次调用）
+inflight_requests = AsyncSingleFlight()
+
+# 同时进行的上游调用数上限和按用户轮转的等待队列（限流的令牌桶与Flask模式共用）
+admission_queue = AsyncFairQueue(
+    max_concurrent=ADMISSION_CONFIG.get('async_max_concurrent', API_CONFIG.get('async_max_connections', 100)),
+    max_queue=ADMISSION_CONFIG.get('async_max_queue', 256),
+    max_per_user=ADMISSION_CONFIG.get('max_per_user', 2),
+    timeout=ADMISSION_CONFIG.get('queue_timeout', 60),
+)
+
+
+def apply_async_settings(current, changed):
+    """热加载的准入配置同样应用到异步模式的队列（限流令牌桶与Flask模式共用，由 backend.apply_settings 处理）"""
+    if 'ADMISSION_CONFIG' in changed:
+        admission = current['ADMISSION_CONFIG']
+        admission_queue.max_queue = admission['async_max_queue']
+        admission_queue.max_per_user = admission['max_per_user']
+        admission_queue.timeout = admission['queue_timeout']
+
+
+settings.subscribe(apply_async_settings)
+
+# 预取线程走同步连接池，按异步连接池的占用判断用户请求是否繁忙
+prefetch_scheduler.is_idle = lambda: upstream_idle(workflow_pool, admission_queue)
+
+# 单个批量请求同时进行的上游调用数
+BATCH_CONCURRENCY = BATCH_CONFIG.get('async_workers', API_CONFIG.get('async_max_connections', 100))
+
+# 流式接口与Flask模式共用同步连接池的流式调用（边读边解析），每个进行中的流占用一个线程，
+# 线程数与同步连接池的连接数相同
+stream_executor = ThreadPoolExecutor(
+    max_workers=API_CONFIG.get('max_connections', 8),
+    thread_name_prefix='stream',
+)
+
+
+async def fetch_papers(user_input, client='anonymous'):
+    """异步调用星火工作流获取论文推荐（与Flask模式共用超时、重试和熔断状态），返回解析后的结果"""
+    return await upstream_guard.acall(lambda timeout: fetch_papers_once(user_input, timeout, client))
+
+
+async def fetch_admitted(user_input, client, timeout=None, bounded=True):
+    """在公平队列中排到名额后调用工作流（timeout、bounded 同 FairQueue.acquire）"""
+    async with admission_queue.slot(client, timeout, bounded):
+        return await fetch_papers(user_input, client)
+
+
+async def fetch_across_workers(fetch, user_input, *args):
+    """其他工作进程正在获取同一研究方向的推荐时等待它写入共享缓存的结果，否则调用 fetch（协程函数）"""
+    if worker_flight is None:
+        return await fetch(user_input, *args)
+    result, _ = await worker_flight.do_async(
+        normalize_topic(user_input), lambda: recommendation_cache.peek(user_input), fetch, user_input, *args
+    )
+    return result
+
+
+async def fetch_papers_once(user_input, timeout, client='anonymous'):
+    """异步调用一次星火工作流，timeout 为本次尝试的超时（秒）"""
+    headers, payload = build_workflow_request(user_input, client=client)
+
+    res = await asyncio.wait_for(
+        workflow_pool.request("POST", API_ENDPOINT, payload, headers, timeout=timeout),
+        timeout,
+    )
+    # 录制响应、解析、写入缓存和候选列表会读写文件和SQLite，放到线程池，不阻塞事件循环
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, handle_pooled_response, user_input, res)
+
+
+def serve_cached(user_input, user_id):
+    """
+    缓存或相似研究方向的结果（已按用户的储存库排序），返回 (结果, 响应头)，都未命中时返回None
+
+    查询共享缓存文件、等待写缓冲、读储存库都会阻塞，在线程池中调用
+    """
+    cached = recommendation_cache.get(user_input)
+    if cached is not None:
+        log.info('papers_served', topic=user_input, cache='hit', papers=paper_count(cached))
+        return with_cursor(user_input, personalize(cached, user_id)), {'X-Cache': 'HIT'}
+
+    similar = lookup_similar(user_input)
+    if similar is not None:
+        log.info('papers_served', topic=user_input, cache='similar', matched=similar['matched_topic'],
+                 similarity=similar['similarity'], papers=paper_count(similar))
+        return with_cursor(similar['matched_topic'], personalize(similar, user_id)), {
+            'X-Cache': 'SIMILAR', 'X-Similarity': str(similar['similarity']),
+        }
+    return None
+
+
+async def unavailable(user_input, error):
+    """upstream_unavailable 会到SQLite中查找过期的结果，放到线程池"""
+    return await asyncio.get_running_loop().run_in_executor(None, upstream_unavailable, user_input, error)
+
+
+async def get_papers(scope, body):
+    """获取论文推荐（GET 用查询参数 research_topic，可以带 If-None-Match 条件请求；带 cursor 时返回更多论文）"""
+    try:
+        with metrics.stage('request_parse'):
+            if scope['method'] == 'GET':
+                query = parse_qs(scope.get('query_string', b'').decode('utf-8', 'replace'))
+                params = {name: values[0] for name, values in query.items()}
+            else:
+                params = json.loads(body)
+            user_input = params.get('research_topic', '')
+            cursor = params.get('cursor')
+
+        if cursor:
+            return await get_more_papers(scope, cursor, params.get('page_size'))
+        if not user_input:
+            return 400, {"error": "请输入研究方向"}, {}
+        topic_tracker.record(user_input)
+        user_id = get_user_id(scope, {})
+        # 查缓存、按用户的储存库排序要读SQLite、等待写缓冲、做矩阵运算，放到线程池，不阻塞事件循环
+        loop = asyncio.get_running_loop()
+
+        # 命中缓存时直接返回已解析的结果
+        if CACHE_ENABLED:
+            served = await loop.run_in_executor(None, serve_cached, user_input, user_id)
+            if served is not None:
+                result, headers = served
+                return 200, result, headers
+
+        # 相同研究方向的并发请求合并为一次上游调用；需要新的上游调用时先经过限流和排队
+        key, client = normalize_topic(user_input), get_client_id(scope)
+        if not inflight_requests.in_flight(key) and not (worker_flight and await worker_flight.in_flight_async(key)):
+            check_rate_limit(client)
+        parsed_result, shared = await inflight_requests.do(
+            key, fetch_across_workers, fetch_admitted, user_input, client
+        )
+        log.info('papers_served', topic=user_input, cache='miss', coalesced=shared,
+                 papers=paper_count(parsed_result))
+
+        ranked = await loop.run_in_executor(None, personalize, parsed_result, user_id)
+        return 200, with_cursor(user_input, ranked), {
+            'X-Cache': 'MISS',
+            'X-Coalesced': 'true' if shared else 'false',
+        }
+
+    except AdmissionRejected as e:
+        return too_many_requests(e)
+
+    except CircuitOpenError as e:
+        return await unavailable(user_input, e)
+
+    except WorkflowError as e:
+        if upstream_guard.retry.is_transient(e):
+            return await unavailable(user_input, e)
+        return 400, {
+            "error": str(e),
+            "code": e.code,
+            "details": e.details
+        }, {}
+
+    except Exception as e:
+        if upstream_guard.retry.is_transient(e):
+            return await unavailable(user_input, e)
+        log.error('get_papers_failed', exc_info=True, error=str(e))
+        return 500, {"error": str(e)}, {}
+
+
+async def get_more_papers(scope, cursor, page_size=None):
+    """按游标从候选列表返回下一页；列表中剩下的论文不够一页时先再调用一次工作流"""
+    try:
+        topic, offset, seen = decode_cursor(cursor)
+        page_size = pool_page_size(page_size)
+    except (TypeError, ValueError) as e:
+        return 400, {"error": str(e)}, {}
+
+    user_id, client = get_user_id(scope, {}), get_client_id(scope)
+    # 读取候选列表要等待写缓冲、按用户的储存库排序，放到线程池，不阻塞事件循环
+    loop = asyncio.get_running_loop()
+    page = await loop.run_in_executor(None, read_pool_page, topic, offset, seen, page_size, user_id)
+    fetched = False
+    if pool_needs_fetch(page, page_size):
+        key = pool_fetch_key(topic, page)
+        try:
+            if not inflight_requests.in_flight(key):
+                check_rate_limit(client)
+            await inflight_requests.do(key, fetch_admitted, topic, client)
+        except Exception as e:
+            error = pool_fetch_failed(topic, page, e)
+            if error is not None:
+                return error
+        else:
+            page = await loop.run_in_executor(None, read_pool_page, topic, offset, seen, page_size, user_id)
+            fetched = True
+
+    log.info('papers_served', topic=topic, cache='miss' if fetched else 'pool', offset=offset,
+             papers=len(page['papers']), pool_size=page['size'])
+    return 200, pool_response(topic, page, seen), {'X-Cache': 'MISS' if fetched else 'POOL'}
+
+
+async def get_papers_batch(scope, body):
+    """批量获取论文推荐，返回按完成顺序逐行输出的NDJSON流"""
+    try:
+        with metrics.stage('request_parse'):
+            data = json.loads(body or b'{}')
+        topics = batch.parse_topics(data.get('topics'), BATCH_MAX_TOPICS)
+        timeout = float(data.get('timeout') or BATCH_TIMEOUT)
+        if timeout <= 0:
+            raise ValueError("timeout 必须大于0")
+    except (AttributeError, TypeError, ValueError) as e:
+        return 400, {"error": str(e)}, {}
+
+    # 整个批量请求消耗一个令牌：按研究方向扣除时，超过 burst 个研究方向的批量请求只有前几个能得到结果
+    client = get_client_id(scope)
+    try:
+        check_rate_limit(client)
+    except AdmissionRejected as e:
+        return too_many_requests(e)
+
+    log.info('batch_started', topics=len(topics), timeout=timeout)
+    for topic in topics:
+        topic_tracker.record(topic)
+
+    loop = asyncio.get_running_loop()
+
+    async def lookup(topic):
+        # 共享缓存文件时会读SQLite，放到线程池
+        return await loop.run_in_executor(None, recommendation_cache.get, topic) if CACHE_ENABLED else None
+
+    async def fetch(topic):
+        # 在公平队列中等待名额（不受排队数限制，并发由 BATCH_CONCURRENCY 限制），最多等到批量请求的超时
+        try:
+            return await inflight_requests.do(
+                normalize_topic(topic), fetch_across_workers, fetch_admitted, topic, client, timeout, False
+            )
+        except AdmissionRejected as e:
+            too_many_requests(e)  # 计数和日志；该研究方向输出带 reason 和 retry_after 的错误记录
+            raise
+
+    async def generate():
+        async for record in batch.aiter_batch(topics, lookup, fetch, BATCH_CONCURRENCY, timeout):
+            if record.get('done'):
+                log.info('batch_served', **{k: v for k, v in record.items() if k != 'done'})
+            yield batch.ndjson_line(record).encode('utf-8')
+
+    return 200, generate(), {'Content-Type': 'application/x-ndjson', 'Cache-Control': 'no-cache'}
+
+
+async def get_papers_stream(scope, body):
+    """流式获取论文推荐：每解析出一篇论文就以SSE事件推送给前端（与Flask模式相同）"""
+    try:
+        with metrics.stage('request_parse'):
+            user_input = json.loads(body or b'{}').get('research_topic', '')
+    except (AttributeError, ValueError) as e:
+        return 400, {"error": str(e)}, {}
+
+    if not user_input:
+        return 400, {"error": "请输入研究方向"}, {}
+    topic_tracker.record(user_input)
+
+    # 缓存中的结果按用户的兴趣排序后推送（查缓存、排序放到线程池）；实时的流式结果按到达顺序推送，不排序
+    loop = asyncio.get_running_loop()
+    user_id = get_user_id(scope, {})
+    events, cache_status = await loop.run_in_executor(None, cached_events, user_input, user_id)
+
+    # 熔断中不发起流式调用：有过期结果时推送过期结果，否则返回503
+    if events is None and upstream_guard.breaker.is_open():
+        status, payload, headers = await unavailable(
+            user_input, CircuitOpenError(upstream_guard.breaker.retry_after())
+        )
+        if status != 200:
+            return status, payload, headers
+        ranked = await loop.run_in_executor(None, personalize, payload, user_id)
+        events, cache_status = replay_papers(ranked, user_input), 'STALE'
+
+    # 流式调用不与其他请求合并，每次都经过限流和排队，名额在响应结束时归还
+    if events is None:
+        client = get_client_id(scope)
+        try:
+            check_rate_limit(client)
+            acquired_at = await admission_queue.acquire(client)
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+        stream = SSEStream(stream_papers(user_input, client), stream_executor, acquired_at)
+    else:
+        stream = SSEStream(events)
+
+    return 200, stream, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        'X-Cache': cache_status,
+    }
+
+
+class SSEStream:
+    """
+    把同步的SSE事件生成器包装为异步迭代器
+
+    executor 为None时在事件循环中生成（已解析结果的回放）；否则每个事件在 executor 中取出（读取上游响应会阻塞）。
+    aclose 时关闭生成器并归还排队名额，还没开始迭代时也会归还。
+    """
+
+    def __init__(self, events, executor=None, acquired_at=None):
+        self.events = events
+        self.executor = executor
+        self.acquired_at = acquired_at
+        self._pending = None
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.executor is None:
+            event = next(self.events, None)
+        else:
+            self._pending = self.executor.submit(next, self.events, None)
+            event = await asyncio.wrap_future(self._pending)
+        if event is None:
+            raise StopAsyncIteration
+        return event.encode('utf-8')
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.acquired_at is not None:
+            admission_queue.release(self.acquired_at)
+        # 客户端断开时线程可能还在读取上游响应，读完这一块后再关闭生成器（关闭上游连接）
+        if self._pending is not None and not self._pending.done():
+            self._pending.add_done_callback(lambda _: self.events.close())
+        else:
+            self.events.close()
+
+
+def get_user_id(scope, data):
+    """当前请求的用户标识（前端在请求头 X-User-Id 中携带）"""
+    user_id = dict(scope['headers']).get(b'x-user-id', b'').decode('utf-8', 'replace') or data.get('user_id')
+    return str(user_id)[:64] if user_id else 'anonymous'
+
+
+def get_client_id(scope):
+    """限流和排队使用的用户标识：X-User-Id，没有时按客户端IP区分"""
+    user_id = dict(scope['headers']).get(b'x-user-id', b'').decode('utf-8', 'replace')
+    if user_id:
+        return user_id[:64]
+    client = scope.get('client')
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+async def save_selection(scope, body):
+    """保存用户选择的论文"""
+    try:
+        data = json.loads(body)
+        key = save_request_key(dict(scope['headers']).get(b'idempotency-key', b'').decode('utf-8', 'replace'), data)
+
+        # 没有写缓冲时直接写入SQLite，放到线程池，不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, save_selected, get_user_id(scope, data), data.get('selected_papers', []), key
+        )
+
+    except Exception as e:
+        return 500, {"error": str(e)}, {}
+
+
+def _query_int(query, name, default):
+    """读取整数查询参数，无法解析时使用默认值（与Flask的 type=int 一致）"""
+    try:
+        return int(query.get(name, [default])[0])
+    except ValueError:
+        return default
+
+
+async def list_library(scope, body):
+    """分页获取储存库中的论文"""
+    try:
+        query = parse_qs(scope.get('query_string', b'').decode('utf-8', 'replace'))
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            None, paper_library.list_papers, get_user_id(scope, {}),
+            _query_int(query, 'page', 1),
+            _query_int(query, 'page_size', 20),
+            query.get('sort', ['newest'])[0],
+        )
+        return 200, result, {}
+    except Exception as e:
+        return 500, {"error": str(e)}, {}
+
+
+async def search_library(scope, body):
+    """在储存库中全文检索（q, page, page_size），按相关度排序"""
+    query = parse_qs(scope.get('query_string', b'').decode('utf-8', 'replace'))
+    text = query.get('q', [''])[0].strip()
+    if not text:
+        return 400, {"error": "请输入搜索关键词"}, {}
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            None, paper_library.search, get_user_id(scope, {}), text,
+            _query_int(query, 'page', 1),
+            _query_int(query, 'page_size', 20),
+        )
+        return 200, result, {}
+    except Exception as e:
+        return 500, {"error": str(e)}, {}
+
+
+async def sync_library(scope, body):
+    """增量同步储存库：提交本地变更（cursor, changes, limit），返回游标之后服务器上的变更"""
+    try:
+        data = json.loads(body or b'{}')
+        changes = data.get('changes') or []
+    except (AttributeError, ValueError):
+        return 400, {"error": "请求体必须是JSON对象"}, {}
+    if not isinstance(changes, list):
+        return 400, {"error": "changes 必须是数组"}, {}
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            None, paper_library.sync, get_user_id(scope, data),
+            data.get('cursor') or 0, changes, data.get('limit') or 500,
+        )
+    except (TypeError, ValueError) as e:
+        return 400, {"error": str(e)}, {}
+    log.info('library_synced', applied=result['applied'], conflicts=len(result['conflicts']),
+             changes=len(result['changes']), reset=result['reset'])
+    return 200, result, {}
+
+
+async def export_library(scope, body):
+    """流式导出储存库（format=ndjson/json/csv/bibtex，默认ndjson），按保存时间从早到晚"""
+    query = parse_qs(scope.get('query_string', b'').decode('utf-8', 'replace'))
+    try:
+        fmt = library_io.detect_format(query.get('format', ['ndjson'])[0])
+    except ValueError as e:
+        return 400, {"error": str(e)}, {}
+    log.info('library_exported', format=fmt)
+    chunks = library_io.write_papers(paper_library.iter_papers(get_user_id(scope, {})), fmt)
+
+    async def generate():
+        # 每块的SQLite查询和序列化在线程池中进行，不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            chunks.close()
+
+    return 200, generate(), export_headers(fmt)
+
+
+class _ReceiveStream(io.RawIOBase):
+    """在线程池中按需读取ASGI请求体的二进制流（每次 read 从事件循环取下一条 http.request 消息）"""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer and not self._done:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            self._buffer = message.get('body', b'')
+            self._done = not message.get('more_body', False)
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+async def import_library(scope, receive):
+    """
+    流式导入论文（format 参数或 Content-Type 指定格式），按批写入并按标题去重
+
+    与其他接口不同，这里接收的是ASGI的 receive 而不是完整的请求体：解析和写入在线程池中进行，边接收边导入
+    """
+    query = parse_qs(scope.get('query_string', b'').decode('utf-8', 'replace'))
+    content_type = dict(scope['headers']).get(b'content-type', b'').decode('latin-1')
+    try:
+        fmt = library_io.detect_format(query.get('format', [None])[0], content_type)
+    except ValueError as e:
+        return 400, {"error": str(e)}, {}
+    loop = asyncio.get_running_loop()
+    stream = io.BufferedReader(_ReceiveStream(receive, loop))
+    result = await loop.run_in_executor(
+        None, paper_library.import_papers, get_user_id(scope, {}), library_io.read_papers(stream, fmt)
+    )
+    log_import(fmt, result)
+    return 400 if result['error'] else 200, result, {}
+
+
+async def clear_library(scope, body):
+    """清空储存库（SQLite读写放到线程池，不阻塞事件循环）"""
+    loop = asyncio.get_running_loop()
+    deleted = await loop.run_in_executor(None, paper_library.clear, get_user_id(scope, {}))
+    return 200, {"success": True, "deleted": deleted}, {}
+
+
+async def get_library_paper(scope, body, paper_id):
+    """获取储存库中的单篇论文"""
+    loop = asyncio.get_running_loop()
+    paper = await loop.run_in_executor(None, paper_library.get_paper, get_user_id(scope, {}), paper_id)
+    if paper is None:
+        return 404, {"error": "论文不存在"}, {}
+    return 200, paper, {}
+
+
+async def delete_library_paper(scope, body, paper_id):
+    """从储存库中删除论文"""
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, paper_library.delete_paper, get_user_id(scope, {}), paper_id):
+        return 404, {"error": "论文不存在"}, {}
+    return 200, {"success": True}, {}
+
+
+async def admission_stats(scope, body):
+    """查看限流和排队情况"""
+    return 200, {"rate_limit": rate_limiter.stats(), "queue": admission_queue.stats()}, {}
+
+
+async def upstream_stats(scope, body):
+    """查看熔断状态、当前超时和重试情况"""
+    return 200, upstream_guard.stats(), {}
+
+
+async def prefetch_stats(scope, body):
+    """查看热门研究方向和后台预取情况"""
+    loop = asyncio.get_running_loop()
+    stats = await loop.run_in_executor(None, prefetch_scheduler.stats)
+    return 200, dict(stats, enabled=PREFETCH_ENABLED), {}
+
+
+async def cache_stats(scope, body):
+    """查看推荐缓存命中情况"""
+    pool = candidate_pool.stats() if candidate_pool is not None else None
+    ranking = library_ranker.stats() if library_ranker is not None else None
+    return 200, dict(recommendation_cache.stats(), similar=topic_index.stats(), papers=paper_store.stats(),
+                     pool=pool, ranking=ranking, compression=response_encoder.stats(),
+                     recording=response_recorder.stats(),
+                     save_buffer=save_buffer.stats() if save_buffer is not None else None), {}
+
+
+async def coalesce_stats(scope, body):
+    """查看并发请求合并情况"""
+    workers = worker_flight.stats() if worker_flight is not None else None
+    return 200, dict(inflight_requests.stats(), workers=workers), {}
+
+
+async def healthz(scope, body):
+    """存活检查"""
+    return 200, dict(worker_state.stats(), status='ok'), {}
+
+
+async def readyz(scope, body):
+    """就绪检查：数据库不可访问时返回503"""
+    loop = asyncio.get_running_loop()
+    status, payload = await loop.run_in_executor(None, readiness)
+    return status, payload, {}
+
+
+async def pool_stats(scope, body):
+    """查看上游连接池使用情况"""
+    return 200, workflow_pool.stats(), {}
+
+
+ROUTES = {
+    ('GET', '/api/get-papers'): get_papers,
+    ('POST', '/api/get-papers'): get_papers,
+    ('POST', '/api/get-papers/batch'): get_papers_batch,
+    ('POST', '/api/get-papers/stream'): get_papers_stream,
+    ('POST', '/api/save-selection'): save_selection,
+    ('GET', '/healthz'): healthz,
+    ('GET', '/readyz'): readyz,
+    ('GET', '/api/cache-stats'): cache_stats,
+    ('GET', '/api/coalesce-stats'): coalesce_stats,
+    ('GET', '/api/pool-stats'): pool_stats,
+    ('GET', '/api/prefetch-stats'): prefetch_stats,
+    ('GET', '/api/upstream-stats'): upstream_stats,
+    ('GET', '/api/admission-stats'): admission_stats,
+    ('GET', '/api/library'): list_library,
+    ('DELETE', '/api/library'): clear_library,
+    ('POST', '/api/library/sync'): sync_library,
+    ('GET', '/api/library/export'): export_library,
+    ('POST', '/api/library/import'): import_library,
+    ('GET', '/api/search'): search_library,
+}
+
+# 带路径参数的路由：(方法, 正则) -> 处理函数，匹配到的整数参数追加在 body 之后
+PARAM_ROUTES = [
+    ('GET', re.compile(r'/api/library/(\d+)'), get_library_paper),
+    ('DELETE', re.compile(r'/api/library/(\d+)'), delete_library_paper),
+]
+
+# 允许跨域请求（与Flask-CORS默认行为一致）
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+]
+
+
+async def _read_body(receive):
+    """读取完整请求体"""
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def _send(send, status, body, content_type, extra_headers=()):
+    """发送完整响应"""
+    headers = [
+        (b'content-type', content_type),
+        (b'content-length', str(len(body)).encode()),
+    ] + CORS_HEADERS + list(extra_headers)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_encoded(send, scope, status, body, content_type, extra_headers=(), etag=False):
+    """按请求的 Accept-Encoding 压缩后发送；etag 为True时加ETag，If-None-Match 匹配时发送304。返回实际的状态码"""
+    request_headers = dict(scope['headers'])
+    encoded_status, body, headers = response_encoder.encode(
+        body,
+        content_type.decode(),
+        request_headers.get(b'accept-encoding', b'').decode('latin-1'),
+        request_headers.get(b'if-none-match', b'').decode('latin-1'),
+        etag=etag and status == 200,
+    )
+    if etag and status == 200:
+        headers.setdefault('Cache-Control', 'no-cache')
+    if encoded_status == 304:
+        status = 304
+    encoded = [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+    await _send(send, status, body, content_type, list(extra_headers) + encoded)
+    return status
+
+
+async def _send_stream(send, status, chunks, content_type, extra_headers=()):
+    """逐块发送响应（分块传输），chunks 是带 aclose 的异步迭代器（异步生成器或 SSEStream）"""
+    headers = [(b'content-type', content_type)] + CORS_HEADERS + list(extra_headers)
+    try:
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        async for chunk in chunks:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        # 客户端断开时 send 会抛出异常，关闭生成器以取消未完成的上游调用
+        await chunks.aclose()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _lifespan(receive, send):
+    """处理ASGI生命周期事件"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # 读取缓存文件、启动后台线程，放到线程池
+            await asyncio.get_running_loop().run_in_executor(None, start_services)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            prefetch_scheduler.stop(timeout=1)
+            workflow_pool.close()
+            stream_executor.shutdown(wait=False)
+            if save_buffer is not None:
+                await asyncio.get_running_loop().run_in_executor(None, save_buffer.close)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI入口"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    settings.reload_if_changed()
+    if not services_started.is_set():
+        # 服务器不发送生命周期事件时，在第一个请求之前初始化
+        await asyncio.get_running_loop().run_in_executor(None, start_services)
+
+    method, path = scope['method'], scope['path']
+
+    # CORS预检请求
+    if method == 'OPTIONS':
+        request_headers = dict(scope['headers'])
+        await _send(send, 204, b'', b'text/plain', [
+            (b'access-control-allow-methods', b'GET, POST, DELETE, OPTIONS'),
+            (b'access-control-allow-headers', request_headers.get(b'access-control-request-headers', b'*')),
+        ])
+        return
+
+    if method == 'GET' and path == '/':
+        request_headers = dict(scope['headers'])
+        status, body, headers = index_response.encode(
+            request_headers.get(b'accept-encoding', b'').decode('latin-1'),
+            request_headers.get(b'if-none-match', b'').decode('latin-1'),
+        )
+        headers['Cache-Control'] = 'no-cache'
+        await _send(send, status, body, b'text/html; charset=utf-8',
+                    [(k.lower().encode(), v.encode()) for k, v in headers.items()])
+        return
+
+    # Prometheus指标是文本格式，不经过JSON序列化
+    if method == 'GET' and path == '/metrics':
+        body = metrics.render(runtime_gauges(workflow_pool, inflight_requests, admission_queue)).encode('utf-8')
+        await _send_encoded(send, scope, 200, body, metrics.CONTENT_TYPE.encode())
+        return
+
+    start = time.perf_counter()
+    handler = ROUTES.get((method, path))
+    route = path
+    args = ()
+    if handler is None:
+        for route_method, pattern, route_handler in PARAM_ROUTES:
+            match = pattern.fullmatch(path) if route_method == method else None
+            if match:
+                handler, args = route_handler, tuple(int(g) for g in match.groups())
+                route = pattern.pattern
+                break
+    if handler is None:
+        body = json.dumps({"error": "Not Found"}).encode('utf-8')
+        await _send(send, 404, body, b'application/json')
+        return
+
+    # 该用户有排队中的保存请求时，先在线程池中等待写入，之后读取储存库（储存库接口、个性化排序）不会阻塞事件循环
+    if save_buffer is not None and handler is not save_selection and save_buffer.pending(get_user_id(scope, {})):
+        await asyncio.get_running_loop().run_in_executor(None, save_buffer.settle, get_user_id(scope, {}))
+
+    # 导入接口自己流式读取请求体
+    body = receive if handler is import_library else await _read_body(receive)
+    status, payload, headers = await handler(scope, body, *args)
+    if hasattr(payload, '__aiter__'):
+        content_type = headers.pop('Content-Type').encode()
+        extra = [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+        await _send_stream(send, status, payload, content_type, extra)
+        metrics.request_seconds.observe(time.perf_counter() - start, route)
+        metrics.requests_total.inc(route, str(status))
+        return
+
+    serialize_start = time.perf_counter()
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if handler is get_papers:
+        metrics.observe_stage('serialization', time.perf_counter() - serialize_start)
+    extra = [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+    status = await _send_encoded(send, scope, status, body, b'application/json', extra, etag=method == 'GET')
+
+    metrics.request_seconds.observe(time.perf_counter() - start, route)
+    metrics.requests_total.inc(route, str(status))
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("异步服务器启动在 http://localhost:5000")
+    print("=" * 50)
+    uvicorn.run(app, host='0.0.0.0', port=5000, log_level='warning')
@@ -1,13 +1,71 @@
-import http.client
+import atexit
+import hashlib
 import json
-import ssl
-from flask import Flask, request, jsonify
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from config import API_CONFIG, get_auth_header
+import batch
+import library_io
+import log
+import metrics
+from admission import AdmissionRejected, FairQueue, RateLimiter
+from cache import RecommendationCache, normalize_topic
+from candidate_pool import CandidatePool, decode_cursor, encode_cursor
+from http_encoding import ResponseEncoder, StaticResponse
+from http_pool import ConnectionPool
+from json_extract import PapersExtractor
+from paper_stream import extract_delta_content, iter_sse_data
+from papers import PaperStore
+from prefork import STATE_PATH_ENV, WorkerState
+from ranking import LibraryRanker
+from settings import settings
+from singleflight import SharedFlight, SingleFlight
+from topic_index import TopicIndex
+
+from library_store import LibraryStore, normalize_title
+from prefetch import PrefetchScheduler, TopicTracker
+from response_parser import parse_api_response
+from response_recorder import ResponseRecorder
+from save_buffer import SaveBuffer
+from resilience import (
+    AdaptiveTimeout, CircuitBreaker, CircuitOpenError, RetryPolicy, UpstreamGuard, UpstreamHTTPError,
+)
+
+# 配置：config.py 和环境变量（XFIND_<分组>_<键>）按类型校验并补齐默认值，config.py 不存在时使用默认值；
+# 修改 config.py 后，可热加载的键在下一个请求时生效（见 apply_settings）
+API_CONFIG = settings['API_CONFIG']
+CACHE_CONFIG = settings['CACHE_CONFIG']
+LIBRARY_CONFIG = settings['LIBRARY_CONFIG']
+LOG_CONFIG = settings['LOG_CONFIG']
+BATCH_CONFIG = settings['BATCH_CONFIG']
+PREFETCH_CONFIG = settings['PREFETCH_CONFIG']
+RESILIENCE_CONFIG = settings['RESILIENCE_CONFIG']
+POOL_CONFIG = settings['POOL_CONFIG']
+RANKING_CONFIG = settings['RANKING_CONFIG']
+ADMISSION_CONFIG = settings['ADMISSION_CONFIG']
+COMPRESSION_CONFIG = settings['COMPRESSION_CONFIG']
+RECORD_CONFIG = settings['RECORD_CONFIG']
+SAVE_BUFFER_CONFIG = settings['SAVE_BUFFER_CONFIG']
+
+log.configure(LOG_CONFIG.get('level', 'INFO'), LOG_CONFIG.get('format', 'text'))
 
 app = Flask(__name__)
+app.json.ensure_ascii = False  # 中文直接输出UTF-8，不转义为 \uXXXX（体积约为一半）
 CORS(app)  # 允许跨域请求
 
+# 响应压缩（gzip/brotli）和ETag
+response_encoder = ResponseEncoder(
+    enabled=COMPRESSION_CONFIG.get('enabled', True),
+    min_size=COMPRESSION_CONFIG.get('min_size', 1024),
+    gzip_level=COMPRESSION_CONFIG.get('gzip_level', 6),
+    brotli_quality=COMPRESSION_CONFIG.get('brotli_quality', 4),
+)
+
 # 从config.py导入API配置
 API_HOST = API_CONFIG['host']
 API_KEY = API_CONFIG['api_key']
@@ -16,28 +74,889 @@ FLOW_ID = API_CONFIG['flow_id']
 API_ENDPOINT = API_CONFIG['endpoint']
 API_TIMEOUT = API_CONFIG['timeout']
 
-print(f"\n🔧 API配置加载成功:")
-print(f"   主机: {API_HOST}")
-print(f"   Flow ID: {FLOW_ID}")
-print(f"   端点: {API_ENDPOINT}\n")
+# 本进程的生命周期状态（多进程部署时由 prefork.py 管理，停止中就绪检查返回503）
+worker_state = WorkerState()
+
+# 论文规范化与驻留：所有结果中指纹相同的论文共用一个对象
+paper_store = PaperStore()
+
+# 推荐结果缓存（相同研究方向直接返回已解析的结果）；
+# 多进程部署时 prefork.py 通过环境变量指定各工作进程共用的文件
+CACHE_ENABLED = CACHE_CONFIG.get('enabled', True)
+CACHE_PATH = CACHE_CONFIG.get('path') or os.environ.get(STATE_PATH_ENV)
+recommendation_cache = RecommendationCache(
+    ttl=CACHE_CONFIG.get('ttl', 3600),
+    max_entries=CACHE_CONFIG.get('max_entries', 512),
+    path=CACHE_PATH,
+    stale_ttl=CACHE_CONFIG.get('stale_ttl'),
+    loader=paper_store.normalize_result,
+    shared=True,
+)
+
+# "更多论文"的候选列表：每个研究方向每次上游调用的结果都追加进去，下一页从列表中读取；
+# 与推荐缓存使用同一个文件（多进程部署时共用），没有文件时只保存在内存中
+POOL_ENABLED = CACHE_ENABLED and POOL_CONFIG.get('enabled', True)
+candidate_pool = CandidatePool(
+    CACHE_PATH,
+    page_size=POOL_CONFIG.get('page_size', 5),
+    ttl=POOL_CONFIG.get('ttl', 86400),
+    max_size=POOL_CONFIG.get('max_size', 100),
+    max_fetches=POOL_CONFIG.get('max_fetches', 4),
+    max_topics=POOL_CONFIG.get('max_topics', 1024),
+) if POOL_ENABLED else None
+
+# 相似研究方向索引：换一种说法的研究方向复用已缓存的结果（阈值为None时关闭）；
+# 已缓存的研究方向在 start_services 中加入
+SIMILAR_THRESHOLD = CACHE_CONFIG.get('similar_threshold', 0.85)
+topic_index = TopicIndex(max_entries=recommendation_cache.max_entries)
+
+# 到星火工作流API的keep-alive连接池
+workflow_pool = ConnectionPool(
+    API_HOST,
+    API_CONFIG.get('port'),
+    timeout=API_TIMEOUT,
+    max_connections=API_CONFIG.get('max_connections', 8),
+    use_tls=API_CONFIG.get('use_tls', True),
+)
+
+# 进行中的上游请求（相同研究方向的并发请求共享一次调用）
+inflight_requests = SingleFlight()
+
+# 缓存文件由多个进程共用时，不同进程中相同研究方向的请求也只调用一次，其余进程从缓存中取结果；
+# 租约时长覆盖排队和整个上游调用
+worker_flight = SharedFlight(
+    CACHE_PATH,
+    lease_seconds=API_TIMEOUT + ADMISSION_CONFIG.get('queue_timeout', 60),
+) if CACHE_ENABLED and CACHE_PATH else None
+
+# 上游容错：单次尝试超时按最近耗时自适应（不超过 API_TIMEOUT），临时故障退避重试，失败率过高时熔断
+upstream_guard = UpstreamGuard(
+    AdaptiveTimeout(
+        min_timeout=RESILIENCE_CONFIG.get('min_timeout', 10),
+        max_timeout=API_TIMEOUT,
+        percentile=RESILIENCE_CONFIG.get('timeout_percentile', 0.99),
+        multiplier=RESILIENCE_CONFIG.get('timeout_multiplier', 1.5),
+    ),
+    RetryPolicy(
+        attempts=RESILIENCE_CONFIG.get('attempts', 3),
+        base_delay=RESILIENCE_CONFIG.get('retry_base_delay', 0.5),
+        max_delay=RESILIENCE_CONFIG.get('retry_max_delay', 8.0),
+        retry_codes=RESILIENCE_CONFIG.get('retry_codes', (10110, 11202, 11203)),
+    ),
+    CircuitBreaker(
+        failure_rate=RESILIENCE_CONFIG.get('failure_rate', 0.5),
+        min_calls=RESILIENCE_CONFIG.get('min_calls', 10),
+        window=RESILIENCE_CONFIG.get('window', 60),
+        open_seconds=RESILIENCE_CONFIG.get('open_seconds', 30),
+    ),
+)
+
+# 准入控制：需要调用上游的请求按用户限流，再经过按用户轮转的公平队列
+rate_limiter = RateLimiter(
+    rate_per_minute=ADMISSION_CONFIG.get('rate_per_minute', 6),
+    burst=ADMISSION_CONFIG.get('burst', 3),
+)
+admission_queue = FairQueue(
+    max_concurrent=ADMISSION_CONFIG.get('max_concurrent', API_CONFIG.get('max_connections', 8)),
+    max_queue=ADMISSION_CONFIG.get('max_queue', 32),
+    max_per_user=ADMISSION_CONFIG.get('max_per_user', 2),
+    timeout=ADMISSION_CONFIG.get('queue_timeout', 60),
+)
+
+# 批量推荐的工作线程（并发上限默认与连接池大小相同，多出的研究方向排队）
+BATCH_TIMEOUT = BATCH_CONFIG.get('timeout', API_TIMEOUT)
+BATCH_MAX_TOPICS = BATCH_CONFIG.get('max_topics', 500)
+batch_executor = ThreadPoolExecutor(
+    max_workers=BATCH_CONFIG.get('workers', API_CONFIG.get('max_connections', 8)),
+    thread_name_prefix='batch',
+)
+
+# 服务器端论文储存库
+paper_library = LibraryStore(
+    LIBRARY_CONFIG.get('path', 'library.db'),
+    tombstone_days=LIBRARY_CONFIG.get('tombstone_days', 90),
+)
+
+# 保存请求的写缓冲：/api/save-selection 加入队列后返回，后台线程把多个请求合并到一个事务写入；
+# 退出时写入剩余的请求（写入失败时保存到文件，下次启动时恢复）
+save_buffer = SaveBuffer(
+    paper_library,
+    max_records=SAVE_BUFFER_CONFIG.get('max_records', 10000),
+    batch_size=SAVE_BUFFER_CONFIG.get('batch_size', 500),
+    flush_interval=SAVE_BUFFER_CONFIG.get('flush_interval', 0.2),
+    spool_path=SAVE_BUFFER_CONFIG.get('spool_path', 'save_spool.jsonl'),
+    key_ttl_hours=SAVE_BUFFER_CONFIG.get('key_ttl_hours', 24),
+) if SAVE_BUFFER_CONFIG.get('enabled', True) else None
+if save_buffer is not None:
+    atexit.register(save_buffer.close)
+
+# 个性化排序：按用户储存库中保存过的论文重新排列推荐结果，去掉已保存的（兴趣向量按同步游标增量更新）
+library_ranker = LibraryRanker(
+    lambda user_id, cursor: paper_library.sync(user_id, cursor, limit=1000),
+    dim=RANKING_CONFIG.get('dim', 4096),
+    max_profiles=RANKING_CONFIG.get('max_profiles', 1024),
+    cache_size=RANKING_CONFIG.get('cache_size', 20000),
+    max_papers=RANKING_CONFIG.get('max_papers', 2000),
+) if RANKING_CONFIG.get('enabled', True) else None
+
+# 上游原始响应录制（默认关闭），供 replay_responses.py 回放解析器
+response_recorder = ResponseRecorder(
+    RECORD_CONFIG.get('path', 'upstream_responses.jsonl'),
+    max_bytes=int(RECORD_CONFIG.get('max_mb', 100) * 1024 * 1024),
+    sample_rate=min(RECORD_CONFIG.get('sample_rate', 1.0), 1.0),
+    enabled=RECORD_CONFIG.get('enabled', False),
+)
+
+# 研究方向热度统计，以及在上游空闲时预取热门研究方向的后台线程（收到第一个请求时启动）；
+# 多进程部署时只在第一个工作进程中预取，避免每个进程各用一份调用额度
+PREFETCH_ENABLED = CACHE_ENABLED and PREFETCH_CONFIG.get('enabled', False) and worker_state.primary
+topic_tracker = TopicTracker(half_life=PREFETCH_CONFIG.get('half_life', 6 * 3600))
+
+
+def upstream_idle(pool, queue, reserve=PREFETCH_CONFIG.get('reserve_connections', 2)):
+    """连接池中除去为用户请求保留的连接后是否还有空闲（有用户请求排队或熔断期间不预取）"""
+    return (pool.in_use + reserve < pool.max_connections and not queue.queued
+            and upstream_guard.breaker.state == CircuitBreaker.CLOSED)
+
+
+prefetch_scheduler = PrefetchScheduler(
+    topic_tracker,
+    recommendation_cache,
+    fetch=lambda topic: inflight_requests.do(
+        normalize_topic(topic), fetch_across_workers, fetch_papers, topic, 'prefetch'
+    ),
+    is_idle=lambda: upstream_idle(workflow_pool, admission_queue),
+    calls_per_hour=PREFETCH_CONFIG.get('calls_per_hour', 30),
+    top_n=PREFETCH_CONFIG.get('top_n', 20),
+    interval=PREFETCH_CONFIG.get('interval', 60),
+    tag_counts=paper_library.tag_counts,
+    tag_weight=PREFETCH_CONFIG.get('tag_weight', 0.5),
+)
+
+# 导入模块时只创建对象，不打开缓存文件和储存库、不导入NumPy（各自在第一次使用时进行），
+# 其余的初始化在第一个请求之前由 start_services 完成
+services_started = threading.Event()
+_services_lock = threading.Lock()
+
+
+def start_services():
+    """把已缓存的研究方向加入相似索引，启动预取和写缓冲的后台线程（重复调用无副作用）"""
+    if services_started.is_set():
+        return
+    with _services_lock:
+        if services_started.is_set():
+            return
+        start = time.perf_counter()
+        for cached_topic in recommendation_cache.topics():
+            topic_index.add(cached_topic)
+        if PREFETCH_ENABLED:
+            prefetch_scheduler.start()
+        if save_buffer is not None:
+            save_buffer.start()
+        services_started.set()
+        log.info('services_started', host=API_HOST, flow_id=FLOW_ID, endpoint=API_ENDPOINT,
+                 similar_topics=len(topic_index), ms=round((time.perf_counter() - start) * 1000, 1))
+
+
+def apply_settings(current, changed):
+    """把热加载的配置应用到运行中的对象（changed: {分组: {变化的键}}）"""
+    global SIMILAR_THRESHOLD
+    if 'LOG_CONFIG' in changed:
+        log_config = current['LOG_CONFIG']
+        log.configure(log_config['level'], log_config['format'])
+    
+    cache_config = current['CACHE_CONFIG']
+    if 'CACHE_CONFIG' in changed:
+        recommendation_cache.ttl = cache_config['ttl']
+        recommendation_cache.stale_ttl = max(cache_config['ttl'], cache_config.get('stale_ttl') or 0)
+        prefetch_scheduler.refresh_after = cache_config['ttl'] * 0.8
+        SIMILAR_THRESHOLD = cache_config['similar_threshold']
+    
+    if 'ADMISSION_CONFIG' in changed:
+        admission = current['ADMISSION_CONFIG']
+        rate_limiter.rate = admission['rate_per_minute'] / 60.0
+        rate_limiter.burst = admission['burst']
+        admission_queue.max_queue = admission['max_queue']
+        admission_queue.max_per_user = admission['max_per_user']
+        admission_queue.timeout = admission['queue_timeout']
+    
+    if 'PREFETCH_CONFIG' in changed:
+        prefetch = current['PREFETCH_CONFIG']
+        prefetch_scheduler.budget.calls_per_hour = prefetch['calls_per_hour']
+        prefetch_scheduler.top_n = prefetch['top_n']
+        prefetch_scheduler.interval = prefetch['interval']
+        prefetch_scheduler.tag_weight = prefetch['tag_weight']
+        topic_tracker.half_life = prefetch['half_life']
+    
+    if 'RESILIENCE_CONFIG' in changed:
+        resilience = current['RESILIENCE_CONFIG']
+        timeouts, retry, breaker = upstream_guard.timeouts, upstream_guard.retry, upstream_guard.breaker
+        timeouts.min_timeout = resilience['min_timeout']
+        timeouts.percentile = resilience['timeout_percentile']
+        timeouts.multiplier = resilience['timeout_multiplier']
+        retry.attempts = resilience['attempts']
+        retry.base_delay = resilience['retry_base_delay']
+        retry.max_delay = resilience['retry_max_delay']
+        retry.retry_codes = frozenset(resilience['retry_codes'])
+        breaker.failure_rate = resilience['failure_rate']
+        breaker.min_calls = resilience['min_calls']
+        breaker.window = resilience['window']
+        breaker.open_seconds = resilience['open_seconds']
+    
+    if 'POOL_CONFIG' in changed and candidate_pool is not None:
+        pool = current['POOL_CONFIG']
+        candidate_pool.page_size = pool['page_size']
+        candidate_pool.max_size = pool['max_size']
+        candidate_pool.max_fetches = pool['max_fetches']
+        candidate_pool.ttl = pool['ttl']
+    
+    if 'COMPRESSION_CONFIG' in changed:
+        compression = current['COMPRESSION_CONFIG']
+        response_encoder.enabled = compression['enabled']
+        response_encoder.min_size = compression['min_size']
+        response_encoder.gzip_level = compression['gzip_level']
+        response_encoder.brotli_quality = compression['brotli_quality']
+        index_response.reset()
+    
+    if 'RECORD_CONFIG' in changed:
+        record = current['RECORD_CONFIG']
+        response_recorder.enabled = record['enabled']
+        response_recorder.sample_rate = min(record['sample_rate'], 1.0)
+        response_recorder.max_bytes = int(record['max_mb'] * 1024 * 1024)
+        response_recorder.resume()
+    
+    if 'SAVE_BUFFER_CONFIG' in changed and save_buffer is not None:
+        save_buffer_config = current['SAVE_BUFFER_CONFIG']
+        save_buffer.max_records = save_buffer_config['max_records']
+        save_buffer.batch_size = save_buffer_config['batch_size']
+        save_buffer.flush_interval = save_buffer_config['flush_interval']
+
+
+settings.subscribe(apply_settings)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    settings.reload_if_changed()
+    start_services()
+    if save_buffer is not None and request.path.startswith('/api/library'):
+        settle_saves(get_user_id(body=False))
+
+
+@app.after_request
+def record_request_metrics(response):
+    """按路由规则（而不是实际路径）统计请求数和耗时，避免标签数量无限增长"""
+    start = g.pop('request_start', None)
+    if start is not None and request.url_rule is not None:
+        endpoint = request.url_rule.rule
+        metrics.request_seconds.observe(time.perf_counter() - start, endpoint)
+        metrics.requests_total.inc(endpoint, str(response.status_code))
+    return response
 
 
-@app.route('/api/get-papers', methods=['POST'])
+@app.after_request
+def encode_response(response):
+    """
+    压缩完整的响应体；GET成功响应加强ETag，If-None-Match 匹配时返回304
+
+    在 record_request_metrics 之前执行（after_request 按注册的相反顺序执行），指标中记录的是最终状态码。
+    流式响应（SSE、NDJSON）逐块发送，不压缩也不加ETag。
+    """
+    if response.is_streamed or response.direct_passthrough or 'ETag' in response.headers:
+        return response
+    conditional = request.method in ('GET', 'HEAD') and response.status_code == 200
+    status, body, headers = response_encoder.encode(
+        response.get_data(),
+        response.mimetype,
+        request.headers.get('Accept-Encoding'),
+        request.headers.get('If-None-Match'),
+        etag=conditional,
+    )
+    response.set_data(body)
+    response.headers.update(headers)
+    if status == 304:
+        response.status_code = 304
+        response.headers.pop('Content-Length', None)
+    elif conditional:
+        # 允许浏览器缓存，但每次使用前用 If-None-Match 向服务器确认
+        response.headers.setdefault('Cache-Control', 'no-cache')
+    return response
+
+
+class WorkflowError(Exception):
+    """星火工作流返回了非0错误码"""
+
+    def __init__(self, code, message, details):
+        super().__init__(f"API错误 ({code}): {message}")
+        self.code = code
+        self.details = details
+
+
+@app.route('/api/get-papers', methods=['GET', 'POST'])
 def get_papers():
-    """获取论文推荐"""
+    """
+    获取论文推荐（GET 用查询参数 research_topic，可以带 If-None-Match 条件请求）
+
+    结果中的 next_cursor 用于获取更多论文：带上 cursor（和可选的 page_size）再次请求，从候选列表返回下一页
+    """
     try:
         # 获取用户输入的研究方向
-        user_input = request.json.get('research_topic', '')
+        with metrics.stage('request_parse'):
+            params = request.args if request.method == 'GET' else request.json
+            user_input = params.get('research_topic', '')
+            cursor = params.get('cursor')
         
+        if cursor:
+            return get_more_papers(cursor, params.get('page_size'))
         if not user_input:
             return jsonify({"error": "请输入研究方向"}), 400
+        topic_tracker.record(user_input)
+        user_id = get_user_id()
+        
+        # 命中缓存时直接返回已解析的结果
+        if CACHE_ENABLED:
+            cached = recommendation_cache.get(user_input)
+            if cached is not None:
+                log.info('papers_served', topic=user_input, cache='hit', papers=paper_count(cached))
+                result = with_cursor(user_input, personalize(cached, user_id))
+                with metrics.stage('serialization'):
+                    response = jsonify(result)
+                response.headers['X-Cache'] = 'HIT'
+                return response, 200
+            
+            similar = lookup_similar(user_input)
+            if similar is not None:
+                log.info('papers_served', topic=user_input, cache='similar', matched=similar['matched_topic'],
+                         similarity=similar['similarity'], papers=paper_count(similar))
+                result = with_cursor(similar['matched_topic'], personalize(similar, user_id))
+                with metrics.stage('serialization'):
+                    response = jsonify(result)
+                response.headers['X-Cache'] = 'SIMILAR'
+                response.headers['X-Similarity'] = str(similar['similarity'])
+                return response, 200
+        
+        # 相同研究方向的并发请求合并为一次上游调用；需要新的上游调用时先经过限流和排队
+        key, client = normalize_topic(user_input), client_id()
+        if not inflight_requests.in_flight(key) and not (worker_flight and worker_flight.in_flight(key)):
+            check_rate_limit(client)
+        parsed_result, shared = inflight_requests.do(key, fetch_across_workers, fetch_admitted, user_input, client)
+        log.info('papers_served', topic=user_input, cache='miss', coalesced=shared,
+                 papers=paper_count(parsed_result))
+        
+        result = with_cursor(user_input, personalize(parsed_result, user_id))
+        with metrics.stage('serialization'):
+            response = jsonify(result)
+        response.headers['X-Cache'] = 'MISS'
+        response.headers['X-Coalesced'] = 'true' if shared else 'false'
+        return response, 200
+        
+    except AdmissionRejected as e:
+        status, payload, headers = too_many_requests(e)
+        return jsonify(payload), status, headers
+        
+    except CircuitOpenError as e:
+        status, payload, headers = upstream_unavailable(user_input, e)
+        return jsonify(payload), status, headers
         
-        # 选择是否使用Few-shot提示（可以通过环境变量或配置控制）
-        use_fewshot = False  # 改为False可以直接发送原始输入（当前API不支持Few-shot格式）
+    except WorkflowError as e:
+        if upstream_guard.retry.is_transient(e):
+            status, payload, headers = upstream_unavailable(user_input, e)
+            return jsonify(payload), status, headers
+        return jsonify({
+            "error": str(e),
+            "code": e.code,
+            "details": e.details
+        }), 400
         
-        if use_fewshot:
-            # 构建简洁的Few-shot提示词
-            enhanced_prompt = f"""{user_input}
+    except Exception as e:
+        if upstream_guard.retry.is_transient(e):
+            status, payload, headers = upstream_unavailable(user_input, e)
+            return jsonify(payload), status, headers
+        log.error('get_papers_failed', exc_info=True, error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+def get_more_papers(cursor, page_size=None):
+    """按游标从候选列表返回下一页；列表中剩下的论文不够一页时先再调用一次工作流"""
+    try:
+        topic, offset, seen = decode_cursor(cursor)
+        page_size = pool_page_size(page_size)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    user_id, client = get_user_id(), client_id()
+    page = read_pool_page(topic, offset, seen, page_size, user_id)
+    fetched = False
+    if pool_needs_fetch(page, page_size):
+        key = pool_fetch_key(topic, page)
+        try:
+            if not inflight_requests.in_flight(key):
+                check_rate_limit(client)
+            inflight_requests.do(key, fetch_admitted, topic, client)
+        except Exception as e:
+            error = pool_fetch_failed(topic, page, e)
+            if error is not None:
+                status, payload, headers = error
+                return jsonify(payload), status, headers
+        else:
+            page = read_pool_page(topic, offset, seen, page_size, user_id)
+            fetched = True
+    
+    log.info('papers_served', topic=topic, cache='miss' if fetched else 'pool', offset=offset,
+             papers=len(page['papers']), pool_size=page['size'])
+    with metrics.stage('serialization'):
+        response = jsonify(pool_response(topic, page, seen))
+    response.headers['X-Cache'] = 'MISS' if fetched else 'POOL'
+    return response, 200
+
+
+def pool_page_size(page_size):
+    """请求中的 page_size（可选），限制在 [1, max_size]；候选列表分页关闭时抛出 ValueError"""
+    if candidate_pool is None:
+        raise ValueError("未启用\"更多论文\"分页（POOL_CONFIG）")
+    if page_size in (None, ''):
+        return candidate_pool.page_size
+    return max(1, min(candidate_pool.max_size, int(page_size)))
+
+
+def read_pool_page(topic, offset, seen, page_size, user_id):
+    """
+    从候选列表读取一页，跳过游标中第一页的论文和用户已保存的论文，页内按用户的兴趣排序
+
+    列表还不存在（例如结果是在启用分页之前缓存的）时先用推荐缓存中的结果补建
+    """
+    def saved(papers):
+        settle_saves(user_id)
+        titles = paper_library.saved_titles(user_id, [paper['title'] for paper in papers])
+        return {paper['fingerprint'] for paper in papers if normalize_title(paper['title']) in titles}
+    
+    page = candidate_pool.page(topic, offset, page_size, seen, saved)
+    if page['size'] == 0 and not page['exhausted']:
+        cached = recommendation_cache.peek(topic)
+        if isinstance(cached, dict) and cached.get('papers'):
+            candidate_pool.extend(topic, cached['papers'], fetched=False)
+            page = candidate_pool.page(topic, offset, page_size, seen, saved)
+    page['papers'] = rank_for_user(user_id, page['papers'])
+    return page
+
+
+def pool_needs_fetch(page, page_size):
+    """候选列表中剩下的论文不够一页，而且还没有取完"""
+    return len(page['papers']) < page_size and not page['exhausted']
+
+
+def pool_fetch_key(topic, page):
+    """补充候选列表的上游调用的合并key：同一研究方向、列表长度相同时的并发请求只调用一次"""
+    return f"pool:{page['size']}:{normalize_topic(topic)}"
+
+
+def pool_fetch_failed(topic, page, error):
+    """
+    补充候选列表的上游调用失败：这一页已经有论文时先返回这些（返回None），
+    否则返回 (状态码, 内容, 响应头)，与 get_papers 的错误响应相同（不返回过期的第一页）
+    """
+    log.warning('pool_fetch_failed', topic=topic, error=str(error), papers=len(page['papers']))
+    if page['papers']:
+        return None
+    if isinstance(error, AdmissionRejected):
+        return too_many_requests(error)
+    if isinstance(error, CircuitOpenError) or upstream_guard.retry.is_transient(error):
+        return upstream_unavailable(topic, error, stale=False)
+    if isinstance(error, WorkflowError):
+        return 400, {"error": str(error), "code": error.code, "details": error.details}, {}
+    log.error('get_more_papers_failed', exc_info=True, error=str(error))
+    return 500, {"error": str(error)}, {}
+
+
+def pool_response(topic, page, seen):
+    """候选列表一页的响应内容；还有更多论文时带上下一页的游标"""
+    has_more = page['remaining'] > 0 or not page['exhausted']
+    return {
+        "papers": page['papers'],
+        "next_cursor": encode_cursor(topic, page['next_offset'], seen) if has_more else None,
+        "has_more": has_more,
+        "pool_size": page['size'],
+    }
+
+
+def personalize(parsed_result, user_id):
+    """结果中的论文按用户储存库中保存过的论文重新排列，去掉已保存的（返回新的dict，不修改缓存中的结果）"""
+    papers = parsed_result.get('papers') if isinstance(parsed_result, dict) else None
+    if not isinstance(papers, list):
+        return parsed_result
+    ranked = rank_for_user(user_id, papers)
+    return parsed_result if ranked is papers else dict(parsed_result, papers=ranked)
+
+
+def rank_for_user(user_id, papers):
+    """按用户的兴趣排列论文并去掉已保存的；排序关闭或用户还没有保存过论文时原样返回"""
+    if library_ranker is None or not papers:
+        return papers
+    settle_saves(user_id)
+    with metrics.stage('ranking'):
+        return library_ranker.rank(user_id, papers)
+
+
+def with_cursor(topic, parsed_result):
+    """完整结果加上获取更多论文的游标 next_cursor（分页关闭或没有论文时原样返回）"""
+    cursor = first_cursor(topic, parsed_result)
+    return parsed_result if cursor is None else dict(parsed_result, next_cursor=cursor)
+
+
+def first_cursor(topic, parsed_result):
+    """第一页之后的游标：从候选列表开头读取，跳过第一页的论文；分页关闭或没有论文时为None"""
+    papers = parsed_result.get('papers') if isinstance(parsed_result, dict) else None
+    if candidate_pool is None or not isinstance(papers, list) or not papers:
+        return None
+    return encode_cursor(topic, 0, [paper['fingerprint'] for paper in papers if paper.get('fingerprint')])
+
+
+def check_rate_limit(client):
+    """消耗该用户的一个令牌，令牌不足时抛出 AdmissionRejected"""
+    retry_after = rate_limiter.check(client)
+    if retry_after:
+        raise AdmissionRejected('rate_limited', retry_after)
+
+
+def fetch_admitted(user_input, client, timeout=None, bounded=True):
+    """在公平队列中排到名额后调用工作流（timeout、bounded 同 FairQueue.acquire）"""
+    with admission_queue.slot(client, timeout, bounded):
+        return fetch_papers(user_input, client)
+
+
+def fetch_across_workers(fetch, user_input, *args):
+    """
+    其他工作进程正在获取同一研究方向的推荐时等待它写入共享缓存的结果，否则调用 fetch
+
+    缓存文件不共用（单进程运行）时直接调用 fetch
+    """
+    if worker_flight is None:
+        return fetch(user_input, *args)
+    result, _ = worker_flight.do(
+        normalize_topic(user_input), lambda: recommendation_cache.peek(user_input), fetch, user_input, *args
+    )
+    return result
+
+
+def too_many_requests(error):
+    """被限流或排队已满时的响应，返回 (状态码, 内容, 响应头)"""
+    metrics.admission_rejected.inc(error.reason)
+    log.info('request_rejected', reason=error.reason, retry_after=round(error.retry_after, 1))
+    payload = {"error": str(error), "reason": error.reason, "retry_after": math.ceil(error.retry_after)}
+    return 429, payload, {'Retry-After': str(math.ceil(error.retry_after))}
+
+
+def upstream_unavailable(user_input, error, stale=True):
+    """
+    上游不可用（熔断中，或重试后仍是临时故障）时的响应，返回 (状态码, 内容, 响应头)
+
+    缓存中有过期但仍在 stale_ttl 内的结果时返回该结果（X-Cache: STALE，stale=False 时不查找），
+    否则返回503和 Retry-After
+    """
+    stale = recommendation_cache.get_stale(user_input) if CACHE_ENABLED and stale else None
+    if stale is not None:
+        result, age = stale
+        log.warning('papers_served_stale', topic=user_input, age=round(age), error=str(error))
+        return 200, result, {'X-Cache': 'STALE', 'Age': str(int(age))}
+    
+    retry_after = getattr(error, 'retry_after', None) or upstream_guard.breaker.open_seconds
+    log.warning('upstream_unavailable', topic=user_input, error=str(error),
+                breaker=upstream_guard.breaker.state)
+    payload = {"error": str(error), "retry_after": round(retry_after, 1)}
+    if getattr(error, 'code', None) is not None:
+        payload["code"] = error.code
+    return 503, payload, {'Retry-After': str(max(1, math.ceil(retry_after)))}
+
+
+def cache_result(user_input, parsed_result):
+    """写入推荐缓存，加入相似研究方向索引，论文追加到该研究方向的候选列表"""
+    recommendation_cache.set(user_input, parsed_result)
+    topic_index.add(normalize_topic(user_input))
+    if candidate_pool is not None:
+        candidate_pool.extend(user_input, parsed_result['papers'])
+
+
+def lookup_similar(user_input):
+    """
+    缓存中与研究方向最相似的结果（精确匹配未命中时调用），没有时返回None
+
+    返回结果的副本，附带 matched_topic（匹配到的研究方向）和 similarity（余弦相似度）
+    """
+    if SIMILAR_THRESHOLD is None:
+        return None
+    with metrics.stage('similar_lookup'):
+        found = topic_index.match(user_input, SIMILAR_THRESHOLD)
+    if found is None:
+        return None
+    
+    topic, score = found
+    # 精确查找已经计过一次未命中，这里用 peek，不再计入命中统计
+    cached = recommendation_cache.peek(topic)
+    if cached is None:
+        # 匹配到的结果已过期或被淘汰
+        topic_index.remove(topic)
+        return None
+    return dict(cached, matched_topic=topic, similarity=score)
+
+
+def paper_count(parsed_result):
+    """解析结果中的论文数，格式不对时为None"""
+    if isinstance(parsed_result, dict) and isinstance(parsed_result.get('papers'), list):
+        return len(parsed_result['papers'])
+    return None
+
+
+@app.route('/api/get-papers/batch', methods=['POST'])
+def get_papers_batch():
+    """批量获取论文推荐：每个研究方向完成后立即输出一行JSON（NDJSON，按完成顺序）"""
+    with metrics.stage('request_parse'):
+        data = request.get_json(silent=True) or {}
+    
+    try:
+        topics = batch.parse_topics(data.get('topics'), BATCH_MAX_TOPICS)
+        timeout = float(data.get('timeout') or BATCH_TIMEOUT)
+        if timeout <= 0:
+            raise ValueError("timeout 必须大于0")
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # 整个批量请求消耗一个令牌：按研究方向扣除时，超过 burst 个研究方向的批量请求只有前几个能得到结果
+    client = client_id()
+    try:
+        check_rate_limit(client)
+    except AdmissionRejected as e:
+        status, payload, headers = too_many_requests(e)
+        return jsonify(payload), status, headers
+    
+    log.info('batch_started', topics=len(topics), timeout=timeout)
+    for topic in topics:
+        topic_tracker.record(topic)
+    
+    def lookup(topic):
+        return recommendation_cache.get(topic) if CACHE_ENABLED else None
+    
+    def fetch(topic):
+        # 在公平队列中等待名额（不受排队数限制，并发由 batch_executor 限制），最多等到批量请求的超时
+        try:
+            return inflight_requests.do(
+                normalize_topic(topic), fetch_across_workers, fetch_admitted, topic, client, timeout, False
+            )
+        except AdmissionRejected as e:
+            too_many_requests(e)  # 计数和日志；该研究方向输出带 reason 和 retry_after 的错误记录
+            raise
+    
+    def generate():
+        for record in batch.iter_batch(topics, lookup, fetch, batch_executor, timeout):
+            if record.get('done'):
+                log.info('batch_served', **{k: v for k, v in record.items() if k != 'done'})
+            yield batch.ndjson_line(record)
+    
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/get-papers/stream', methods=['POST'])
+def get_papers_stream():
+    """流式获取论文推荐：每解析出一篇论文就以SSE事件推送给前端"""
+    with metrics.stage('request_parse'):
+        user_input = (request.json or {}).get('research_topic', '')
+    
+    if not user_input:
+        return jsonify({"error": "请输入研究方向"}), 400
+    topic_tracker.record(user_input)
+    
+    # 缓存中的结果按用户的兴趣排序后推送；实时的流式结果按到达顺序推送，不排序
+    user_id = get_user_id()
+    events, cache_status = cached_events(user_input, user_id)
+    
+    # 熔断中不发起流式调用：有过期结果时推送过期结果，否则返回503
+    if events is None and upstream_guard.breaker.is_open():
+        status, payload, headers = upstream_unavailable(
+            user_input, CircuitOpenError(upstream_guard.breaker.retry_after())
+        )
+        if status != 200:
+            return jsonify(payload), status, headers
+        events, cache_status = replay_papers(personalize(payload, user_id), user_input), 'STALE'
+    
+    # 流式调用不与其他请求合并，每次都经过限流和排队，名额在响应结束时归还
+    acquired_at = None
+    if events is None:
+        client = client_id()
+        try:
+            check_rate_limit(client)
+            acquired_at = admission_queue.acquire(client)
+        except AdmissionRejected as e:
+            status, payload, headers = too_many_requests(e)
+            return jsonify(payload), status, headers
+        events = stream_papers(user_input, client)
+    
+    response = Response(events, mimetype='text/event-stream')
+    if acquired_at is not None:
+        response.call_on_close(lambda: admission_queue.release(acquired_at))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 禁止反向代理缓冲
+    response.headers['X-Cache'] = cache_status
+    return response
+
+
+def cached_events(user_input, user_id):
+    """
+    流式接口命中缓存或相似研究方向时的SSE事件（按用户的兴趣排序后逐篇推送），返回 (事件生成器, X-Cache)，
+    都未命中时返回 (None, 'MISS')
+    """
+    if not CACHE_ENABLED:
+        return None, 'MISS'
+    cached = recommendation_cache.get(user_input)
+    if cached is not None:
+        log.info('papers_served', topic=user_input, cache='hit', stream=True, papers=paper_count(cached))
+        return replay_papers(personalize(cached, user_id), user_input), 'HIT'
+    similar = lookup_similar(user_input)
+    if similar is not None:
+        log.info('papers_served', topic=user_input, cache='similar', stream=True,
+                 matched=similar['matched_topic'], similarity=similar['similarity'], papers=paper_count(similar))
+        return replay_papers(personalize(similar, user_id), similar['matched_topic']), 'SIMILAR'
+    return None, 'MISS'
+
+
+def sse_event(event, data):
+    """格式化一个SSE事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def replay_papers(parsed_result, topic=None):
+    """把已解析的结果（缓存命中）逐篇推送；topic 为结果所属的研究方向，done 事件中带上 next_cursor"""
+    papers = parsed_result.get('papers', []) if isinstance(parsed_result, dict) else []
+    for index, paper in enumerate(papers):
+        yield sse_event('paper', {"index": index, "paper": paper})
+    done = {"count": len(papers)}
+    cursor = first_cursor(topic, parsed_result) if topic else None
+    if cursor is not None:
+        done['next_cursor'] = cursor
+    if isinstance(parsed_result, dict) and 'similarity' in parsed_result:
+        done.update(matched_topic=parsed_result['matched_topic'], similarity=parsed_result['similarity'])
+    yield sse_event('done', done)
+
+
+def stream_papers(user_input, client='anonymous'):
+    """以流式方式调用工作流，边接收边解析并推送论文"""
+    headers, payload = build_workflow_request(user_input, stream=True, client=client)
+    extractor = PapersExtractor()
+    papers = []
+    seen = set()  # 已推送论文的指纹
+    
+    log.debug('stream_started', topic=user_input)
+    
+    try:
+        with workflow_pool.stream("POST", API_ENDPOINT, payload, headers) as res:
+            metrics.observe_upstream(res.timings)
+            
+            # 上游没有按流式返回时，按普通响应整体解析
+            if 'text/event-stream' not in (res.getheader('Content-Type') or ''):
+                with metrics.stage('body_read'):
+                    data = res.read()
+                yield from replay_papers(handle_workflow_response(user_input, data), user_input)
+                return
+            
+            # 读取、解码、提取和推送交替进行，分别累计耗时，结束时各记录一次
+            stream_start = time.perf_counter()
+            decode_time = extract_time = push_time = 0.0
+            for data in iter_sse_data(res):
+                if data.strip() == '[DONE]':
+                    continue
+                t0 = time.perf_counter()
+                chunk = json.loads(data)
+                t1 = time.perf_counter()
+                decode_time += t1 - t0
+                if isinstance(chunk, dict) and chunk.get('code', 0) != 0:
+                    raise WorkflowError(chunk['code'], chunk.get('message', '未知错误'), chunk)
+                
+                found = paper_store.dedup(extractor.feed(extract_delta_content(chunk)), seen)
+                t2 = time.perf_counter()
+                extract_time += t2 - t1
+                for paper in found:
+                    yield sse_event('paper', {"index": len(papers), "paper": paper})
+                    papers.append(paper)
+                    log.debug('paper_pushed', topic=user_input, index=len(papers) - 1)
+                push_time += time.perf_counter() - t2
+            
+            metrics.observe_stage('json_decode', decode_time)
+            metrics.observe_stage('extraction', extract_time)
+            metrics.observe_stage(
+                'body_read', time.perf_counter() - stream_start - decode_time - extract_time - push_time
+            )
+        
+        if CACHE_ENABLED and papers:
+            cache_result(user_input, {"papers": papers})
+        
+        log.info('papers_served', topic=user_input, cache='miss', stream=True, papers=len(papers))
+        done = {"count": len(papers)}
+        cursor = first_cursor(user_input, {"papers": papers})
+        if cursor is not None:
+            done['next_cursor'] = cursor
+        yield sse_event('done', done)
+    
+    except WorkflowError as e:
+        log.warning('workflow_error', topic=user_input, code=e.code, error=str(e))
+        yield sse_event('error', {"error": str(e), "code": e.code})
+    
+    except Exception as e:
+        log.error('stream_failed', exc_info=True, topic=user_input, error=str(e))
+        yield sse_event('error', {"error": str(e)})
+
+
+def fetch_papers(user_input, client='anonymous'):
+    """调用星火工作流获取论文推荐（超时自适应、临时故障重试、熔断时快速失败），返回解析后的结果"""
+    return upstream_guard.call(lambda timeout: fetch_papers_once(user_input, timeout, client))
+
+
+def fetch_papers_once(user_input, timeout, client='anonymous'):
+    """调用一次星火工作流，timeout 为本次尝试的超时（秒）"""
+    headers, payload = build_workflow_request(user_input, client=client)
+    
+    # 发送请求（复用连接池中的keep-alive连接）
+    res = workflow_pool.request(
+        "POST", API_ENDPOINT, payload, headers, timeout=timeout, encode_chunked=True
+    )
+    return handle_pooled_response(user_input, res)
+
+
+def handle_pooled_response(user_input, res):
+    """处理连接池返回的上游响应：记录耗时、检查状态码、解析并写入缓存，返回解析后的结果（会读写文件和SQLite）"""
+    log_upstream_response(user_input, res)
+    check_upstream_status(res)
+    return handle_workflow_response(user_input, res.data)
+
+
+def check_upstream_status(res):
+    """上游限流（429）或服务端错误（5xx）时抛出 UpstreamHTTPError，可以重试"""
+    if res.status == 429 or res.status >= 500:
+        raise UpstreamHTTPError(res.status, res.reason)
+
+
+def log_upstream_response(user_input, res):
+    """记录上游各阶段耗时（连接池返回的 PooledResponse），开启录制时按采样率录制原始响应"""
+    metrics.observe_upstream(res.timings)
+    response_recorder.record(user_input, res.status, res.data)
+    if log.enabled(log.INFO):
+        log.info('upstream_response', topic=user_input, status=res.status, reused=res.reused,
+                 bytes=len(res.data), **{f"{k}_ms": round(v * 1000, 1) for k, v in res.timings.items()})
+
+
+def build_workflow_request(user_input, stream=False, client='anonymous'):
+    """
+    构建发送给星火工作流的请求头和请求体，返回 (headers, payload)
+
+    client: 发起请求的用户标识，作为工作流的 uid（最长32个字符）
+    """
+    # 选择是否使用Few-shot提示（可以通过环境变量或配置控制）
+    use_fewshot = False  # 改为False可以直接发送原始输入（当前API不支持Few-shot格式）
+    
+    if use_fewshot:
+        # 构建简洁的Few-shot提示词
+        enhanced_prompt = f"""{user_input}
 
 请推荐5篇相关论文，严格按照以下JSON格式返回（不要其他说明）：
 
@@ -53,228 +972,395 @@ def get_papers():
     }}
   ]
 }}"""
-        else:
-            # 直接使用用户输入
-            enhanced_prompt = user_input
-        
-        # 构建请求头
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "text/event-stream",
-            "Authorization": f"Bearer {API_KEY}:{API_SECRET}",
-        }
-        
-        # 构建请求数据
-        data = {
-            "flow_id": FLOW_ID,
-            "uid": "123",
-            "parameters": {"AGENT_USER_INPUT": enhanced_prompt},
-            "ext": {"bot_id": "paper_recommendation", "caller": "workflow"},
-            "stream": False,
-        }
-        payload = json.dumps(data)
-        
-        print(f"\n{'='*60}")
-        print(f"📝 用户输入: {user_input}")
-        print(f"🚀 发送请求到API...")
-        
-        # 发送请求
-        conn = http.client.HTTPSConnection(API_HOST, timeout=API_TIMEOUT)
-        conn.request(
-            "POST", API_ENDPOINT, payload, headers, encode_chunked=True
-        )
-        res = conn.getresponse()
-        
-        # 读取响应
-        response_data = res.read()
+    else:
+        # 直接使用用户输入
+        enhanced_prompt = user_input
+    
+    # 构建请求头
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+        "Authorization": f"Bearer {API_KEY}:{API_SECRET}",
+    }
+    
+    # 构建请求数据
+    data = {
+        "flow_id": FLOW_ID,
+        "uid": workflow_uid(client),
+        "parameters": {"AGENT_USER_INPUT": enhanced_prompt},
+        "ext": {"bot_id": "paper_recommendation", "caller": "workflow"},
+        "stream": stream,
+    }
+    return headers, json.dumps(data)
+
+
+def workflow_uid(client):
+    """工作流 uid 最长32个字符：去掉UUID中的连字符，IP等其他标识超长时取哈希"""
+    uid = client.replace('-', '')
+    if len(uid) > 32:
+        uid = hashlib.sha1(client.encode('utf-8')).hexdigest()[:32]
+    return uid
+
+
+def handle_workflow_response(user_input, response_data):
+    """检查工作流响应的错误码并解析论文数据，成功时写入缓存"""
+    with metrics.stage('json_decode'):
         result = json.loads(response_data.decode("utf-8"))
-        
-        print(f"✅ 收到API响应")
-        
-        # 检查API错误码
-        if isinstance(result, dict) and 'code' in result:
-            if result['code'] != 0:
-                error_msg = result.get('message', '未知错误')
-                print(f"❌ API返回错误码: {result['code']}")
-                print(f"❌ 错误信息: {error_msg}")
-                return jsonify({
-                    "error": f"API错误 ({result['code']}): {error_msg}",
-                    "code": result['code'],
-                    "details": result
-                }), 400
-        
-        print(f"📦 原始响应: {json.dumps(result, ensure_ascii=False, indent=2)[:500]}...")
-        
-        conn.close()
-        
-        # 尝试解析并标准化响应格式
+    
+    # 检查API错误码
+    if isinstance(result, dict) and 'code' in result:
+        if result['code'] != 0:
+            error_msg = result.get('message', '未知错误')
+            log.warning('workflow_error', topic=user_input, code=result['code'], error=error_msg)
+            raise WorkflowError(result['code'], error_msg, result)
+    
+    # 日志只截取原始响应的开头，不再对整个响应重新序列化
+    if log.enabled(log.DEBUG):
+        log.debug('upstream_body', preview=response_data[:500].decode('utf-8', 'replace'))
+    
+    # 尝试解析并标准化响应格式，再统一论文字段类型并去重
+    with metrics.stage('extraction'):
         parsed_result = parse_api_response(result)
-        
-        print(f"✨ 解析后数据: {json.dumps(parsed_result, ensure_ascii=False, indent=2)[:300]}...")
-        print(f"{'='*60}\n")
-        
-        return jsonify(parsed_result), 200
-        
-    except Exception as e:
-        print(f"❌ 错误: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+    with metrics.stage('normalize'):
+        parsed_result = paper_store.normalize_result(parsed_result)
+    
+    # 只缓存成功解析出论文的结果
+    if CACHE_ENABLED and isinstance(parsed_result, dict) and 'papers' in parsed_result:
+        cache_result(user_input, parsed_result)
+    
+    return parsed_result
 
 
-def parse_api_response(result):
-    """解析API响应，提取论文数据"""
-    try:
-        print(f"🔍 开始解析响应，数据类型: {type(result)}")
-        
-        # 格式1: 直接是标准格式 {"papers": [...]}
-        if isinstance(result, dict) and 'papers' in result:
-            print("✅ 格式1: 直接包含papers字段")
-            return result
-        
-        # 格式2: 嵌套格式 {data: {"papers": [...]}} 或类似
-        if isinstance(result, dict):
-            # 尝试查找所有可能包含papers的嵌套字段
-            for key, value in result.items():
-                if isinstance(value, dict) and 'papers' in value:
-                    print(f"✅ 格式2: 在 {key} 字段中找到papers")
-                    return value
-                # 如果value是字符串，尝试解析
-                if isinstance(value, str):
-                    try:
-                        parsed = json.loads(value)
-                        if isinstance(parsed, dict) and 'papers' in parsed:
-                            print(f"✅ 格式2b: 在 {key} 字段的字符串中解析出papers")
-                            return parsed
-                    except:
-                        pass
-        
-        # 格式3: OpenAI/ChatGPT格式 {"choices": [{"message/delta": {"content": "..."}}]}
-        if isinstance(result, dict) and 'choices' in result:
-            print("🔍 检测到choices格式，尝试提取content")
-            
-            # 尝试从 delta 或 message 中获取 content
-            choice = result['choices'][0]
-            content = None
-            
-            if 'delta' in choice and 'content' in choice['delta']:
-                content = choice['delta']['content']
-                print("✅ 从 delta.content 提取")
-            elif 'message' in choice and 'content' in choice['message']:
-                content = choice['message']['content']
-                print("✅ 从 message.content 提取")
-            
-            if content:
-                # 去除可能的前导空格
-                content = content.strip()
-                
-                # 尝试从content中提取JSON
-                import re
-                
-                # 方法1: 查找JSON代码块
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
-                if json_match:
-                    content = json_match.group(1)
-                    print("✅ 从markdown代码块提取JSON")
-                
-                # 方法2: 智能提取JSON对象
-                else:
-                    # 找到第一个 {
-                    start = content.find('{')
-                    if start != -1:
-                        # 从第一个 { 开始，找到匹配的 }
-                        brace_count = 0
-                        json_end = -1
-                        
-                        for i in range(start, len(content)):
-                            if content[i] == '{':
-                                brace_count += 1
-                            elif content[i] == '}':
-                                brace_count -= 1
-                                if brace_count == 0:
-                                    json_end = i + 1
-                                    break
-                        
-                        if json_end != -1:
-                            content = content[start:json_end]
-                            print(f"✅ 智能提取JSON对象 (长度: {len(content)})")
-                        else:
-                            print("⚠️ 未找到匹配的闭合括号，使用原始content")
-                    else:
-                        print("⚠️ content中没有找到JSON对象")
-                
-                # 解析JSON
-                try:
-                    parsed = json.loads(content)
-                    if 'papers' in parsed:
-                        print(f"✅ 格式3: 成功解析，包含 {len(parsed['papers'])} 篇论文")
-                        return parsed
-                    else:
-                        print("⚠️ 解析成功但未找到papers字段")
-                except json.JSONDecodeError as e:
-                    print(f"❌ JSON解析失败: {e}")
-                    print(f"   内容长度: {len(content)}")
-                    print(f"   前200字符: {content[:200]}")
-                    print(f"   后100字符: {content[-100:]}")
-                    
-                    # 尝试修复常见问题
-                    try:
-                        # 移除可能的尾部逗号
-                        content_fixed = re.sub(r',\s*}', '}', content)
-                        content_fixed = re.sub(r',\s*]', ']', content_fixed)
-                        parsed = json.loads(content_fixed)
-                        if 'papers' in parsed:
-                            print(f"✅ 修复后解析成功，包含 {len(parsed['papers'])} 篇论文")
-                            return parsed
-                    except:
-                        pass
-        
-        # 格式4: 直接是字符串
-        if isinstance(result, str):
-            print("🔍 响应是字符串，尝试解析JSON")
-            parsed = json.loads(result)
-            if 'papers' in parsed:
-                print("✅ 格式4: 字符串解析成功")
-                return parsed
-        
-        # 如果都不是，打印结构帮助调试
-        print(f"⚠️ 未识别的格式，响应结构: {list(result.keys()) if isinstance(result, dict) else type(result)}")
-        print(f"📦 原始响应前200字符: {str(result)[:200]}")
-        
-        return result
-        
-    except Exception as e:
-        print(f"❌ 解析响应失败: {e}")
-        import traceback
-        traceback.print_exc()
-        # 解析失败时返回原始结果
-        return result
+def get_user_id(body=True):
+    """当前请求的用户标识（前端在请求头 X-User-Id 中携带）；body 为False时不从请求体中读取（流式读取请求体的接口）"""
+    user_id = request.headers.get('X-User-Id') or (body and (request.get_json(silent=True) or {}).get('user_id'))
+    return str(user_id)[:64] if user_id else 'anonymous'
+
+
+def client_id():
+    """限流和排队使用的用户标识：X-User-Id，没有时按客户端IP区分"""
+    user_id = request.headers.get('X-User-Id')
+    return user_id[:64] if user_id else f"ip:{request.remote_addr}"
 
 
 @app.route('/api/save-selection', methods=['POST'])
 def save_selection():
     """保存用户选择的论文"""
     try:
-        selected_papers = request.json.get('selected_papers', [])
-        
-        # 这里可以将选择的论文保存到数据库或文件
-        # 暂时只返回确认信息
-        print(f"用户选择的论文: {selected_papers}")
+        data = request.get_json(silent=True) or {}
+        key = save_request_key(request.headers.get('Idempotency-Key'), data)
+        status, payload, headers = save_selected(get_user_id(), data.get('selected_papers', []), key)
+        return jsonify(payload), status, headers
         
-        return jsonify({
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def settle_saves(user_id):
+    """等待该用户排队中的保存请求写入储存库：读取储存库或按储存库排序之前调用，保证能读到刚保存的论文"""
+    if save_buffer is not None:
+        save_buffer.settle(user_id)
+
+
+def save_request_key(header, data):
+    """保存请求的幂等键：请求头 Idempotency-Key，或请求体中的 request_id"""
+    key = header or data.get('request_id')
+    return str(key)[:128] if key else None
+
+
+def save_selected(user_id, selected_papers, key=None):
+    """
+    保存用户选择的论文，返回 (状态码, 内容, 响应头)
+
+    开启写缓冲时加入队列后返回202，队列已满时返回429；否则直接写入储存库（一个事务，按标题去重）。
+    论文无法写入（如包含无法编码的字符）时返回400
+    """
+    if not isinstance(selected_papers, list):
+        return 400, {"error": "selected_papers 应为论文列表"}, {}
+    count = len(selected_papers)
+    if save_buffer is None:
+        try:
+            result = paper_library.save_papers(user_id, selected_papers, key)
+        except ValueError as e:
+            return 400, {"error": str(e)}, {}
+        log.info('papers_saved', saved=result['saved'], duplicates=result['duplicates'], replayed=result['replayed'])
+        return 200, {
             "success": True,
-            "message": f"成功保存 {len(selected_papers)} 篇论文",
-            "count": len(selected_papers)
-        }), 200
-        
+            "message": f"成功保存 {count} 篇论文",
+            "count": count,
+            "saved": result['saved'],
+            "duplicates": result['duplicates'],
+            "replayed": result['replayed'],
+        }, {}
+    try:
+        queued = save_buffer.submit(user_id, selected_papers, key)
+    except ValueError as e:
+        return 400, {"error": str(e)}, {}
+    except AdmissionRejected as e:
+        return too_many_requests(e)
+    return 202, {
+        "success": True,
+        "message": f"已提交保存 {count} 篇论文",
+        "count": count,
+        "queued": queued['queued'],
+        "duplicate": queued['duplicate'],
+    }, {}
+
+
+@app.route('/api/library', methods=['GET'])
+def list_library():
+    """分页获取储存库中的论文"""
+    try:
+        result = paper_library.list_papers(
+            get_user_id(),
+            page=request.args.get('page', 1, type=int),
+            page_size=request.args.get('page_size', 20, type=int),
+            sort=request.args.get('sort', 'newest'),
+        )
+        return jsonify(result), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/')
-def index():
-    """根路径提示信息"""
-    return """
+@app.route('/api/search', methods=['GET'])
+def search_library():
+    """在储存库中全文检索（q, page, page_size），按相关度排序"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "请输入搜索关键词"}), 400
+    try:
+        result = paper_library.search(
+            get_user_id(),
+            query,
+            page=request.args.get('page', 1, type=int),
+            page_size=request.args.get('page_size', 20, type=int),
+        )
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/library/sync', methods=['POST'])
+def sync_library():
+    """增量同步储存库：提交本地变更（cursor, changes, limit），返回游标之后服务器上的变更"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "请求体必须是JSON对象"}), 400
+    changes = data.get('changes') or []
+    if not isinstance(changes, list):
+        return jsonify({"error": "changes 必须是数组"}), 400
+    try:
+        result = paper_library.sync(
+            get_user_id(), data.get('cursor') or 0, changes, data.get('limit') or 500
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    log.info('library_synced', applied=result['applied'], conflicts=len(result['conflicts']),
+             changes=len(result['changes']), reset=result['reset'])
+    return jsonify(result), 200
+
+
+def export_headers(fmt):
+    """导出文件的响应头"""
+    content_type, extension = library_io.FORMATS[fmt]
+    return {
+        'Content-Type': f'{content_type}; charset=utf-8',
+        'Content-Disposition': f'attachment; filename="library.{extension}"',
+    }
+
+
+def log_import(fmt, result):
+    """记录一次导入的结果"""
+    fields = {key: value for key, value in result.items() if key != 'error'}
+    if result['error']:
+        log.warning('library_import_failed', format=fmt, error=result['error'], **fields)
+    else:
+        log.info('library_imported', format=fmt, **fields)
+
+
+@app.route('/api/library/export', methods=['GET'])
+def export_library():
+    """流式导出储存库（format=ndjson/json/csv/bibtex，默认ndjson），按保存时间从早到晚"""
+    try:
+        fmt = library_io.detect_format(request.args.get('format', 'ndjson'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    log.info('library_exported', format=fmt)
+    papers = paper_library.iter_papers(get_user_id())
+    return Response(library_io.write_papers(papers, fmt), headers=export_headers(fmt))
+
+
+@app.route('/api/library/import', methods=['POST'])
+def import_library():
+    """
+    流式导入论文（format 参数或 Content-Type 指定格式），按批写入并按标题去重
+
+    请求体边读边解析，不整体读入内存。文件格式错误时返回400，此前已导入的批次保留（重新导入会按标题去重）
+    """
+    try:
+        fmt = library_io.detect_format(request.args.get('format'), request.content_type)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    papers = library_io.read_papers(request.stream, fmt)
+    result = paper_library.import_papers(get_user_id(body=False), papers)
+    log_import(fmt, result)
+    return jsonify(result), 400 if result['error'] else 200
+
+
+@app.route('/api/library', methods=['DELETE'])
+def clear_library():
+    """清空储存库"""
+    deleted = paper_library.clear(get_user_id())
+    return jsonify({"success": True, "deleted": deleted}), 200
+
+
+@app.route('/api/library/<int:paper_id>', methods=['GET'])
+def get_library_paper(paper_id):
+    """获取储存库中的单篇论文"""
+    paper = paper_library.get_paper(get_user_id(), paper_id)
+    if paper is None:
+        return jsonify({"error": "论文不存在"}), 404
+    return jsonify(paper), 200
+
+
+@app.route('/api/library/<int:paper_id>', methods=['DELETE'])
+def delete_library_paper(paper_id):
+    """从储存库中删除论文"""
+    if not paper_library.delete_paper(get_user_id(), paper_id):
+        return jsonify({"error": "论文不存在"}), 404
+    return jsonify({"success": True}), 200
+
+
+def runtime_gauges(pool, inflight, queue):
+    """缓存、连接池、请求合并和准入队列的当前统计，作为 /metrics 中的gauge导出"""
+    cache = recommendation_cache.stats()
+    pool_stats = pool.stats()
+    coalesce = inflight.stats()
+    gauges = {
+        'xfind_cache_entries': ('推荐缓存条目数', cache['entries']),
+        'xfind_cache_hits': ('推荐缓存命中次数', cache['hits']),
+        'xfind_cache_misses': ('推荐缓存未命中次数', cache['misses']),
+        'xfind_pool_connections_in_use': ('正在使用的上游连接数', pool_stats['in_use']),
+        'xfind_pool_connections_idle': ('空闲的上游连接数', pool_stats['idle']),
+        'xfind_pool_connections_created': ('新建的上游连接总数', pool_stats['created']),
+        'xfind_pool_connections_reused': ('复用上游连接的次数', pool_stats['reused']),
+        'xfind_inflight_requests': ('进行中的上游请求数', coalesce['in_flight']),
+        'xfind_upstream_calls': ('实际发出的上游调用数', coalesce['upstream_calls']),
+        'xfind_coalesced_callers': ('合并到进行中请求的调用数', coalesce['coalesced_callers']),
+        'xfind_circuit_open': ('上游熔断状态（0 正常，1 熔断，2 探测中）',
+                               ('closed', 'open', 'half_open').index(upstream_guard.breaker.state)),
+        'xfind_upstream_attempt_timeout_seconds': ('当前单次上游尝试的超时', upstream_guard.timeouts.current()),
+        'xfind_upstream_retries': ('上游调用的重试次数', upstream_guard.retries),
+        'xfind_admission_active': ('占用准入名额的上游调用数', queue.active),
+        'xfind_admission_queued': ('排队等待上游名额的请求数', queue.queued),
+        'xfind_prefetched': ('后台预取成功的研究方向数', prefetch_scheduler.prefetched),
+        'xfind_prefetch_budget_remaining': ('最近一小时剩余的预取调用次数', prefetch_scheduler.budget.remaining()),
+        'xfind_response_bytes_uncompressed': ('完整响应体压缩前的总字节数', response_encoder.bytes_in),
+        'xfind_response_bytes_sent': ('完整响应体实际发送的总字节数（压缩后，304不含响应体）', response_encoder.bytes_out),
+        'xfind_responses_not_modified': ('返回304的条件请求数', response_encoder.not_modified),
+    }
+    if save_buffer is not None:
+        saves = save_buffer.stats()
+        gauges.update({
+            'xfind_save_buffer_pending': ('写缓冲中还没有写入的论文数', saves['pending']),
+            'xfind_save_buffer_flushed': ('写缓冲已写入的论文数', saves.get('flushed', 0)),
+            'xfind_save_buffer_rejected': ('写缓冲已满被拒绝的保存请求数', saves.get('rejected', 0)),
+            'xfind_save_buffer_dropped': ('写入失败被丢弃的保存请求数（数据无法写入）', saves.get('dropped', 0)),
+        })
+    return gauges
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus指标"""
+    body = metrics.render(runtime_gauges(workflow_pool, inflight_requests, admission_queue))
+    return Response(body, content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/api/admission-stats', methods=['GET'])
+def admission_stats():
+    """查看限流和排队情况"""
+    return jsonify({"rate_limit": rate_limiter.stats(), "queue": admission_queue.stats()}), 200
+
+
+@app.route('/api/upstream-stats', methods=['GET'])
+def upstream_stats():
+    """查看熔断状态、当前超时和重试情况"""
+    return jsonify(upstream_guard.stats()), 200
+
+
+@app.route('/api/prefetch-stats', methods=['GET'])
+def prefetch_stats():
+    """查看热门研究方向和后台预取情况"""
+    return jsonify(dict(prefetch_scheduler.stats(), enabled=PREFETCH_ENABLED)), 200
+
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """查看推荐缓存命中情况"""
+    pool = candidate_pool.stats() if candidate_pool is not None else None
+    ranking = library_ranker.stats() if library_ranker is not None else None
+    return jsonify(dict(recommendation_cache.stats(), similar=topic_index.stats(), papers=paper_store.stats(),
+                        pool=pool, ranking=ranking, compression=response_encoder.stats(),
+                        recording=response_recorder.stats(),
+                        save_buffer=save_buffer.stats() if save_buffer is not None else None)), 200
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """存活检查：进程能够处理请求即返回200"""
+    return jsonify(dict(worker_state.stats(), status='ok')), 200
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """就绪检查：停止中或数据库不可访问时返回503，负载均衡器据此不再转发请求"""
+    status, payload = readiness()
+    return jsonify(payload), status
+
+
+def readiness():
+    """
+    就绪检查，返回 (状态码, 内容)
+
+    上游熔断不影响就绪：缓存命中和储存库接口仍然可用，熔断状态只在 upstream 字段中给出
+    """
+    probes = [('library', paper_library.ping), ('cache', recommendation_cache.ping)]
+    if worker_flight is not None:
+        probes.append(('inflight', worker_flight.ping))
+    checks = {}
+    for name, ping in probes:
+        try:
+            ping()
+            checks[name] = 'ok'
+        except sqlite3.Error as e:
+            checks[name] = str(e)
+    
+    ready = not worker_state.draining and all(result == 'ok' for result in checks.values())
+    payload = dict(
+        worker_state.stats(),
+        status='ok' if ready else ('draining' if worker_state.draining else 'unavailable'),
+        checks=checks,
+        upstream=upstream_guard.breaker.state,
+    )
+    return (200 if ready else 503), payload
+
+
+@app.route('/api/pool-stats', methods=['GET'])
+def pool_stats():
+    """查看上游连接池使用情况"""
+    return jsonify(workflow_pool.stats()), 200
+
+
+@app.route('/api/coalesce-stats', methods=['GET'])
+def coalesce_stats():
+    """查看并发请求合并情况"""
+    workers = worker_flight.stats() if worker_flight is not None else None
+    return jsonify(dict(inflight_requests.stats(), workers=workers)), 200
+
+
+# 根路径的说明页面内容固定，ETag和压缩结果只计算一次
+INDEX_HTML = """
     <html>
     <head>
         <title>PaperSwipe API</title>
@@ -328,13 +1414,44 @@ def index():
             <h2>🔌 API 端点</h2>
             <ul>
                 <li><code>POST /api/get-papers</code> - 获取论文推荐</li>
+                <li><code>GET /api/get-papers?research_topic=...</code> - 获取论文推荐（支持ETag/304）</li>
+                <li><code>GET /api/get-papers?cursor=...</code> - 更多论文（按结果中的 next_cursor 分页）</li>
+                <li><code>POST /api/get-papers/stream</code> - 流式获取论文推荐（SSE）</li>
+                <li><code>POST /api/get-papers/batch</code> - 批量获取论文推荐（NDJSON）</li>
                 <li><code>POST /api/save-selection</code> - 保存论文选择</li>
+                <li><code>GET /api/library</code> - 分页获取储存库（page, page_size, sort）</li>
+                <li><code>GET|DELETE /api/library/&lt;id&gt;</code> - 查看/删除单篇论文</li>
+                <li><code>POST /api/library/sync</code> - 储存库增量同步（游标、墓碑、最后写入者胜）</li>
+                <li><code>GET /api/library/export</code> - 流式导出储存库（format=ndjson/json/csv/bibtex）</li>
+                <li><code>POST /api/library/import</code> - 流式导入论文（同上四种格式，按标题去重）</li>
+                <li><code>GET /api/search?q=</code> - 储存库全文检索</li>
+                <li><code>GET /healthz</code> - 存活检查</li>
+                <li><code>GET /readyz</code> - 就绪检查（停止中或数据库不可用时返回503）</li>
+                <li><code>GET /api/cache-stats</code> - 推荐缓存统计</li>
+                <li><code>GET /api/coalesce-stats</code> - 请求合并统计</li>
+                <li><code>GET /api/admission-stats</code> - 限流与排队统计</li>
+                <li><code>GET /api/upstream-stats</code> - 上游熔断状态、自适应超时与重试统计</li>
+                <li><code>GET /api/prefetch-stats</code> - 热门研究方向与后台预取统计</li>
+                <li><code>GET /api/pool-stats</code> - 上游连接池统计</li>
+                <li><code>GET /metrics</code> - Prometheus指标（各阶段耗时直方图）</li>
             </ul>
         </div>
     </body>
     </html>
     """
 
+index_response = StaticResponse(INDEX_HTML, 'text/html; charset=utf-8', response_encoder)
+
+
+@app.route('/')
+def index():
+    """根路径提示信息"""
+    status, body, headers = index_response.encode(
+        request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match')
+    )
+    headers['Cache-Control'] = 'no-cache'
+    return Response(body, status=status, mimetype='text/html', headers=headers)
+
 
 if __name__ == '__main__':
     print("服务器启动在 http://localhost:5000")
@@ -342,6 +1459,7 @@ if __name__ == '__main__':
     print("⚠️  注意：这是API服务器，不提供网页界面")
     print("📋 请在浏览器中打开 index.html 文件")
     print("   或运行: python -m http.server 8080")
+    print("🚀 线上部署请使用多进程模式: python prefork.py --workers 4")
     print("=" * 50)
     app.run(debug=True, host='0.0.0.0', port=5000)
 
@@ -0,0 +1,196 @@
+"""
+批量推荐 - 一次请求获取多个研究方向的论文，按完成顺序逐行返回（NDJSON）
+
+每个研究方向独立调用工作流，由有上限的线程池（异步模式下由信号量）控制并发，
+总耗时取决于最慢的几个研究方向，而不是所有研究方向的耗时之和。
+- 命中缓存的研究方向立即返回
+- 每个研究方向从开始执行算起有单独的超时，超时后不再等待（上游调用仍在后台完成并写入缓存）
+- 客户端断开时取消还没开始执行的研究方向，不浪费工作流额度
+
+每行一个JSON对象：
+    {"index": 0, "topic": "...", "status": "ok", "cached": false, "elapsed_ms": 21034, "result": {"papers": [...]}}
+    {"index": 1, "topic": "...", "status": "error", "error": "...", "code": 10013, "elapsed_ms": 812}
+    {"index": 2, "topic": "...", "status": "timeout", "elapsed_ms": 90000}
+    {"index": 3, "topic": "...", "status": "error", "error": "...", "reason": "queue_timeout", "retry_after": 8, "elapsed_ms": 90000}
+最后一行是汇总：
+    {"done": true, "total": 4, "ok": 1, "error": 2, "timeout": 1, "elapsed_ms": 90012}
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import math
+import time
+
+from cache import normalize_topic
+
+
+def parse_topics(raw, max_topics):
+    """
+    校验并去重研究方向列表（按归一化后的研究方向去重，保留第一次出现的写法）
+
+    格式不对时抛出 ValueError
+    """
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("topics 必须是非空的研究方向列表")
+
+    topics, seen = [], set()
+    for topic in raw:
+        if not isinstance(topic, str) or not topic.strip():
+            raise ValueError("研究方向必须是非空字符串")
+        key = normalize_topic(topic)
+        if key not in seen:
+            seen.add(key)
+            topics.append(topic.strip())
+
+    if len(topics) > max_topics:
+        raise ValueError(f"一次最多 {max_topics} 个研究方向（收到 {len(topics)} 个）")
+    return topics
+
+
+def ndjson_line(record):
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _elapsed_ms(start):
+    return round((time.monotonic() - start) * 1000)
+
+
+def _result_record(index, topic, result, start, cached=False, shared=False):
+    if not (isinstance(result, dict) and 'papers' in result):
+        return {"index": index, "topic": topic, "status": "error",
+                "error": "未能从工作流响应中解析出论文", "elapsed_ms": _elapsed_ms(start)}
+    return {"index": index, "topic": topic, "status": "ok", "cached": cached, "coalesced": shared,
+            "elapsed_ms": _elapsed_ms(start), "result": result}
+
+
+def _error_record(index, topic, error, start):
+    record = {"index": index, "topic": topic, "status": "error", "error": str(error),
+              "elapsed_ms": _elapsed_ms(start)}
+    if getattr(error, 'code', None) is not None:
+        record["code"] = error.code
+    # 被准入控制拒绝（或熔断中）时带上原因和建议的重试等待秒数
+    if getattr(error, 'reason', None) is not None:
+        record["reason"] = error.reason
+    if getattr(error, 'retry_after', None) is not None:
+        record["retry_after"] = math.ceil(error.retry_after)
+    return record
+
+
+def _timeout_record(index, topic, start):
+    return {"index": index, "topic": topic, "status": "timeout", "elapsed_ms": _elapsed_ms(start)}
+
+
+class _Summary:
+    def __init__(self, total):
+        self.start = time.monotonic()
+        self.counts = {"ok": 0, "error": 0, "timeout": 0}
+        self.total = total
+
+    def add(self, record):
+        self.counts[record["status"]] += 1
+        return record
+
+    def record(self):
+        return dict({"done": True, "total": self.total}, **self.counts, elapsed_ms=_elapsed_ms(self.start))
+
+
+def iter_batch(topics, lookup, fetch, executor, timeout):
+    """
+    在线程池中获取多个研究方向的论文，按完成顺序逐个返回结果记录，最后返回汇总
+
+    lookup(topic): 查缓存，未命中返回None
+    fetch(topic):  调用工作流，返回 (结果, 是否合并到了进行中的请求)
+    timeout:       每个研究方向从开始执行算起的超时（秒）
+    """
+    summary = _Summary(len(topics))
+    futures = {}
+    started = {}
+
+    def run(index, topic):
+        started[index] = time.monotonic()
+        return fetch(topic)
+
+    try:
+        for index, topic in enumerate(topics):
+            cached = lookup(topic)
+            if cached is not None:
+                yield summary.add(_result_record(index, topic, cached, time.monotonic(), cached=True))
+            else:
+                futures[executor.submit(run, index, topic)] = (index, topic)
+
+        pending = set(futures)
+        while pending:
+            # 等到下一个研究方向完成，或最早开始执行的那个超时
+            now = time.monotonic()
+            deadlines = [started[futures[f][0]] + timeout for f in pending if futures[f][0] in started]
+            wait_for = max(0.0, min(deadlines) - now) if deadlines else timeout
+            done, _ = concurrent.futures.wait(
+                pending, timeout=wait_for, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+
+            for future in done:
+                pending.discard(future)
+                index, topic = futures[future]
+                start = started.get(index, now)
+                try:
+                    result, shared = future.result()
+                except Exception as e:
+                    yield summary.add(_error_record(index, topic, e, start))
+                else:
+                    yield summary.add(_result_record(index, topic, result, start, shared=shared))
+
+            now = time.monotonic()
+            for future in [f for f in pending if futures[f][0] in started]:
+                index, topic = futures[future]
+                if now - started[index] >= timeout:
+                    # 线程里的上游调用无法中断，不再等待；完成后结果照常写入缓存
+                    pending.discard(future)
+                    yield summary.add(_timeout_record(index, topic, started[index]))
+
+        yield summary.record()
+
+    finally:
+        # 客户端断开（生成器被关闭）时，还没开始的研究方向不再执行
+        for future in futures:
+            future.cancel()
+
+
+async def aiter_batch(topics, lookup, fetch, concurrency, timeout):
+    """
+    iter_batch 的异步版本：用信号量限制并发，超时的研究方向直接取消等待
+
+    lookup(topic) 和 fetch(topic) 都是协程（查缓存可能读SQLite，由调用方放到线程池），
+    fetch 返回 (结果, 是否合并到了进行中的请求)
+    """
+    summary = _Summary(len(topics))
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(index, topic):
+        async with slots:
+            start = time.monotonic()
+            try:
+                result, shared = await asyncio.wait_for(fetch(topic), timeout)
+            except asyncio.TimeoutError:
+                return _timeout_record(index, topic, start)
+            except Exception as e:
+                return _error_record(index, topic, e, start)
+            return _result_record(index, topic, result, start, shared=shared)
+
+    tasks = []
+    try:
+        for index, topic in enumerate(topics):
+            cached = await lookup(topic)
+            if cached is not None:
+                yield summary.add(_result_record(index, topic, cached, time.monotonic(), cached=True))
+            else:
+                tasks.append(asyncio.ensure_future(run(index, topic)))
+
+        for next_done in asyncio.as_completed(tasks):
+            yield summary.add(await next_done)
+
+        yield summary.record()
+
+    finally:
+        for task in tasks:
+            task.cancel()
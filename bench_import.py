@@ -0,0 +1,97 @@
+"""
+储存库导入导出基准 - 迁移大储存库需要多长时间、占用多少内存
+
+用 bench_search 的随机论文生成器逐篇生成导入文件（不在内存中保存论文列表），然后对每种格式：
+- 导入到新的临时数据库（LibraryStore.import_papers，每批一个事务）
+- 再导入一次同一个文件（全部是重复，测试去重的开销）
+- 流式导出（LibraryStore.iter_papers + library_io.write_papers）
+报告耗时、每秒篇数和进程最大常驻内存（RSS）。读写都是流式的，RSS不随论文数增长。
+
+用法：
+    python bench_import.py
+    python bench_import.py -n 100000 --formats ndjson bibtex
+"""
+
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import library_io
+from bench_search import PaperGenerator
+from library_store import LibraryStore
+
+
+def max_rss_mb():
+    """进程至今的最大常驻内存（MB）"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位，macOS 以字节为单位
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def write_input(path, fmt, count):
+    generator = PaperGenerator(count)
+    papers = (generator.make_paper(i) for i in range(count))
+    with open(path, 'wb') as f:
+        for chunk in library_io.write_papers(papers, fmt):
+            f.write(chunk)
+    return os.path.getsize(path)
+
+
+def timed_import(store, path, fmt):
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        result = store.import_papers("bench", library_io.read_papers(f, fmt))
+    return result, time.perf_counter() - start
+
+
+def bench_format(fmt, count, workdir):
+    path = os.path.join(workdir, f"papers.{library_io.FORMATS[fmt][1]}")
+    size = write_input(path, fmt, count)
+    store = LibraryStore(os.path.join(workdir, f"library_{fmt}.db"))
+
+    result, import_time = timed_import(store, path, fmt)
+    duplicate, duplicate_time = timed_import(store, path, fmt)
+
+    start = time.perf_counter()
+    exported = sum(len(chunk) for chunk in library_io.write_papers(store.iter_papers("bench"), fmt))
+    export_time = time.perf_counter() - start
+
+    return {
+        "format": fmt,
+        "file_mb": size / 1e6,
+        "saved": result["saved"],
+        "duplicates": duplicate["duplicates"],
+        "import": import_time,
+        "reimport": duplicate_time,
+        "export": export_time,
+        "export_mb": exported / 1e6,
+        "rss": max_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="储存库导入导出基准")
+    parser.add_argument('-n', '--papers', type=int, default=20000, help="论文数")
+    parser.add_argument('--formats', nargs='+', default=list(library_io.FORMATS), choices=list(library_io.FORMATS))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_import_")
+    try:
+        print(f"{args.papers} 篇论文，初始RSS {max_rss_mb():.0f}MB")
+        print(f"{'格式':<8}{'文件':>9}{'导入':>9}{'篇/秒':>9}{'重复导入':>10}{'导出':>9}{'最大RSS':>10}")
+        print("=" * 66)
+        for fmt in args.formats:
+            r = bench_format(fmt, args.papers, workdir)
+            rate = r['saved'] / r['import'] if r['import'] else 0
+            print(f"{fmt:<8}{r['file_mb']:>7.1f}MB{r['import']:>8.2f}s{rate:>9.0f}"
+                  f"{r['reimport']:>9.2f}s{r['export']:>8.2f}s{r['rss']:>8.0f}MB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
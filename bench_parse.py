@@ -0,0 +1,112 @@
+"""
+解析性能基准 - 对比旧的正则+括号计数提取和 json_extract 一遍扫描提取
+
+样本来自 test_parse.py 的实际返回数据和 expected_format.json，
+覆盖纯JSON、代码块、尾部逗号、截断和大响应（100篇论文）几种情况。
+"分段喂入"列按32字符一段模拟流式响应，反映的是增量解析的总开销。
+
+用法：
+    python bench_parse.py
+    python bench_parse.py -n 5000
+"""
+
+import argparse
+import json
+import os
+import re
+import timeit
+
+from json_extract import PapersExtractor, extract_papers
+from test_parse import fixture_variants
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def legacy_extract(content):
+    """旧版 parse_api_response 中的提取逻辑（去掉日志），作为对照"""
+    content = content.strip()
+    json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
+    if json_match:
+        content = json_match.group(1)
+    else:
+        start = content.find('{')
+        if start != -1:
+            brace_count = 0
+            json_end = -1
+            for i in range(start, len(content)):
+                if content[i] == '{':
+                    brace_count += 1
+                elif content[i] == '}':
+                    brace_count -= 1
+                    if brace_count == 0:
+                        json_end = i + 1
+                        break
+            if json_end != -1:
+                content = content[start:json_end]
+    try:
+        parsed = json.loads(content)
+        if 'papers' in parsed:
+            return parsed
+    except json.JSONDecodeError:
+        try:
+            content_fixed = re.sub(r',\s*}', '}', content)
+            content_fixed = re.sub(r',\s*]', ']', content_fixed)
+            parsed = json.loads(content_fixed)
+            if 'papers' in parsed:
+                return parsed
+        except Exception:
+            pass
+    return None
+
+
+def chunked_extract(content, size=32):
+    """模拟流式响应：按固定大小分段喂入"""
+    extractor = PapersExtractor()
+    for i in range(0, len(content), size):
+        extractor.feed(content[i:i + size])
+    return extractor.result()
+
+
+def build_samples():
+    """构建测试样本"""
+    samples = dict(fixture_variants())
+
+    with open(os.path.join(HERE, 'expected_format.json'), encoding='utf-8') as f:
+        expected = f.read()
+    samples["中文示例"] = expected
+
+    papers = json.loads(expected)['papers']
+    large = {"papers": [dict(p, title=f"{p['title']} #{i}") for i in range(20) for p in papers]}
+    samples["大响应(100篇)"] = "```json\n" + json.dumps(large, ensure_ascii=False, indent=2) + "\n```"
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比论文JSON提取方法的性能")
+    parser.add_argument('-n', '--number', type=int, default=2000, help="每个样本的重复次数")
+    args = parser.parse_args()
+
+    methods = [
+        ("旧版提取", legacy_extract),
+        ("一遍扫描", extract_papers),
+        ("分段喂入", chunked_extract),
+    ]
+
+    print(f"{'样本':<14}{'长度':>8}  " + "".join(f"{name:>14}" for name, _ in methods))
+    print("=" * (24 + 14 * len(methods)))
+
+    for name, text in build_samples().items():
+        cells = []
+        for _, fn in methods:
+            result = fn(text)
+            count = len(result['papers']) if result else 0
+            per_call = min(timeit.repeat(lambda: fn(text), number=args.number, repeat=3)) / args.number
+            cells.append(f"{per_call * 1e6:8.1f}µs/{count:<3d}")
+        print(f"{name:<14}{len(text):>8}  " + "".join(f"{c:>14}" for c in cells))
+
+    print("=" * (24 + 14 * len(methods)))
+    print("每格: 单次耗时 / 提取到的论文数")
+
+
+if __name__ == '__main__':
+    main()
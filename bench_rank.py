@@ -0,0 +1,86 @@
+"""
+个性化排序基准 - 给一组推荐的论文按用户储存库重新排序需要多长时间
+
+用 bench_search 的随机论文生成器生成用户已保存的论文和候选论文，分别测量：
+- 冷启动：候选论文的向量还没有缓存（第一次出现的论文），包括分词和特征哈希
+- 缓存命中：候选论文的向量已经缓存（缓存结果、候选列表中的论文），只计算得分和排序
+有NumPy时同时给出不用NumPy（纯Python稀疏向量）的对照。
+
+用法：
+    python bench_rank.py
+    python bench_rank.py --saved 200 --candidates 10 100 1000 -n 50
+"""
+
+import argparse
+import statistics
+import time
+
+import topic_index
+from bench_search import PaperGenerator
+from papers import paper_fingerprint
+from ranking import LibraryRanker
+
+
+def make_papers(generator, start, count):
+    papers = [generator.make_paper(i) for i in range(start, start + count)]
+    for paper in papers:
+        paper['fingerprint'] = paper_fingerprint(paper)
+    return papers
+
+
+def make_changes(saved):
+    """模拟 LibraryStore.sync：一次返回所有已保存的论文"""
+    changes = [{"op": "upsert", "version": i + 1, "key": f"k{i}", "paper": paper} for i, paper in enumerate(saved)]
+
+    def sync(user_id, cursor):
+        return {"cursor": len(changes), "changes": changes[cursor:], "has_more": False, "reset": False}
+
+    return sync
+
+
+def bench(saved, candidates, rounds):
+    """返回 (冷启动毫秒, 缓存命中毫秒中位数)"""
+    ranker = LibraryRanker(make_changes(saved))
+    ranker.rank("bench", candidates[:1])  # 先建好兴趣向量，不计入冷启动
+
+    start = time.perf_counter()
+    ranker.rank("bench", candidates)
+    cold = time.perf_counter() - start
+
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        ranker.rank("bench", candidates)
+        samples.append(time.perf_counter() - start)
+    return cold * 1000, statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="个性化排序延迟基准")
+    parser.add_argument('--saved', type=int, default=500, help="用户已保存的论文数")
+    parser.add_argument('--candidates', type=int, nargs='+', default=[5, 100, 1000])
+    parser.add_argument('-n', '--rounds', type=int, default=30, help="缓存命中时的重复次数")
+    args = parser.parse_args()
+
+    generator = PaperGenerator(1)
+    saved = make_papers(generator, 0, args.saved)
+    pool = make_papers(generator, args.saved, max(args.candidates))
+
+    numpy = topic_index.load_numpy()
+    backends = [("numpy", numpy), ("python", False)] if numpy is not None else [("python", False)]
+    print(f"已保存 {args.saved} 篇论文")
+    print(f"{'实现':<8}{'候选数':>8}{'冷启动':>12}{'缓存命中':>12}")
+    print("=" * 40)
+    try:
+        for name, module in backends:
+            # 替换 load_numpy 缓存的模块，False 表示没有安装
+            topic_index._numpy = module
+            for count in args.candidates:
+                cold, warm = bench(saved, pool[:count], args.rounds)
+                print(f"{name:<8}{count:>10}{cold:>10.2f}ms{warm:>10.2f}ms")
+    finally:
+        topic_index._numpy = numpy or False
+
+
+if __name__ == '__main__':
+    main()
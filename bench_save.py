@@ -0,0 +1,115 @@
+"""
+保存请求写入基准 - 写缓冲（SaveBuffer，多个请求合并为一个事务）与每个请求单独提交一个事务对比
+
+模拟高峰期：多个线程并发发送保存请求，每个请求是一个用户一次划卡选中的几篇论文（bench_search 的随机论文）。
+- 逐个提交：每个请求调用一次 LibraryStore.save_papers（一个事务），与关闭写缓冲时相同
+- 写缓冲：每个请求调用 SaveBuffer.submit 后返回，后台线程按批写入；计时到全部写入完成为止
+报告每秒写入的论文数、每秒处理的请求数和请求延迟（写缓冲的延迟只是加入队列的时间）。
+
+用法：
+    python bench_save.py
+    python bench_save.py -n 20000 --threads 32 --papers 5 --batch-size 1000
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from admission import AdmissionRejected
+from bench_search import PaperGenerator
+from library_store import LibraryStore
+from save_buffer import SaveBuffer
+
+
+def make_requests(count, papers_per_request):
+    generator = PaperGenerator(count * papers_per_request)
+    return [
+        (f"user{i % 1000}", [generator.make_paper(i * papers_per_request + k) for k in range(papers_per_request)],
+         f"req{i}")
+        for i in range(count)
+    ]
+
+
+def run_threads(requests, threads, send):
+    """threads 个线程分摊发送 requests，返回每个请求的延迟（秒）"""
+    latencies = [[] for _ in range(threads)]
+
+    def worker(index):
+        for user_id, papers, key in requests[index::threads]:
+            start = time.perf_counter()
+            send(user_id, papers, key)
+            latencies[index].append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return [latency for part in latencies for latency in part]
+
+
+def bench_direct(store, requests, threads):
+    start = time.perf_counter()
+    latencies = run_threads(requests, threads, store.save_papers)
+    return time.perf_counter() - start, latencies, None
+
+
+def bench_buffered(store, requests, threads, batch_size, flush_interval, spool_path):
+    buffer = SaveBuffer(store, max_records=batch_size * 20, batch_size=batch_size,
+                        flush_interval=flush_interval, spool_path=spool_path)
+
+    def send(user_id, papers, key):
+        # 队列已满时按 Retry-After 的方式等待后重试（这里只等一个写入间隔）
+        while True:
+            try:
+                return buffer.submit(user_id, papers, key)
+            except AdmissionRejected:
+                time.sleep(flush_interval)
+
+    start = time.perf_counter()
+    latencies = run_threads(requests, threads, send)
+    buffer.close()
+    return time.perf_counter() - start, latencies, buffer.stats()
+
+
+def report(name, requests, elapsed, latencies, papers_per_request):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<10}{len(requests) * papers_per_request / elapsed:>12.0f}{len(requests) / elapsed:>12.0f}"
+          f"{statistics.median(latencies) * 1000:>10.2f}ms{p99 * 1000:>10.2f}ms{elapsed:>9.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="保存请求写入基准")
+    parser.add_argument('-n', '--requests', type=int, default=5000, help="保存请求数")
+    parser.add_argument('--papers', type=int, default=5, help="每个请求的论文数")
+    parser.add_argument('--threads', type=int, default=16, help="并发线程数")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--flush-interval', type=float, default=0.2)
+    args = parser.parse_args()
+
+    requests = make_requests(args.requests, args.papers)
+    workdir = tempfile.mkdtemp(prefix="bench_save_")
+    try:
+        print(f"{args.requests} 个请求 × {args.papers} 篇论文，{args.threads} 个线程")
+        print(f"{'方式':<8}{'论文/秒':>11}{'请求/秒':>10}{'延迟p50':>11}{'延迟p99':>10}{'总耗时':>9}")
+        print("=" * 62)
+        elapsed, latencies, _ = bench_direct(LibraryStore(os.path.join(workdir, "direct.db")), requests, args.threads)
+        report("逐个提交", requests, elapsed, latencies, args.papers)
+        elapsed, latencies, stats = bench_buffered(
+            LibraryStore(os.path.join(workdir, "buffered.db")), requests, args.threads,
+            args.batch_size, args.flush_interval, os.path.join(workdir, "spool.jsonl"),
+        )
+        report("写缓冲", requests, elapsed, latencies, args.papers)
+        print(f"\n写缓冲：{stats.get('flushes', 0)} 个事务，平均每批 {stats.get('avg_batch', 0)} 篇论文，"
+              f"队列已满拒绝 {stats.get('rejected', 0)} 次")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
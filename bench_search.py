@@ -0,0 +1,156 @@
+"""
+储存库检索基准 - 1k/10k/100k 篇论文时 /api/search 的查询延迟
+
+用随机生成的中英文论文填充临时数据库，对每种规模运行一组查询
+（英文词、前缀、中文词、多词组合），报告 LibraryStore.search 的 p50/p99。
+每篇论文带几个主题词，其余是按Zipf分布抽取的随机词，单个主题词大约命中5%~15%的论文；
+检索耗时主要取决于命中数（所有命中的论文都要计算bm25才能排序）。
+"线性扫描"列是 library.js 原来的做法（对每篇论文做小写 includes 匹配）在Python中的对照，
+只统计匹配，不含排序和分页。
+
+用法：
+    python bench_search.py
+    python bench_search.py --sizes 1000 10000 -n 500
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from library_store import LibraryStore
+
+EN_WORDS = (
+    "learning deep neural network graph transformer attention reinforcement "
+    "federated privacy diffusion generative model language vision robust "
+    "optimization causal inference retrieval recommendation medical imaging "
+    "segmentation detection contrastive representation sparse efficient"
+).split()
+
+ZH_WORDS = (
+    "深度学习 神经网络 图神经网络 强化学习 联邦学习 隐私保护 扩散模型 生成模型 "
+    "自然语言处理 计算机视觉 医学影像 目标检测 推荐系统 知识图谱 因果推断 对比学习"
+).split()
+
+AUTHORS = "Wang Li Zhang Liu Chen Smith Johnson Brown Garcia Kim 王伟 李娜 张敏 刘洋".split()
+
+QUERIES = [
+    "transformer",
+    "graph neural",
+    "optim",              # 前缀
+    "深度学习",
+    "医学影像 分割",
+    "联邦",
+    "diffusion 生成模型",
+    "Zhang",
+    "nonexistentterm",
+]
+
+
+def make_vocabulary(rng, size=20000):
+    """生成随机英文词和中文双字词，模拟真实文本中大量低频词"""
+    syllables = "ka lo mi ne tra sen vor pli qua dex gen ro tu mar fi zel".split()
+    english = {"".join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(size)}
+    chinese = {chr(rng.randint(0x4E00, 0x9FA5)) + chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(size // 4)}
+    return sorted(english), sorted(chinese)
+
+
+class PaperGenerator:
+    """随机生成中英混合的论文：少量主题词（查询会用到）+ 按Zipf分布抽取的填充词"""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.english, self.chinese = make_vocabulary(self.rng)
+        self.en_weights = [1 / (rank + 1) for rank in range(len(self.english))]
+        self.zh_weights = [1 / (rank + 1) for rank in range(len(self.chinese))]
+
+    def make_paper(self, i):
+        rng = self.rng
+        if rng.random() < 0.5:
+            filler = rng.choices(self.english, self.en_weights, k=60)
+            title = " ".join(rng.sample(EN_WORDS, 2) + filler[:5])
+            abstract = " ".join(rng.sample(EN_WORDS, 3) + filler[5:])
+        else:
+            filler = rng.choices(self.chinese, self.zh_weights, k=40)
+            title = "基于" + "".join(rng.sample(ZH_WORDS, 2) + filler[:3]) + "的研究"
+            abstract = "，".join(rng.sample(ZH_WORDS, 3) + filler[3:])
+        return {
+            "title": f"{title} {i}",
+            "authors": ", ".join(rng.sample(AUTHORS, 3)),
+            "abstract": abstract,
+            "year": rng.randint(2000, 2025),
+            "tags": rng.sample(EN_WORDS + ZH_WORDS, 2),
+        }
+
+
+def linear_filter(papers, query):
+    """library.js filterPapers 的等价实现"""
+    q = query.lower().strip()
+    return [
+        p for p in papers
+        if q in p['title'].lower() or q in p['authors'].lower() or q in p['abstract'].lower()
+        or any(q in tag.lower() for tag in p['tags'])
+    ]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def bench_size(size, rounds, workdir):
+    generator = PaperGenerator(size)
+    papers = [generator.make_paper(i) for i in range(size)]
+
+    store = LibraryStore(os.path.join(workdir, f"library_{size}.db"))
+    start = time.perf_counter()
+    for i in range(0, size, 1000):
+        store.save_papers("bench", papers[i:i + 1000])
+    insert_time = time.perf_counter() - start
+
+    fts, scan, hits = [], [], []
+    for r in range(rounds):
+        query = QUERIES[r % len(QUERIES)]
+        t0 = time.perf_counter()
+        result = store.search("bench", query, page=1, page_size=20)
+        fts.append(time.perf_counter() - t0)
+        hits.append(result['total'])
+
+        t0 = time.perf_counter()
+        linear_filter(papers, query)
+        scan.append(time.perf_counter() - t0)
+
+    return {
+        "size": size,
+        "insert": insert_time,
+        "p50": percentile(fts, 50),
+        "p99": percentile(fts, 99),
+        "scan_p50": percentile(scan, 50),
+        "avg_hits": sum(hits) / len(hits),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="储存库全文检索延迟基准")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('-n', '--rounds', type=int, default=300, help="每种规模的查询次数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_search_")
+    try:
+        print(f"{'论文数':>8}{'写入耗时':>10}{'检索p50':>10}{'检索p99':>10}{'线性扫描p50':>14}{'平均命中':>10}")
+        print("=" * 66)
+        for size in args.sizes:
+            r = bench_size(size, args.rounds, workdir)
+            print(f"{r['size']:>10}{r['insert']:>10.2f}s{r['p50'] * 1000:>10.2f}ms"
+                  f"{r['p99'] * 1000:>10.2f}ms{r['scan_p50'] * 1000:>14.2f}ms{r['avg_hits']:>10.0f}")
+        print("=" * 66)
+        print(f"查询: {', '.join(QUERIES)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+服务模式压测 - 在不同并发数下测试 /api/get-papers 的吞吐量、延迟和内存占用
+
+在本地启动模拟的星火工作流（upstream_sim.py），分别以Flask模式和异步（ASGI）模式启动后端，
+对每个并发数各跑一轮，输出吞吐量、延迟分位数和后端进程的内存占用。不消耗真实API额度。
+模拟服务的延迟、错误率和内容格式都可以配置（参数与 upstream_sim.py 相同）。
+
+压测测的是服务栈本身：每个请求带不同的 X-User-Id，后端启动时通过环境变量放开限流和排队
+（ADMISSION_CONFIG 的默认值是每个用户每分钟6次，所有请求来自127.0.0.1，不放开时几乎全部是429）。
+加 --admission 保留默认的准入配置，测试限流和排队本身。
+
+用法：
+    python bench_serving.py                              # 默认: 并发200，上游延迟2秒
+    python bench_serving.py -c 10 50 200 500 -n 2000 -d 5
+    python bench_serving.py -c 100 --formats plain:6,fenced:2,truncated:1,malformed:1 --error-rate 0.05
+    python bench_serving.py -c 20 -n 60 --admission         # 保留默认的限流和排队
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import upstream_sim
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_backend(mode, port, upstream_port, max_connections):
+    """以指定模式启动后端，并把上游指向本地模拟服务"""
+    import backend
+    from http_pool import AsyncConnectionPool, ConnectionPool
+
+    if mode == 'flask':
+        backend.workflow_pool = ConnectionPool(
+            '127.0.0.1', upstream_port, use_tls=False, max_connections=max_connections
+        )
+        # 与 python backend.py 相同的多线程开发服务器，关闭debug避免重载进程
+        backend.app.run(host='127.0.0.1', port=port, threaded=True)
+    else:
+        import asgi_backend
+        import uvicorn
+        asgi_backend.workflow_pool = AsyncConnectionPool(
+            '127.0.0.1', upstream_port, use_tls=False, max_connections=max_connections
+        )
+        uvicorn.run(asgi_backend.app, host='127.0.0.1', port=port,
+                    log_level='error', backlog=2048)
+
+
+def admission_env(concurrency):
+    """放开限流和排队的环境变量：令牌桶足够大，准入名额和排队长度不小于并发数"""
+    return {
+        'XFIND_ADMISSION_RATE_PER_MINUTE': '1000000',
+        'XFIND_ADMISSION_BURST': '1000000',
+        'XFIND_ADMISSION_MAX_CONCURRENT': str(concurrency),
+        'XFIND_ADMISSION_MAX_QUEUE': str(concurrency),
+        'XFIND_ADMISSION_ASYNC_MAX_CONCURRENT': str(concurrency),
+        'XFIND_ADMISSION_ASYNC_MAX_QUEUE': str(concurrency),
+    }
+
+
+def wait_for_port(port, timeout=15):
+    """等待服务开始监听"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/cache-stats')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"服务没有在 {timeout} 秒内启动 (端口 {port})")
+
+
+def process_memory(pid):
+    """读取进程当前和峰值常驻内存（MB），非Linux系统返回 (None, None)"""
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('VmRSS', 'VmHWM'):
+                    fields[name] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return fields.get('VmRSS'), fields.get('VmHWM')
+
+
+def percentile(values, p):
+    """计算分位数（values需已排序）"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run_load(port, concurrency, total, timeout):
+    """
+    并发请求 /api/get-papers，每个请求使用不同的研究方向（避免命中缓存和请求合并）和不同的用户标识
+
+    模拟服务返回错误或无法解析的内容时，后端仍会正常响应：
+    200且有papers计为成功，200但没有papers计为"无论文"，其余状态码和连接异常计为失败
+    """
+    latencies = []
+    no_papers = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        for i in counter:
+            body = json.dumps({"research_topic": f"bench topic {i} {time.time()}"})
+            start = time.perf_counter()
+            try:
+                conn.request('POST', '/api/get-papers', body,
+                             {'Content-Type': 'application/json', 'X-User-Id': f"bench-{i}"})
+                res = conn.getresponse()
+                data = res.read()
+                ok = res.status == 200
+                has_papers = ok and 'papers' in json.loads(data)
+            except Exception as e:
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+                ok, res = False, e
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok and has_papers:
+                    latencies.append(elapsed)
+                elif ok:
+                    no_papers.append(elapsed)
+                else:
+                    errors.append(getattr(res, 'status', repr(res)))
+        conn.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "ok": len(latencies),
+        "no_papers": len(no_papers),
+        "errors": len(errors),
+        "error_kinds": sorted(set(map(str, errors))),
+        "wall": wall,
+        "rps": len(latencies) / wall if wall else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在不同并发数下压测Flask模式和ASGI模式")
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[200], help="并发客户端数，可以给多个")
+    parser.add_argument('-n', '--requests', type=int, default=1000, help="每轮的总请求数")
+    parser.add_argument('--modes', default='flask,asgi', help="要测试的模式，逗号分隔")
+    parser.add_argument('--upstream-port', type=int, default=18080)
+    parser.add_argument('--port', type=int, default=18000)
+    parser.add_argument('--admission', action='store_true', help="保留默认的限流和排队配置")
+    upstream_sim.add_arguments(parser)
+    # 内部使用：在子进程中启动后端
+    parser.add_argument('--serve', choices=['flask', 'asgi'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_backend(args.serve, args.port, args.upstream_port, args.concurrency[0])
+        return
+
+    # 后端在临时目录中运行，储存库和缓存数据库不会留在项目目录
+    workdir = tempfile.mkdtemp(prefix='bench_serving_')
+
+    def spawn_backend(mode, concurrency):
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', mode,
+             '--port', str(args.port), '--upstream-port', str(args.upstream_port),
+             '-c', str(concurrency)],
+            cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            env=os.environ if args.admission else dict(os.environ, **admission_env(concurrency)),
+        )
+
+    print(f"每轮请求: {args.requests}  上游延迟: {args.latency}s ±{args.jitter}s  "
+          f"格式: {args.formats}  错误率: {args.error_rate}/{args.http_error_rate}")
+    print("=" * 100)
+    print(f"{'模式':6s}{'并发':>6s}{'成功':>7s}{'无论文':>7s}{'失败':>6s}{'req/s':>9s}"
+          f"{'p50':>8s}{'p95':>8s}{'p99':>8s}{'max':>8s}{'RSS':>9s}{'峰值RSS':>10s}")
+
+    upstream = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'upstream_sim.py'), '--port', str(args.upstream_port)]
+        + upstream_sim.to_argv(args),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(0.5)
+        for mode in args.modes.split(','):
+            for concurrency in args.concurrency:
+                # 每轮重启后端，峰值内存只反映本轮的并发数
+                server = spawn_backend(mode, concurrency)
+                try:
+                    wait_for_port(args.port)
+                    r = run_load(args.port, concurrency, args.requests,
+                                 timeout=(args.latency + args.jitter) * 10 + 30)
+                    rss, peak = process_memory(server.pid)
+                finally:
+                    server.terminate()
+                    server.wait()
+
+                memory = (f"{rss:7.1f}MB{peak:8.1f}MB" if rss is not None else f"{'-':>9s}{'-':>10s}")
+                print(f"{mode:6s}{concurrency:>6d}{r['ok']:>7d}{r['no_papers']:>7d}{r['errors']:>6d}"
+                      f"{r['rps']:>9.1f}{r['p50']:>7.2f}s{r['p95']:>7.2f}s{r['p99']:>7.2f}s"
+                      f"{r['max']:>7.2f}s{memory}")
+                if r['error_kinds']:
+                    print(f"{'':12s}失败原因: {', '.join(r['error_kinds'][:5])}")
+    finally:
+        upstream.terminate()
+        upstream.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # 理想情况下吞吐量 = 并发数 / 上游延迟
+    print("=" * 100)
+    print("理论上限: " + "  ".join(
+        f"并发{c} {c / args.latency:.1f} req/s" for c in args.concurrency if args.latency
+    ))
+
+
+if __name__ == '__main__':
+    main()
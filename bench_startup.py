@@ -0,0 +1,83 @@
+"""
+启动耗时基准 - 导入后端模块（工作进程冷启动、测试脚本启动）需要多长时间
+
+每次在新的子进程中导入一次模块，给出导入耗时（不含解释器启动）和进程总耗时的中位数，
+并用 python -X importtime 列出自身耗时最多的模块，找出拖慢启动的依赖。
+储存库和缓存文件放在临时目录，不影响当前目录下的 library.db。
+
+用法：
+    python bench_startup.py
+    python bench_startup.py --runs 20 --modules backend asgi_backend settings --top 15
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def run_once(module, env):
+    """在新进程中导入一次模块，返回 (导入秒数, 进程总秒数)"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', SNIPPET.format(module=module)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    total = time.perf_counter() - start
+    return float(result.stdout.strip().splitlines()[-1]), total
+
+
+def import_profile(module, env, top):
+    """python -X importtime 的结果中自身耗时最多的 top 个模块 [(毫秒, 累计毫秒, 模块)]"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(self_us) / 1000, int(cumulative_us) / 1000, name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument('--runs', type=int, default=10, help="每个模块导入的次数")
+    parser.add_argument('--modules', nargs='+', default=['settings', 'backend', 'asgi_backend'])
+    parser.add_argument('--top', type=int, default=10, help="列出自身耗时最多的模块数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = dict(os.environ)
+    env.setdefault('XFIND_LIBRARY_PATH', os.path.join(workdir, 'library.db'))
+    env.setdefault('XFIND_LOG_LEVEL', 'WARNING')
+
+    # 第一次导入会编译 .pyc，不计入结果
+    for module in args.modules:
+        run_once(module, env)
+
+    print(f"{'模块':<16}{'导入中位数':>12}{'导入最小值':>12}{'进程中位数':>12}")
+    print("=" * 52)
+    for module in args.modules:
+        samples = [run_once(module, env) for _ in range(args.runs)]
+        imports = [s[0] * 1000 for s in samples]
+        totals = [s[1] * 1000 for s in samples]
+        print(f"{module:<16}{statistics.median(imports):>10.1f}ms{min(imports):>10.1f}ms"
+              f"{statistics.median(totals):>10.1f}ms")
+
+    for module in args.modules:
+        print(f"\n{module} 自身耗时最多的模块（python -X importtime）")
+        print(f"{'自身':>10}{'累计':>10}  模块")
+        for self_ms, cumulative_ms, name in import_profile(module, env, args.top):
+            print(f"{self_ms:>8.1f}ms{cumulative_ms:>8.1f}ms  {name.strip()}")
+
+
+if __name__ == '__main__':
+    main()
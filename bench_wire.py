@@ -0,0 +1,113 @@
+"""
+响应体积基准 - 推荐结果、储存库分页和首页在各种编码下实际发送的字节数
+
+通过Flask测试客户端请求真实的接口（经过 encode_response），对比：
+- 原始：中文转义为 \\uXXXX、不压缩（本次改动之前的行为）
+- UTF-8：中文直接输出UTF-8
+- gzip / br：UTF-8 + 按 Accept-Encoding 压缩（br 需要安装 brotli 包）
+- 304：客户端带着上次的ETag重复请求，内容未变化时只返回响应头
+
+推荐结果来自 expected_format.json（规范化后）；储存库分页用 upstream_sim 的论文模板按研究方向生成，
+与本地模拟上游返回的内容相同。响应头按 "名称: 值\\r\\n" 估算字节数。
+
+用法：
+    python bench_wire.py
+    python bench_wire.py --library-size 200 --page-size 50
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import backend
+from http_encoding import available_encodings
+from library_store import LibraryStore
+from upstream_sim import UpstreamSimulator
+
+TOPIC = "机器学习在医疗诊断中的应用"
+
+
+def header_bytes(response):
+    return sum(len(f"{name}: {value}\r\n".encode('utf-8')) for name, value in response.headers.items())
+
+
+def measure(client, url, headers):
+    """返回 (状态码, 响应体字节数, 响应头字节数, ETag)"""
+    response = client.get(url, headers=headers)
+    return response.status_code, len(response.data), header_bytes(response), response.headers.get('ETag')
+
+
+def run_scenarios(client, url, user_headers):
+    """依次测量各种编码，返回 [(名称, 状态码, 响应体, 响应头)]"""
+    results = []
+    encoder = backend.response_encoder
+
+    backend.app.json.ensure_ascii, encoder.enabled = True, False
+    results.append(("原始", *measure(client, url, user_headers)[:3]))
+
+    backend.app.json.ensure_ascii = False
+    results.append(("UTF-8", *measure(client, url, user_headers)[:3]))
+
+    encoder.enabled = True
+    etag = None
+    encodings = ['gzip'] + (['br'] if 'br' in available_encodings() else [])
+    for encoding in encodings:
+        status, body, head, etag = measure(client, url, dict(user_headers, **{'Accept-Encoding': encoding}))
+        results.append((encoding, status, body, head))
+
+    status, body, head, _ = measure(
+        client, url, dict(user_headers, **{'Accept-Encoding': encodings[-1], 'If-None-Match': etag})
+    )
+    results.append(("304", status, body, head))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应体积基准")
+    parser.add_argument('--library-size', type=int, default=120, help="储存库中的论文数")
+    parser.add_argument('--page-size', type=int, default=30, help="储存库每页论文数（library.js 为30）")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_wire_")
+    saved_library = backend.paper_library
+    try:
+        backend.paper_library = LibraryStore(os.path.join(workdir, "library.db"))
+        sim = UpstreamSimulator()
+        papers = []
+        topics = ["深度学习", "联邦学习", "图神经网络", "强化学习", "知识图谱", "推荐系统"]
+        while len(papers) < args.library_size:
+            round_ = len(papers) // sim.papers
+            papers.extend(sim.papers_for(f"{topics[round_ % len(topics)]} {round_ // len(topics) + 1}"))
+        backend.paper_library.save_papers("bench", papers[:args.library_size])
+
+        with open('expected_format.json', encoding='utf-8') as f:
+            backend.recommendation_cache.set(TOPIC, backend.paper_store.normalize_result(json.load(f)))
+
+        client = backend.app.test_client()
+        user = {'X-User-Id': 'bench'}
+        endpoints = [
+            ("推荐结果", f"/api/get-papers?research_topic={TOPIC}"),
+            (f"储存库第1页（{args.page_size}篇）", f"/api/library?page=1&page_size={args.page_size}"),
+            ("首页", "/"),
+        ]
+
+        print(f"{'接口':<22}{'编码':>8}{'状态':>6}{'响应体':>10}{'响应头':>8}{'合计':>10}{'节省':>8}")
+        print("=" * 74)
+        for name, url in endpoints:
+            baseline = None
+            for encoding, status, body, head in run_scenarios(client, url, user):
+                total = body + head
+                baseline = baseline or total
+                print(f"{name:<22}{encoding:>8}{status:>6}{body:>10}{head:>8}{total:>10}"
+                      f"{1 - total / baseline:>8.0%}")
+                name = ""
+            print("-" * 74)
+    finally:
+        backend.paper_library = saved_library
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""
+推荐结果缓存 - 按研究方向缓存 parse_api_response 的解析结果
+
+相同的研究方向（忽略大小写和多余空白）在有效期内直接返回已解析的论文数据，
+不再请求星火工作流API。可选地写入SQLite文件，后端重启后缓存仍然有效。
+
+多进程部署（prefork.py）时各工作进程共用同一个SQLite文件（WAL模式）：内存中的条目相当于本进程的一级缓存，
+没有或已过期时再到文件中查找，一个进程写入的结果其他进程也能命中。
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_topic(topic):
+    """归一化研究方向：折叠空白并忽略大小写"""
+    return re.sub(r'\s+', ' ', topic or '').strip().casefold()
+
+
+class RecommendationCache:
+    """
+    带TTL过期和LRU淘汰的推荐结果缓存（线程安全）
+
+    stale_ttl: 过期后仍保留条目的时长（秒，从保存时算起），期间 get 视为未命中，
+               但上游不可用时可以通过 get_stale 返回过期的结果；默认等于 ttl（不保留）
+    loader:    从磁盘缓存加载的结果先经过该函数处理（例如论文规范化和驻留），默认原样使用
+    shared:    path 指定的文件由多个进程共用：内存中没有或已过期的条目再到文件中查找，
+               清空缓存时通知其他进程丢弃内存中的条目（最多延迟 sync_interval 秒）
+
+    磁盘缓存在第一次访问时才打开并加载，导入后端的耗时不随缓存文件的大小增长
+    """
+
+    def __init__(self, ttl=3600, max_entries=512, path=None, stale_ttl=None, loader=None,
+                 shared=False, sync_interval=1.0):
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl or 0)
+        self.max_entries = max_entries
+        self.path = path
+        self.loader = loader
+        self.shared = bool(shared and path)
+        self.sync_interval = sync_interval
+
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._db = None
+        self._opened = not path  # 磁盘缓存是否已经打开（没有文件时不需要打开）
+        self._generation = 0  # 共享文件被清空的次数，与文件中的不同时丢弃内存中的条目
+        self._synced_at = 0.0
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+        self.shared_hits = 0
+
+    def _open(self):
+        """第一次访问时打开磁盘缓存（调用方需持有锁）"""
+        if not self._opened:
+            self._open_db(self.path)
+            self._opened = True
+
+    def _open_db(self, path):
+        """打开磁盘缓存并加载未过期的条目"""
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        if self.shared:
+            # WAL模式下读写互不阻塞，多个进程可以同时查询
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS recommendations ("
+            " topic TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache_generation ("
+            " id INTEGER PRIMARY KEY CHECK (id = 1),"
+            " generation INTEGER NOT NULL)"
+        )
+        self._db.execute("INSERT OR IGNORE INTO cache_generation (id, generation) VALUES (1, 0)")
+        self._generation = self._db.execute("SELECT generation FROM cache_generation").fetchone()[0]
+        self._synced_at = time.monotonic()
+        self._db.execute(
+            "DELETE FROM recommendations WHERE stored_at < ?",
+            (time.time() - self.stale_ttl,)
+        )
+        self._db.commit()
+
+        rows = self._db.execute(
+            "SELECT topic, value, stored_at FROM recommendations"
+            " ORDER BY stored_at DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        # 按保存时间从旧到新插入，最新的排在LRU末尾
+        for topic, value, stored_at in reversed(rows):
+            value = json.loads(value)
+            self._entries[topic] = (stored_at, self.loader(value) if self.loader else value)
+
+    def get(self, topic):
+        """查询缓存，未命中或已过期时返回None"""
+        key = normalize_topic(topic)
+        with self._lock:
+            entry, shared = self._lookup(key, self.ttl)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            age = time.time() - stored_at
+            if age > self.ttl:
+                # 在 stale_ttl 内保留过期条目，供 get_stale 使用
+                if age > self.stale_ttl:
+                    self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.shared_hits += shared
+            return value
+
+    def peek(self, topic):
+        """查询未过期的结果，不计入命中统计、不影响LRU顺序（用于轮询其他进程是否已写入结果、取相似研究方向的结果）"""
+        key = normalize_topic(topic)
+        with self._lock:
+            entry, _ = self._lookup(key, self.ttl)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def get_stale(self, topic):
+        """
+        查询缓存（包括已过期但仍在 stale_ttl 内的条目），返回 (结果, 已保存秒数)，没有时返回None
+
+        用于上游不可用时降级返回
+        """
+        key = normalize_topic(topic)
+        with self._lock:
+            entry, _ = self._lookup(key, self.stale_ttl)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            age = time.time() - stored_at
+            if age > self.stale_ttl:
+                return None
+            self.stale_hits += 1
+            return value, age
+
+    def age(self, topic):
+        """缓存条目已保存的秒数，不存在或已过期时返回None（不计入命中统计，不影响LRU顺序）"""
+        with self._lock:
+            entry, _ = self._lookup(normalize_topic(topic), self.ttl)
+        if entry is None:
+            return None
+        age = time.time() - entry[0]
+        return age if age <= self.ttl else None
+
+    def topics(self):
+        """所有未过期条目的研究方向（归一化后的写法；共享文件时包括其他进程写入的）"""
+        now = time.time()
+        with self._lock:
+            self._open()
+            if self.shared:
+                rows = self._db.execute(
+                    "SELECT topic FROM recommendations WHERE stored_at >= ?"
+                    " ORDER BY stored_at DESC LIMIT ?",
+                    (now - self.ttl, self.max_entries)
+                ).fetchall()
+                return [topic for topic, in rows]
+            return [key for key, (stored_at, _) in self._entries.items() if now - stored_at <= self.ttl]
+
+    def _lookup(self, key, max_age):
+        """
+        查找条目（调用方需持有锁），返回 (条目或None, 是否来自共享文件)
+
+        共享文件时，内存中没有或已超过 max_age 的条目再到文件中查找其他进程写入的较新结果
+        """
+        self._open()
+        self._sync_generation()
+        entry = self._entries.get(key)
+        if not self.shared or (entry is not None and time.time() - entry[0] <= max_age):
+            return entry, False
+
+        row = self._db.execute(
+            "SELECT value, stored_at FROM recommendations WHERE topic = ?", (key,)
+        ).fetchone()
+        if row is None or (entry is not None and row[1] <= entry[0]):
+            return entry, False
+        value = json.loads(row[0])
+        entry = (row[1], self.loader(value) if self.loader else value)
+        self._entries[key] = entry
+        self._evict()
+        return entry, True
+
+    def _sync_generation(self):
+        """其他进程清空了共享文件时丢弃内存中的条目（调用方需持有锁，最多每 sync_interval 秒检查一次）"""
+        if not self.shared or time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = time.monotonic()
+        generation = self._db.execute("SELECT generation FROM cache_generation").fetchone()[0]
+        if generation != self._generation:
+            self._entries.clear()
+            self._generation = generation
+
+    def set(self, topic, value):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        key = normalize_topic(topic)
+        stored_at = time.time()
+        with self._lock:
+            self._open()
+            self._entries[key] = (stored_at, value)
+            self._entries.move_to_end(key)
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO recommendations (topic, value, stored_at)"
+                    " VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), stored_at)
+                )
+                if self.shared:
+                    # 各进程的内存容量分别计算，文件只保留最新的 max_entries 个条目
+                    self._db.execute(
+                        "DELETE FROM recommendations WHERE topic IN ("
+                        " SELECT topic FROM recommendations ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,)
+                    )
+                self._db.commit()
+
+            self._evict()
+
+    def _evict(self):
+        """超出容量时淘汰最久未使用的条目（调用方需持有锁）"""
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            if self.shared:
+                # 文件中的条目可能仍被其他进程使用，只从内存中淘汰
+                del self._entries[oldest]
+            else:
+                self._remove(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        """清空缓存（共享文件时其他进程也随之丢弃内存中的条目）"""
+        with self._lock:
+            self._open()
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM recommendations")
+                self._db.execute("UPDATE cache_generation SET generation = generation + 1")
+                self._db.commit()
+                self._generation = self._db.execute("SELECT generation FROM cache_generation").fetchone()[0]
+
+    def ping(self):
+        """检查磁盘缓存文件是否可以访问（就绪检查），不可访问时抛出 sqlite3.Error"""
+        if self.path:
+            with self._lock:
+                self._open()
+                self._db.execute("SELECT 1 FROM cache_generation").fetchone()
+
+    def _remove(self, key):
+        """删除条目（调用方需持有锁）"""
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM recommendations WHERE topic = ?", (key,))
+            self._db.commit()
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "persistent": bool(self.path),
+                "shared": self.shared,
+                "shared_hits": self.shared_hits,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale_ttl": self.stale_ttl,
+                "stale_hits": self.stale_hits,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
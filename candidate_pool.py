@@ -0,0 +1,223 @@
+"""
+候选论文池 - 同一研究方向"更多论文"的分页
+
+工作流每次只返回约5篇论文，用户看完之后重新提交会再跑一遍完整的工作流（翻译、arXiv检索、大模型），
+结果还经常与上一次重复。这里为每个研究方向保存一个候选列表：
+- 该研究方向每次上游调用得到的论文按指纹去重后追加到列表末尾（只追加，已有论文的位置不变）
+- 后续页从列表中读取，跳过用户已经看过（记录在游标中）和已经保存（储存库中）的论文
+- 列表中剩下的论文不够一页时才再调用一次上游，一次调用没有带来新论文，
+  或已经调用了 max_fetches 次时认为候选已经取完
+
+游标是不透明的字符串（base64url编码的JSON）：研究方向、下一页在列表中的起始位置，以及第一页论文的指纹
+（第一页来自推荐缓存，不一定在列表开头）。服务器端不保存会话，多进程部署时任何一个工作进程都能处理下一页。
+"""
+
+import base64
+import json
+import sqlite3
+import threading
+import time
+
+from cache import normalize_topic
+
+
+def encode_cursor(topic, offset, seen=()):
+    """生成游标：topic 为研究方向，offset 为下一页在候选列表中的起始位置，seen 为第一页论文的指纹"""
+    state = {"t": topic, "o": offset}
+    if seen:
+        state["s"] = list(seen)
+    raw = json.dumps(state, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (研究方向, 起始位置, 第一页论文的指纹集合)；格式不对时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        state = json.loads(raw.decode('utf-8'))
+        topic, offset, seen = state["t"], state["o"], state.get("s", [])
+    except (TypeError, ValueError, KeyError, AttributeError):
+        raise ValueError("无效的游标") from None
+    if not isinstance(topic, str) or not topic.strip() or not isinstance(offset, int) or offset < 0 \
+            or not isinstance(seen, list):
+        raise ValueError("无效的游标")
+    return topic, offset, frozenset(str(s) for s in seen)
+
+
+class CandidatePool:
+    """
+    按研究方向保存的候选论文列表（线程安全；path 指定文件时多个进程可以共用，WAL模式）
+
+    page_size:   请求没有指定时每页的篇数
+    ttl:         候选列表最后一次追加之后保留的秒数，过期后重新开始
+    max_size:    每个研究方向最多保存的论文数，满了之后认为候选已经取完
+    max_fetches: 每个研究方向最多合并多少次上游调用的结果（包括第一次）
+    max_topics:  最多保存的研究方向数，超出时删除最久没有追加的
+
+    第一次访问时才打开文件和建表
+    """
+
+    def __init__(self, path=None, page_size=5, ttl=86400, max_size=100, max_fetches=4, max_topics=1024):
+        self.path = path
+        self.page_size = page_size
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_fetches = max_fetches
+        self.max_topics = max_topics
+
+        self._lock = threading.Lock()
+        self._db = None
+
+        # 统计计数
+        self.pages = 0
+        self.appended = 0
+        self.fetches = 0
+
+    def _open(self):
+        """数据库连接，第一次调用时打开并建表（调用方需持有锁）"""
+        if self._db is not None:
+            return self._db
+        # 自动提交模式，追加时显式 BEGIN IMMEDIATE，多个进程同时追加同一研究方向时不会相互覆盖
+        db = sqlite3.connect(self.path or ':memory:', timeout=30, check_same_thread=False,
+                             isolation_level=None)
+        if self.path:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(
+            "CREATE TABLE IF NOT EXISTS candidate_topics ("
+            " topic TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " fetches INTEGER NOT NULL,"
+            " exhausted INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS candidate_papers ("
+            " topic TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " fingerprint TEXT NOT NULL,"
+            " paper TEXT NOT NULL,"
+            " PRIMARY KEY (topic, position),"
+            " UNIQUE (topic, fingerprint));"
+            "CREATE INDEX IF NOT EXISTS idx_candidate_topics_updated ON candidate_topics(updated_at);"
+        )
+        self._db = db
+        return db
+
+    def extend(self, topic, papers, fetched=True):
+        """
+        把一组论文（已规范化，带 fingerprint 字段）中还没有的追加到候选列表末尾，返回追加的篇数
+
+        fetched: 这组论文是否来自一次上游调用（从推荐缓存补建列表时为False，不计入调用次数）
+        """
+        key = normalize_topic(topic)
+        now = time.time()
+        with self._lock:
+            db = self._open()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self._prune(now)
+                row = db.execute(
+                    "SELECT size, fetches FROM candidate_topics WHERE topic = ?", (key,)
+                ).fetchone()
+                size, fetches = row if row is not None else (0, 0)
+                known = {fp for fp, in db.execute(
+                    "SELECT fingerprint FROM candidate_papers WHERE topic = ?", (key,)
+                )}
+                rows = []
+                for paper in papers:
+                    fingerprint = paper.get('fingerprint')
+                    if not fingerprint or fingerprint in known or size + len(rows) >= self.max_size:
+                        continue
+                    known.add(fingerprint)
+                    rows.append((key, size + len(rows), fingerprint, json.dumps(paper, ensure_ascii=False)))
+                db.executemany(
+                    "INSERT INTO candidate_papers (topic, position, fingerprint, paper) VALUES (?, ?, ?, ?)", rows
+                )
+                size += len(rows)
+                fetches += bool(fetched)
+                # 一次上游调用没有带来新论文时，再调用也多半是重复的结果
+                exhausted = size >= self.max_size or fetches >= self.max_fetches or (fetched and not rows)
+                db.execute(
+                    "INSERT OR REPLACE INTO candidate_topics (topic, size, fetches, exhausted, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, size, fetches, int(exhausted), now)
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            self.appended += len(rows)
+            self.fetches += bool(fetched)
+        return len(rows)
+
+    def _prune(self, now):
+        """删除过期和超出 max_topics 的研究方向（调用方需持有锁并已开始事务）"""
+        stale = [topic for topic, in self._db.execute(
+            "SELECT topic FROM candidate_topics WHERE updated_at < ?"
+            " UNION SELECT topic FROM ("
+            "  SELECT topic FROM candidate_topics ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (now - self.ttl, self.max_topics - 1)
+        )]
+        for topic in stale:
+            self._db.execute("DELETE FROM candidate_papers WHERE topic = ?", (topic,))
+            self._db.execute("DELETE FROM candidate_topics WHERE topic = ?", (topic,))
+
+    def page(self, topic, offset, limit, skip=frozenset(), exclude=None):
+        """
+        从 offset 开始读取一页（最多 limit 篇），跳过 skip 中的指纹和 exclude 返回的指纹
+
+        exclude: 可选，接收候选论文列表、返回其中需要跳过的指纹集合（例如用户已保存的论文）
+        返回 {"papers": [...], "next_offset": 下一页的起始位置, "size": 列表篇数,
+              "remaining": 下一页之后还有多少篇候选, "exhausted": 是否已取完}；
+        列表不存在时 size 为0、exhausted 为False
+        """
+        key = normalize_topic(topic)
+        with self._lock:
+            db = self._open()
+            row = db.execute(
+                "SELECT size, exhausted FROM candidate_topics WHERE topic = ? AND updated_at >= ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+            size, exhausted = (row[0], bool(row[1])) if row is not None else (0, False)
+            # 列表过期后重建过，游标中的位置已经失效，从头开始（仍然跳过 skip 中的论文）
+            if offset > size:
+                offset = 0
+            rows = db.execute(
+                "SELECT position, fingerprint, paper FROM candidate_papers"
+                " WHERE topic = ? AND position >= ? ORDER BY position",
+                (key, offset)
+            ).fetchall() if row is not None else []
+            self.pages += 1
+
+        candidates = [(position, json.loads(paper)) for position, fingerprint, paper in rows
+                      if fingerprint not in skip]
+        if exclude is not None and candidates:
+            excluded = exclude([paper for _, paper in candidates])
+            candidates = [(position, paper) for position, paper in candidates
+                          if paper['fingerprint'] not in excluded]
+
+        taken = candidates[:limit]
+        next_offset = taken[-1][0] + 1 if taken else max(offset, size)
+        return {
+            "papers": [paper for _, paper in taken],
+            "next_offset": next_offset,
+            "size": size,
+            "remaining": len(candidates) - len(taken),
+            "exhausted": exhausted,
+        }
+
+    def stats(self):
+        with self._lock:
+            topics, papers = self._open().execute(
+                "SELECT COUNT(*), IFNULL(SUM(size), 0) FROM candidate_topics"
+            ).fetchone()
+            return {
+                "topics": topics,
+                "papers": papers,
+                "persistent": self.path is not None,
+                "pages": self.pages,
+                "appended": self.appended,
+                "fetches": self.fetches,
+                "page_size": self.page_size,
+                "max_size": self.max_size,
+                "max_fetches": self.max_fetches,
+            }
@@ -1,6 +1,10 @@
 """
 API配置文件示例
 复制此文件为 config.py 并填入你的真实API信息
+
+config.py 是可选的：没有写的键使用默认值，也可以用环境变量 XFIND_<分组>_<键> 覆盖
+（例如 XFIND_API_PORT=18080、XFIND_ADMISSION_RATE_PER_MINUTE=30），XFIND_CONFIG 指定文件位置。
+运行中修改本文件后，settings.HOT_RELOAD 中的键不需要重启即可生效。
 """
 
 import os
@@ -10,6 +14,10 @@ API_CONFIG = {
     # API主机地址
     "host": "xingchen-api.xf-yun.com",
     
+    # 端口和是否使用HTTPS（使用本地模拟服务 upstream_sim.py 时改为 18080 和 False）
+    "port": None,
+    "use_tls": True,
+    
     # 从环境变量读取，或直接填写（不推荐）
     "api_key": os.getenv('XFIND_API_KEY', 'your_api_key_here'),
     
@@ -24,6 +32,193 @@ API_CONFIG = {
     
     # 超时设置（秒）
     "timeout": 120,
+    
+    # 到API的最大并发连接数（连接池大小）
+    "max_connections": 8,
+    
+    # 异步服务模式（asgi_backend.py）的最大并发连接数
+    "async_max_connections": 100,
+}
+
+# 推荐结果缓存配置
+CACHE_CONFIG = {
+    # 是否启用缓存
+    "enabled": True,
+    
+    # 缓存有效期（秒）
+    "ttl": 3600,
+    
+    # 最多缓存的研究方向数量，超出后淘汰最久未使用的
+    "max_entries": 512,
+    
+    # 磁盘缓存文件路径，设置后重启仍保留缓存（None表示仅内存）
+    "path": None,
+    
+    # 相似研究方向的余弦相似度阈值：换一种说法（语序、虚词、大小写、单复数不同）的研究方向
+    # 达到该相似度时直接返回已缓存的结果；越低越容易复用，None表示关闭
+    "similar_threshold": 0.85,
+    
+    # 过期后继续保留结果的时长（秒，从保存时算起）：上游熔断或重试后仍失败时返回过期的结果
+    "stale_ttl": 24 * 3600,
+}
+
+# 服务器端论文储存库配置
+LIBRARY_CONFIG = {
+    # SQLite数据库文件路径
+    "path": "library.db",
+    # 删除记录（墓碑）保留的天数，更久没有同步的客户端下次同步时重新获取完整的储存库
+    "tombstone_days": 90,
+}
+
+# 日志配置
+LOG_CONFIG = {
+    # 日志级别：DEBUG 会额外输出原始响应开头和解析细节
+    "level": "INFO",
+    # 输出格式：text（key=value）或 json（每行一个JSON对象）
+    "format": "text",
+}
+
+# 批量推荐配置（/api/get-papers/batch）
+BATCH_CONFIG = {
+    # 同时调用工作流的研究方向数（Flask模式的工作线程数），默认与 max_connections 相同
+    "workers": 8,
+    # 异步模式下单个批量请求同时调用工作流的研究方向数，默认与 async_max_connections 相同
+    "async_workers": 100,
+    # 单个研究方向的超时（秒），从开始调用算起；请求体中的 timeout 可覆盖
+    "timeout": 90,
+    # 一次最多提交的研究方向数
+    "max_topics": 500,
+}
+
+# 准入控制配置：需要调用工作流的请求按用户（X-User-Id，没有时按IP）限流并排队，超出时返回429
+ADMISSION_CONFIG = {
+    # 令牌桶：每个用户每分钟补充的调用次数，以及最多可以连续发起的次数
+    "rate_per_minute": 6,
+    "burst": 3,
+    # 同时进行的上游调用数（Flask模式），默认与 max_connections 相同；超出的请求按用户轮转排队
+    "max_concurrent": 8,
+    # 排队的请求总数上限，以及每个用户最多排队的请求数
+    "max_queue": 32,
+    "max_per_user": 2,
+    # 排队超过该时长（秒）返回429
+    "queue_timeout": 60,
+    # 异步模式下的同时调用数和排队上限
+    "async_max_concurrent": 100,
+    "async_max_queue": 256,
+}
+
+# 后台预取配置：在上游空闲时提前计算热门研究方向的推荐并写入缓存（需要开启缓存）
+PREFETCH_CONFIG = {
+    # 默认关闭（与 settings.SCHEMA 一致）：开启后即使没有用户请求，每小时也会消耗最多 calls_per_hour 次工作流调用额度
+    "enabled": False,
+    # 每小时最多用于预取的工作流调用次数
+    "calls_per_hour": 30,
+    # 预取热度最高的前N个研究方向
+    "top_n": 20,
+    # 两轮预取之间的间隔（秒）
+    "interval": 60,
+    # 为用户请求保留的连接数，连接池空闲连接不足时暂停预取
+    "reserve_connections": 2,
+    # 请求热度的半衰期（秒）
+    "half_life": 6 * 3600,
+    # 储存库中每次保存某标签的论文，相当于多少次请求
+    "tag_weight": 0.5,
+}
+
+# 上游容错配置：单次尝试的超时按最近耗时自适应，临时故障退避重试，失败率过高时熔断
+RESILIENCE_CONFIG = {
+    # 单次尝试超时 = 最近成功调用耗时的分位数 × 倍数，限制在 [min_timeout, API_CONFIG["timeout"]]
+    "timeout_percentile": 0.99,
+    "timeout_multiplier": 1.5,
+    "min_timeout": 10,
+    # 最多尝试次数（含第一次），所有尝试共用 API_CONFIG["timeout"] 的总时长
+    "attempts": 3,
+    # 重试前等待 0 ~ min(retry_max_delay, retry_base_delay × 2^n) 秒的随机时间
+    "retry_base_delay": 0.5,
+    "retry_max_delay": 8.0,
+    # 可以重试的工作流错误码（服务繁忙、流控）；超时、连接错误、HTTP 429/5xx 总是重试
+    "retry_codes": (10110, 11202, 11203),
+    # 最近 window 秒内至少 min_calls 次调用且失败比例超过 failure_rate 时熔断 open_seconds 秒
+    "failure_rate": 0.5,
+    "min_calls": 10,
+    "window": 60,
+    "open_seconds": 30,
+}
+
+# "更多论文"分页配置：每个研究方向保存一个候选列表，下一页从列表中读取，不够一页时才再调用工作流
+POOL_CONFIG = {
+    "enabled": True,
+    # 默认每页篇数（请求参数 page_size 可以修改，不超过 max_size）
+    "page_size": 5,
+    # 每个研究方向最多保存的候选论文数
+    "max_size": 100,
+    # 每个研究方向最多合并几次工作流调用的结果（包括第一次），一次调用没有新论文时也不再调用
+    "max_fetches": 4,
+    # 候选列表最后一次追加之后保留的秒数
+    "ttl": 86400,
+    # 最多保存的研究方向数
+    "max_topics": 1024,
+}
+
+# 个性化排序配置：按用户储存库中保存过的论文（标签、标题、摘要的哈希TF-IDF向量）重新排列推荐结果，去掉已保存的论文
+RANKING_CONFIG = {
+    "enabled": True,
+    # 特征哈希的维数
+    "dim": 4096,
+    # 内存中最多保存的用户兴趣向量数
+    "max_profiles": 1024,
+    # 最多缓存的论文向量数
+    "cache_size": 20000,
+    # 每个用户的兴趣向量最多累加的论文数（更多的已保存论文仍会从结果中去掉）
+    "max_papers": 2000,
+}
+
+# 响应压缩与缓存配置：按 Accept-Encoding 压缩JSON/HTML响应，GET响应带ETag，内容未变化时返回304
+COMPRESSION_CONFIG = {
+    "enabled": True,
+    # 小于该字节数的响应不压缩（压缩后反而更大）
+    "min_size": 1024,
+    # gzip 压缩级别（1-9）
+    "gzip_level": 6,
+    # brotli 压缩质量（0-11，需要 pip install brotli；未安装时只使用gzip）
+    "brotli_quality": 4,
+}
+
+# 上游原始响应录制（非流式调用），用 python replay_responses.py 回放，检查解析器的成功率和耗时
+RECORD_CONFIG = {
+    "enabled": False,
+    # JSONL文件，多个工作进程追加到同一个文件
+    "path": "upstream_responses.jsonl",
+    # 文件达到该大小（MB）后停止录制
+    "max_mb": 100,
+    # 录制的比例（0-1）
+    "sample_rate": 1.0,
+}
+
+# 保存请求的写缓冲：/api/save-selection 加入队列后立即返回，后台按批写入储存库
+SAVE_BUFFER_CONFIG = {
+    "enabled": True,
+    # 队列中未写入的论文数达到该值时拒绝新的保存请求（429，客户端稍后重试）
+    "max_records": 10000,
+    # 攒够该数量的论文，或最早的请求等待了 flush_interval 秒时写入一批
+    "batch_size": 500,
+    "flush_interval": 0.2,
+    # 退出时写入失败的请求保存到该文件，下次启动时恢复
+    "spool_path": "save_spool.jsonl",
+    # 幂等键（请求头 Idempotency-Key）的保留时间（小时）
+    "key_ttl_hours": 24,
+}
+
+# 多进程部署配置（python prefork.py），命令行参数可覆盖
+SERVER_CONFIG = {
+    "host": "0.0.0.0",
+    "port": 5000,
+    # 工作进程数，None表示CPU核数；每个进程各有 API_CONFIG["max_connections"] 个上游连接和独立的限流计数
+    "workers": None,
+    # 工作进程共用的推荐缓存和进行中调用表（SQLite文件）；CACHE_CONFIG 设置了 path 时使用该文件
+    "state_path": "xfind_state.db",
+    # 停止时等待正在处理的请求（包括流式响应）结束的最长秒数
+    "graceful_timeout": 30,
 }
 
 # 获取完整的API URL
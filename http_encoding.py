@@ -0,0 +1,220 @@
+"""
+响应压缩与条件请求 - 按 Accept-Encoding 协商 gzip/brotli，强ETag与304
+
+- 大于 min_size 字节的 JSON/HTML/文本响应按客户端的 Accept-Encoding 压缩：
+  优先 brotli（安装了 brotli 包时），其次 gzip；小响应压缩后反而更大，原样返回
+- GET 响应带强ETag（响应体的哈希，不同的压缩编码加后缀区分），
+  If-None-Match 匹配时返回304和空响应体，客户端重复拉取未变化的论文列表时不再传输响应体
+- 内容固定的响应（首页HTML）用 StaticResponse 预先计算ETag和各编码的压缩结果
+
+同一份内容的不同编码比较时忽略编码后缀（与 nginx/Apache 的做法一致），
+客户端切换 Accept-Encoding 后仍然可以得到304。
+"""
+
+import gzip
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/x-ndjson', 'text/html', 'text/plain', 'text/css',
+    'application/javascript', 'text/javascript', 'image/svg+xml',
+)
+
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding，返回 {编码: q值}（编码为小写）"""
+    codings = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def available_encodings():
+    """本机支持的压缩编码，按优先顺序"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(header, encodings=None):
+    """按客户端的 q 值选择压缩编码（q 值相同时按 encodings 的顺序），客户端不接受任何一种时返回None"""
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for coding in encodings or available_encodings():
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body, encoding, gzip_level=6, brotli_quality=4):
+    """压缩响应体；gzip 固定 mtime，相同内容的压缩结果相同"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    raise ValueError(f"不支持的压缩编码: {encoding}")
+
+
+def make_etag(body, encoding=None):
+    """强ETag：未压缩响应体的哈希，压缩的表示加编码后缀"""
+    return with_encoding(f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"', encoding)
+
+
+def with_encoding(etag, encoding):
+    """未压缩表示的ETag换成某个压缩编码的表示的ETag"""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+def _etag_base(etag):
+    """去掉弱ETag前缀、引号和编码后缀，用于比较是否是同一份内容"""
+    etag = etag.strip()
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    etag = etag.strip('"')
+    for encoding in ('br', 'gzip'):
+        if etag.endswith('-' + encoding):
+            return etag[:-len(encoding) - 1]
+    return etag
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match 是否与ETag匹配（弱比较，忽略编码后缀）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    base = _etag_base(etag)
+    return any(_etag_base(candidate) == base for candidate in if_none_match.split(','))
+
+
+def is_compressible(content_type):
+    return (content_type or '').split(';')[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+class ResponseEncoder:
+    """
+    按请求头为一个完整的响应体选择ETag和压缩编码（线程安全）
+
+    encode 返回 (状态码, 响应体, 附加响应头)：状态码为304时响应体为空
+    """
+
+    def __init__(self, enabled=True, min_size=1024, gzip_level=6, brotli_quality=4):
+        self.enabled = enabled
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.responses = 0
+        self.compressed = 0
+        self.not_modified = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def choose(self, content_type, size, accept_encoding):
+        """该响应应该使用的压缩编码，不压缩时返回None"""
+        if not self.enabled or size < self.min_size or not is_compressible(content_type):
+            return None
+        return choose_encoding(accept_encoding)
+
+    def encode(self, body, content_type, accept_encoding=None, if_none_match=None, etag=True):
+        """
+        body: 未压缩的响应体（bytes）
+        etag: 是否加ETag并处理 If-None-Match（只用于GET/HEAD的成功响应）
+        """
+        encoding = self.choose(content_type, len(body), accept_encoding)
+        headers = {}
+        if self.enabled and is_compressible(content_type):
+            # 同一个URL可能按 Accept-Encoding 返回不同的表示，共享缓存需要区分
+            headers['Vary'] = 'Accept-Encoding'
+        if etag:
+            headers['ETag'] = make_etag(body, encoding)
+            if etag_matches(if_none_match, headers['ETag']):
+                self._count(len(body), 0, not_modified=True)
+                return 304, b'', headers
+
+        if encoding is not None:
+            compressed = compress(body, encoding, self.gzip_level, self.brotli_quality)
+            headers['Content-Encoding'] = encoding
+            self._count(len(body), len(compressed), compressed=True)
+            return 200, compressed, headers
+
+        self._count(len(body), len(body))
+        return 200, body, headers
+
+    def _count(self, size_in, size_out, compressed=False, not_modified=False):
+        with self._lock:
+            self.responses += 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+            self.compressed += compressed
+            self.not_modified += not_modified
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "encodings": list(available_encodings()),
+                "min_size": self.min_size,
+                "responses": self.responses,
+                "compressed": self.compressed,
+                "not_modified": self.not_modified,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else 1.0,
+            }
+
+
+class StaticResponse:
+    """内容固定的响应：ETag和各编码的压缩结果只计算一次"""
+
+    def __init__(self, body, content_type, encoder):
+        self.body = body if isinstance(body, bytes) else body.encode('utf-8')
+        self.content_type = content_type
+        self.encoder = encoder
+        self.etag = make_etag(self.body)
+        self._variants = {}  # 编码 -> 压缩后的响应体
+
+    def reset(self):
+        """丢弃已缓存的压缩结果（压缩级别改变后调用）"""
+        self._variants = {}
+
+    def encode(self, accept_encoding=None, if_none_match=None):
+        """返回 (状态码, 响应体, 附加响应头)，与 ResponseEncoder.encode 相同"""
+        encoding = self.encoder.choose(self.content_type, len(self.body), accept_encoding)
+        headers = {'ETag': with_encoding(self.etag, encoding)}
+        if self.encoder.enabled and is_compressible(self.content_type):
+            headers['Vary'] = 'Accept-Encoding'
+        if etag_matches(if_none_match, self.etag):
+            self.encoder._count(len(self.body), 0, not_modified=True)
+            return 304, b'', headers
+        if encoding is None:
+            self.encoder._count(len(self.body), len(self.body))
+            return 200, self.body, headers
+
+        body = self._variants.get(encoding)
+        if body is None:
+            body = self._variants[encoding] = compress(
+                self.body, encoding, self.encoder.gzip_level, self.encoder.brotli_quality
+            )
+        headers['Content-Encoding'] = encoding
+        self.encoder._count(len(self.body), len(body), compressed=True)
+        return 200, body, headers
@@ -0,0 +1,489 @@
+"""
+HTTPS连接池 - 复用到星火工作流API的keep-alive连接
+
+每次请求不再新建TCP连接和TLS握手；同时限制到上游的最大并发连接数，
+连接出错时关闭并丢弃，空闲过久的连接自动回收。
+"""
+
+import asyncio
+import contextlib
+import http.client
+import ssl
+import threading
+import time
+
+
+# 单次响应默认最多读取的字节数（防止异常响应占满内存）
+_MAX_RESPONSE_SIZE = 64 * 1024 * 1024
+
+# 复用空闲连接时，服务器可能已经关闭了它，这些异常说明需要换一个新连接重试
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    BrokenPipeError,
+    ConnectionResetError,
+)
+
+
+class ResponseTooLarge(Exception):
+    """上游响应体超过连接池的 max_response_size（连接已关闭；不是临时故障，不重试）"""
+
+    def __init__(self, limit):
+        super().__init__(f"上游响应超过 {limit} 字节")
+        self.limit = limit
+
+
+class PooledResponse:
+    """已读取完毕的上游响应"""
+
+    def __init__(self, status, reason, headers, data, reused, connect_time, timings=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.data = data
+        self.reused = reused              # 是否复用了已有连接
+        self.connect_time = connect_time  # 本次请求花在TCP连接+TLS握手上的时间（秒）
+        # 各阶段耗时（秒）：connect、tls（仅新建连接时有）、wait（发出请求到收到响应头）、read（读取响应体）
+        self.timings = timings or {}
+
+
+class _TimedHTTPSConnection(http.client.HTTPSConnection):
+    """分别记录TCP连接和TLS握手耗时的HTTPS连接"""
+
+    tcp_time = 0.0
+    tls_time = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        http.client.HTTPConnection.connect(self)
+        tcp_done = time.perf_counter()
+        server_hostname = self._tunnel_host or self.host
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname)
+        self.tcp_time = tcp_done - start
+        self.tls_time = time.perf_counter() - tcp_done
+
+
+class ConnectionPool:
+    """线程安全的keep-alive连接池"""
+
+    def __init__(self, host, port=None, timeout=120, max_connections=8,
+                 idle_timeout=60, use_tls=True, ssl_context=None, max_response_size=_MAX_RESPONSE_SIZE):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_response_size = max_response_size
+        self.idle_timeout = idle_timeout
+        self.use_tls = use_tls
+        self._ssl_context = ssl_context
+
+        self._idle = []  # [(conn, last_used)]，后进先出
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+        # 统计计数
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+        self.in_use = 0
+        self.handshake_time = 0.0
+
+    @property
+    def ssl_context(self):
+        """TLS上下文，第一次建立连接时才创建（加载系统证书需要数十毫秒，不计入启动时间）"""
+        if self._ssl_context is None and self.use_tls:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _new_connection(self, timeout=None):
+        """
+        新建连接并完成TCP连接和TLS握手，返回 (连接, {"connect": 秒, "tls": 秒})
+
+        timeout: 连接和握手的超时（秒），默认使用连接池的 timeout
+        """
+        timeout = timeout or self.timeout
+        if self.use_tls:
+            conn = _TimedHTTPSConnection(
+                self.host, self.port, timeout=timeout, context=self.ssl_context
+            )
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+        start = time.perf_counter()
+        conn.connect()
+        elapsed = time.perf_counter() - start
+        timings = {"connect": elapsed - conn.tls_time, "tls": conn.tls_time} if self.use_tls else {"connect": elapsed}
+
+        with self._lock:
+            self.created += 1
+            self.handshake_time += elapsed
+        return conn, timings
+
+    def _get_idle(self):
+        """取出一个未过期的空闲连接，没有则返回None"""
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if now - last_used <= self.idle_timeout:
+                    self.reused += 1
+                    return conn
+                conn.close()
+                self.recycled += 1
+        return None
+
+    def _put_idle(self, conn):
+        """归还连接到空闲列表"""
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    def _acquire(self):
+        """占用一个连接名额"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"等待上游连接超时（最大连接数 {self.max_connections}）")
+        with self._lock:
+            self.in_use += 1
+
+    def _release(self):
+        """释放连接名额"""
+        with self._lock:
+            self.in_use -= 1
+        self._slots.release()
+
+    def _send(self, method, url, body, headers, timeout=None, **kwargs):
+        """
+        发送请求并读取响应头，返回 (conn, res, reused, timings)
+
+        timeout: 本次请求的套接字超时（秒，也用于新建连接），默认使用连接池的 timeout
+        """
+        conn = self._get_idle()
+        reused = conn is not None
+        timings = {}
+
+        while True:
+            if conn is None:
+                conn, timings = self._new_connection(timeout)
+            try:
+                conn.sock.settimeout(timeout or self.timeout)
+                start = time.perf_counter()
+                conn.request(method, url, body, headers or {}, **kwargs)
+                res = conn.getresponse()
+                timings["wait"] = time.perf_counter() - start
+                return conn, res, reused, timings
+            except _STALE_CONNECTION_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                # 复用的连接已被服务器关闭，换新连接重试一次
+                with self._lock:
+                    self.recycled += 1
+                conn, reused = None, False
+            except BaseException:
+                conn.close()
+                raise
+
+    def _finish(self, conn, res):
+        """响应读取完毕后归还连接，未读完或服务器要求关闭时直接关闭"""
+        if res.isclosed() and not res.will_close:
+            self._put_idle(conn)
+        else:
+            conn.close()
+
+    def request(self, method, url, body=None, headers=None, timeout=None, **kwargs):
+        """
+        发送请求并读取完整响应，返回 PooledResponse（timeout 见 _send）
+
+        响应体超过 max_response_size 时关闭连接并抛出 ResponseTooLarge
+        """
+        self._acquire()
+        try:
+            conn, res, reused, timings = self._send(method, url, body, headers, timeout, **kwargs)
+            try:
+                start = time.perf_counter()
+                if res.length is not None and res.length > self.max_response_size:
+                    raise ResponseTooLarge(self.max_response_size)
+                data = res.read(self.max_response_size + 1)
+                if len(data) > self.max_response_size:
+                    raise ResponseTooLarge(self.max_response_size)
+                timings["read"] = time.perf_counter() - start
+            except BaseException:
+                conn.close()
+                raise
+            self._finish(conn, res)
+
+            connect_time = timings.get("connect", 0.0) + timings.get("tls", 0.0)
+            return PooledResponse(
+                res.status, res.reason, dict(res.headers), data, reused, connect_time, timings
+            )
+        finally:
+            self._release()
+
+    @contextlib.contextmanager
+    def stream(self, method, url, body=None, headers=None, **kwargs):
+        """
+        发送请求并返回未读取的 http.client.HTTPResponse，用于逐行读取流式响应
+
+        with pool.stream("POST", url, body, headers) as res:
+            for line in res: ...
+
+        退出时如果响应已读完则归还连接，否则关闭连接。
+        res.timings 中有 connect、tls、wait 耗时，响应体由调用方边读边处理。
+        """
+        self._acquire()
+        try:
+            conn, res, _, timings = self._send(method, url, body, headers, **kwargs)
+            res.timings = timings
+            try:
+                yield res
+            except BaseException:
+                conn.close()
+                raise
+            self._finish(conn, res)
+        finally:
+            self._release()
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            for conn, _ in self._idle:
+                conn.close()
+            self._idle.clear()
+
+    def stats(self):
+        """返回连接池统计信息"""
+        with self._lock:
+            return {
+                "host": self.host,
+                "max_connections": self.max_connections,
+                "in_use": self.in_use,
+                "idle": len(self._idle),
+                "created": self.created,
+                "reused": self.reused,
+                "recycled": self.recycled,
+                "avg_handshake_ms": round(self.handshake_time / self.created * 1000, 2) if self.created else 0.0,
+            }
+
+
+class _StaleConnection(Exception):
+    """复用的连接在发送请求前已被服务器关闭"""
+
+
+class AsyncConnectionPool:
+    """
+    基于asyncio的keep-alive连接池（HTTP/1.1）
+
+    等待上游响应时不占用线程，单个进程可以同时挂起大量慢请求。
+    接口与 ConnectionPool 保持一致，返回同样的 PooledResponse。
+    """
+
+    def __init__(self, host, port=None, timeout=120, max_connections=100,
+                 idle_timeout=60, use_tls=True, ssl_context=None, max_response_size=_MAX_RESPONSE_SIZE):
+        self.host = host
+        self.port = port or (443 if use_tls else 80)
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_response_size = max_response_size
+        self.idle_timeout = idle_timeout
+        self.use_tls = use_tls
+        self._ssl_context = ssl_context
+
+        self._idle = []  # [(reader, writer, last_used)]，后进先出
+        self._slots = None  # 在事件循环中首次使用时创建
+
+        # 统计计数
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+        self.in_use = 0
+        self.handshake_time = 0.0
+
+    @property
+    def ssl_context(self):
+        """TLS上下文，第一次建立连接时才创建（加载系统证书需要数十毫秒，不计入启动时间）"""
+        if self._ssl_context is None and self.use_tls:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    async def _new_connection(self, timeout=None):
+        """
+        新建连接并完成TCP连接和TLS握手，返回 (reader, writer, {"connect": 秒, "tls": 秒})
+
+        timeout: 连接和握手各自的超时（秒），默认使用连接池的 timeout
+        """
+        timeout = timeout or self.timeout
+        start = time.perf_counter()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), timeout)
+        timings = {"connect": time.perf_counter() - start}
+        if self.use_tls:
+            tls_start = time.perf_counter()
+            try:
+                await asyncio.wait_for(writer.start_tls(self.ssl_context, server_hostname=self.host), timeout)
+            except BaseException:
+                writer.close()
+                raise
+            timings["tls"] = time.perf_counter() - tls_start
+        elapsed = time.perf_counter() - start
+        self.created += 1
+        self.handshake_time += elapsed
+        return reader, writer, timings
+
+    def _get_idle(self):
+        """取出一个未过期的空闲连接，没有则返回None"""
+        now = time.monotonic()
+        while self._idle:
+            reader, writer, last_used = self._idle.pop()
+            if now - last_used <= self.idle_timeout and not reader.at_eof():
+                self.reused += 1
+                return reader, writer
+            writer.close()
+            self.recycled += 1
+        return None
+
+    def _encode_request(self, method, url, body, headers):
+        """序列化HTTP/1.1请求"""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        body = body or b""
+
+        lines = [f"{method} {url} HTTP/1.1", f"Host: {self.host}"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        lines.append(f"Content-Length: {len(body)}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+    async def _read_response(self, reader, reused, timings, start):
+        """
+        读取完整响应，返回 (status, reason, headers, data, will_close)，在timings中记录wait和read耗时
+
+        响应体超过 max_response_size 时抛出 ResponseTooLarge（调用方关闭连接）
+        """
+        status_line = await reader.readline()
+        if not status_line:
+            if reused:
+                raise _StaleConnection()
+            raise http.client.RemoteDisconnected("上游关闭了连接")
+
+        version, status, reason = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip()] = value.strip()
+
+        headers_done = time.perf_counter()
+        timings["wait"] = headers_done - start
+
+        lower = {k.lower(): v.lower() for k, v in headers.items()}
+        will_close = lower.get("connection") == "close" or version == "HTTP/1.0"
+
+        limit = self.max_response_size
+        if "chunked" in lower.get("transfer-encoding", ""):
+            chunks = []
+            total = 0
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip(), 16)
+                if size == 0:
+                    # 跳过trailer
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                total += size
+                if total > limit:
+                    raise ResponseTooLarge(limit)
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            data = b"".join(chunks)
+        elif "content-length" in lower:
+            length = int(lower["content-length"])
+            if length > limit:
+                raise ResponseTooLarge(limit)
+            data = await reader.readexactly(length)
+        else:
+            # 没有长度的响应读到连接关闭为止
+            chunks = []
+            total = 0
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > limit:
+                    raise ResponseTooLarge(limit)
+                chunks.append(chunk)
+            data = b"".join(chunks)
+            will_close = True
+
+        timings["read"] = time.perf_counter() - headers_done
+        return int(status), reason, headers, data, will_close
+
+    async def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        发送请求并读取完整响应，返回 PooledResponse
+
+        timeout: 新建连接和TLS握手的超时（秒），默认使用连接池的 timeout；整个请求的超时由调用方用 asyncio.wait_for 控制
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+
+        async with self._slots:
+            self.in_use += 1
+            try:
+                conn = self._get_idle()
+                reused = conn is not None
+                timings = {}
+                payload = self._encode_request(method, url, body, headers)
+
+                while True:
+                    if conn is None:
+                        reader, writer, timings = await self._new_connection(timeout)
+                    else:
+                        reader, writer = conn
+                    try:
+                        start = time.perf_counter()
+                        writer.write(payload)
+                        await writer.drain()
+                        status, reason, res_headers, data, will_close = await self._read_response(
+                            reader, reused, timings, start
+                        )
+                    except (_StaleConnection,) + _STALE_CONNECTION_ERRORS:
+                        writer.close()
+                        if not reused:
+                            raise
+                        # 复用的连接已被服务器关闭，换新连接重试一次
+                        self.recycled += 1
+                        conn, reused = None, False
+                        continue
+                    except BaseException:
+                        writer.close()
+                        raise
+                    break
+
+                if will_close:
+                    writer.close()
+                else:
+                    self._idle.append((reader, writer, time.monotonic()))
+
+                connect_time = timings.get("connect", 0.0) + timings.get("tls", 0.0)
+                return PooledResponse(status, reason, res_headers, data, reused, connect_time, timings)
+            finally:
+                self.in_use -= 1
+
+    def close(self):
+        """关闭所有空闲连接"""
+        for _, writer, _ in self._idle:
+            writer.close()
+        self._idle.clear()
+
+    def stats(self):
+        """返回连接池统计信息"""
+        return {
+            "host": self.host,
+            "max_connections": self.max_connections,
+            "in_use": self.in_use,
+            "idle": len(self._idle),
+            "created": self.created,
+            "reused": self.reused,
+            "recycled": self.recycled,
+            "avg_handshake_ms": round(self.handshake_time / self.created * 1000, 2) if self.created else 0.0,
+        }
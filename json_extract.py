@@ -0,0 +1,212 @@
+"""
+论文JSON提取器 - 从模型输出文本中一遍扫描提取 {"papers": [...]} 对象
+
+模型返回的content可能是纯JSON、markdown代码块（```json ... ```）、前后带说明文字，
+也可能带尾部逗号或在中途被截断。提取器只扫描一遍文本：
+- 识别字符串，字符串里的括号和转义引号不会干扰括号匹配
+- papers数组中每个论文对象一闭合就解析出来，截断时也能返回已完整的论文
+- 支持分段喂入（流式响应），已扫描的部分不会重复扫描，缓冲区只保留未闭合的论文对象
+"""
+
+import json
+import re
+
+
+# 一次匹配一个完整字符串（含转义）或一个括号；字符串未闭合时 group(1) 为None
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.?)*(")?|[{}\[\]]')
+
+# 键名和数组开头之间的分隔
+_KEY_SEPARATOR = re.compile(r'\s*:\s*')
+
+# 尾部逗号（模型偶尔会输出 {"a": 1,} 这样的对象）
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+_DECODER = json.JSONDecoder()
+
+
+def loads_lenient(text):
+    """解析JSON，失败时去掉尾部逗号再试一次"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        fixed = _TRAILING_COMMA.sub(r'\1', text)
+        if fixed == text:
+            raise
+        return json.loads(fixed)
+
+
+class PapersExtractor:
+    """增量提取论文对象，每次 feed 返回新闭合的论文"""
+
+    def __init__(self):
+        self.papers = []
+        self.done = False        # 包含papers的顶层对象已闭合
+
+        self._buf = ''
+        self._pos = 0            # 下一个待扫描字符的位置
+        self._start = -1         # 当前顶层对象在缓冲区中的起点
+        self._depth = 0          # 括号嵌套深度（{} 和 [] 都计入）
+        self._last_key = None    # 顶层对象中最近一个字符串及其结束位置
+        self._last_key_end = -1
+        self._in_papers = False  # 正在papers数组中
+        self._paper_start = -1
+        self._object_text = None  # 已闭合的顶层对象，在 result() 中才完整解析
+        self._trimmed = False
+        self._result = None
+
+    def feed(self, text):
+        """喂入一段文本，返回本次新解析出的论文列表"""
+        if self.done or not text:
+            return []
+        self._buf += text
+        found = []
+        self._scan(found)
+        return found
+
+    def result(self):
+        """
+        返回提取结果：顶层对象完整时返回整个对象，
+        截断时返回 {"papers": 已完整的论文}，没有找到论文时返回None
+        """
+        if self._result is None and self._object_text is not None:
+            parsed = self._decode(self._object_text)
+            self._object_text = None
+            if isinstance(parsed, dict) and 'papers' in parsed:
+                self._result = parsed
+        if self._result is not None:
+            return self._result
+        if self.papers:
+            return {"papers": list(self.papers)}
+        return None
+
+    @property
+    def truncated(self):
+        """是否在顶层对象闭合之前就结束了"""
+        return not self.done and self._start >= 0
+
+    def _scan(self, found):
+        buf = self._buf
+        pos = self._pos
+
+        while True:
+            if self._start < 0:
+                # 还没进入顶层对象：跳到第一个 {（代码块标记和说明文字中没有 {）
+                brace = buf.find('{', pos)
+                if brace < 0:
+                    pos = len(buf)
+                    break
+                self._start = brace
+                self._depth = 1
+                pos = brace + 1
+
+            match = _TOKEN.search(buf, pos)
+            if match is None:
+                pos = len(buf)
+                break
+            token = match.group()
+
+            if token[0] == '"':
+                if match.group(1) is None:
+                    # 字符串在分段末尾未闭合，等下一段从字符串开头重新匹配
+                    pos = match.start()
+                    break
+                pos = match.end()
+                if self._depth == 1:
+                    self._last_key = token
+                    self._last_key_end = pos
+                continue
+
+            i = match.start()
+            pos = i + 1
+            if token == '{':
+                if self._in_papers and self._depth == 2:
+                    self._paper_start = i
+                self._depth += 1
+            elif token == '[':
+                if (self._depth == 1 and self._last_key == '"papers"'
+                        and _KEY_SEPARATOR.fullmatch(buf, self._last_key_end, i)):
+                    self._in_papers = True
+                self._depth += 1
+            elif token == ']':
+                self._depth -= 1
+                if self._depth == 1:
+                    self._in_papers = False
+            else:  # '}'
+                self._depth -= 1
+                if self._depth == 2 and self._in_papers and self._paper_start >= 0:
+                    paper = self._decode(buf[self._paper_start:pos])
+                    if isinstance(paper, dict):
+                        self.papers.append(paper)
+                        found.append(paper)
+                    self._paper_start = -1
+                elif self._depth == 0:
+                    if self._finish_object(buf[self._start:pos]):
+                        break
+                    # 不是论文对象，继续寻找下一个顶层对象
+                    self._start = -1
+                    self._last_key = None
+
+        self._pos = pos
+        if not self.done:
+            self._trim()
+
+    def _trim(self):
+        """丢弃不再需要的已扫描文本，流式喂入时缓冲区只保留未闭合的论文对象"""
+        if self._start < 0:
+            cut = self._pos
+        elif self._in_papers:
+            cut = self._paper_start if self._paper_start >= 0 else self._pos
+            # 顶层对象的开头已丢弃，结束时只返回papers
+            self._trimmed = True
+        else:
+            return
+        if cut <= 0:
+            return
+
+        self._buf = self._buf[cut:]
+        self._pos -= cut
+        self._last_key_end -= cut
+        if self._start >= 0:
+            self._start = max(0, self._start - cut)
+        if self._paper_start >= 0:
+            self._paper_start -= cut
+
+    def _finish_object(self, text):
+        """顶层对象闭合，返回是否已找到论文"""
+        if self.papers:
+            # 论文已逐个解析出来，完整对象等需要时再解析
+            if not self._trimmed:
+                self._object_text = text
+        else:
+            parsed = self._decode(text)
+            if not (isinstance(parsed, dict) and 'papers' in parsed):
+                return False
+            self._result = parsed
+        self.done = True
+        return True
+
+    @staticmethod
+    def _decode(text):
+        try:
+            return loads_lenient(text)
+        except json.JSONDecodeError:
+            return None
+
+
+def extract_papers(text):
+    """从完整文本中提取论文对象，找不到时返回None"""
+    # 快速路径：第一个 { 开始就是合法JSON时，直接用C实现的解码器一次解析完
+    start = text.find('{')
+    if start < 0:
+        return None
+    try:
+        parsed, _ = _DECODER.raw_decode(text, start)
+    except json.JSONDecodeError:
+        parsed = None
+    if isinstance(parsed, dict) and 'papers' in parsed:
+        return parsed
+
+    # 尾部逗号、截断、前面有其他对象等情况，逐个扫描
+    extractor = PapersExtractor()
+    extractor.feed(text)
+    return extractor.result()
@@ -1,12 +1,59 @@
+// API配置
+const API_URL = 'http://localhost:5000/api';
+
+// 服务器端储存库每页加载的论文数
+const PAGE_SIZE = 30;
+
+// 输入停顿多久后发起搜索（毫秒）
+const SEARCH_DELAY = 200;
+
+// 增量同步时每次提交的本地变更数
+const SYNC_BATCH = 500;
+
+// 客户端标识（与 script.js 共用 localStorage 中的 clientId）
+function getClientId() {
+    let clientId = localStorage.getItem('clientId');
+    if (!clientId) {
+        clientId = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+        localStorage.setItem('clientId', clientId);
+    }
+    return clientId;
+}
+
+// 读取localStorage中的JSON，不存在或损坏时返回默认值
+function readStorage(name, fallback) {
+    try {
+        const value = localStorage.getItem(name);
+        return value ? JSON.parse(value) : fallback;
+    } catch (error) {
+        return fallback;
+    }
+}
+
 // 储存库管理
 class LibraryManager {
     constructor() {
         this.papers = [];
         this.filteredPapers = [];
+        
+        // 服务器端储存库状态（服务器不可用时使用localStorage）
+        this.remote = false;
+        this.page = 0;
+        this.total = 0;
+        this.hasMore = false;
+        this.sort = 'newest';
+        this.query = '';          // 服务器端全文检索的关键词，为空时按 sort 列出
+        this.searchTimer = null;
+        this.requestSeq = 0;      // 丢弃过期的响应（连续输入时只显示最后一次搜索）
+        
         this.loadPapers();
         this.initElements();
         this.initEventListeners();
         this.render();
+        this.loadRemotePapers();
+        this.syncLibrary();
     }
 
     // 初始化DOM元素
@@ -18,15 +65,20 @@ class LibraryManager {
             todayCount: document.getElementById('todayCount'),
             searchInput: document.getElementById('searchInput'),
             sortSelect: document.getElementById('sortSelect'),
-            clearAllBtn: document.getElementById('clearAllBtn')
+            clearAllBtn: document.getElementById('clearAllBtn'),
+            loadMoreBtn: document.getElementById('loadMoreBtn')
         };
     }
 
     // 初始化事件监听
     initEventListeners() {
-        // 搜索
+        // 搜索：服务器端储存库使用全文索引，本地储存库直接过滤
         this.elements.searchInput.addEventListener('input', (e) => {
-            this.filterPapers(e.target.value);
+            if (this.remote) {
+                this.searchRemote(e.target.value);
+            } else {
+                this.filterPapers(e.target.value);
+            }
         });
 
         // 排序
@@ -38,13 +90,70 @@ class LibraryManager {
         this.elements.clearAllBtn.addEventListener('click', () => {
             this.clearAll();
         });
+
+        // 加载下一页
+        this.elements.loadMoreBtn.addEventListener('click', () => {
+            this.loadRemotePapers(false);
+        });
     }
 
-    // 从localStorage加载论文
+    // 输入停顿后在服务器端检索
+    searchRemote(query) {
+        clearTimeout(this.searchTimer);
+        this.searchTimer = setTimeout(() => {
+            this.query = query.trim();
+            this.loadRemotePapers(true);
+        }, SEARCH_DELAY);
+    }
+
+    // 从服务器分页加载论文（有关键词时按相关度返回检索结果），服务器不可用时继续使用localStorage
+    async loadRemotePapers(reset = true) {
+        const page = reset ? 1 : this.page + 1;
+        const seq = ++this.requestSeq;
+        const url = this.query
+            ? `${API_URL}/search?q=${encodeURIComponent(this.query)}&page=${page}&page_size=${PAGE_SIZE}`
+            : `${API_URL}/library?page=${page}&page_size=${PAGE_SIZE}&sort=${this.sort}`;
+        
+        try {
+            const response = await fetch(url, { headers: { 'X-User-Id': getClientId() } });
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            const data = await response.json();
+            if (seq !== this.requestSeq) {
+                return;
+            }
+            
+            // 服务器上还没有任何论文时，继续显示本地储存库
+            if (!this.remote && data.total === 0 && this.papers.length > 0) {
+                return;
+            }
+            
+            this.remote = true;
+            this.page = data.page;
+            this.hasMore = data.has_more;
+            if (!this.query) {
+                this.total = data.total;
+            }
+            
+            const loaded = reset ? 0 : this.papers.length;
+            this.papers = reset ? data.papers : this.papers.concat(data.papers);
+            this.filteredPapers = this.papers;
+            console.log(`📚 从服务器加载第 ${data.page} 页，共 ${data.total} 篇论文`);
+            
+            // 加载更多时只追加新卡片
+            this.render(loaded);
+        } catch (error) {
+            console.warn('⚠️ 服务器储存库不可用，使用本地数据:', error.message);
+        }
+    }
+
+    // 从localStorage加载论文（本地副本 + 尚未同步的变更）
     loadPapers() {
         try {
             const saved = localStorage.getItem('savedPapers');
             this.papers = saved ? JSON.parse(saved) : [];
+            this.applyPendingChanges(readStorage('libraryChanges', []));
             this.filteredPapers = [...this.papers];
             console.log(`📚 加载了 ${this.papers.length} 篇论文`);
         } catch (error) {
@@ -54,6 +163,101 @@ class LibraryManager {
         }
     }
 
+    // 把尚未同步的变更合并到内存中的论文列表（不写回localStorage）
+    applyPendingChanges(changes) {
+        changes.forEach(change => {
+            if (change.op === 'save') {
+                const title = change.paper.title;
+                if (!this.papers.some(p => p.title === title)) {
+                    this.papers.push(change.paper);
+                }
+            } else if (change.op === 'delete') {
+                this.papers = this.papers.filter(p => !(change.key ? p.key === change.key : p.title === change.title));
+            }
+        });
+    }
+
+    // 记录待同步的变更：只追加到变更队列，不重写整个本地储存库
+    queueChanges(changes) {
+        try {
+            const modifiedAt = new Date().toISOString();
+            changes = readStorage('libraryChanges', []).concat(
+                changes.map(change => ({ ...change, modified_at: modifiedAt }))
+            );
+            localStorage.setItem('libraryChanges', JSON.stringify(changes));
+        } catch (error) {
+            console.error('记录变更失败:', error);
+        }
+    }
+
+    // 与服务器增量同步：提交本地变更，按游标取回之后的变更合并到本地副本，流量与变更数成正比
+    async syncLibrary() {
+        const local = readStorage('savedPapers', []);
+        const queued = readStorage('libraryChanges', []);
+        let cursor = Number(localStorage.getItem('libraryCursor') || 0);
+        
+        // 首次同步时把只保存在本地的论文一并提交
+        const outgoing = cursor
+            ? queued.slice()
+            : local.map(p => ({ op: 'save', paper: p, modified_at: p.savedAt })).concat(queued);
+        let papers = new Map(local.filter(p => p.key).map(p => [p.key, p]));
+        let hasMore = true;
+        
+        try {
+            while (hasMore || outgoing.length > 0) {
+                const response = await fetch(`${API_URL}/library/sync`, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-User-Id': getClientId()
+                    },
+                    body: JSON.stringify({ cursor: cursor, changes: outgoing.splice(0, SYNC_BATCH) })
+                });
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                const data = await response.json();
+                
+                // reset：服务器返回的是完整的储存库，替换本地副本
+                if (data.reset) {
+                    papers = new Map();
+                }
+                data.changes.forEach(record => {
+                    if (record.op === 'save') {
+                        papers.set(record.key, { ...record.paper, key: record.key });
+                    } else {
+                        papers.delete(record.key);
+                    }
+                });
+                cursor = data.cursor;
+                hasMore = data.has_more;
+            }
+        } catch (error) {
+            console.warn('⚠️ 储存库同步失败，稍后重试:', error.message);
+            return false;
+        }
+        
+        // 同步期间新加入的变更留到下次同步
+        const pending = readStorage('libraryChanges', []).slice(queued.length);
+        try {
+            localStorage.setItem('savedPapers', JSON.stringify([...papers.values()]));
+            localStorage.setItem('libraryChanges', JSON.stringify(pending));
+            localStorage.setItem('libraryCursor', String(cursor));
+        } catch (error) {
+            console.error('保存同步结果失败:', error);
+            return false;
+        }
+        console.log(`🔄 储存库已同步，本地 ${papers.size} 篇论文，提交 ${queued.length} 个变更`);
+        
+        if (!this.remote) {
+            this.papers = [...papers.values()];
+            this.applyPendingChanges(pending);
+            this.filteredPapers = [...this.papers];
+            this.render();
+        }
+        return true;
+    }
+
     // 保存论文到localStorage
     savePapers() {
         try {
@@ -66,28 +270,89 @@ class LibraryManager {
 
     // 删除单篇论文
     deletePaper(index) {
+        if (this.remote) {
+            if (confirm('确定要删除这篇论文吗？')) {
+                this.deleteRemotePaper(this.filteredPapers[index]);
+            }
+            return;
+        }
+        
         if (confirm('确定要删除这篇论文吗？')) {
-            this.papers.splice(index, 1);
-            this.savePapers();
+            const paper = this.filteredPapers[index];
+            this.papers = this.papers.filter(p => p !== paper);
+            this.queueChanges([{ op: 'delete', key: paper.key, title: paper.title }]);
             this.filteredPapers = [...this.papers];
             this.render();
             this.showNotification('论文已删除', 'success');
         }
     }
 
+    // 从服务器端储存库删除论文
+    async deleteRemotePaper(paper) {
+        try {
+            const response = await fetch(`${API_URL}/library/${paper.id}`, {
+                method: 'DELETE',
+                headers: { 'X-User-Id': getClientId() }
+            });
+            if (!response.ok && response.status !== 404) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            
+            this.papers = this.papers.filter(p => p.id !== paper.id);
+            this.filteredPapers = this.filteredPapers.filter(p => p.id !== paper.id);
+            this.total = Math.max(0, this.total - 1);
+            this.render();
+            this.showNotification('论文已删除', 'success');
+        } catch (error) {
+            console.error('删除论文失败:', error);
+            this.showNotification('删除失败，请稍后重试', 'error');
+        }
+    }
+
     // 清空所有论文
     clearAll() {
+        if (this.remote && this.total > 0) {
+            if (confirm(`确定要清空所有 ${this.total} 篇论文吗？此操作无法撤销！`)) {
+                this.clearRemote();
+            }
+            return;
+        }
+        
         if (this.papers.length === 0) {
             this.showNotification('储存库已经是空的了', 'info');
             return;
         }
 
         if (confirm(`确定要清空所有 ${this.papers.length} 篇论文吗？此操作无法撤销！`)) {
+            this.queueChanges(this.papers.map(paper => ({ op: 'delete', key: paper.key, title: paper.title })));
             this.papers = [];
             this.filteredPapers = [];
+            this.render();
+            this.showNotification('已清空储存库', 'success');
+        }
+    }
+
+    // 清空服务器端储存库（本地副本一并清空）
+    async clearRemote() {
+        try {
+            const response = await fetch(`${API_URL}/library`, {
+                method: 'DELETE',
+                headers: { 'X-User-Id': getClientId() }
+            });
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            
+            this.papers = [];
+            this.filteredPapers = [];
+            this.total = 0;
+            this.hasMore = false;
             this.savePapers();
             this.render();
             this.showNotification('已清空储存库', 'success');
+        } catch (error) {
+            console.error('清空储存库失败:', error);
+            this.showNotification('清空失败，请稍后重试', 'error');
         }
     }
 
@@ -113,6 +378,13 @@ class LibraryManager {
 
     // 排序论文
     sortPapers(sortType) {
+        // 服务器端储存库由服务器排序后重新加载
+        if (this.remote) {
+            this.sort = sortType;
+            this.loadRemotePapers(true);
+            return;
+        }
+        
         switch (sortType) {
             case 'newest':
                 this.filteredPapers.sort((a, b) => 
@@ -257,10 +529,13 @@ class LibraryManager {
     }
 
     // 渲染页面
-    render() {
+    render(appendFrom = 0) {
         // 更新统计
-        this.elements.totalCount.textContent = this.papers.length;
+        this.elements.totalCount.textContent = this.remote ? this.total : this.papers.length;
         this.elements.todayCount.textContent = this.getTodayCount();
+        
+        // 服务器端还有未加载的论文时显示"加载更多"
+        this.elements.loadMoreBtn.classList.toggle('hidden', !(this.remote && this.hasMore));
 
         // 显示/隐藏空状态
         if (this.filteredPapers.length === 0) {
@@ -270,12 +545,15 @@ class LibraryManager {
             this.elements.papersGrid.style.display = 'grid';
             this.elements.emptyState.classList.add('hidden');
             
-            // 渲染论文卡片
-            this.elements.papersGrid.innerHTML = '';
-            this.filteredPapers.forEach((paper, index) => {
-                const card = this.createPaperCard(paper, index);
-                this.elements.papersGrid.appendChild(card);
+            // 渲染论文卡片（appendFrom 之前的卡片已在页面上）
+            if (appendFrom === 0) {
+                this.elements.papersGrid.innerHTML = '';
+            }
+            const fragment = document.createDocumentFragment();
+            this.filteredPapers.slice(appendFrom).forEach((paper, offset) => {
+                fragment.appendChild(this.createPaperCard(paper, appendFrom + offset));
             });
+            this.elements.papersGrid.appendChild(fragment);
         }
     }
 
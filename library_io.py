@@ -0,0 +1,384 @@
+"""
+储存库导入导出 - NDJSON、JSON数组、CSV、BibTeX 的流式读写
+
+读写都是生成器，一次只处理一篇论文（按块读取请求体、按块输出响应），内存占用与储存库大小无关：
+- read_papers(stream, fmt) 从二进制流中逐篇解析论文，无法解析的记录产出 None（由调用方计为跳过）；
+  整个文件的格式错误（例如JSON数组被截断）时抛出 ValueError
+- write_papers(papers, fmt) 把论文序列化为若干字节块，供流式响应逐块发送
+
+JSON数组兼容浏览器 localStorage 中的 savedPapers 和安卓版保存的论文列表（savedAt 为毫秒时间戳）。
+BibTeX只取标题、作者、摘要、年份、期刊/会议和关键词，作者从 "Last, First and ..." 转为逗号分隔。
+"""
+
+import csv
+import io
+import json
+import re
+
+# 格式 -> (Content-Type, 文件扩展名)
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "json": ("application/json", "json"),
+    "csv": ("text/csv", "csv"),
+    "bibtex": ("application/x-bibtex", "bib"),
+}
+
+# 导入时没有指定格式，按请求的 Content-Type 判断
+_CONTENT_TYPES = {
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json": "json",
+    "text/csv": "csv",
+    "application/x-bibtex": "bibtex",
+    "text/x-bibtex": "bibtex",
+}
+
+CSV_COLUMNS = ("title", "authors", "abstract", "year", "venue", "tags", "savedAt")
+
+# CSV表头的别名（不区分大小写）
+_CSV_ALIASES = {"author": "authors", "keywords": "tags", "journal": "venue", "saved_at": "savedAt",
+                "savedat": "savedAt"}
+
+# 每次从流中读取的字符数，以及输出时每块的大致字节数
+_READ_SIZE = 64 * 1024
+_CHUNK_SIZE = 64 * 1024
+
+
+def detect_format(fmt=None, content_type=None):
+    """导入/导出格式：优先使用参数 fmt，否则按 Content-Type 判断；不支持时抛出 ValueError"""
+    if fmt:
+        fmt = fmt.strip().lower()
+        fmt = "bibtex" if fmt == "bib" else "ndjson" if fmt == "jsonl" else fmt
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的格式: {fmt}（可选 {', '.join(FORMATS)}）")
+        return fmt
+    mimetype = (content_type or "").split(";")[0].strip().lower()
+    if mimetype in _CONTENT_TYPES:
+        return _CONTENT_TYPES[mimetype]
+    raise ValueError(f"请用 format 参数指定格式（可选 {', '.join(FORMATS)}）")
+
+
+def _text(stream):
+    """二进制流按UTF-8解码（去掉BOM），保留原始换行符供CSV解析"""
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def read_papers(stream, fmt):
+    """从二进制流中逐篇产出论文（dict），无法解析的记录产出 None"""
+    text = _text(stream)
+    if fmt == "ndjson":
+        return _read_ndjson(text)
+    if fmt == "json":
+        return _read_json_array(text)
+    if fmt == "csv":
+        return _read_csv(text)
+    if fmt == "bibtex":
+        return _read_bibtex(text)
+    raise ValueError(f"不支持的格式: {fmt}")
+
+
+def _read_ndjson(text):
+    for line in text:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            paper = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        yield paper if isinstance(paper, dict) else None
+
+
+def _read_json_array(text):
+    """逐个解析JSON数组的元素（数组可以任意大，缓冲区只保留尚未解析的部分）"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = text.read(_READ_SIZE)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+    def skip(chars):
+        """跳过空白和 chars 中的字符，返回下一个字符（文件结束时返回空字符串）"""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] in chars):
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            fill()
+
+    if skip("") != "[":
+        raise ValueError("JSON文件应为论文数组")
+    pos += 1
+    while True:
+        char = skip(",")
+        if char == "]":
+            return
+        if not char:
+            raise ValueError("JSON数组不完整")
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            item, end = None, None
+        # 解析失败或正好用完缓冲区（数字、字符串可能被截断）时读入更多内容再试
+        if (end is None or end == len(buffer)) and not eof:
+            fill()
+            continue
+        if end is None:
+            raise ValueError("JSON数组格式错误")
+        pos = end
+        yield item if isinstance(item, dict) else None
+
+
+def _read_csv(text):
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = []
+    for name in header:
+        name = name.strip()
+        key = name.lower()
+        columns.append(_CSV_ALIASES.get(key, key if key in CSV_COLUMNS else name))
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        paper = {column: value for column, value in zip(columns, row) if value != ""}
+        if "tags" in paper:
+            paper["tags"] = [tag.strip() for tag in re.split(r"[;,，；]", paper["tags"]) if tag.strip()]
+        yield paper
+
+
+_ENTRY_START = re.compile(r"@\s*(\w+)\s*([{(])")
+_FIELD_NAME = re.compile(r"\s*([\w\-:.]+)\s*=\s*")
+_BARE_VALUE = re.compile(r"[^,\s#})]+")
+_LATEX_ESCAPE = re.compile(r"\\([&%$#_{}])")
+_LATEX_ACCENT = re.compile(r"\\[`'^\"~=.]\s*\{?(\w)\}?")
+_LATEX_COMMAND = re.compile(r"\\[a-zA-Z]+\s*")
+_BIBTEX_SKIP = {"comment", "preamble", "string"}
+_BRACES = re.compile(r"[{}]")
+_BRACES_PAREN = re.compile(r"[{})]")
+# 引号内的 \" 是转义，不结束字符串
+_BRACES_QUOTE = re.compile(r'\\"|[{}"]')
+
+
+def _read_bibtex(text):
+    """逐个读取 @type{...} 条目（条目可以跨任意多个读取块）"""
+    buffer, pos, eof = "", 0, False
+    while True:
+        match = _ENTRY_START.search(buffer, pos)
+        end = _entry_end(buffer, match.end(), match.group(2)) if match else None
+        if end is None:
+            if eof:
+                if match:
+                    raise ValueError("BibTeX条目不完整")
+                return
+            if match:
+                buffer = buffer[match.start():]
+            else:
+                # 条目之间的注释等内容直接丢弃，只保留可能是 @ 开头的结尾
+                at = buffer.rfind("@", pos)
+                buffer = buffer[at:] if at >= 0 else ""
+            chunk = text.read(_READ_SIZE)
+            eof = not chunk
+            buffer, pos = buffer + chunk, 0
+            continue
+        entry_type, body = match.group(1).lower(), buffer[match.end():end]
+        pos = end + 1
+        if entry_type not in _BIBTEX_SKIP:
+            yield _bibtex_paper(body)
+
+
+def _scan(text, start, pattern, closer, depth=0):
+    """
+    从 start 开始按 pattern 找到的括号（和引号）计算嵌套深度，返回深度为0时遇到的 closer 的位置
+
+    用正则跳过普通字符，比逐个字符判断快得多；没有找到时返回 None
+    """
+    for match in pattern.finditer(text, start):
+        char = match.group()
+        if char == closer and not depth:
+            return match.start()
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+    return None
+
+
+def _entry_end(buffer, start, opener):
+    """条目结束符的位置（与开头的 { 或 ( 配对），缓冲区中还没有时返回 None"""
+    if opener == "{":
+        return _scan(buffer, start, _BRACES, "}")
+    return _scan(buffer, start, _BRACES_PAREN, ")")
+
+
+def _bibtex_fields(body):
+    """解析条目内容（引用键之后的 name = value 列表），返回 {小写字段名: 原始值}"""
+    fields = {}
+    pos = body.find(",")
+    if pos < 0:
+        return fields
+    pos += 1
+    while True:
+        match = _FIELD_NAME.match(body, pos)
+        if not match:
+            return fields
+        name, pos = match.group(1).lower(), match.end()
+        parts = []
+        while True:
+            value, pos = _bibtex_value(body, pos)
+            if value is None:
+                return fields
+            parts.append(value)
+            # 用 # 连接的多段值
+            while pos < len(body) and body[pos].isspace():
+                pos += 1
+            if not body.startswith("#", pos):
+                break
+            pos += 1
+            while pos < len(body) and body[pos].isspace():
+                pos += 1
+        fields[name] = "".join(parts)
+        while pos < len(body) and (body[pos].isspace() or body[pos] == ","):
+            pos += 1
+
+
+def _bibtex_value(body, pos):
+    """解析 {…}、"…" 或裸值，返回 (值, 之后的位置)；格式错误时值为 None"""
+    if pos >= len(body):
+        return None, pos
+    if body[pos] in '{"':
+        closer = "}" if body[pos] == "{" else '"'
+        end = _scan(body, pos + 1, _BRACES if closer == "}" else _BRACES_QUOTE, closer)
+        return (body[pos + 1:end], end + 1) if end is not None else (None, pos)
+    match = _BARE_VALUE.match(body, pos)
+    return (match.group(0), match.end()) if match else (None, pos)
+
+
+def _clean_latex(value):
+    """去掉常见的LaTeX转义和命令、花括号，合并空白"""
+    value = _LATEX_ESCAPE.sub(r"\1", value)
+    value = _LATEX_ACCENT.sub(r"\1", value)
+    value = _LATEX_COMMAND.sub("", value)
+    value = value.replace("{", "").replace("}", "").replace("~", " ")
+    return " ".join(value.split())
+
+
+def _bibtex_authors(value):
+    """BibTeX的 "Last, First and First Last" 转为 "First Last, First Last" """
+    names = []
+    for name in re.split(r"\s+and\s+", _clean_latex(value)):
+        if "," in name:
+            last, first = name.split(",", 1)
+            name = f"{first.strip()} {last.strip()}"
+        if name.strip():
+            names.append(name.strip())
+    return ", ".join(names)
+
+
+def _bibtex_paper(body):
+    """BibTeX条目转为论文，没有标题时返回 None"""
+    fields = _bibtex_fields(body)
+    title = _clean_latex(fields.get("title", ""))
+    if not title:
+        return None
+    paper = {"title": title, "authors": _bibtex_authors(fields.get("author", ""))}
+    if fields.get("abstract"):
+        paper["abstract"] = _clean_latex(fields["abstract"])
+    if fields.get("year"):
+        paper["year"] = _clean_latex(fields["year"])
+    venue = fields.get("journal") or fields.get("booktitle")
+    if venue:
+        paper["venue"] = _clean_latex(venue)
+    if fields.get("keywords"):
+        paper["tags"] = [tag.strip() for tag in re.split(r"[;,]", _clean_latex(fields["keywords"]))
+                         if tag.strip()]
+    return paper
+
+
+def write_papers(papers, fmt):
+    """把论文逐篇序列化，每凑满约64KB产出一个字节块"""
+    if fmt == "ndjson":
+        records = (json.dumps(_export_fields(paper), ensure_ascii=False) + "\n" for paper in papers)
+    elif fmt == "json":
+        records = _json_array(papers)
+    elif fmt == "csv":
+        records = _csv_rows(papers)
+    elif fmt == "bibtex":
+        records = (_bibtex_entry(paper) for paper in papers)
+    else:
+        raise ValueError(f"不支持的格式: {fmt}")
+
+    parts, size = [], 0
+    for record in records:
+        data = record.encode("utf-8")
+        parts.append(data)
+        size += len(data)
+        if size >= _CHUNK_SIZE:
+            yield b"".join(parts)
+            parts, size = [], 0
+    if parts:
+        yield b"".join(parts)
+
+
+def _export_fields(paper):
+    """导出的论文不含服务器内部的论文id（导入到其他服务器时没有意义）"""
+    return {key: value for key, value in paper.items() if key != "id"}
+
+
+def _json_array(papers):
+    yield "["
+    separator = "\n"
+    for paper in papers:
+        yield separator + json.dumps(_export_fields(paper), ensure_ascii=False)
+        separator = ",\n"
+    yield "\n]\n"
+
+
+def _csv_rows(papers):
+    # 带BOM，Excel打开时能正确识别中文
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    writer.writerow(CSV_COLUMNS)
+    yield "\ufeff" + buffer.getvalue()
+    for paper in papers:
+        buffer.seek(0)
+        buffer.truncate()
+        row = dict(paper, tags="; ".join(paper.get("tags") or []))
+        writer.writerow(["" if row.get(column) is None else row[column] for column in CSV_COLUMNS])
+        yield buffer.getvalue()
+
+
+def _bibtex_escape(value):
+    """转义BibTeX/LaTeX的特殊字符；花括号和反斜杠去掉，保证值中的括号配对"""
+    value = str(value).replace("\\", "").replace("{", "").replace("}", "")
+    return re.sub(r"([&%$#_])", r"\\\1", " ".join(value.split()))
+
+
+def _bibtex_key(paper):
+    """引用键：第一作者的姓 + 年份 + 标题第一个词 + 论文id（保证唯一，不需要记住已用过的键）"""
+    authors = re.split(r"[,，、;]", paper.get("authors") or "")
+    surname = re.sub(r"[^a-z]", "", authors[0].split()[-1].lower()) if authors[0].split() else ""
+    words = [re.sub(r"[^a-z]", "", word.lower()) for word in (paper.get("title") or "").split()]
+    word = next((w for w in words if len(w) > 3), "")
+    return f"{surname or 'paper'}{paper.get('year') or ''}{word}-{paper.get('id', '')}".rstrip("-")
+
+
+def _bibtex_entry(paper):
+    authors = [name.strip() for name in re.split(r"[,，、;]", paper.get("authors") or "") if name.strip()]
+    fields = [
+        ("title", paper.get("title")),
+        ("author", " and ".join(authors)),
+        ("year", paper.get("year")),
+        ("journal", paper.get("venue")),
+        ("abstract", paper.get("abstract")),
+        ("keywords", ", ".join(paper.get("tags") or [])),
+    ]
+    lines = [f"  {name} = {{{_bibtex_escape(value)}}}" for name, value in fields if value not in (None, "")]
+    entry_type = "article" if paper.get("venue") else "misc"
+    return f"@{entry_type}{{{_bibtex_key(paper)},\n" + ",\n".join(lines) + "\n}\n\n"
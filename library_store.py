@@ -0,0 +1,745 @@
+"""
+论文储存库 - 服务器端持久化保存用户选择的论文（SQLite）
+
+- 论文按归一化标题去重，多个用户保存同一篇论文只存一份
+- 每个用户有自己的保存记录（user_id + paper_id），按保存时间、年份建索引
+- 批量保存在一个事务内完成，列表接口分页返回
+- 标题、作者、摘要、标签建有FTS5全文索引，支持中英文、前缀匹配和按相关度排序
+- 每次保存和删除分配一个单调递增的版本号，删除留下墓碑记录，客户端按游标增量同步（sync）
+- 导入按批提交（每批一个事务），导出按保存时间分批查询，都不需要把整个储存库读入内存
+- 保存请求可以带幂等键（save_requests 表），客户端重试同一个请求不会重复保存
+"""
+
+import itertools
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+from tokenizer import build_match_query, segment
+
+
+# 单页最多返回的论文数
+MAX_PAGE_SIZE = 100
+
+# 一次同步最多提交的变更数和最多返回的变更数
+MAX_SYNC_CHANGES = 1000
+MAX_SYNC_PAGE = 1000
+
+# 导入时每个事务写入的论文数，导出时每次查询的论文数
+IMPORT_BATCH_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+SORT_ORDERS = {
+    "newest": "s.saved_at DESC, s.paper_id DESC",
+    "oldest": "s.saved_at ASC, s.paper_id ASC",
+    "title": "p.title COLLATE NOCASE ASC",
+    "year": "p.year IS NULL, p.year DESC, s.saved_at DESC",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    id INTEGER PRIMARY KEY,
+    title_key TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    authors TEXT NOT NULL DEFAULT '',
+    abstract TEXT NOT NULL DEFAULT '',
+    year INTEGER,
+    venue TEXT,
+    tags TEXT NOT NULL DEFAULT '[]'
+);
+CREATE TABLE IF NOT EXISTS saved_papers (
+    user_id TEXT NOT NULL,
+    paper_id INTEGER NOT NULL REFERENCES papers(id),
+    saved_at TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    modified_at TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (user_id, paper_id)
+);
+CREATE TABLE IF NOT EXISTS library_tombstones (
+    user_id TEXT NOT NULL,
+    paper_id INTEGER NOT NULL REFERENCES papers(id),
+    deleted_at TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (user_id, paper_id)
+);
+CREATE TABLE IF NOT EXISTS save_requests (
+    user_id TEXT NOT NULL,
+    request_key TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, request_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sync_clock (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    pruned INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO sync_clock (id, version) VALUES (1, 0);
+CREATE INDEX IF NOT EXISTS idx_saved_user_time ON saved_papers(user_id, saved_at);
+CREATE INDEX IF NOT EXISTS idx_papers_year ON papers(year);
+CREATE INDEX IF NOT EXISTS idx_tombstones_user_version ON library_tombstones(user_id, version);
+CREATE INDEX IF NOT EXISTS idx_save_requests_time ON save_requests(created_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+    title, authors, abstract, tags,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+"""
+
+# 把还没有建索引的论文加入全文索引（论文只增不删，id单调递增）。
+# 在保存论文的同一个事务里执行，也用于为旧数据库补建索引
+_INDEX_NEW_PAPERS = """
+INSERT INTO papers_fts (rowid, title, authors, abstract, tags)
+SELECT id, fts_segment(title), fts_segment(authors), fts_segment(abstract), fts_segment(tags)
+FROM papers
+WHERE id > IFNULL((SELECT rowid FROM papers_fts ORDER BY rowid DESC LIMIT 1), 0)
+"""
+
+# 旧数据库的 saved_papers 没有版本号：补上列，已有的保存记录按 rowid 编号（首次同步时全部返回）
+_MIGRATE_SAVED_VERSION = """
+ALTER TABLE saved_papers ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE saved_papers ADD COLUMN modified_at TEXT NOT NULL DEFAULT '';
+UPDATE saved_papers SET version = rowid, modified_at = saved_at;
+UPDATE sync_clock SET version = (SELECT IFNULL(MAX(rowid), 0) FROM saved_papers);
+"""
+
+_SYNC_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_saved_user_version ON saved_papers(user_id, version);
+"""
+
+# bm25列权重：标题 > 标签 > 作者 > 摘要
+_RANK = "bm25(papers_fts, 10.0, 3.0, 1.0, 4.0)"
+
+_PAPER_COLUMNS = "p.id, p.title, p.authors, p.abstract, p.year, p.venue, p.tags, s.saved_at"
+
+_INSERT_PAPER = (
+    "INSERT INTO papers (title_key, title, authors, abstract, year, venue, tags)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(title_key) DO NOTHING"
+)
+
+
+def normalize_title(title):
+    """归一化标题用于去重：忽略大小写、空白和标点"""
+    if not isinstance(title, str):
+        title = '' if title is None else str(title)
+    return re.sub(r'[\W_]+', '', title.casefold())
+
+
+def _format_time(moment):
+    """格式化为UTC时间字符串，格式与前端 new Date().toISOString() 一致，可以直接按字符串比较先后"""
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def utc_now():
+    """当前UTC时间，格式与前端 new Date().toISOString() 一致"""
+    return _format_time(datetime.now(timezone.utc))
+
+
+def _sync_time(value, now):
+    """
+    客户端提交的时间戳统一为 utc_now 的格式；无法识别或晚于服务器当前时间（设备时钟偏快）时使用当前时间
+
+    数字按毫秒时间戳处理（安卓版的 savedAt 和 JavaScript 的 Date.now()）
+    """
+    try:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            moment = datetime.fromtimestamp(value / 1000, timezone.utc)
+        else:
+            moment = datetime.fromisoformat(str(value))
+    except (ValueError, OverflowError, OSError):
+        return now
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return min(_format_time(moment), now)
+
+
+def _coerce_year(year):
+    """年份可能是数字或字符串，无法识别时返回None"""
+    try:
+        return int(str(year).strip()[:4])
+    except (TypeError, ValueError):
+        return None
+
+
+def _paper_row(paper):
+    """前端提交的论文转为 papers 表的一行 (title_key, title, authors, abstract, year, venue, tags)，没有标题时返回None"""
+    if not isinstance(paper, dict):
+        return None
+    key = normalize_title(paper.get('title'))
+    if not key:
+        return None
+    tags = paper.get('tags') or []
+    if isinstance(tags, str):
+        tags = [t.strip() for t in tags.split(',') if t.strip()]
+    elif not isinstance(tags, list):
+        tags = []
+    # 客户端提交的字段类型不可信：都转为字符串再绑定，列表或对象会让 SQLite 抛出 ProgrammingError
+    return (
+        key,
+        str(paper['title']).strip(),
+        str(paper.get('authors') or ''),
+        str(paper.get('abstract') or ''),
+        _coerce_year(paper.get('year')),
+        str(paper.get('venue') or ''),
+        json.dumps([str(t) for t in tags], ensure_ascii=False),
+    )
+
+
+def check_selection(user_id, papers, request_key=None):
+    """
+    检查一个保存请求能否写入储存库，不能时抛出 ValueError（写缓冲在加入队列之前调用，坏请求不会进入批量事务）
+
+    JSON 字符串可以包含单独的代理项（如 "\\ud800"），无法按 UTF-8 写入 SQLite
+    """
+    texts = [user_id, request_key or '']
+    for paper in papers:
+        row = _paper_row(paper)
+        if row is not None:
+            texts.extend(row[1:4] + row[5:])
+    for text in texts:
+        try:
+            text.encode('utf-8')
+        except UnicodeEncodeError:
+            raise ValueError("保存请求包含无法编码的字符") from None
+
+
+def _row_to_paper(row):
+    paper_id, title, authors, abstract, year, venue, tags, saved_at = row
+    return {
+        "id": paper_id,
+        "title": title,
+        "authors": authors,
+        "abstract": abstract,
+        "year": year,
+        "venue": venue,
+        "tags": json.loads(tags),
+        "savedAt": saved_at,
+    }
+
+
+def _sync_record(op, row):
+    """同步返回的一条变更：保存记录带完整论文，删除记录只有论文id"""
+    version, key, modified_at = row[:3]
+    record = {"op": op, "version": version, "key": key, "modified_at": modified_at}
+    if op == 'save':
+        record["paper"] = _row_to_paper(row[3:])
+    else:
+        record["id"] = row[3]
+    return record
+
+
+class LibraryStore:
+    """
+    基于SQLite的论文储存库（线程安全，每个线程使用独立连接）
+
+    第一次访问时才打开文件、建表和清理过期的删除记录，导入后端和启动工作进程时不读写磁盘
+    """
+
+    def __init__(self, path='library.db', tombstone_days=90):
+        self.path = path
+        self.tombstone_days = tombstone_days
+        self._local = threading.local()
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self):
+        """获取当前线程的数据库连接（第一次调用时初始化表结构）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.create_function('fts_segment', 1, segment, deterministic=True)
+            self._local.conn = conn
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    self._init_schema(conn)
+                    self._ready = True
+                    if self.tombstone_days:
+                        self.prune_tombstones(self.tombstone_days)
+        return conn
+
+    @staticmethod
+    def _init_schema(conn):
+        conn.executescript(_SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(saved_papers)")}
+        if 'version' not in columns:
+            conn.executescript(_MIGRATE_SAVED_VERSION)
+        conn.executescript(_SYNC_INDEXES)
+        with conn:
+            conn.execute(_INDEX_NEW_PAPERS)
+
+    def save_papers(self, user_id, papers, request_key=None):
+        """
+        批量保存论文（一个事务），返回 {"saved": 新保存数, "duplicates": 已存在数, "replayed": 是否重复的请求}
+
+        没有标题的论文会被忽略；request_key 为幂等键，同一用户的同一个键只保存一次
+        """
+        return self.save_selections([(user_id, papers, request_key)])[0]
+
+    def save_selections(self, selections):
+        """
+        在一个事务中保存多个请求的论文，selections 为 [(user_id, papers, request_key), ...]，
+        按顺序返回每个请求的结果（格式同 save_papers）
+
+        所有请求的论文一起写入 papers 表、一起查询id，按用户逐个写入保存记录；
+        幂等键已经存在的请求（客户端重试）不再保存，replayed 为True
+        """
+        now = utc_now()
+        entries = []
+        for user_id, papers, request_key in selections:
+            rows = {}
+            submitted = 0
+            for paper in papers:
+                row = _paper_row(paper)
+                if row is None:
+                    continue
+                submitted += 1
+                if row[0] not in rows:
+                    # 客户端的 savedAt 可能是毫秒时间戳、带时区的ISO时间或偏快的时钟，统一后再写入（按它排序和分页）
+                    saved_at = paper.get('savedAt')
+                    rows[row[0]] = row + (_sync_time(saved_at, now) if saved_at is not None else now,)
+            entries.append((user_id, request_key, rows, submitted))
+
+        results = [{"saved": 0, "duplicates": 0, "replayed": False} for _ in entries]
+        if not any(rows for _, _, rows, _ in entries):
+            return results
+
+        conn = self._connect()
+        with conn:
+            pending = []
+            for result, (user_id, request_key, rows, submitted) in zip(results, entries):
+                if rows and request_key is not None:
+                    before = conn.total_changes
+                    conn.execute(
+                        "INSERT OR IGNORE INTO save_requests (user_id, request_key, created_at) VALUES (?, ?, ?)",
+                        (user_id, request_key, now)
+                    )
+                    if conn.total_changes == before:
+                        result["replayed"] = True
+                        continue
+                if rows:
+                    pending.append((result, user_id, rows, submitted))
+            if not pending:
+                return results
+
+            papers = {}
+            for _, _, rows, _ in pending:
+                papers.update(rows)
+            conn.executemany(_INSERT_PAPER, [row[:7] for row in papers.values()])
+            conn.execute(_INDEX_NEW_PAPERS)
+            ids = self._paper_ids(conn, list(papers))
+            version = self._reserve_versions(conn, sum(len(rows) for _, _, rows, _ in pending))
+            for result, user_id, rows, submitted in pending:
+                before = conn.total_changes
+                conn.executemany(
+                    "INSERT OR IGNORE INTO saved_papers (user_id, paper_id, saved_at, version, modified_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    [(user_id, ids[key], row[7], version + i, now) for i, (key, row) in enumerate(rows.items())]
+                )
+                result["saved"] = conn.total_changes - before
+                result["duplicates"] = submitted - result["saved"]
+                version += len(rows)
+                # 重新保存的论文不再是已删除状态
+                conn.executemany(
+                    "DELETE FROM library_tombstones WHERE user_id = ? AND paper_id = ?",
+                    [(user_id, ids[key]) for key in rows]
+                )
+
+        return results
+
+    @staticmethod
+    def _paper_ids(conn, keys):
+        """按归一化标题批量查询论文id"""
+        ids = {}
+        # SQLite限制单条语句的参数个数，分批查询
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            ids.update(conn.execute(
+                f"SELECT title_key, id FROM papers WHERE title_key IN ({placeholders})", batch
+            ).fetchall())
+        return ids
+
+    def import_papers(self, user_id, papers, batch_size=IMPORT_BATCH_SIZE):
+        """
+        从可迭代对象中逐批导入论文（每批一个事务，与 save_papers 相同的按标题去重）
+
+        papers 可以是生成器，只在内存中保留一批；不是dict或没有标题的记录计为 skipped，
+        已经在用户储存库中的论文计为 duplicates（保留原来的保存时间）。
+        迭代中途抛出 ValueError（文件格式错误）时停止，已提交的批次保留，error 中给出原因。
+        返回 {"read", "saved", "duplicates", "skipped", "batches", "error"}
+        """
+        result = {"read": 0, "saved": 0, "duplicates": 0, "skipped": 0, "batches": 0, "error": None}
+        papers = iter(papers)
+        while True:
+            batch = []
+            try:
+                # savedAt 由 save_selections 统一格式
+                for paper in itertools.islice(papers, batch_size):
+                    result["read"] += 1
+                    batch.append(paper)
+            except ValueError as e:
+                result["error"] = str(e)
+            if batch:
+                saved = self.save_papers(user_id, batch)
+                result["saved"] += saved["saved"]
+                result["duplicates"] += saved["duplicates"]
+                result["skipped"] += len(batch) - saved["saved"] - saved["duplicates"]
+                result["batches"] += 1
+            if len(batch) < batch_size or result["error"]:
+                return result
+
+    def iter_papers(self, user_id, batch_size=EXPORT_BATCH_SIZE):
+        """
+        按保存时间从早到晚逐篇产出用户保存的论文（格式与 list_papers 相同）
+
+        按 (saved_at, paper_id) 分批查询，不在两批之间保持读事务，也不依赖调用线程（每批使用当前线程的连接）
+        """
+        last = ('', 0)
+        while True:
+            rows = self._connect().execute(
+                f"SELECT {_PAPER_COLUMNS} FROM saved_papers s JOIN papers p ON p.id = s.paper_id"
+                " WHERE s.user_id = ? AND (s.saved_at, s.paper_id) > (?, ?)"
+                " ORDER BY s.saved_at, s.paper_id LIMIT ?",
+                (user_id, last[0], last[1], batch_size)
+            ).fetchall()
+            for row in rows:
+                yield _row_to_paper(row)
+            if len(rows) < batch_size:
+                return
+            last = (rows[-1][-1], rows[-1][0])
+
+    def list_papers(self, user_id, page=1, page_size=20, sort='newest'):
+        """分页列出用户保存的论文"""
+        page = max(1, int(page))
+        page_size = max(1, min(MAX_PAGE_SIZE, int(page_size)))
+        order = SORT_ORDERS.get(sort, SORT_ORDERS['newest'])
+
+        conn = self._connect()
+        total = conn.execute(
+            "SELECT COUNT(*) FROM saved_papers WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {_PAPER_COLUMNS} FROM saved_papers s JOIN papers p ON p.id = s.paper_id"
+            f" WHERE s.user_id = ? ORDER BY {order} LIMIT ? OFFSET ?",
+            (user_id, page_size, (page - 1) * page_size)
+        ).fetchall()
+
+        return {
+            "papers": [_row_to_paper(row) for row in rows],
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "has_more": page * page_size < total,
+        }
+
+    def search(self, user_id, query, page=1, page_size=20, prefix=True):
+        """
+        在用户保存的论文中全文检索，按相关度排序分页返回
+
+        返回格式与 list_papers 相同，每篇论文多一个 score 字段（越小越相关）
+        """
+        page = max(1, int(page))
+        page_size = max(1, min(MAX_PAGE_SIZE, int(page_size)))
+        match = build_match_query(query, prefix=prefix)
+        result = {"papers": [], "total": 0, "page": page, "page_size": page_size, "has_more": False}
+        if match is None:
+            return result
+
+        # CROSS JOIN固定连接顺序：先在全文索引中匹配，再按主键查保存记录。
+        # 否则查询规划器可能先遍历用户的保存记录，对每一行重新执行一次MATCH
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT {_PAPER_COLUMNS}, {_RANK} AS score FROM papers_fts f"
+            " CROSS JOIN saved_papers s ON s.paper_id = f.rowid JOIN papers p ON p.id = f.rowid"
+            " WHERE papers_fts MATCH ? AND s.user_id = ?"
+            " ORDER BY score, s.saved_at DESC LIMIT ? OFFSET ?",
+            (match, user_id, page_size, (page - 1) * page_size)
+        ).fetchall()
+
+        if page == 1 and len(rows) < page_size:
+            # 第一页没有取满，不需要再统计总数
+            total = len(rows)
+        else:
+            total = conn.execute(
+                "SELECT COUNT(*) FROM papers_fts f CROSS JOIN saved_papers s ON s.paper_id = f.rowid"
+                " WHERE papers_fts MATCH ? AND s.user_id = ?",
+                (match, user_id)
+            ).fetchone()[0]
+
+        papers = []
+        for row in rows:
+            paper = _row_to_paper(row[:-1])
+            paper["score"] = round(row[-1], 4)
+            papers.append(paper)
+
+        result.update(papers=papers, total=total, has_more=page * page_size < total)
+        return result
+
+    def get_paper(self, user_id, paper_id):
+        """获取用户保存的单篇论文，不存在时返回None"""
+        row = self._connect().execute(
+            f"SELECT {_PAPER_COLUMNS} FROM saved_papers s JOIN papers p ON p.id = s.paper_id"
+            " WHERE s.user_id = ? AND s.paper_id = ?",
+            (user_id, paper_id)
+        ).fetchone()
+        return _row_to_paper(row) if row else None
+
+    def saved_titles(self, user_id, titles):
+        """titles 中用户已经保存过的论文，返回它们的归一化标题集合"""
+        keys = list({normalize_title(title) for title in titles} - {''})
+        saved = set()
+        conn = self._connect()
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            saved.update(key for key, in conn.execute(
+                "SELECT p.title_key FROM saved_papers s JOIN papers p ON p.id = s.paper_id"
+                f" WHERE s.user_id = ? AND p.title_key IN ({placeholders})",
+                [user_id] + batch
+            ))
+        return saved
+
+    def delete_paper(self, user_id, paper_id):
+        """从用户的储存库中删除论文（留下墓碑供其他设备同步），返回是否删除成功"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM saved_papers WHERE user_id = ? AND paper_id = ?",
+                (user_id, paper_id)
+            )
+            if cursor.rowcount:
+                conn.execute(
+                    "INSERT OR REPLACE INTO library_tombstones (user_id, paper_id, deleted_at, version)"
+                    " VALUES (?, ?, ?, ?)",
+                    (user_id, paper_id, utc_now(), self._reserve_versions(conn, 1))
+                )
+        return cursor.rowcount > 0
+
+    def clear(self, user_id):
+        """清空用户的储存库（每篇论文留下墓碑），返回删除的数量"""
+        conn = self._connect()
+        with conn:
+            count = conn.execute(
+                "SELECT COUNT(*) FROM saved_papers WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+            if not count:
+                return 0
+            conn.execute(
+                "INSERT OR REPLACE INTO library_tombstones (user_id, paper_id, deleted_at, version)"
+                " SELECT user_id, paper_id, ?, ? + ROW_NUMBER() OVER (ORDER BY paper_id) - 1"
+                " FROM saved_papers WHERE user_id = ?",
+                (utc_now(), self._reserve_versions(conn, count), user_id)
+            )
+            cursor = conn.execute("DELETE FROM saved_papers WHERE user_id = ?", (user_id,))
+        return cursor.rowcount
+
+    @staticmethod
+    def _reserve_versions(conn, count):
+        """在当前事务中分配 count 个连续的版本号，返回第一个（写事务串行执行，提交顺序与版本号顺序一致）"""
+        version = conn.execute(
+            "UPDATE sync_clock SET version = version + ? WHERE id = 1 RETURNING version", (count,)
+        ).fetchone()[0]
+        return version - count + 1
+
+    def sync(self, user_id, cursor=0, changes=(), limit=500):
+        """
+        增量同步：先合并客户端提交的变更，再返回游标之后该用户在服务器上的变更
+
+        changes: [{"op": "save", "paper": {...}, "modified_at": 时间},
+                  {"op": "delete", "id": 论文id 或 "key": 归一化标题, "modified_at": 时间}]
+        同一篇论文以时间戳较晚的操作为准（最后写入者胜），被拒绝的变更在 conflicts 中返回服务器上的当前状态。
+        本次提交并被接受的变更也会出现在 changes 中（带服务器分配的论文id），客户端只需按 changes 更新本地副本。
+
+        返回 {"cursor", "changes", "has_more", "reset", "applied", "conflicts"}。cursor 为0（首次同步）
+        或早于已清理的墓碑时只返回仍保存的论文，reset 为True，客户端应以此替换本地副本。
+        """
+        cursor = max(0, int(cursor))
+        limit = max(1, min(MAX_SYNC_PAGE, int(limit)))
+        if len(changes) > MAX_SYNC_CHANGES:
+            raise ValueError(f"一次最多同步 {MAX_SYNC_CHANGES} 个变更")
+
+        now = utc_now()
+        applied = 0
+        conflicts = []
+        conn = self._connect()
+        with conn:
+            if changes:
+                first = self._reserve_versions(conn, len(changes))
+                for offset, change in enumerate(changes):
+                    outcome, paper_id = self._apply_change(conn, user_id, change, first + offset, now)
+                    if outcome == 'applied':
+                        applied += 1
+                    elif outcome == 'conflict' and paper_id not in conflicts:
+                        conflicts.append(paper_id)
+                conn.execute(_INDEX_NEW_PAPERS)
+
+            clock, pruned = conn.execute("SELECT version, pruned FROM sync_clock").fetchone()
+            reset = cursor == 0 or cursor < pruned
+            if reset:
+                cursor = 0
+
+            records = self._changes_since(conn, user_id, cursor, limit + 1, tombstones=not reset)
+            has_more = len(records) > limit
+            records = records[:limit]
+            conflict_records = self._current_records(conn, user_id, conflicts)
+
+        return {
+            "cursor": records[-1]["version"] if has_more else clock,
+            "changes": records,
+            "has_more": has_more,
+            "reset": reset,
+            "applied": applied,
+            "conflicts": conflict_records,
+        }
+
+    def _apply_change(self, conn, user_id, change, version, now):
+        """按最后写入者胜合并一个客户端变更，返回 (applied/ignored/conflict, 论文id)"""
+        op = change.get('op') if isinstance(change, dict) else None
+        if op == 'save':
+            row = _paper_row(change.get('paper'))
+            if row is None:
+                return 'ignored', None
+            conn.execute(_INSERT_PAPER, row)
+            paper_id = self._paper_ids(conn, [row[0]])[row[0]]
+        elif op == 'delete':
+            paper_id = self._resolve_paper(conn, change)
+            if paper_id is None:
+                return 'ignored', None
+        else:
+            return 'ignored', None
+
+        modified_at = _sync_time(change.get('modified_at'), now)
+        saved = conn.execute(
+            "SELECT modified_at FROM saved_papers WHERE user_id = ? AND paper_id = ?", (user_id, paper_id)
+        ).fetchone()
+        deleted = conn.execute(
+            "SELECT deleted_at FROM library_tombstones WHERE user_id = ? AND paper_id = ?", (user_id, paper_id)
+        ).fetchone()
+        current = saved or deleted
+        if current is not None and modified_at < current[0]:
+            return 'conflict', paper_id
+
+        if op == 'save':
+            if saved:
+                return 'ignored', paper_id
+            # savedAt 与 save_selections 相同地统一格式（安卓版提交毫秒时间戳），否则按保存时间排序和分页会错乱
+            saved_at = change['paper'].get('savedAt')
+            conn.execute("DELETE FROM library_tombstones WHERE user_id = ? AND paper_id = ?", (user_id, paper_id))
+            conn.execute(
+                "INSERT INTO saved_papers (user_id, paper_id, saved_at, version, modified_at) VALUES (?, ?, ?, ?, ?)",
+                (user_id, paper_id, _sync_time(saved_at, now) if saved_at else modified_at, version, modified_at)
+            )
+        else:
+            if deleted and not saved:
+                return 'ignored', paper_id
+            # 服务器上没有保存记录时也留下墓碑，其他设备离线时保存的更早的记录同步上来会被拒绝
+            conn.execute("DELETE FROM saved_papers WHERE user_id = ? AND paper_id = ?", (user_id, paper_id))
+            conn.execute(
+                "INSERT OR REPLACE INTO library_tombstones (user_id, paper_id, deleted_at, version)"
+                " VALUES (?, ?, ?, ?)",
+                (user_id, paper_id, modified_at, version)
+            )
+        return 'applied', paper_id
+
+    def _resolve_paper(self, conn, change):
+        """删除操作指定的论文id（按 id，或按 key / title 的归一化标题），不存在时返回None"""
+        if change.get('id') is not None:
+            try:
+                row = conn.execute("SELECT id FROM papers WHERE id = ?", (int(change['id']),)).fetchone()
+            except (TypeError, ValueError):
+                return None
+            return row[0] if row else None
+        key = change.get('key') or normalize_title(change.get('title'))
+        return self._paper_ids(conn, [key]).get(key) if key else None
+
+    @staticmethod
+    def _changes_since(conn, user_id, cursor, limit, tombstones=True):
+        """游标之后的保存和删除记录，按版本号排序"""
+        params = (user_id, cursor, limit)
+        records = [
+            _sync_record('save', row) for row in conn.execute(
+                f"SELECT s.version, p.title_key, s.modified_at, {_PAPER_COLUMNS}"
+                " FROM saved_papers s JOIN papers p ON p.id = s.paper_id"
+                " WHERE s.user_id = ? AND s.version > ?"
+                " ORDER BY s.version LIMIT ?", params
+            )
+        ]
+        if tombstones:
+            records += [
+                _sync_record('delete', row) for row in conn.execute(
+                    "SELECT t.version, p.title_key, t.deleted_at, t.paper_id"
+                    " FROM library_tombstones t JOIN papers p ON p.id = t.paper_id"
+                    " WHERE t.user_id = ? AND t.version > ?"
+                    " ORDER BY t.version LIMIT ?", params
+                )
+            ]
+            records.sort(key=lambda record: record["version"])
+        return records[:limit]
+
+    @staticmethod
+    def _current_records(conn, user_id, paper_ids):
+        """论文在服务器上的当前状态（保存或删除记录）"""
+        records = []
+        for paper_id in paper_ids:
+            row = conn.execute(
+                f"SELECT s.version, p.title_key, s.modified_at, {_PAPER_COLUMNS}"
+                " FROM saved_papers s JOIN papers p ON p.id = s.paper_id"
+                " WHERE s.user_id = ? AND s.paper_id = ?", (user_id, paper_id)
+            ).fetchone()
+            if row:
+                records.append(_sync_record('save', row))
+                continue
+            row = conn.execute(
+                "SELECT t.version, p.title_key, t.deleted_at, t.paper_id"
+                " FROM library_tombstones t JOIN papers p ON p.id = t.paper_id"
+                " WHERE t.user_id = ? AND t.paper_id = ?", (user_id, paper_id)
+            ).fetchone()
+            if row:
+                records.append(_sync_record('delete', row))
+        return records
+
+    def prune_tombstones(self, max_age_days):
+        """
+        清理删除时间早于 max_age_days 天的墓碑，返回清理的数量
+
+        游标早于被清理墓碑版本号的客户端下次同步时收到完整的储存库（reset）
+        """
+        cutoff = _format_time(datetime.now(timezone.utc) - timedelta(days=max_age_days))
+        conn = self._connect()
+        with conn:
+            newest = conn.execute(
+                "SELECT MAX(version) FROM library_tombstones WHERE deleted_at < ?", (cutoff,)
+            ).fetchone()[0]
+            if newest is None:
+                return 0
+            conn.execute("UPDATE sync_clock SET pruned = MAX(pruned, ?)", (newest,))
+            cursor = conn.execute("DELETE FROM library_tombstones WHERE deleted_at < ?", (cutoff,))
+        return cursor.rowcount
+
+    def prune_save_requests(self, max_age_hours):
+        """清理早于 max_age_hours 小时的幂等键，返回清理的数量（之后再重试这些请求会重新保存）"""
+        cutoff = _format_time(datetime.now(timezone.utc) - timedelta(hours=max_age_hours))
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute("DELETE FROM save_requests WHERE created_at < ?", (cutoff,))
+        return cursor.rowcount
+
+    def tag_counts(self, limit=50):
+        """所有用户保存的论文中出现最多的标签，返回 [(标签, 保存次数)]"""
+        rows = self._connect().execute(
+            "SELECT MIN(t.value), COUNT(*) AS n"
+            " FROM saved_papers s JOIN papers p ON p.id = s.paper_id, json_each(p.tags) t"
+            " WHERE trim(t.value) != ''"
+            " GROUP BY lower(trim(t.value)) ORDER BY n DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [(tag.strip(), count) for tag, count in rows]
+
+    def ping(self):
+        """检查数据库是否可以访问（就绪检查），不可访问时抛出 sqlite3.Error"""
+        self._connect().execute("SELECT 1 FROM sync_clock").fetchone()
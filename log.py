@@ -0,0 +1,98 @@
+"""
+结构化日志 - 取代请求处理路径上的 print
+
+每条日志是一个事件名加若干字段：
+    log.info('papers_served', topic=topic, cache='miss', papers=5, ms=21034)
+文本格式输出为
+    2024-05-01 12:00:00,123 INFO papers_served topic="深度学习" cache=miss papers=5 ms=21034
+也可以配置为每行一个JSON对象，方便日志系统采集。
+
+级别低于配置的日志在进入函数时就返回，不会格式化字段。需要额外计算才能得到的字段
+（例如截取原始响应），调用方先用 log.enabled(logging.DEBUG) 判断。
+"""
+
+import json
+import logging
+import sys
+
+
+logger = logging.getLogger('xfind')
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+
+def _format_field(value):
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    if isinstance(value, (int, bool)) or value is None:
+        return str(value)
+    text = str(value)
+    if not text or any(c in text for c in ' ="\n'):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+class TextFormatter(logging.Formatter):
+    """时间 级别 事件 key=value ..."""
+
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname} {record.getMessage()}"
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f"{k}={_format_field(v)}" for k, v in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """每行一个JSON对象"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure(level='INFO', fmt='text', stream=None):
+    """设置日志级别和输出格式（text 或 json）"""
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+
+
+def enabled(level):
+    """该级别的日志是否会输出"""
+    return logger.isEnabledFor(level)
+
+
+def _log(level, event, fields, exc_info=False):
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields}, exc_info=exc_info)
+
+
+def debug(event, **fields):
+    _log(DEBUG, event, fields)
+
+
+def info(event, **fields):
+    _log(INFO, event, fields)
+
+
+def warning(event, **fields):
+    _log(WARNING, event, fields)
+
+
+def error(event, exc_info=False, **fields):
+    _log(ERROR, event, fields, exc_info)
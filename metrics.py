@@ -0,0 +1,188 @@
+"""
+运行指标 - 各处理阶段的耗时直方图，以Prometheus文本格式在 /metrics 导出
+
+一次论文推荐请求的耗时按阶段记录（单位秒）：
+    request_parse     解析请求体
+    similar_lookup    在相似研究方向索引中查找（缓存未命中时）
+    upstream_connect  新建到工作流API的TCP连接（复用连接时不记录）
+    upstream_tls      TLS握手（复用连接时不记录）
+    upstream_wait     发出请求到收到响应头，基本就是工作流生成论文的时间
+    body_read         读取响应体
+    json_decode       解析工作流响应的JSON
+    extraction        从模型输出中提取论文（parse_api_response；流式调用时包括规范化）
+    normalize         统一论文字段类型、去重并驻留（papers.PaperStore）
+    ranking           按用户储存库重新排列论文（ranking.LibraryRanker）
+    serialization     序列化返回给前端的JSON
+
+保存请求的写缓冲每批写入储存库的耗时记为 save_flush（save_buffer.SaveBuffer）。
+
+不依赖 prometheus_client，记录一次耗时只是一次二分查找和几次加法。
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+
+
+# 覆盖从微秒级的解析到分钟级的上游等待
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 20, 30, 60, 120,
+)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数器，可带标签"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """耗时直方图，可带标签"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [各区间计数..., 总和, 总数]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, *labels):
+        """记录 with 块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self, *labels):
+        """返回 (总数, 总和)，没有记录时为 (0, 0.0)"""
+        series = self._series.get(labels)
+        if series is None:
+            return 0, 0.0
+        return series[-1], series[-2]
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                label_text = _format_labels(self.labelnames, labels, ('le', _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{label_text} {series[-1]}")
+        return lines
+
+
+def render(gauges=None):
+    """
+    导出所有指标（Prometheus文本格式 0.0.4）
+
+    gauges: 额外导出的瞬时值 {名称: (说明, 值)}，例如缓存和连接池的统计
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    for name, (documentation, value) in (gauges or {}).items():
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 论文推荐请求各阶段耗时
+stage_seconds = Histogram(
+    'xfind_stage_duration_seconds', '论文推荐请求各处理阶段的耗时', ('stage',)
+)
+
+# 每个接口的请求数和总耗时
+requests_total = Counter(
+    'xfind_http_requests_total', '按接口和状态码统计的请求数', ('endpoint', 'status')
+)
+request_seconds = Histogram(
+    'xfind_http_request_duration_seconds', '按接口统计的请求总耗时', ('endpoint',)
+)
+
+# 被准入控制拒绝（429）的请求数
+admission_rejected = Counter(
+    'xfind_admission_rejected_total', '被限流或排队已满拒绝的请求数', ('reason',)
+)
+
+
+def stage(name):
+    """记录一个处理阶段的耗时：with metrics.stage('json_decode'): ..."""
+    return stage_seconds.time(name)
+
+
+def observe_stage(name, seconds):
+    """记录已经测得的阶段耗时"""
+    stage_seconds.observe(seconds, name)
+
+
+def observe_upstream(timings):
+    """记录连接池返回的上游阶段耗时（见 http_pool.PooledResponse.timings）"""
+    for key, stage_name in (('connect', 'upstream_connect'), ('tls', 'upstream_tls'),
+                            ('wait', 'upstream_wait'), ('read', 'body_read')):
+        value = timings.get(key)
+        if value is not None:
+            stage_seconds.observe(value, stage_name)
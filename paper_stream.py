@@ -0,0 +1,42 @@
+"""
+流式响应读取 - 解析工作流的SSE（text/event-stream）响应
+
+工作流以SSE逐段返回 choices[0].delta.content，拼接起来才是完整的 {"papers": [...]} JSON。
+增量文本交给 json_extract.PapersExtractor，每个论文对象一闭合就能推送给前端。
+"""
+
+
+def iter_sse_data(res):
+    """逐个返回SSE事件的data字段（多行data按规范用换行拼接）"""
+    data_lines = []
+    while True:
+        line = res.readline()
+        if not line:
+            break
+        line = line.decode('utf-8').rstrip('\r\n')
+
+        if not line:
+            if data_lines:
+                yield '\n'.join(data_lines)
+                data_lines = []
+            continue
+
+        if line.startswith('data:'):
+            value = line[5:]
+            data_lines.append(value[1:] if value.startswith(' ') else value)
+
+    if data_lines:
+        yield '\n'.join(data_lines)
+
+
+def extract_delta_content(chunk):
+    """从一个流式响应块中取出增量文本，没有内容时返回空字符串"""
+    choices = chunk.get('choices') if isinstance(chunk, dict) else None
+    if not choices:
+        return ''
+    choice = choices[0]
+    for field in ('delta', 'message'):
+        content = (choice.get(field) or {}).get('content')
+        if content:
+            return content
+    return ''
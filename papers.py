@@ -0,0 +1,195 @@
+"""
+论文规范化与去重 - parse_api_response 之后统一整理每篇论文
+
+工作流返回的论文字段类型并不固定（年份可能是数字或字符串，作者可能是逗号分隔的字符串或列表，
+标签可能缺失或是字符串），各个客户端都要再校验一遍。这里按 expected_format.json 的格式：
+- 只保留 title / authors / abstract / year / venue / tags 六个字段并统一类型，没有标题的论文丢弃
+- 按归一化的标题和作者计算指纹（fingerprint 字段），同一结果中重复的论文只保留一篇（字段更完整的那篇）
+- 同一篇论文在所有结果（包括缓存中成千上万个研究方向的结果）中只保存一份：
+  指纹相同的论文共用同一个对象，作者、期刊和标签字符串用 sys.intern 驻留
+
+共用的论文对象只读，不要在返回给调用方之后修改。
+"""
+
+import hashlib
+import re
+import sys
+import threading
+import weakref
+
+from library_store import normalize_title
+
+
+PAPER_FIELDS = ('title', 'authors', 'abstract', 'year', 'venue', 'tags')
+
+# 作者之间的分隔符：中英文逗号、分号、顿号和 " and "
+_AUTHOR_SEPARATORS = re.compile(r'\s*(?:[,，;；、]|\band\b)\s*')
+_TAG_SEPARATORS = re.compile(r'\s*[,，;；、]\s*')
+
+
+class Paper(dict):
+    """规范化后的论文（普通dict，可以直接序列化为JSON），支持弱引用以便在不再使用时释放"""
+
+    __slots__ = ('__weakref__',)
+
+
+def _text(value):
+    """字符串字段：None 变为空字符串，其他类型转为字符串，折叠首尾空白"""
+    if value is None:
+        return ''
+    return (value if isinstance(value, str) else str(value)).strip()
+
+
+def coerce_year(year):
+    """年份可能是数字或字符串（"2024"、"2024年"、"2024-05"），无法识别时返回None"""
+    if isinstance(year, bool):
+        return None
+    if isinstance(year, int):
+        return year
+    match = re.search(r'\d{4}', _text(year))
+    return int(match.group()) if match else None
+
+
+def split_authors(authors):
+    """作者列表：接受逗号分隔的字符串或列表，去掉空项"""
+    if isinstance(authors, (list, tuple)):
+        names = [_text(a) for a in authors]
+    else:
+        names = _AUTHOR_SEPARATORS.split(_text(authors))
+    return [n for n in names if n]
+
+
+def split_tags(tags):
+    """标签列表：接受列表或逗号分隔的字符串，去掉空项和重复项"""
+    if isinstance(tags, (list, tuple)):
+        items = [_text(t) for t in tags]
+    else:
+        items = _TAG_SEPARATORS.split(_text(tags))
+    return list(dict.fromkeys(t for t in items if t))
+
+
+def normalize_paper(raw):
+    """
+    按 expected_format.json 规范化一篇论文，返回新的 dict；不是对象或没有标题时返回None
+
+    authors 统一为 ", " 分隔的字符串，year 为整数或None，tags 为字符串列表，其余字段为字符串
+    """
+    if not isinstance(raw, dict):
+        return None
+    title = re.sub(r'\s+', ' ', _text(raw.get('title')))
+    if not normalize_title(title):
+        return None
+    return {
+        "title": title,
+        "authors": ', '.join(split_authors(raw.get('authors'))),
+        "abstract": _text(raw.get('abstract')),
+        "year": coerce_year(raw.get('year')),
+        "venue": _text(raw.get('venue')),
+        "tags": split_tags(raw.get('tags')),
+    }
+
+
+def paper_fingerprint(paper):
+    """按归一化的标题和作者（忽略顺序、大小写和空白）计算指纹，16位十六进制"""
+    authors = sorted(re.sub(r'\s+', '', a).casefold() for a in split_authors(paper.get('authors')))
+    key = normalize_title(paper.get('title')) + '\x1f' + '\x1f'.join(authors)
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class PaperStore:
+    """
+    论文驻留表（线程安全）：指纹 -> 共用的 Paper 对象
+
+    只持有弱引用，没有任何结果（缓存条目、正在返回的响应）再引用某篇论文时自动释放，不需要容量上限。
+    """
+
+    def __init__(self):
+        self._papers = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.interned = 0
+        self.shared = 0
+        self.invalid = 0
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self._papers)
+
+    def intern(self, raw):
+        """规范化一篇论文并返回共用的对象；无效时返回None"""
+        paper = normalize_paper(raw)
+        if paper is None:
+            with self._lock:
+                self.invalid += 1
+            return None
+        fingerprint = paper_fingerprint(paper)
+        with self._lock:
+            existing = self._papers.get(fingerprint)
+            # 已有的版本字段不比新版本少时直接共用；否则用新版本替换（已引用旧版本的结果不受影响）
+            if existing is not None and _filled(existing) >= _filled(paper):
+                self.shared += 1
+                return existing
+            compact = Paper(
+                title=paper['title'],
+                authors=sys.intern(paper['authors']),
+                abstract=paper['abstract'],
+                year=paper['year'],
+                venue=sys.intern(paper['venue']),
+                tags=[sys.intern(t) for t in paper['tags']],
+                fingerprint=fingerprint,
+            )
+            self._papers[fingerprint] = compact
+            self.interned += 1
+            return compact
+
+    def normalize_result(self, parsed):
+        """
+        规范化 parse_api_response 的结果：{"papers": [...]} 中的每篇论文换成共用的对象，
+        丢弃无效和重复的论文；不是这种格式时原样返回
+        """
+        if not isinstance(parsed, dict) or 'papers' not in parsed:
+            return parsed
+        papers = parsed['papers'] if isinstance(parsed['papers'], list) else []
+        return dict(parsed, papers=self.dedup(papers))
+
+    def dedup(self, papers, seen=None):
+        """
+        规范化一组论文，按指纹去掉重复项；seen 为之前已经出现过的指纹集合（会被更新）
+
+        同一组中重复的论文保留第一篇的位置，但字段更完整的版本优先
+        """
+        seen = set() if seen is None else seen
+        result = []
+        positions = {}  # 本组论文的指纹 -> 在 result 中的位置
+        for raw in papers:
+            paper = self.intern(raw)
+            if paper is None:
+                continue
+            fingerprint = paper['fingerprint']
+            if fingerprint in seen:
+                with self._lock:
+                    self.duplicates += 1
+                index = positions.get(fingerprint)
+                if index is not None and _filled(paper) > _filled(result[index]):
+                    result[index] = paper
+                continue
+            seen.add(fingerprint)
+            positions[fingerprint] = len(result)
+            result.append(paper)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "papers": len(self._papers),
+                "interned": self.interned,
+                "shared": self.shared,
+                "invalid": self.invalid,
+                "duplicates": self.duplicates,
+            }
+
+
+def _filled(paper):
+    """有内容的字段数"""
+    return sum(1 for field in PAPER_FIELDS if paper.get(field) not in (None, '', []))
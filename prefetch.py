@@ -0,0 +1,216 @@
+"""
+推荐预取 - 在上游空闲时提前计算热门研究方向的论文推荐
+
+第一个查询某个研究方向的用户总要等待完整的工作流耗时（几十秒）。这里在后台：
+- 统计研究方向热度：/api/get-papers 等接口的请求（按半衰期衰减），加上储存库中保存论文的标签
+- 定期取热度最高的 top_n 个研究方向，缓存中没有或即将过期的，在上游空闲时调用工作流写入缓存
+- 每小时的预取调用次数有上限，并且只在连接池有空闲连接时调用，不挤占用户的实时请求
+"""
+
+import threading
+import time
+from collections import deque
+
+import log
+from cache import normalize_topic
+
+
+class TopicTracker:
+    """研究方向热度统计（线程安全），热度按半衰期指数衰减"""
+
+    def __init__(self, half_life=6 * 3600, max_topics=1000):
+        self.half_life = half_life
+        self.max_topics = max_topics
+        self._scores = {}  # key -> [热度, 更新时间, 原始写法]
+        self._lock = threading.Lock()
+
+    def _decayed(self, entry, now):
+        score, updated_at, _ = entry
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def record(self, topic, weight=1.0):
+        """记录一次请求"""
+        key = normalize_topic(topic)
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._scores.get(key)
+            score = self._decayed(entry, now) if entry else 0.0
+            self._scores[key] = [score + weight, now, topic.strip()]
+
+            # 超出容量时去掉热度最低的十分之一，避免每次记录都要排序
+            if len(self._scores) > self.max_topics:
+                ranked = sorted(self._scores, key=lambda k: self._decayed(self._scores[k], now))
+                for stale in ranked[:max(1, self.max_topics // 10)]:
+                    del self._scores[stale]
+
+    def scores(self):
+        """当前热度 {归一化研究方向: (原始写法, 热度)}"""
+        now = time.time()
+        with self._lock:
+            return {key: (entry[2], self._decayed(entry, now)) for key, entry in self._scores.items()}
+
+    def __len__(self):
+        return len(self._scores)
+
+
+class HourlyBudget:
+    """最近一小时内的调用次数上限（滑动窗口，线程安全）"""
+
+    WINDOW = 3600
+
+    def __init__(self, calls_per_hour):
+        self.calls_per_hour = calls_per_hour
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._calls and now - self._calls[0] >= self.WINDOW:
+            self._calls.popleft()
+
+    def try_acquire(self):
+        """还有额度时记一次调用并返回True"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if len(self._calls) >= self.calls_per_hour:
+                return False
+            self._calls.append(now)
+            return True
+
+    def remaining(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return max(0, self.calls_per_hour - len(self._calls))
+
+
+class PrefetchScheduler:
+    """
+    后台预取线程
+
+    fetch(topic):  调用工作流并写入缓存（与用户请求走同一条路径，相同研究方向会合并）
+    is_idle():     上游是否有空闲容量，返回False时本轮停止预取
+    tag_counts():  可选，返回 [(标签, 次数)]，保存论文的标签按 tag_weight 计入热度
+    refresh_after: 缓存条目保存超过这么多秒就重新预取，默认是缓存有效期的80%
+    """
+
+    def __init__(self, tracker, cache, fetch, is_idle, calls_per_hour=30, top_n=20,
+                 interval=60, refresh_after=None, tag_counts=None, tag_weight=0.5,
+                 retry_after=600):
+        self.tracker = tracker
+        self.cache = cache
+        self.fetch = fetch
+        self.is_idle = is_idle
+        self.budget = HourlyBudget(calls_per_hour)
+        self.top_n = top_n
+        self.interval = interval
+        self.refresh_after = refresh_after if refresh_after is not None else cache.ttl * 0.8
+        self.tag_counts = tag_counts
+        self.tag_weight = tag_weight
+        self.retry_after = retry_after
+
+        self._attempts = {}  # key -> 上次预取时间，失败的研究方向不会每轮重试
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        # 统计计数
+        self.runs = 0
+        self.prefetched = 0
+        self.failures = 0
+        self.skipped_busy = 0
+        self.skipped_budget = 0
+
+    def start(self):
+        """启动后台线程（重复调用无副作用）"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+                self._thread.start()
+                log.info('prefetch_started', top_n=self.top_n, calls_per_hour=self.budget.calls_per_hour)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                log.error('prefetch_failed', exc_info=True, error=str(e))
+
+    def ranked_topics(self):
+        """按热度排序的前 top_n 个研究方向 [(原始写法, 热度)]"""
+        scores = self.tracker.scores()
+        if self.tag_counts is not None:
+            for tag, count in self.tag_counts(self.top_n * 2):
+                key = normalize_topic(tag)
+                topic, score = scores.get(key, (tag, 0.0))
+                scores[key] = (topic, score + count * self.tag_weight)
+        ranked = sorted(scores.values(), key=lambda item: item[1], reverse=True)
+        return ranked[:self.top_n]
+
+    def candidates(self):
+        """需要预取的研究方向：缓存中没有或即将过期，且最近没有尝试过"""
+        now = time.time()
+        topics = []
+        for topic, _ in self.ranked_topics():
+            age = self.cache.age(topic)
+            if age is not None and age < self.refresh_after:
+                continue
+            if now - self._attempts.get(normalize_topic(topic), 0) < self.retry_after:
+                continue
+            topics.append(topic)
+        return topics
+
+    def run_once(self):
+        """执行一轮预取，返回成功预取的研究方向数"""
+        self.runs += 1
+        done = 0
+        for topic in self.candidates():
+            if self._stop.is_set():
+                break
+            if not self.is_idle():
+                self.skipped_busy += 1
+                break
+            if not self.budget.try_acquire():
+                self.skipped_budget += 1
+                break
+
+            self._attempts[normalize_topic(topic)] = time.time()
+            start = time.perf_counter()
+            try:
+                self.fetch(topic)
+            except Exception as e:
+                self.failures += 1
+                log.warning('prefetch_error', topic=topic, error=str(e))
+                continue
+            done += 1
+            self.prefetched += 1
+            log.info('prefetched', topic=topic, ms=round((time.perf_counter() - start) * 1000))
+
+        # 清理早已过了重试间隔的记录
+        now = time.time()
+        for key in [k for k, t in self._attempts.items() if now - t >= self.retry_after]:
+            del self._attempts[key]
+        return done
+
+    def stats(self):
+        """返回预取统计信息"""
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "tracked_topics": len(self.tracker),
+            "top_topics": [[topic, round(score, 2)] for topic, score in self.ranked_topics()],
+            "calls_per_hour": self.budget.calls_per_hour,
+            "budget_remaining": self.budget.remaining(),
+            "runs": self.runs,
+            "prefetched": self.prefetched,
+            "failures": self.failures,
+            "skipped_busy": self.skipped_busy,
+            "skipped_budget": self.skipped_budget,
+        }
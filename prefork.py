@@ -0,0 +1,274 @@
+"""
+多进程部署入口 - 预先fork多个工作进程共同监听一个端口
+
+`python backend.py` 启动的是Flask开发服务器（单进程、debug模式、自动重载），不适合线上使用。
+这里由主进程监听端口后fork出N个工作进程，每个工作进程导入 backend 并用多线程WSGI服务器处理请求：
+- 工作进程共用 XFIND_STATE_PATH 指定的SQLite文件（WAL模式）作为推荐缓存和进行中的上游调用表，
+  一个进程得到的结果其他进程直接命中，多个进程同时请求同一研究方向时只调用一次工作流
+- 工作进程异常退出时主进程重新fork
+- 收到 SIGTERM/SIGINT 时平滑停止：工作进程不再接受新连接，就绪检查返回503，
+  等正在处理的请求（包括SSE流）结束后退出，超过 graceful_timeout 仍未退出的强制结束
+- GET /healthz 为存活检查，GET /readyz 为就绪检查（停止中或数据库不可用时返回503）
+
+只支持 Linux/macOS（需要 os.fork）；Windows 下只能以单进程运行。
+
+用法：
+    python prefork.py --workers 4 --port 5000
+    python prefork.py --workers 8 --state /var/lib/xfind/state.db --graceful-timeout 60
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import log
+from settings import settings
+
+
+# 主进程传给工作进程的环境变量
+WORKER_ID_ENV = 'XFIND_WORKER_ID'
+STATE_PATH_ENV = 'XFIND_STATE_PATH'
+
+
+class WorkerState:
+    """本进程的生命周期状态和正在处理的请求数（线程安全）"""
+
+    def __init__(self):
+        self.worker_id = os.environ.get(WORKER_ID_ENV)
+        self.started_at = time.time()
+        self.draining = False
+        self.active = 0
+        self._cond = threading.Condition()
+
+    @property
+    def primary(self):
+        """是否是第一个工作进程（或单进程运行），后台预取等只需要一个进程执行的任务只在这里运行"""
+        return self.worker_id in (None, '0')
+
+    def begin(self):
+        with self._cond:
+            self.active += 1
+
+    def end(self):
+        with self._cond:
+            self.active -= 1
+            if self.active == 0:
+                self._cond.notify_all()
+
+    def drain(self, timeout):
+        """标记为停止中，等待正在处理的请求结束；超时仍未结束时返回False"""
+        with self._cond:
+            self.draining = True
+            return self._cond.wait_for(lambda: self.active == 0, timeout)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pid": os.getpid(),
+                "worker": self.worker_id,
+                "uptime": round(time.time() - self.started_at, 1),
+                "draining": self.draining,
+                "active_requests": self.active,
+            }
+
+
+def track_requests(wsgi_app, state):
+    """WSGI中间件：统计正在处理的请求数，流式响应在响应体关闭时才算结束"""
+    from werkzeug.wsgi import ClosingIterator
+
+    def middleware(environ, start_response):
+        state.begin()
+        try:
+            body = wsgi_app(environ, start_response)
+        except BaseException:
+            state.end()
+            raise
+        return ClosingIterator(body, state.end)
+
+    return middleware
+
+
+def run_worker(listener, worker_id, graceful_timeout):
+    """工作进程：导入后端（连接和数据库在fork之后打开），在继承的监听套接字上处理请求直到收到 SIGTERM"""
+    os.environ[WORKER_ID_ENV] = str(worker_id)
+    # Ctrl+C 发给整个进程组，由主进程统一转为 SIGTERM；导入完成之前收到 SIGTERM 直接退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    from werkzeug.serving import make_server
+    import backend
+
+    state = backend.worker_state
+    backend.app.wsgi_app = track_requests(backend.app.wsgi_app, state)
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, backend.app, threaded=True, fd=listener.fileno())
+
+    def stop(signum, frame):
+        state.draining = True
+        # shutdown 等待 serve_forever 退出，不能在信号处理函数所在的主线程中调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    log.info('worker_started', worker=worker_id, pid=os.getpid())
+    server.serve_forever()
+
+    drained = state.drain(graceful_timeout)
+    backend.prefetch_scheduler.stop(timeout=1)
+    backend.workflow_pool.close()
+    if backend.save_buffer is not None:
+        # 写入排队中的保存请求（失败时保存到文件）
+        backend.save_buffer.close()
+    log.info('worker_stopped', worker=worker_id, pid=os.getpid(), drained=drained, active=state.active)
+
+
+class PreforkServer:
+    """主进程：监听端口，fork并看护工作进程，转发停止信号"""
+
+    def __init__(self, host='0.0.0.0', port=5000, workers=2, graceful_timeout=30, backlog=128):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.listener = None
+
+        self._children = {}  # pid -> 工作进程编号
+        self._stopping = False
+
+    def bind(self):
+        """在fork之前监听端口，所有工作进程继承同一个套接字，由内核分配连接"""
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((self.host, self.port))
+        self.listener.listen(self.backlog)
+        self.listener.set_inheritable(True)
+        self.port = self.listener.getsockname()[1]
+        return self.listener
+
+    def spawn(self, worker_id):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.listener, worker_id, self.graceful_timeout)
+            except BaseException:
+                log.error('worker_crashed', exc_info=True, worker=worker_id, pid=os.getpid())
+                code = 1
+            finally:
+                # 不执行从主进程继承的清理逻辑
+                os._exit(code)
+        self._children[pid] = worker_id
+        return pid
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        """启动工作进程并看护到收到停止信号，返回退出码"""
+        if self.listener is None:
+            self.bind()
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        log.info('prefork_started', host=self.host, port=self.port, workers=self.workers, pid=os.getpid())
+        started = {}
+        for worker_id in range(self.workers):
+            started[worker_id] = time.monotonic()
+            self.spawn(worker_id)
+
+        while not self._stopping:
+            time.sleep(0.5)
+            for pid, status in self._reap():
+                worker_id = self._children.pop(pid)
+                if self._stopping:
+                    continue
+                log.warning('worker_exited', worker=worker_id, pid=pid, status=status)
+                # 启动后马上退出（例如配置错误）时放慢重启，避免空转
+                if time.monotonic() - started[worker_id] < 5:
+                    time.sleep(1)
+                started[worker_id] = time.monotonic()
+                self.spawn(worker_id)
+
+        self.stop()
+        return 0
+
+    def _reap(self):
+        """回收已退出的工作进程，返回 [(pid, 退出状态)]"""
+        exited = []
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in self._children:
+                exited.append((pid, os.waitstatus_to_exitcode(status)))
+        return exited
+
+    def stop(self):
+        """通知所有工作进程平滑停止，超过 graceful_timeout 仍未退出的强制结束"""
+        log.info('prefork_stopping', workers=len(self._children), graceful_timeout=self.graceful_timeout)
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self._children.pop(pid, None)
+
+        # 工作进程自己最多等待 graceful_timeout，这里多留一点退出的时间
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self._children and time.monotonic() < deadline:
+            for pid, _ in self._reap():
+                self._children.pop(pid, None)
+            time.sleep(0.1)
+
+        for pid in list(self._children):
+            log.warning('worker_killed', worker=self._children.pop(pid), pid=pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.listener.close()
+        log.info('prefork_stopped')
+
+
+def main():
+    server_config = settings['SERVER_CONFIG']
+    log_config = settings['LOG_CONFIG']
+    parser = argparse.ArgumentParser(description="多进程部署入口")
+    parser.add_argument('--host', default=server_config.get('host', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=server_config.get('port', 5000))
+    parser.add_argument('--workers', type=int, default=server_config.get('workers') or os.cpu_count() or 2,
+                        help="工作进程数，默认为CPU核数")
+    parser.add_argument('--state', default=server_config.get('state_path', 'xfind_state.db'),
+                        help="工作进程共用的缓存和进行中调用表（SQLite文件）；CACHE_CONFIG 设置了 path 时使用该文件")
+    parser.add_argument('--graceful-timeout', type=float, default=server_config.get('graceful_timeout', 30),
+                        help="停止时等待正在处理的请求结束的最长秒数")
+    parser.add_argument('--backlog', type=int, default=server_config.get('backlog', 128))
+    args = parser.parse_args()
+
+    log.configure(log_config.get('level', 'INFO'), log_config.get('format', 'text'))
+    os.environ.setdefault(STATE_PATH_ENV, args.state)
+
+    if not hasattr(os, 'fork'):
+        print("⚠️  当前系统不支持 os.fork，以单进程运行（Windows 下建议使用 asgi_backend.py）")
+        from werkzeug.serving import run_simple
+        import backend
+        run_simple(args.host, args.port, backend.app, threaded=True)
+        return
+
+    server = PreforkServer(args.host, args.port, args.workers, args.graceful_timeout, args.backlog)
+    server.bind()
+    print(f"服务器启动在 http://localhost:{server.port}（{args.workers} 个工作进程）")
+    print("=" * 50)
+    sys.exit(server.run())
+
+
+if __name__ == '__main__':
+    main()
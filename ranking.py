@@ -0,0 +1,280 @@
+"""
+个性化排序 - 按用户储存库中保存过的论文重新排列工作流推荐的论文
+
+工作流返回的论文按大模型输出的顺序排列，不考虑用户之前右滑保存过什么。这里为每个用户建一个兴趣向量：
+- 每篇论文的标签（整体和其中的词）、标题和摘要中的词（英文取单词，中文取相邻两字）
+  按字段加权计数、取对数后用特征哈希映射到固定维数的向量，并归一化
+- 用户的兴趣向量是他保存过的论文向量之和；打分时两边都乘以IDF（出现在越多论文中的词权重越低），
+  再计算余弦相似度，按得分从高到低排列，得分相同时保持原来的顺序
+- 用户已经保存过的论文直接去掉
+
+兴趣向量按储存库的同步游标增量更新：每次排序前取游标之后的变更，新保存的论文直接累加，
+有删除（或游标失效）时整个重建。多进程部署时其他进程保存的论文也会在下一次排序时加入。
+候选论文的向量按指纹缓存，缓存命中时给1000篇论文打分只需要几毫秒。
+IDF统计的是本进程计算过向量的所有论文（保存的和推荐的），随着运行时间增长逐渐接近真实的词频分布。
+
+有NumPy时用数组运算一次算完所有候选论文的得分；没有NumPy时退化为稀疏向量逐篇计算。
+NumPy在第一次排序时才导入（topic_index.load_numpy）。
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+from library_store import normalize_title
+from tokenizer import query_terms
+from topic_index import DEFAULT_DIM, feature_hash, load_numpy
+
+
+# 各字段中的词的权重：标签最能代表论文的方向，其次是标题
+FIELD_WEIGHTS = (('tags', 3.0), ('title', 2.0), ('abstract', 1.0))
+
+# 没有区分度的英文虚词（其余常见词由IDF降低权重）
+_STOPWORDS = frozenset(
+    'a an and are as at be by for from has have in is it its of on or our that the their this to via we with'
+    .split()
+)
+
+
+def paper_features(paper):
+    """论文的特征及权重 {特征: 权重}（按字段加权的词频取对数）"""
+    counts = {}
+
+    def add(feature, weight):
+        counts[feature] = counts.get(feature, 0.0) + weight
+
+    for field, weight in FIELD_WEIGHTS:
+        value = paper.get(field)
+        if field == 'tags':
+            # 标签整体也作为一个特征（"图神经网络"比其中任意两个字更能说明方向）
+            tags = [str(tag).strip().casefold() for tag in value] if isinstance(value, (list, tuple)) else []
+            for tag in filter(None, tags):
+                add('t:' + tag, weight)
+            value = ' '.join(tags)
+        if not isinstance(value, str):
+            continue
+        for word, is_cjk, _ in query_terms(value.casefold()):
+            if is_cjk:
+                if len(word) == 1:
+                    add(word, weight)
+                for i in range(len(word) - 1):
+                    add(word[i:i + 2], weight)
+            elif len(word) > 1 and word not in _STOPWORDS:
+                # 去掉复数的 s：networks 与 network 视为同一个词
+                if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+                    word = word[:-1]
+                add('w:' + word, weight)
+    return {feature: 1.0 + math.log(count) for feature, count in counts.items()}
+
+
+def paper_vector(paper, dim=DEFAULT_DIM):
+    """归一化的哈希特征向量，返回 (维度列表, 值列表)，按维度排序；没有特征时两个列表都为空"""
+    vector = {}
+    for feature, weight in paper_features(paper).items():
+        index, sign = feature_hash(feature, dim)
+        vector[index] = vector.get(index, 0.0) + sign * weight
+    vector = {i: v for i, v in vector.items() if v}
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    if not norm:
+        return [], []
+    indices = sorted(vector)
+    return indices, [vector[i] / norm for i in indices]
+
+
+class _Profile:
+    """一个用户的兴趣向量和已保存论文的归一化标题"""
+
+    def __init__(self, dim):
+        self.cursor = 0
+        self.keys = set()
+        self.papers = 0
+        np = load_numpy()
+        self.vector = np.zeros(dim, dtype=np.float32) if np is not None else {}
+
+    def add(self, indices, values):
+        np = load_numpy()
+        if np is not None:
+            np.add.at(self.vector, indices, values)
+        else:
+            for i, v in zip(indices, values):
+                self.vector[i] = self.vector.get(i, 0.0) + v
+        self.papers += 1
+
+
+class LibraryRanker:
+    """
+    按储存库为每个用户的推荐结果排序（线程安全）
+
+    changes:      储存库的增量同步函数 changes(user_id, cursor)，返回 LibraryStore.sync 的结果
+    max_profiles: 内存中最多保存的用户兴趣向量数，超出时淘汰最久没有使用的
+    cache_size:   最多缓存的论文向量数（按指纹）
+    max_papers:   每个兴趣向量最多累加的论文数；之后保存的论文只用于去掉已保存的，
+                  导入很大的储存库后第一次排序不需要为每篇论文计算向量
+    """
+
+    def __init__(self, changes, dim=DEFAULT_DIM, max_profiles=1024, cache_size=20000, max_papers=2000):
+        self.changes = changes
+        self.dim = dim
+        self.max_profiles = max_profiles
+        self.cache_size = cache_size
+        self.max_papers = max_papers
+
+        self._profiles = OrderedDict()  # 用户 -> _Profile
+        self._vectors = OrderedDict()   # 指纹或归一化标题 -> (维度, 值)
+        self._lock = threading.Lock()
+        # 文档频率：每个维度出现在多少篇论文中（IDF），第一次计算论文向量时创建
+        self._df = None
+        self._documents = 0
+        self._idf = None  # (文档数, IDF)，文档数不变时复用
+
+        # 统计计数
+        self.ranked = 0
+        self.dropped = 0
+        self.rebuilds = 0
+        self.vector_hits = 0
+        self.vector_misses = 0
+
+    def rank(self, user_id, papers):
+        """
+        按用户的兴趣重新排列论文并去掉已保存的，返回新的列表
+
+        用户还没有保存过论文时原样返回 papers
+        """
+        if not papers:
+            return papers
+        with self._lock:
+            profile = self._profile(user_id)
+            if not profile.papers:
+                return papers
+            vectors = [self._vector(paper) for paper in papers]
+            kept = [i for i, vector in enumerate(vectors) if vector[0] not in profile.keys]
+            scores = self._scores(profile, [vectors[i] for i in kept])
+            self.ranked += 1
+            self.dropped += len(papers) - len(kept)
+        order = sorted(range(len(kept)), key=lambda i: -scores[i])
+        return [papers[kept[i]] for i in order]
+
+    def _profile(self, user_id):
+        """用户的兴趣向量，先合并储存库中游标之后的变更（调用方需持有锁）"""
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            profile = _Profile(self.dim)
+            self._profiles[user_id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        self._profiles.move_to_end(user_id)
+
+        while True:
+            result = self.changes(user_id, profile.cursor)
+            deleted = any(change['op'] == 'delete' for change in result['changes'])
+            if deleted or (result['reset'] and profile.cursor):
+                # 删除的论文无法从向量中精确减掉，从头重建
+                self.rebuilds += 1
+                profile = self._profiles[user_id] = _Profile(self.dim)
+                continue
+            for change in result['changes']:
+                if change['key'] in profile.keys:
+                    continue
+                profile.keys.add(change['key'])
+                if profile.papers >= self.max_papers:
+                    continue
+                _, indices, values = self._vector(change['paper'])
+                if len(indices):
+                    profile.add(indices, values)
+            profile.cursor = result['cursor']
+            if not result['has_more']:
+                return profile
+
+    def _vector(self, paper):
+        """
+        论文的 (归一化标题, 维度, 值)，按指纹缓存；第一次计算时计入文档频率（调用方需持有锁）
+        """
+        title_key = None
+        key = paper.get('fingerprint')
+        if not key:
+            key = title_key = normalize_title(paper.get('title'))
+        vector = self._vectors.get(key)
+        if vector is not None:
+            self._vectors.move_to_end(key)
+            self.vector_hits += 1
+            return vector
+
+        self.vector_misses += 1
+        if title_key is None:
+            title_key = normalize_title(paper.get('title'))
+        indices, values = paper_vector(paper, self.dim)
+        np = load_numpy()
+        if self._df is None:
+            self._df = np.zeros(self.dim, dtype=np.float32) if np is not None else [0] * self.dim
+        if np is not None:
+            vector = (title_key, np.array(indices, dtype=np.intp), np.array(values, dtype=np.float32))
+            self._df[vector[1]] += 1
+        else:
+            vector = (title_key, indices, values)
+            for i in indices:
+                self._df[i] += 1
+        self._documents += 1
+        self._vectors[key] = vector
+        while len(self._vectors) > self.cache_size:
+            self._vectors.popitem(last=False)
+        return vector
+
+    def _scores(self, profile, vectors):
+        """论文向量（_vector 的结果）与兴趣向量的TF-IDF余弦相似度（调用方需持有锁）"""
+        if not vectors:
+            return []
+        idf = self._current_idf()
+
+        np = load_numpy()
+        if np is not None:
+            weighted = profile.vector * idf
+            norm = float(np.linalg.norm(weighted))
+            if not norm:
+                return np.zeros(len(vectors))
+            lengths = [len(indices) for _, indices, _ in vectors]
+            indices = np.concatenate([indices for _, indices, _ in vectors])
+            values = np.concatenate([values for _, _, values in vectors]) * idf[indices]
+            owners = np.repeat(np.arange(len(vectors)), lengths)
+            dots = np.bincount(owners, weights=values * weighted[indices], minlength=len(vectors))
+            norms = np.sqrt(np.bincount(owners, weights=values * values, minlength=len(vectors)))
+            return np.divide(dots, norms * norm, out=np.zeros(len(vectors)), where=norms > 0)
+
+        # 点积 = Σ 候选值 × IDF × 兴趣值 × IDF，兴趣向量一侧预先乘好 IDF²
+        weighted = {i: v * idf[i] * idf[i] for i, v in profile.vector.items()}
+        norm = math.sqrt(sum((v * idf[i]) ** 2 for i, v in profile.vector.items()))
+        scores = []
+        for _, indices, values in vectors:
+            dot = length = 0.0
+            for i, v in zip(indices, values):
+                dot += v * weighted.get(i, 0.0)
+                length += (v * idf[i]) ** 2
+            scores.append(dot / (math.sqrt(length) * norm) if length and norm else 0.0)
+        return scores
+
+    def _current_idf(self):
+        """每个维度的IDF，只在有新论文计入文档频率后重新计算（调用方需持有锁）"""
+        if self._idf is None or self._idf[0] != self._documents:
+            documents = self._documents + 1
+            np = load_numpy()
+            if np is not None:
+                idf = np.log(documents / (self._df + 1.0)) + 1.0
+            else:
+                idf = [math.log(documents / (df + 1.0)) + 1.0 for df in self._df]
+            self._idf = (self._documents, idf)
+        return self._idf[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "profiles": len(self._profiles),
+                "max_profiles": self.max_profiles,
+                "vectors": len(self._vectors),
+                "documents": self._documents,
+                "dim": self.dim,
+                "numpy": load_numpy() is not None,
+                "ranked": self.ranked,
+                "dropped": self.dropped,
+                "rebuilds": self.rebuilds,
+                "vector_hits": self.vector_hits,
+                "vector_misses": self.vector_misses,
+            }
@@ -0,0 +1,226 @@
+"""
+上游响应回放 - 用录制的原始响应检查 parse_api_response 的成功率和耗时
+
+语料是 response_recorder 录制的JSONL文件（RECORD_CONFIG），每行一条响应：
+    {"ts": ..., "topic": "深度学习", "status": 200, "body": "原始响应体", "expect": 5}
+expect 是可选的期望论文数：给典型或出过问题的响应标注 expect 后，这份语料就是解析器的回归测试，
+解析出的论文数与 expect 不符的响应列为失败。
+
+逐条流式读取语料，按与后端相同的步骤（json.loads + classify_response，即 parse_api_response 去掉日志）解析每条响应并计时，报告：
+- 每种响应格式的条数、成功率（解析出至少一篇论文）和每条的解析耗时（p50/p99/最大）；
+  choices 格式按模型输出的形态细分为 plain（纯JSON）、fenced（含代码块）、prose（前面有说明文字）
+- HTTP错误（状态码不是200）、工作流错误（code 不为0）和无法解码的响应单独计数，不计入成功率
+- 最慢的N条响应
+- 与 expect 不符的响应；与基线（--save-baseline 保存的上次结果）相比解析结果变差的响应
+有失败或退步时退出码为1，可以在修改解析器后作为检查运行。
+
+用法：
+    python replay_responses.py upstream_responses.jsonl
+    python replay_responses.py upstream_responses.jsonl --slowest 20 --save-baseline baseline.json
+    python replay_responses.py upstream_responses.jsonl --baseline baseline.json
+    python replay_responses.py --generate corpus.jsonl     # 用 upstream_sim 的各种形态生成合成语料
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import sys
+import time
+
+from response_parser import choice_content, classify_response
+
+HTTP_ERROR = 'http_error'
+WORKFLOW_ERROR = 'workflow_error'
+INVALID_JSON = 'invalid_json'
+
+
+def read_corpus(path):
+    """逐行读取语料，yield (行号, 记录)；无法解析的行记录为None"""
+    with open(path, encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield lineno, record if isinstance(record, dict) and isinstance(record.get('body'), str) else None
+
+
+def content_shape(result):
+    """choices 格式的模型输出形态"""
+    content = choice_content(result.get('choices')) if isinstance(result, dict) else None
+    if not isinstance(content, str):
+        return 'choices'
+    if '```' in content:
+        return 'choices/fenced'
+    return 'choices/plain' if content.lstrip().startswith('{') else 'choices/prose'
+
+
+def replay(record):
+    """
+    按后端的步骤解析一条响应，返回 (格式, 论文数, 耗时秒)
+
+    格式为 classify_response 的格式名，或 http_error / workflow_error / invalid_json（论文数为None）
+    """
+    if record.get('status', 200) != 200:
+        return HTTP_ERROR, None, 0.0
+    start = time.perf_counter()
+    try:
+        result = json.loads(record['body'])
+    except ValueError:
+        return INVALID_JSON, None, time.perf_counter() - start
+    if isinstance(result, dict) and result.get('code', 0) != 0:
+        return WORKFLOW_ERROR, None, time.perf_counter() - start
+    fmt, parsed = classify_response(result)
+    elapsed = time.perf_counter() - start
+    if fmt == 'choices':
+        fmt = content_shape(result)
+    papers = parsed.get('papers') if parsed is not None else None
+    return fmt, len(papers) if isinstance(papers, list) else 0, elapsed
+
+
+def record_key(record):
+    """基线中标识一条响应：响应体的哈希（语料追加或重排后仍能对应）"""
+    return hashlib.sha1(record['body'].encode('utf-8')).hexdigest()[:16]
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def run(path, slowest=10, baseline=None):
+    """回放整个语料，返回报告（dict）"""
+    formats = {}
+    errors = {HTTP_ERROR: 0, WORKFLOW_ERROR: 0, INVALID_JSON: 0, 'bad_line': 0}
+    slow = []
+    failures = []
+    regressions = []
+    results = {}
+    for lineno, record in read_corpus(path):
+        if record is None:
+            errors['bad_line'] += 1
+            continue
+        fmt, papers, elapsed = replay(record)
+        if papers is None:
+            errors[fmt] += 1
+            continue
+
+        stats = formats.setdefault(fmt, {"count": 0, "ok": 0, "times": []})
+        stats["count"] += 1
+        stats["ok"] += papers > 0
+        stats["times"].append(elapsed)
+        case = (elapsed, lineno, fmt, papers, record.get('topic'), len(record['body']))
+        if len(slow) < slowest:
+            heapq.heappush(slow, case)
+        elif slowest:
+            heapq.heappushpop(slow, case)
+
+        if 'expect' in record and papers != record['expect']:
+            failures.append((lineno, fmt, record['expect'], papers, record.get('topic')))
+        key = record_key(record)
+        results[key] = papers
+        if baseline is not None and papers < baseline.get(key, 0):
+            regressions.append((lineno, fmt, baseline[key], papers, record.get('topic')))
+
+    return {
+        "formats": formats,
+        "errors": errors,
+        "slowest": sorted(slow, reverse=True),
+        "failures": failures,
+        "regressions": regressions,
+        "results": results,
+    }
+
+
+def print_report(report):
+    print(f"{'格式':<18}{'条数':>8}{'成功率':>9}{'p50':>11}{'p99':>11}{'最大':>11}")
+    print("=" * 68)
+    total = ok = 0
+    for fmt, stats in sorted(report["formats"].items()):
+        times = sorted(stats["times"])
+        total += stats["count"]
+        ok += stats["ok"]
+        print(f"{fmt:<18}{stats['count']:>8}{stats['ok'] / stats['count']:>9.1%}"
+              f"{percentile(times, 0.5) * 1000:>9.3f}ms{percentile(times, 0.99) * 1000:>9.3f}ms"
+              f"{times[-1] * 1000:>9.3f}ms")
+    if total:
+        print(f"{'合计':<16}{total:>8}{ok / total:>9.1%}")
+    print("未计入：" + "，".join(f"{name} {count}" for name, count in report["errors"].items()))
+
+    if report["slowest"]:
+        print(f"\n最慢的 {len(report['slowest'])} 条：")
+        for elapsed, lineno, fmt, papers, topic, size in report["slowest"]:
+            print(f"  第{lineno}行 {elapsed * 1000:8.3f}ms {fmt:<16}{size:>9}字符 {papers}篇 {topic}")
+    for title, cases in (("与 expect 不符", report["failures"]), ("比基线退步", report["regressions"])):
+        if cases:
+            print(f"\n{title} {len(cases)} 条：")
+            for lineno, fmt, expected, papers, topic in cases:
+                print(f"  第{lineno}行 {fmt:<16}期望 {expected} 篇，解析出 {papers} 篇 {topic}")
+
+
+def generate(path, count=20):
+    """用 upstream_sim 的论文和模型输出形态生成合成语料（带 expect），覆盖各种响应格式和错误"""
+    from upstream_sim import FORMATS, load_papers, render_content
+
+    templates = load_papers()
+    records = []
+    for i in range(count):
+        topic = f"合成研究方向{i}"
+        papers = [dict(t, title=f"{t['title']}（{topic}）") for t in templates]
+        expect = len(papers)
+        payload = {"papers": papers}
+        for fmt in FORMATS:
+            content = render_content(papers, fmt)
+            record = {"topic": topic, "status": 200, "body": json.dumps(
+                {"code": 0, "message": "Success", "choices": [{"delta": {"role": "assistant", "content": content}}]},
+                ensure_ascii=False)}
+            if fmt != 'truncated':
+                record["expect"] = 0 if fmt == 'malformed' else expect
+            records.append(record)
+        records.append({"topic": topic, "status": 200, "expect": expect,
+                        "body": json.dumps(payload, ensure_ascii=False)})
+        records.append({"topic": topic, "status": 200, "expect": expect,
+                        "body": json.dumps({"code": 0, "data": payload}, ensure_ascii=False)})
+        records.append({"topic": topic, "status": 200, "expect": expect,
+                        "body": json.dumps({"code": 0, "output": json.dumps(payload, ensure_ascii=False)},
+                                           ensure_ascii=False)})
+        records.append({"topic": topic, "status": 200, "expect": expect,
+                        "body": json.dumps(json.dumps(payload, ensure_ascii=False), ensure_ascii=False)})
+    records.append({"topic": "合成错误", "status": 200, "body": json.dumps({"code": 10013, "message": "error"})})
+    records.append({"topic": "合成错误", "status": 503, "body": "Service Temporarily Unavailable"})
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放录制的上游响应，检查解析器")
+    parser.add_argument('corpus', help="语料文件（JSONL）")
+    parser.add_argument('--slowest', type=int, default=10, help="列出最慢的条数")
+    parser.add_argument('--baseline', help="与该基线比较，列出解析结果变差的响应")
+    parser.add_argument('--save-baseline', help="把本次的解析结果保存为基线")
+    parser.add_argument('--generate', action='store_true', help="生成合成语料到 corpus 路径，不回放")
+    parser.add_argument('-n', type=int, default=20, help="--generate 时的研究方向数")
+    args = parser.parse_args()
+
+    if args.generate:
+        print(f"已生成 {generate(args.corpus, args.n)} 条响应：{args.corpus}")
+        return 0
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    report = run(args.corpus, args.slowest, baseline)
+    print_report(report)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report["results"], f)
+    return 1 if report["failures"] or report["regressions"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
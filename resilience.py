@@ -0,0 +1,319 @@
+"""
+上游容错 - 自适应超时、带抖动的重试和熔断
+
+星火工作流变慢或出错时，固定120秒超时、不重试的调用会让每个工作线程都卡住两分钟。这里：
+- 每次尝试的超时按最近成功调用耗时的分位数计算（默认p99的1.5倍），限制在 [min_timeout, max_timeout]
+- 超时、网络错误（连接、DNS、SSL，证书校验失败除外）、HTTP 429/5xx 和可重试的工作流错误码按指数退避加随机抖动重试，所有尝试共享一个总截止时间
+- 最近一段时间内失败比例超过阈值时熔断：直接抛出 CircuitOpenError（调用方可返回过期的缓存结果），
+  冷却时间过后放行少量探测请求，成功则恢复
+
+只有上游自身的问题（超时、网络错误、5xx、服务繁忙类错误码）计入失败率，
+内容审核、解析失败等与上游健康无关的错误不影响熔断。
+"""
+
+import asyncio
+import http.client
+import random
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpenError(Exception):
+    """熔断中，未调用上游"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"上游服务暂时不可用，请在 {retry_after:.0f} 秒后重试")
+        self.retry_after = retry_after
+
+
+class UpstreamHTTPError(Exception):
+    """上游返回了非200的HTTP状态码"""
+
+    def __init__(self, status, reason=''):
+        super().__init__(f"上游HTTP错误 {status} {reason}".strip())
+        self.status = status
+
+
+class AdaptiveTimeout:
+    """按最近成功调用耗时的分位数计算超时（线程安全）"""
+
+    def __init__(self, min_timeout=10, max_timeout=120, percentile=0.99, multiplier=1.5,
+                 window=200, min_samples=20):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        """最近样本的分位数，没有样本时返回None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def current(self):
+        """当前的单次尝试超时（秒），样本不足时用 max_timeout"""
+        if len(self._samples) < self.min_samples:
+            return self.max_timeout
+        timeout = self.quantile(self.percentile) * self.multiplier
+        return min(self.max_timeout, max(self.min_timeout, timeout))
+
+
+class RetryPolicy:
+    """哪些错误可以重试，以及每次重试前等待多久（指数退避 + 完全随机抖动）"""
+
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=8.0, retry_codes=(10110, 11202, 11203)):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_codes = frozenset(retry_codes)
+
+    def is_transient(self, error):
+        """
+        上游自身的临时故障：超时、网络错误、429/5xx、服务繁忙类工作流错误码
+
+        网络错误只包括连接被拒绝、重置或中断（ConnectionError）、DNS解析失败（socket.gaierror）、
+        SSL错误和 http.client.HTTPException（连接中途关闭、响应不完整）。证书校验失败重试也不会成功，
+        其他 OSError（权限不足、文件不存在等本地问题）也不重试
+        """
+        if isinstance(error, ssl.SSLCertVerificationError):
+            return False
+        if isinstance(error, (ConnectionError, socket.gaierror, TimeoutError, asyncio.TimeoutError,
+                              ssl.SSLError, http.client.HTTPException)):
+            return True
+        if isinstance(error, UpstreamHTTPError):
+            return error.status == 429 or error.status >= 500
+        return getattr(error, 'code', None) in self.retry_codes
+
+    def delay(self, attempt):
+        """第 attempt 次（从0开始）失败后的等待时间"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    滑动时间窗口内的失败率熔断器（线程安全）
+
+    closed:    正常放行，窗口内调用数达到 min_calls 且失败率超过 failure_rate 时转为 open
+    open:      拒绝调用，open_seconds 后转为 half_open
+    half_open: 同时只放行 half_open_calls 个探测调用，成功则 closed，失败则重新 open
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate=0.5, min_calls=10, window=60, open_seconds=30, half_open_calls=1):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = self.CLOSED
+        self._outcomes = deque()  # (时间, 是否成功)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.opened = 0
+        self.rejected = 0
+
+    def _expire(self, now):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def is_open(self):
+        """是否处于熔断冷却期（不占用探测名额）"""
+        return self.state == self.OPEN and time.monotonic() - self._opened_at < self.open_seconds
+
+    def retry_after(self):
+        """熔断还要持续的秒数"""
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def allow(self):
+        """是否放行本次调用；放行的调用之后必须调用 record_success 或 record_failure"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self.state, self._probes = self.HALF_OPEN, 0
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self.rejected += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            self._outcomes.append((now, True))
+            self._expire(now)
+
+    def record_failure(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open(now)
+                return
+            self._outcomes.append((now, False))
+            self._expire(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) > self.failure_rate:
+                self._open(now)
+
+    def release(self):
+        """放行的调用没有得出上游是否健康的结论（例如内容审核失败），归还探测名额"""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self.opened += 1
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            calls = len(self._outcomes)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            return {
+                "state": self.state,
+                "window_calls": calls,
+                "window_failures": failures,
+                "failure_rate": round(failures / calls, 4) if calls else 0.0,
+                "retry_after": round(self.retry_after(), 1) if self.state == self.OPEN else 0.0,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class UpstreamGuard:
+    """
+    把一次上游调用包装成：熔断检查 -> 按自适应超时尝试 -> 临时故障时退避重试
+
+    被包装的函数接收本次尝试的超时（秒）作为唯一参数。
+    所有尝试共享 timeouts.max_timeout 的总截止时间，剩余时间不足 min_timeout 时不再重试。
+    """
+
+    def __init__(self, timeouts, retry, breaker):
+        self.timeouts = timeouts
+        self.retry = retry
+        self.breaker = breaker
+
+        # 统计计数
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _attempt_timeout(self, attempt, deadline):
+        """
+        本次尝试的超时：第n次重试放宽到 2^n 倍，熔断探测时用满剩余时间
+
+        上游整体变慢时，按旧的耗时分布算出的超时会让每次尝试都超时、永远得不到新的成功样本，
+        放宽超时保证慢但正常的响应最终能完成并更新耗时分布。
+        """
+        remaining = deadline - time.monotonic()
+        if self.breaker.state == CircuitBreaker.HALF_OPEN:
+            return remaining
+        return min(self.timeouts.current() * 2 ** attempt, remaining)
+
+    def _after_failure(self, error, attempt, deadline):
+        """记录失败，返回重试前的等待时间；不应重试时返回None"""
+        if not self.retry.is_transient(error):
+            self.breaker.release()
+            return None
+        self.breaker.record_failure()
+        if attempt + 1 >= self.retry.attempts:
+            return None
+        delay = self.retry.delay(attempt)
+        if deadline - time.monotonic() - delay < self.timeouts.min_timeout:
+            return None
+        return delay
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.breaker.retry_after())
+
+    def call(self, fn):
+        """同步调用"""
+        self._count('calls')
+        deadline = time.monotonic() + self.timeouts.max_timeout
+        for attempt in range(self.retry.attempts):
+            self._check_breaker()
+            start = time.monotonic()
+            try:
+                result = fn(self._attempt_timeout(attempt, deadline))
+            except Exception as e:
+                delay = self._after_failure(e, attempt, deadline)
+                if delay is None:
+                    self._count('failures')
+                    raise
+                self._count('retries')
+                time.sleep(delay)
+                continue
+            self.timeouts.observe(time.monotonic() - start)
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, fn):
+        """异步调用，fn 返回协程"""
+        self._count('calls')
+        deadline = time.monotonic() + self.timeouts.max_timeout
+        for attempt in range(self.retry.attempts):
+            self._check_breaker()
+            start = time.monotonic()
+            try:
+                result = await fn(self._attempt_timeout(attempt, deadline))
+            except Exception as e:
+                delay = self._after_failure(e, attempt, deadline)
+                if delay is None:
+                    self._count('failures')
+                    raise
+                self._count('retries')
+                await asyncio.sleep(delay)
+                continue
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            self.timeouts.observe(time.monotonic() - start)
+            self.breaker.record_success()
+            return result
+
+    def stats(self):
+        p50 = self.timeouts.quantile(0.5)
+        p99 = self.timeouts.quantile(0.99)
+        return {
+            "breaker": self.breaker.stats(),
+            "attempt_timeout": round(self.timeouts.current(), 2),
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p99": round(p99, 3) if p99 is not None else None,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
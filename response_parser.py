@@ -0,0 +1,93 @@
+"""
+工作流响应解析 - 从星火工作流的响应中找出 {"papers": [...]}
+
+工作流响应的结构不固定，按以下顺序识别（格式名用于日志和 replay_responses.py 的统计）：
+    direct         直接是 {"papers": [...]}
+    nested         某个字段的值是 {"papers": [...]}，例如 {"data": {"papers": [...]}}
+    nested_string  某个字段的值是 {"papers": [...]} 的JSON字符串
+    choices        {"choices": [{"delta"/"message": {"content": "模型输出"}}]}，从模型输出中提取（json_extract）
+    string         整个响应是 {"papers": [...]} 的JSON字符串
+都不是时为 unknown。
+
+不依赖后端的其他模块，回放工具可以单独导入。
+"""
+
+import json
+
+import log
+from json_extract import extract_papers
+
+
+def _loads_object(text):
+    """解析JSON对象字符串，不是对象或无法解析时返回None（不以 { 开头的字符串直接跳过，不尝试解析）"""
+    if not text.lstrip().startswith('{'):
+        return None
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def choice_content(choices):
+    """choices[0] 中 delta 或 message 的 content"""
+    choice = choices[0] if isinstance(choices, list) and choices else None
+    if not isinstance(choice, dict):
+        return None
+    for field in ('delta', 'message'):
+        message = choice.get(field)
+        if isinstance(message, dict) and 'content' in message:
+            return message['content']
+    return None
+
+
+def classify_response(result):
+    """
+    识别响应格式并提取论文，返回 (格式名, 解析结果)
+
+    识别出了格式但没有找到论文时（例如模型输出里没有JSON）解析结果为None
+    """
+    if isinstance(result, dict):
+        if 'papers' in result:
+            return 'direct', result
+        for value in result.values():
+            if isinstance(value, dict) and 'papers' in value:
+                return 'nested', value
+            if isinstance(value, str):
+                parsed = _loads_object(value)
+                if parsed is not None and 'papers' in parsed:
+                    return 'nested_string', parsed
+        if 'choices' in result:
+            content = choice_content(result['choices'])
+            # 一遍扫描提取JSON（兼容代码块、说明文字、尾部逗号和截断）
+            return 'choices', extract_papers(content) if isinstance(content, str) and content else None
+        return 'unknown', None
+    if isinstance(result, str):
+        parsed = _loads_object(result)
+        return 'string', parsed if parsed is not None and 'papers' in parsed else None
+    return 'unknown', None
+
+
+def parse_api_response(result):
+    """解析API响应，提取论文数据；找不到论文时返回原始结果"""
+    try:
+        fmt, parsed = classify_response(result)
+    except Exception as e:
+        log.error('parse_failed', exc_info=True, error=str(e))
+        return result
+
+    if parsed is not None:
+        if log.enabled(log.DEBUG):
+            papers = parsed.get('papers')
+            log.debug('response_format', format=fmt, papers=len(papers) if isinstance(papers, list) else None)
+        return parsed
+
+    # 记录结构帮助调试
+    if fmt == 'choices':
+        content = choice_content(result['choices'])
+        log.warning('papers_not_found', length=len(content or ''), preview=str(content or '')[:200])
+    else:
+        log.warning('response_format_unknown',
+                    keys=list(result.keys()) if isinstance(result, dict) else type(result).__name__,
+                    preview=str(result)[:200])
+    return result
@@ -0,0 +1,78 @@
+"""
+上游响应录制 - 把星火工作流的原始响应追加到JSONL文件，供 replay_responses.py 回放
+
+每条响应一行紧凑JSON：
+    {"ts": 1714536000.123, "topic": "深度学习", "status": 200, "body": "原始响应体"}
+不记录用户标识。文件以 O_APPEND 打开，每条记录一次 os.write 写入，多进程部署时各工作进程
+写同一个文件也不会交错。文件达到 max_bytes 后停止录制（记录一次警告），不轮转也不截断，
+需要继续录制时移走文件即可。
+
+只录制非流式调用的响应（流式调用的响应是SSE分片，按分片解析，不经过 parse_api_response）。
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+import log
+
+
+class ResponseRecorder:
+    """按采样率把上游响应追加到JSONL文件；enabled 和 sample_rate 可以在运行中修改"""
+
+    def __init__(self, path, max_bytes=100 * 1024 * 1024, sample_rate=1.0, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+        self.recorded = 0
+        self._fd = None
+        self._full = False
+        self._lock = threading.Lock()
+
+    def record(self, topic, status, body):
+        """录制一条响应（body 为原始响应体字节串），返回是否写入"""
+        if not self.enabled or self._full or random.random() >= self.sample_rate:
+            return False
+        line = json.dumps(
+            {"ts": round(time.time(), 3), "topic": topic, "status": status,
+             "body": body.decode('utf-8', 'replace')},
+            ensure_ascii=False, separators=(',', ':'),
+        ).encode('utf-8') + b'\n'
+        with self._lock:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                if os.fstat(self._fd).st_size + len(line) > self.max_bytes:
+                    self._full = True
+                    log.warning('recording_full', path=self.path, max_bytes=self.max_bytes)
+                    return False
+                os.write(self._fd, line)
+            except OSError as e:
+                # 录制失败不影响请求，关闭录制并记录原因
+                self.enabled = False
+                log.error('recording_failed', path=self.path, error=str(e))
+                return False
+            self.recorded += 1
+        return True
+
+    def resume(self):
+        """文件被移走后重新开始录制（下一条记录重新打开文件）"""
+        with self._lock:
+            self._close_locked()
+            self._full = False
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+    def _close_locked(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def stats(self):
+        return {"enabled": self.enabled, "path": self.path, "recorded": self.recorded,
+                "sample_rate": self.sample_rate, "full": self._full}
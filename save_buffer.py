@@ -0,0 +1,335 @@
+"""
+保存请求的写缓冲（write-behind）- /api/save-selection 先进入内存队列，由后台线程批量写入储存库
+
+每个保存请求单独提交一个事务时，高峰期大量小事务争用SQLite的写锁。这里：
+- 请求只加入队列就返回（202），队列中的论文数达到 batch_size 或最早的请求等待了 flush_interval 秒时，
+  后台线程把队列中的多个请求在一个事务中写入（LibraryStore.save_selections）
+- 队列中的论文数达到 max_records 时拒绝新的请求（AdmissionRejected，429 + Retry-After），客户端稍后重试
+- 请求可以带幂等键：队列中已有同一用户的同一个键时直接返回；写入时键记入 save_requests 表，
+  已经写入过的请求不再保存。键保留 key_ttl_hours 小时
+- 读写储存库之前调用 settle(user_id)，等待该用户排队中的请求写入，保证先保存后读取的顺序
+- 加入队列之前检查请求能否写入（check_selection），坏请求直接拒绝（ValueError）；整批写入失败时逐个请求重试，
+  数据本身无法写入的请求记录日志后丢弃，不会一直留在队列头部挡住其他用户；储存库暂时不可用时整批稍后重试
+- close() 停止后台线程并写入剩余的请求；写入失败时追加到 spool_path（JSONL），下次启动时重新写入。
+  多进程部署时各工作进程共用同一个文件，恢复前先把文件改名，只有一个进程会恢复同一份数据
+"""
+
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+import log
+import metrics
+from admission import AdmissionRejected
+from library_store import check_selection
+
+# 写入失败后重试的间隔（秒）
+RETRY_DELAY = 1.0
+
+# 改名后超过该时间（秒）仍未删除的恢复文件视为恢复中途退出，由其他进程接手
+STALE_SPOOL_SECONDS = 600
+
+# 清理过期幂等键的间隔（秒）
+PRUNE_INTERVAL = 3600
+
+# 请求数据本身无法写入的错误，重试也不会成功；其他错误（锁超时、磁盘已满等）视为储存库暂时不可用
+DATA_ERRORS = (ValueError, TypeError, OverflowError, sqlite3.InterfaceError, sqlite3.ProgrammingError,
+               sqlite3.IntegrityError, sqlite3.DataError)
+
+
+def _read_spool(path):
+    """读取保存到文件的请求，跳过不完整的行（写入中途退出）"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                log.warning('save_spool_bad_line', path=path, preview=line[:100])
+                continue
+            if isinstance(entry, dict) and isinstance(entry.get('papers'), list):
+                yield entry
+
+
+class SaveBuffer:
+    """保存请求的写缓冲（线程安全），后台线程在第一次 submit 或 start 时启动"""
+
+    def __init__(self, store, max_records=10000, batch_size=500, flush_interval=0.2,
+                 spool_path='save_spool.jsonl', key_ttl_hours=24):
+        self.store = store
+        self.max_records = max_records
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.key_ttl_hours = key_ttl_hours
+
+        self._entries = deque()  # (user_id, papers, key, 加入时间)
+        self._queued = 0         # 队列中（还没有取出写入）的论文数
+        self._records = 0        # 还没有写入完成的论文数（包括正在写入的），用于背压
+        self._keys = set()       # 还没有写入完成的 (user_id, key)
+        self._users = Counter()  # 用户 -> 还没有写入完成的请求数
+        self._flush_now = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats = Counter()
+
+    def start(self):
+        """启动后台线程（重复调用无副作用）；先恢复上次关闭时写入失败的请求"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='save-buffer', daemon=True)
+                self._thread.start()
+
+    def submit(self, user_id, papers, key=None):
+        """
+        把一个保存请求加入队列，返回 {"queued": 论文数, "duplicate": 是否重复的请求}
+
+        请求无法写入时抛出 ValueError，队列已满时抛出 AdmissionRejected；关闭后直接写入储存库
+        """
+        papers = list(papers)
+        if not papers:
+            return {"queued": 0, "duplicate": False}
+        check_selection(user_id, papers, key)
+        self.start()
+        with self._cond:
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                if key is not None and (user_id, key) in self._keys:
+                    self._stats['duplicates'] += 1
+                    return {"queued": 0, "duplicate": True}
+                # 单个请求超过 max_records 时只在队列为空时接受，不会永远被拒绝
+                if self._records and self._records + len(papers) > self.max_records:
+                    self._stats['rejected'] += 1
+                    raise AdmissionRejected('save_buffer_full', max(self.flush_interval, RETRY_DELAY))
+                self._entries.append((user_id, papers, key, time.monotonic()))
+                self._queued += len(papers)
+                self._records += len(papers)
+                if key is not None:
+                    self._keys.add((user_id, key))
+                self._users[user_id] += 1
+                self._stats['submitted'] += 1
+                # 第一个请求开始计时，或者已经攒够一批
+                if len(self._entries) == 1 or self._queued >= self.batch_size:
+                    self._cond.notify_all()
+        if closed:
+            result = self.store.save_papers(user_id, papers, key)
+            return {"queued": 0, "duplicate": result['replayed']}
+        return {"queued": len(papers), "duplicate": False}
+
+    def pending(self, user_id):
+        """该用户是否有还没有写入的请求（不加锁，只用于判断是否需要 settle）"""
+        return bool(self._users.get(user_id))
+
+    def settle(self, user_id, timeout=5.0):
+        """等待该用户排队中的请求写入储存库，返回是否已全部写入"""
+        with self._cond:
+            if not self._users.get(user_id):
+                return True
+            self._flush_now = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._users.get(user_id), timeout)
+
+    def close(self, timeout=10.0):
+        """停止后台线程，写入剩余的请求；写入失败的追加到 spool_path（重复调用无副作用）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            failed = self._write(batch)
+            if failed:
+                with self._cond:
+                    failed.extend(self._entries)
+                    self._entries.clear()
+                    self._queued = 0
+                self._spool(failed)
+                return
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats, pending=self._records, queued_requests=len(self._entries))
+        stats.update(max_records=self.max_records, batch_size=self.batch_size, flush_interval=self.flush_interval)
+        if stats.get('flushes'):
+            stats['avg_batch'] = round(stats['flushed'] / stats['flushes'], 1)
+        return stats
+
+    def _run(self):
+        self._recover()
+        next_prune = 0.0
+        while True:
+            with self._cond:
+                while not self._ready():
+                    self._cond.wait(self._wait_time())
+                batch = self._take_batch()
+                closing = self._closed
+            failed = self._write(batch) if batch else []
+            if failed:
+                with self._cond:
+                    # 放回队列头部保持顺序，稍后重试；关闭时由 close 写入或保存到文件
+                    self._entries.extendleft(reversed(failed))
+                    self._queued += sum(len(entry[1]) for entry in failed)
+                    if not self._closed:
+                        self._cond.wait(RETRY_DELAY)
+            if closing:
+                return
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + PRUNE_INTERVAL
+                try:
+                    self.store.prune_save_requests(self.key_ttl_hours)
+                except Exception as e:
+                    log.error('save_keys_prune_failed', error=str(e))
+
+    def _ready(self):
+        if self._closed or self._flush_now or self._queued >= self.batch_size:
+            return True
+        return bool(self._entries) and time.monotonic() - self._entries[0][3] >= self.flush_interval
+
+    def _wait_time(self):
+        if not self._entries:
+            return PRUNE_INTERVAL
+        return max(0.0, self._entries[0][3] + self.flush_interval - time.monotonic())
+
+    def _take_batch(self):
+        """从队列头部取出至少 batch_size 篇论文的请求（不拆分单个请求）"""
+        batch = []
+        count = 0
+        while self._entries and count < self.batch_size:
+            entry = self._entries.popleft()
+            batch.append(entry)
+            count += len(entry[1])
+        self._queued -= count
+        # settle 要求立即写入时，写完整个队列为止
+        self._flush_now = self._flush_now and bool(self._entries)
+        return batch
+
+    def _write(self, batch):
+        """
+        写入一批请求，返回需要稍后重试的请求（储存库暂时不可用）
+
+        整批在一个事务中写入；失败时逐个请求重试，数据无法写入的请求丢弃，不影响同一批的其他请求
+        """
+        try:
+            self._save(batch)
+            return []
+        except Exception as e:
+            log.error('save_flush_failed', exc_info=True, requests=len(batch), error=str(e))
+            self._stats['errors'] += 1
+            if len(batch) == 1:
+                return self._failed(batch[0], e)
+        failed = []
+        for entry in batch:
+            try:
+                self._save([entry])
+            except Exception as e:
+                failed.extend(self._failed(entry, e))
+        return failed
+
+    def _failed(self, entry, error):
+        """单个请求写入失败：储存库暂时不可用时返回 [entry] 稍后重试，数据无法写入时丢弃并返回 []"""
+        if not isinstance(error, DATA_ERRORS):
+            return [entry]
+        user_id, papers, key, _ = entry
+        log.error('save_request_dropped', user_id=user_id, key=key, papers=len(papers), error=str(error))
+        with self._cond:
+            self._stats['dropped'] += 1
+            self._release([entry])
+        return []
+
+    def _release(self, batch):
+        """写入完成（或丢弃）的请求不再计入背压和 settle（调用方持有 _cond）"""
+        for user_id, _, key, _ in batch:
+            self._keys.discard((user_id, key))
+            self._users[user_id] -= 1
+            if not self._users[user_id]:
+                del self._users[user_id]
+        self._records -= sum(len(entry[1]) for entry in batch)
+        self._cond.notify_all()
+
+    def _save(self, batch):
+        """在一个事务中写入一批请求，失败时抛出异常"""
+        start = time.perf_counter()
+        with self._flush_lock:
+            results = self.store.save_selections([(user_id, papers, key) for user_id, papers, key, _ in batch])
+        elapsed = time.perf_counter() - start
+        metrics.observe_stage('save_flush', elapsed)
+
+        count = sum(len(entry[1]) for entry in batch)
+        with self._cond:
+            self._release(batch)
+            self._stats['flushes'] += 1
+            self._stats['flushed'] += count
+            self._stats['max_batch'] = max(self._stats['max_batch'], count)
+        log.info('papers_saved', requests=len(batch),
+                 saved=sum(r['saved'] for r in results), duplicates=sum(r['duplicates'] for r in results),
+                 replayed=sum(r['replayed'] for r in results), ms=round(elapsed * 1000, 1))
+
+    def _spool(self, batch):
+        """把没有写入的请求追加到文件；没有幂等键的请求补上键，恢复时重复写入也只保存一次"""
+        lines = ''.join(
+            json.dumps({"user_id": user_id, "papers": papers, "key": key or f"spool-{uuid.uuid4().hex}"},
+                       ensure_ascii=False) + '\n'
+            for user_id, papers, key, _ in batch
+        )
+        try:
+            with open(self.spool_path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            log.error('save_spool_failed', path=self.spool_path, requests=len(batch), error=str(e))
+            return
+        self._stats['spooled'] += len(batch)
+        log.warning('save_spooled', path=self.spool_path, requests=len(batch))
+
+    def _claim_spools(self):
+        """把待恢复的文件改名归本进程所有，返回改名后的路径"""
+        now = time.time()
+        candidates = [self.spool_path] + [
+            path for path in glob.glob(glob.escape(self.spool_path) + '.*.recovering')
+            if now - os.path.getmtime(path) > STALE_SPOOL_SECONDS
+        ]
+        claimed = []
+        for i, path in enumerate(candidates):
+            # 只恢复普通文件（spool_path 配置成设备文件时不动它）
+            if not os.path.isfile(path):
+                continue
+            target = f"{self.spool_path}.{os.getpid()}-{i}.{uuid.uuid4().hex[:8]}.recovering"
+            try:
+                os.replace(path, target)
+            except OSError:
+                continue
+            claimed.append(target)
+        return claimed
+
+    def _recover(self):
+        """写入上次关闭时保存到文件的请求，成功后删除文件"""
+        for path in self._claim_spools():
+            try:
+                entries = list(_read_spool(path))
+                for i in range(0, len(entries), self.batch_size):
+                    self.store.save_selections(
+                        [(e['user_id'], e['papers'], e.get('key')) for e in entries[i:i + self.batch_size]]
+                    )
+            except Exception as e:
+                # 保留文件，超过 STALE_SPOOL_SECONDS 后或下次启动时再试
+                log.error('save_recover_failed', exc_info=True, path=path, error=str(e))
+                continue
+            os.remove(path)
+            self._stats['recovered'] += len(entries)
+            log.info('save_recovered', path=path, requests=len(entries))
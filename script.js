@@ -6,12 +6,31 @@ const state = {
     isDragging: false,
     startX: 0,
     startY: 0,
-    currentCard: null
+    currentCard: null,
+    streaming: false,
+    nextCursor: null,  // 获取更多论文的游标（服务器返回的 next_cursor）
+    loadingMore: false
 };
 
 // API配置
 const API_URL = 'http://localhost:5000/api';
 
+// 客户端标识（服务器端储存库按此区分用户）
+function getClientId() {
+    let clientId = localStorage.getItem('clientId');
+    if (!clientId) {
+        clientId = randomId();
+        localStorage.setItem('clientId', clientId);
+    }
+    return clientId;
+}
+
+function randomId() {
+    return window.crypto && crypto.randomUUID
+        ? crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
 // DOM元素
 const elements = {
     searchSection: document.getElementById('searchSection'),
@@ -72,13 +91,19 @@ async function handleSearch() {
     showLoading(true);
     
     try {
+        // 优先使用流式接口，第一篇论文解析出来就显示卡片
+        if (await searchWithStream(topic)) {
+            return;
+        }
+        
         console.log('🔍 发送请求到:', `${API_URL}/get-papers`);
         console.log('📋 研究方向:', topic);
         
         const response = await fetch(`${API_URL}/get-papers`, {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'X-User-Id': getClientId()
             },
             body: JSON.stringify({ research_topic: topic })
         });
@@ -107,6 +132,7 @@ async function handleSearch() {
             state.papers = papers;
             state.currentIndex = 0;
             state.savedPapers = [];
+            state.nextCursor = data.next_cursor || null;
             
             showSection('card');
             initializeCards();
@@ -134,6 +160,137 @@ async function handleSearch() {
     }
 }
 
+// 流式获取论文（SSE），不支持流式时返回false以回退到普通接口
+async function searchWithStream(topic) {
+    if (!window.ReadableStream || !window.TextDecoder) {
+        return false;
+    }
+    
+    console.log('🔍 发送流式请求到:', `${API_URL}/get-papers/stream`);
+    
+    const response = await fetch(`${API_URL}/get-papers/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-User-Id': getClientId()
+        },
+        body: JSON.stringify({ research_topic: topic })
+    });
+    
+    // 参数错误或被限流时不再回退到普通接口（普通接口同样会拒绝）
+    if (response.status === 400 || response.status === 429) {
+        const data = await response.json();
+        throw new Error(data.error || '请求参数错误');
+    }
+    if (!response.ok || !response.body) {
+        console.warn('⚠️ 流式接口不可用，使用普通接口');
+        return false;
+    }
+    
+    state.papers = [];
+    state.currentIndex = 0;
+    state.savedPapers = [];
+    state.currentCard = null;
+    state.streaming = true;
+    state.nextCursor = null;
+    elements.cardsContainer.innerHTML = '';
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    try {
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            // SSE事件之间以空行分隔
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                handleStreamEvent(parseSseFrame(frame));
+            }
+        }
+    } finally {
+        state.streaming = false;
+    }
+    
+    console.log(`✨ 流式加载完成，共 ${state.papers.length} 篇论文`);
+    
+    if (state.papers.length === 0) {
+        showNotification('未找到相关论文，请尝试其他关键词', 'error');
+        showLoading(false);
+    } else if (state.currentIndex >= state.papers.length) {
+        // 用户在等待下一篇时流已结束
+        showLoading(false);
+        finishOrLoadMore();
+    }
+    
+    return true;
+}
+
+// 解析单个SSE事件
+function parseSseFrame(frame) {
+    let event = 'message';
+    const dataLines = [];
+    
+    frame.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).replace(/^ /, ''));
+        }
+    });
+    
+    return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : null };
+}
+
+// 处理流式事件
+function handleStreamEvent({ event, data }) {
+    if (event === 'paper') {
+        const paper = data.paper;
+        if (!paper || !paper.title || !paper.authors || !paper.abstract) {
+            console.warn('⚠️ 过滤掉无效论文:', paper);
+            return;
+        }
+        console.log(`📄 收到第 ${state.papers.length + 1} 篇: ${paper.title}`);
+        appendStreamedCard(paper);
+    } else if (event === 'done') {
+        state.nextCursor = data.next_cursor || null;
+    } else if (event === 'error') {
+        console.error('❌ API错误:', data.error);
+        throw new Error(data.error);
+    }
+}
+
+// 追加一张流式到达的卡片（放在卡片堆最底层）
+function appendStreamedCard(paper) {
+    const index = state.papers.length;
+    state.papers.push(paper);
+    
+    const card = createCard(paper, index);
+    elements.cardsContainer.insertBefore(card, elements.cardsContainer.firstChild);
+    
+    // 论文总数变化，更新所有卡片上的编号
+    elements.cardsContainer.querySelectorAll('.paper-card').forEach(c => {
+        c.querySelector('.paper-number').textContent = `论文 ${parseInt(c.dataset.index) + 1} / ${state.papers.length}`;
+    });
+    
+    // 第一篇到达，或用户正在等待这一篇
+    if (index === state.currentIndex) {
+        state.currentCard = card;
+        addCardInteraction(card);
+        card.style.transform = 'scale(1) translateY(0)';
+        showSection('card');
+        showLoading(false);
+    }
+    
+    updateProgress();
+}
+
 // 解析API响应中的论文数据
 function parsePapersFromResponse(data) {
     console.log('🔧 开始解析响应数据...');
@@ -485,9 +642,61 @@ function moveToNextCard() {
             nextCard.style.transform = 'scale(1) translateY(0)';
         }
         updateProgress();
+    } else if (state.streaming) {
+        // 流式加载中，等待下一篇论文到达
+        state.currentCard = null;
+        updateProgress();
+        showLoading(true);
     } else {
         // 所有卡片已完成
+        finishOrLoadMore();
+    }
+}
+
+// 看完所有卡片：服务器还有更多论文时继续加载，否则显示完成界面
+function finishOrLoadMore() {
+    if (state.nextCursor) {
+        loadMorePapers();
+    } else {
+        showCompletionScreen();
+    }
+}
+
+// 按游标获取下一页论文（服务器从候选列表读取，不会重复已看过和已保存的论文）
+async function loadMorePapers() {
+    if (state.loadingMore) return;
+    state.loadingMore = true;
+    state.currentCard = null;
+    showLoading(true);
+    let empty = false;
+    
+    try {
+        const response = await fetch(`${API_URL}/get-papers?cursor=${encodeURIComponent(state.nextCursor)}`, {
+            headers: { 'X-User-Id': getClientId() }
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || `请求失败 (${response.status})`);
+        }
+        
+        state.nextCursor = data.next_cursor || null;
+        const papers = parsePapersFromResponse(data);
+        console.log(`📚 加载了 ${papers.length} 篇更多论文`);
+        papers.forEach(paper => appendStreamedCard(paper));
+        empty = papers.length === 0;
+    } catch (error) {
+        console.error('❌ 加载更多论文失败:', error);
+        state.nextCursor = null;
+        showNotification(`没有更多论文了：${error.message}`, 'error');
         showCompletionScreen();
+    } finally {
+        state.loadingMore = false;
+        showLoading(false);
+    }
+    
+    // 这一页的候选都已看过或已保存，继续下一页（服务器取完后不再返回游标）
+    if (empty) {
+        finishOrLoadMore();
     }
 }
 
@@ -499,7 +708,7 @@ function handleCardAction(action) {
 }
 
 // 显示完成界面
-async function showCompletionScreen() {
+function showCompletionScreen() {
     updateProgress();
     
     // 显示保存的论文数量
@@ -514,23 +723,51 @@ async function showCompletionScreen() {
             </div>
         `).join('');
         
-        // 发送保存的论文到后端
+        // 在后台发送保存的论文到后端，重试期间不阻塞完成界面；最终失败时提示（论文已在本地储存库中）
+        saveSelection(state.savedPapers).then(saved => {
+            if (!saved) {
+                showNotification('保存到服务器失败，论文已保存在本地，打开储存库时会自动同步', 'error');
+            }
+        });
+    } else {
+        elements.savedPapersList.innerHTML = '<p style="text-align: center; color: var(--text-secondary);">你没有保存任何论文</p>';
+    }
+    
+    showSection('completion');
+}
+
+// 保存选择的论文：同一次保存的重试使用同一个幂等键，服务器只保存一次；
+// 网络错误、429（写缓冲已满）和5xx时按 Retry-After 或指数退避重试
+async function saveSelection(papers, attempts = 4) {
+    const requestId = randomId();
+    for (let attempt = 1; attempt <= attempts; attempt++) {
+        let retryAfter = 2 ** (attempt - 1);
         try {
-            await fetch(`${API_URL}/save-selection`, {
+            const response = await fetch(`${API_URL}/save-selection`, {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json'
+                    'Content-Type': 'application/json',
+                    'X-User-Id': getClientId(),
+                    'Idempotency-Key': requestId
                 },
-                body: JSON.stringify({ selected_papers: state.savedPapers })
+                body: JSON.stringify({ selected_papers: papers })
             });
+            if (response.ok) {
+                return true;
+            }
+            if (response.status !== 429 && response.status < 500) {
+                console.error('保存失败:', response.status);
+                return false;
+            }
+            retryAfter = Number(response.headers.get('Retry-After')) || retryAfter;
         } catch (error) {
             console.error('保存失败:', error);
         }
-    } else {
-        elements.savedPapersList.innerHTML = '<p style="text-align: center; color: var(--text-secondary);">你没有保存任何论文</p>';
+        if (attempt < attempts) {
+            await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+        }
     }
-    
-    showSection('completion');
+    return false;
 }
 
 // 切换显示区域
@@ -626,6 +863,7 @@ function resetToSearch() {
     state.currentIndex = 0;
     state.savedPapers = [];
     state.currentCard = null;
+    state.nextCursor = null;
     updateSavedCount();
     showSection('search');
 }
@@ -636,28 +874,24 @@ function viewSavedPapers() {
     window.location.href = 'library.html';
 }
 
-// 保存论文到localStorage
+// 保存论文到本地储存库：只追加到待同步的变更队列，不重写整个储存库（储存库页面同步时合并）
 function savePaperToLocalStorage(paper) {
     try {
-        let savedPapers = JSON.parse(localStorage.getItem('savedPapers') || '[]');
-        
-        // 检查是否已存在（避免重复）
-        const exists = savedPapers.some(p => p.title === paper.title);
-        if (!exists) {
-            savedPapers.push(paper);
-            localStorage.setItem('savedPapers', JSON.stringify(savedPapers));
-            console.log('💾 论文已保存到储存库');
-        }
+        const changes = JSON.parse(localStorage.getItem('libraryChanges') || '[]');
+        changes.push({ op: 'save', paper: paper, modified_at: paper.savedAt });
+        localStorage.setItem('libraryChanges', JSON.stringify(changes));
+        console.log('💾 论文已加入待同步队列');
     } catch (error) {
         console.error('保存到localStorage失败:', error);
     }
 }
 
-// 从localStorage加载已保存的论文数量
+// 从localStorage加载已保存的论文数量（本地副本 + 尚未同步的保存）
 function loadSavedCount() {
     try {
         const savedPapers = JSON.parse(localStorage.getItem('savedPapers') || '[]');
-        elements.savedCount.textContent = savedPapers.length;
+        const changes = JSON.parse(localStorage.getItem('libraryChanges') || '[]');
+        elements.savedCount.textContent = savedPapers.length + changes.filter(c => c.op === 'save').length;
     } catch (error) {
         console.error('加载储存库数量失败:', error);
     }
@@ -0,0 +1,385 @@
+"""
+配置加载 - 按需读取 config.py 和环境变量，校验类型并补齐默认值，支持不重启热加载
+
+优先级：环境变量 > 配置文件 > 默认值
+- 配置文件默认是本目录下的 config.py，可以用环境变量 XFIND_CONFIG 指定其他路径；文件不存在时只用环境变量和默认值
+- 环境变量名为 XFIND_<分组>_<键>（分组去掉 _CONFIG 后缀），例如 XFIND_CACHE_TTL=600、XFIND_API_HOST=127.0.0.1；
+  键本身以分组名开头时不重复（XFIND_API_KEY、XFIND_API_SECRET），XFIND_FLOW_ID 兼容旧写法
+- 布尔值接受 1/0、true/false、yes/no、on/off；元组用逗号分隔；none 或 null 表示None
+- 每个键按 SCHEMA 中的类型和取值范围校验，不合法时抛出 ConfigError 并指出是哪个键；SCHEMA 以外的键原样保留
+- 默认值为None的键只在配置了时才出现（调用方用 .get(键, 回退值) 表示“未配置时与另一项相同”）
+
+第一次访问某个分组时才读取配置文件。reload_if_changed 每隔 check_interval 秒检查一次文件的修改时间，
+变化时重新加载：新配置校验失败时保留旧配置；可热加载的键（HOT_RELOAD）通过 subscribe 注册的回调应用到
+运行中的对象，其余的键（端口、连接池大小、文件路径等）需要重启才生效，只记录警告。
+"""
+
+import os
+import runpy
+import threading
+import time
+
+import log
+
+
+class ConfigError(ValueError):
+    """配置项的值不合法"""
+
+
+# 分组 -> {键: (类型, 默认值[, 约束])}；类型为 int/float/bool/str/'codes'（整数元组），
+# 约束对数值是下限，对字符串是可选值
+SCHEMA = {
+    'API_CONFIG': {
+        'host': (str, 'xingchen-api.xf-yun.com'),
+        'port': (int, None, 1),
+        'use_tls': (bool, True),
+        'api_key': (str, ''),
+        'api_secret': (str, ''),
+        'flow_id': (str, ''),
+        'endpoint': (str, '/workflow/v1/chat/completions'),
+        'timeout': (float, 120, 1),
+        'max_connections': (int, 8, 1),
+        'async_max_connections': (int, 100, 1),
+    },
+    'CACHE_CONFIG': {
+        'enabled': (bool, True),
+        'ttl': (float, 3600, 0),
+        'max_entries': (int, 512, 1),
+        'path': (str, None),
+        'similar_threshold': (float, 0.85, 0),  # None 表示关闭
+        'stale_ttl': (float, None, 0),
+    },
+    'LIBRARY_CONFIG': {
+        'path': (str, 'library.db'),
+        'tombstone_days': (float, 90, 0),
+    },
+    'LOG_CONFIG': {
+        'level': (str, 'INFO', ('DEBUG', 'INFO', 'WARNING', 'ERROR')),
+        'format': (str, 'text', ('text', 'json')),
+    },
+    'BATCH_CONFIG': {
+        'workers': (int, None, 1),
+        'async_workers': (int, None, 1),
+        'timeout': (float, None, 1),
+        'max_topics': (int, 500, 1),
+    },
+    'ADMISSION_CONFIG': {
+        'rate_per_minute': (float, 6, 0),
+        'burst': (float, 3, 1),
+        'max_concurrent': (int, None, 1),
+        'max_queue': (int, 32, 0),
+        'max_per_user': (int, 2, 1),
+        'queue_timeout': (float, 60, 0),
+        'async_max_concurrent': (int, None, 1),
+        'async_max_queue': (int, 256, 0),
+    },
+    'PREFETCH_CONFIG': {
+        'enabled': (bool, False),
+        'calls_per_hour': (int, 30, 0),
+        'top_n': (int, 20, 1),
+        'interval': (float, 60, 1),
+        'reserve_connections': (int, 2, 0),
+        'half_life': (float, 6 * 3600, 1),
+        'tag_weight': (float, 0.5, 0),
+    },
+    'RESILIENCE_CONFIG': {
+        'timeout_percentile': (float, 0.99, 0),
+        'timeout_multiplier': (float, 1.5, 1),
+        'min_timeout': (float, 10, 0),
+        'attempts': (int, 3, 1),
+        'retry_base_delay': (float, 0.5, 0),
+        'retry_max_delay': (float, 8.0, 0),
+        'retry_codes': ('codes', (10110, 11202, 11203)),
+        'failure_rate': (float, 0.5, 0),
+        'min_calls': (int, 10, 1),
+        'window': (float, 60, 1),
+        'open_seconds': (float, 30, 0),
+    },
+    'POOL_CONFIG': {
+        'enabled': (bool, True),
+        'page_size': (int, 5, 1),
+        'max_size': (int, 100, 1),
+        'max_fetches': (int, 4, 1),
+        'ttl': (float, 86400, 1),
+        'max_topics': (int, 1024, 1),
+    },
+    'RANKING_CONFIG': {
+        'enabled': (bool, True),
+        'dim': (int, 4096, 64),
+        'max_profiles': (int, 1024, 1),
+        'cache_size': (int, 20000, 1),
+        'max_papers': (int, 2000, 1),
+    },
+    'COMPRESSION_CONFIG': {
+        'enabled': (bool, True),
+        'min_size': (int, 1024, 0),
+        'gzip_level': (int, 6, 1),
+        'brotli_quality': (int, 4, 0),
+    },
+    'RECORD_CONFIG': {
+        'enabled': (bool, False),
+        'path': (str, 'upstream_responses.jsonl'),
+        'max_mb': (float, 100, 0),
+        'sample_rate': (float, 1.0, 0),
+    },
+    'SAVE_BUFFER_CONFIG': {
+        'enabled': (bool, True),
+        'max_records': (int, 10000, 1),
+        'batch_size': (int, 500, 1),
+        'flush_interval': (float, 0.2, 0),
+        'spool_path': (str, 'save_spool.jsonl'),
+        'key_ttl_hours': (float, 24, 0),
+    },
+    'SERVER_CONFIG': {
+        'host': (str, '0.0.0.0'),
+        'port': (int, 5000, 0),
+        'workers': (int, None, 1),
+        'state_path': (str, 'xfind_state.db'),
+        'graceful_timeout': (float, 30, 0),
+        'backlog': (int, 128, 1),
+    },
+}
+
+# 修改后不需要重启即可生效的键，其余的键修改后只记录 config_restart_required
+HOT_RELOAD = {
+    'LOG_CONFIG': {'level', 'format'},
+    'CACHE_CONFIG': {'ttl', 'stale_ttl', 'similar_threshold'},
+    'ADMISSION_CONFIG': {'rate_per_minute', 'burst', 'max_queue', 'max_per_user', 'queue_timeout', 'async_max_queue'},
+    'PREFETCH_CONFIG': {'calls_per_hour', 'top_n', 'interval', 'half_life', 'tag_weight'},
+    'RESILIENCE_CONFIG': set(SCHEMA['RESILIENCE_CONFIG']),
+    'POOL_CONFIG': {'page_size', 'max_size', 'max_fetches', 'ttl'},
+    'COMPRESSION_CONFIG': set(SCHEMA['COMPRESSION_CONFIG']),
+    'RECORD_CONFIG': {'enabled', 'max_mb', 'sample_rate'},
+    'SAVE_BUFFER_CONFIG': {'max_records', 'batch_size', 'flush_interval'},
+}
+
+# 默认值不是None、但可以设置为None的键
+NULLABLE = {
+    'CACHE_CONFIG': {'similar_threshold'},
+}
+
+# 旧版环境变量名 -> (分组, 键)
+ENV_ALIASES = {
+    'XFIND_FLOW_ID': ('API_CONFIG', 'flow_id'),
+}
+
+_TRUE = {'1', 'true', 'yes', 'on'}
+_FALSE = {'0', 'false', 'no', 'off'}
+
+
+def env_name(section, key):
+    """配置项对应的环境变量名"""
+    prefix = section[:-len('_CONFIG')] if section.endswith('_CONFIG') else section
+    name = key.upper()
+    if not name.startswith(prefix + '_'):
+        name = f"{prefix}_{name}"
+    return f"XFIND_{name}"
+
+
+def _parse_env(text, kind):
+    """把环境变量的字符串转换为 kind 类型的值"""
+    text = text.strip()
+    if text.lower() in ('none', 'null'):
+        return None
+    if kind is bool:
+        if text.lower() in _TRUE:
+            return True
+        if text.lower() in _FALSE:
+            return False
+        raise ValueError(text)
+    if kind == 'codes':
+        return tuple(int(part) for part in text.split(',') if part.strip())
+    return kind(text)
+
+
+def coerce(section, key, value, spec):
+    """按 SCHEMA 校验并转换一个配置项，不合法时抛出 ConfigError"""
+    kind, default = spec[0], spec[1]
+    constraint = spec[2] if len(spec) > 2 else None
+    name = f"{section}.{key}"
+    if value is None:
+        if default is None or key in NULLABLE.get(section, ()):
+            return None
+        raise ConfigError(f"{name} 不能为 None")
+    if kind is bool:
+        if not isinstance(value, bool):
+            raise ConfigError(f"{name} 应为 True/False，实际为 {value!r}")
+        return value
+    if kind == 'codes':
+        if not isinstance(value, (list, tuple, set, frozenset)) or not all(
+                isinstance(v, int) and not isinstance(v, bool) for v in value):
+            raise ConfigError(f"{name} 应为整数元组，实际为 {value!r}")
+        return tuple(value)
+    if kind is str:
+        if not isinstance(value, str):
+            raise ConfigError(f"{name} 应为字符串，实际为 {value!r}")
+        if constraint is not None and value.upper() not in (c.upper() for c in constraint):
+            raise ConfigError(f"{name} 应为 {'/'.join(constraint)} 之一，实际为 {value!r}")
+        return value
+    # 数值：float 类型也接受整数，但不接受布尔值
+    allowed = (int, float) if kind is float else (int,)
+    if isinstance(value, bool) or not isinstance(value, allowed):
+        raise ConfigError(f"{name} 应为{'数字' if kind is float else '整数'}，实际为 {value!r}")
+    if constraint is not None and value < constraint:
+        raise ConfigError(f"{name} 不能小于 {constraint}，实际为 {value!r}")
+    return value
+
+
+def default_path():
+    return os.environ.get('XFIND_CONFIG') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.py')
+
+
+class Settings:
+    """
+    按需加载并校验的配置（线程安全）
+
+    section(分组) 返回该分组的dict（不要修改）；重新加载后返回新的dict，已取得的旧dict不变
+    """
+
+    def __init__(self, path=None, environ=None, check_interval=2.0):
+        self.path = path or default_path()
+        self.environ = os.environ if environ is None else environ
+        self.check_interval = check_interval
+
+        self._sections = None  # 分组 -> dict，第一次访问时加载
+        self._mtime = None
+        self._checked_at = 0.0
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.loads = 0
+        self.reloads = 0
+        self.reload_errors = 0
+        self.load_seconds = 0.0
+
+    def section(self, name):
+        if self._sections is None:
+            with self._lock:
+                if self._sections is None:
+                    self._sections, self._mtime = self._load()
+        return self._sections.get(name, {})
+
+    def __getitem__(self, name):
+        return self.section(name)
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read_file(self):
+        """执行配置文件，返回其中的全局变量；文件不存在时返回空dict"""
+        if not os.path.exists(self.path):
+            return {}
+        return runpy.run_path(self.path)
+
+    def _load(self):
+        """读取配置文件和环境变量并校验，返回 (各分组, 文件修改时间)"""
+        start = time.perf_counter()
+        mtime = self._file_mtime()
+        if mtime is None:
+            log.warning('config_file_missing', path=self.path)
+        namespace = self._read_file()
+
+        sections = {}
+        for name in set(SCHEMA) | {k for k, v in namespace.items() if k.endswith('_CONFIG') and isinstance(v, dict)}:
+            raw = namespace.get(name, {})
+            if not isinstance(raw, dict):
+                raise ConfigError(f"{name} 应为dict，实际为 {type(raw).__name__}")
+            schema = SCHEMA.get(name, {})
+            values = dict(raw)
+            for key, spec in schema.items():
+                text = self.environ.get(env_name(name, key))
+                if text is not None:
+                    try:
+                        values[key] = _parse_env(text, spec[0])
+                    except ValueError:
+                        raise ConfigError(f"环境变量 {env_name(name, key)} 的值不合法: {text!r}") from None
+                if key in values:
+                    values[key] = coerce(name, key, values[key], spec)
+                elif spec[1] is not None:
+                    values[key] = spec[1]
+            sections[name] = values
+
+        for alias, (name, key) in ENV_ALIASES.items():
+            if alias in self.environ and env_name(name, key) not in self.environ:
+                sections[name][key] = self.environ[alias]
+
+        self.loads += 1
+        self.load_seconds += time.perf_counter() - start
+        return sections, mtime
+
+    def subscribe(self, callback):
+        """注册热加载回调 callback(settings, changed)，changed 为变化的可热加载键 {分组: {键, ...}}"""
+        self._subscribers.append(callback)
+
+    def reload_if_changed(self):
+        """配置文件的修改时间变化时重新加载（最多每 check_interval 秒检查一次），返回是否重新加载了"""
+        now = time.monotonic()
+        if self._sections is None or now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        if self._file_mtime() == self._mtime:
+            return False
+        return self.reload()
+
+    def reload(self):
+        """
+        重新加载配置，新配置不合法时保留旧配置并返回False
+
+        可热加载的键变化时调用已注册的回调，其他键的变化只记录警告（需要重启）
+        """
+        if not self._lock.acquire(blocking=False):
+            return False  # 其他线程正在重新加载
+        try:
+            old = self._sections or {}
+            try:
+                sections, mtime = self._load()
+            except Exception as e:
+                # 记录新的修改时间，文件改正之前不再重复报错
+                self._mtime = self._file_mtime()
+                self.reload_errors += 1
+                log.error('config_reload_failed', path=self.path, error=str(e))
+                return False
+            self._sections, self._mtime = sections, mtime
+            self.reloads += 1
+        finally:
+            self._lock.release()
+
+        hot, restart = {}, []
+        for name in set(old) | set(sections):
+            before, after = old.get(name, {}), sections.get(name, {})
+            for key in set(before) | set(after):
+                if before.get(key) == after.get(key):
+                    continue
+                if key in HOT_RELOAD.get(name, ()):
+                    hot.setdefault(name, set()).add(key)
+                else:
+                    restart.append(f"{name}.{key}")
+
+        log.info('config_reloaded', path=self.path, changed=sorted(f"{n}.{k}" for n, keys in hot.items() for k in keys))
+        if restart:
+            log.warning('config_restart_required', keys=sorted(restart))
+        if hot:
+            for callback in self._subscribers:
+                try:
+                    callback(self, hot)
+                except Exception as e:
+                    log.error('config_apply_failed', exc_info=True, error=str(e))
+        return True
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "loaded": self._sections is not None,
+            "loads": self.loads,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "load_ms": round(self.load_seconds * 1000, 2),
+        }
+
+
+# 进程内共用的配置
+settings = Settings()
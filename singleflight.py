@@ -0,0 +1,294 @@
+"""
+请求合并（single-flight）- 相同的并发请求只调用一次上游
+
+第一个到达的请求负责调用上游，其余相同key的请求等待并共享同一个结果（或异常）。
+多进程部署时 SharedFlight 通过共用的SQLite文件在进程之间合并，等待的进程从共享缓存中取结果。
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class _Call:
+    """一次正在进行的上游调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.callers = 1
+
+
+class SingleFlight:
+    """按key合并并发调用（线程安全）"""
+
+    def __init__(self, history_size=100):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+        # 统计计数
+        self.upstream_calls = 0
+        self.coalesced_callers = 0
+        self.max_fold = 0
+        self._recent_folds = deque(maxlen=history_size)
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        执行fn，相同key的并发调用只执行一次
+
+        返回 (结果, 是否共享了其他请求的调用)，fn抛出的异常会传给所有等待者
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.callers += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self.upstream_calls += 1
+                self.coalesced_callers += call.callers - 1
+                self.max_fold = max(self.max_fold, call.callers)
+                self._recent_folds.append(call.callers)
+            call.done.set()
+
+        return call.result, False
+
+    def in_flight(self, key):
+        """该key是否有正在进行的调用（此时调用 do 会合并，不产生新的上游调用）"""
+        return key in self._calls
+
+    def stats(self):
+        """返回合并统计信息"""
+        with self._lock:
+            total = self.upstream_calls + self.coalesced_callers
+            return {
+                "in_flight": len(self._calls),
+                "upstream_calls": self.upstream_calls,
+                "coalesced_callers": self.coalesced_callers,
+                "max_fold": self.max_fold,
+                "avg_fold": round(total / self.upstream_calls, 2) if self.upstream_calls else 0.0,
+                "recent_folds": list(self._recent_folds),
+            }
+
+
+class AsyncSingleFlight:
+    """按key合并并发协程调用（用于asyncio服务模式，只在事件循环线程中使用）"""
+
+    def __init__(self, history_size=100):
+        self._calls = {}  # key -> [future, callers]
+
+        # 统计计数
+        self.upstream_calls = 0
+        self.coalesced_callers = 0
+        self.max_fold = 0
+        self._recent_folds = deque(maxlen=history_size)
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        等待协程函数fn的结果，相同key的并发调用只执行一次
+
+        返回 (结果, 是否共享了其他请求的调用)
+        """
+        call = self._calls.get(key)
+        if call is not None:
+            call[1] += 1
+            # shield: 某个等待者被取消时不影响共享的上游调用
+            return await asyncio.shield(call[0]), True
+
+        future = asyncio.ensure_future(fn(*args, **kwargs))
+        call = [future, 1]
+        self._calls[key] = call
+        try:
+            return await asyncio.shield(future), False
+        finally:
+            if future.done():
+                self._finish(key, call)
+            else:
+                future.add_done_callback(lambda _: self._finish(key, call))
+
+    def in_flight(self, key):
+        """该key是否有正在进行的调用（此时调用 do 会合并，不产生新的上游调用）"""
+        return key in self._calls
+
+    def _finish(self, key, call):
+        """上游调用结束，记录合并数量"""
+        if self._calls.get(key) is not call:
+            return
+        del self._calls[key]
+        self.upstream_calls += 1
+        self.coalesced_callers += call[1] - 1
+        self.max_fold = max(self.max_fold, call[1])
+        self._recent_folds.append(call[1])
+
+    def stats(self):
+        """返回合并统计信息"""
+        total = self.upstream_calls + self.coalesced_callers
+        return {
+            "in_flight": len(self._calls),
+            "upstream_calls": self.upstream_calls,
+            "coalesced_callers": self.coalesced_callers,
+            "max_fold": self.max_fold,
+            "avg_fold": round(total / self.upstream_calls, 2) if self.upstream_calls else 0.0,
+            "recent_folds": list(self._recent_folds),
+        }
+
+
+class SharedFlight:
+    """
+    按key在多个进程之间合并上游调用（多进程部署时使用，各进程共用一个SQLite文件）
+
+    先拿到某个key租约的进程负责调用上游，其他进程的相同请求轮询 lookup（查询共享缓存）等待结果。
+    调用失败没有写入结果，或持有租约的进程崩溃（租约过期）时，等待的进程重新竞争租约。
+    进程内的合并仍由 SingleFlight 完成，每个进程每个key只有一个线程在这里等待。
+
+    lease_seconds 应大于一次上游调用的最长时间（包括排队），否则调用未结束时其他进程也会开始调用。
+    """
+
+    def __init__(self, path, lease_seconds=180, poll_interval=0.2):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.leader_calls = 0
+        self.waited = 0
+        self.shared_results = 0
+        self.takeovers = 0
+
+    def _connect(self):
+        """每个线程一个连接（自动提交）；每个线程第一次连接时建表，不在导入后端时打开文件"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS inflight_leases ("
+                " key TEXT PRIMARY KEY,"
+                " owner TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _acquire(self, key, owner):
+        """尝试取得租约（不存在或已过期时），成功返回True"""
+        now = time.time()
+        row = self._connect().execute(
+            "INSERT INTO inflight_leases (key, owner, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+            " WHERE inflight_leases.expires_at < ?"
+            " RETURNING owner",
+            (key, owner, now + self.lease_seconds, now)
+        ).fetchone()
+        return row is not None
+
+    def _release(self, key, owner):
+        self._connect().execute("DELETE FROM inflight_leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def in_flight(self, key):
+        """是否有进程持有该key未过期的租约"""
+        row = self._connect().execute(
+            "SELECT 1 FROM inflight_leases WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def do(self, key, lookup, fn, *args, **kwargs):
+        """
+        执行fn，所有进程中相同key的并发调用只执行一次
+
+        lookup: 无参数函数，返回其他进程调用的结果（通常是查询共享缓存），还没有时返回None
+        返回 (结果, 是否共享了其他进程的调用)
+        """
+        owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        waited = False
+        while True:
+            if self._acquire(key, owner):
+                self._count('takeovers' if waited else 'leader_calls')
+                try:
+                    return fn(*args, **kwargs), False
+                finally:
+                    self._release(key, owner)
+
+            if not waited:
+                waited = True
+                self._count('waited')
+            while self.in_flight(key):
+                time.sleep(self.poll_interval)
+            result = lookup()
+            if result is not None:
+                self._count('shared_results')
+                return result, True
+
+    async def in_flight_async(self, key):
+        """in_flight 的协程版本：查询共享文件放到线程池，不阻塞事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.in_flight, key)
+
+    async def do_async(self, key, lookup, fn, *args, **kwargs):
+        """
+        do 的协程版本：fn 是协程函数
+
+        读写租约和调用 lookup 都会访问SQLite，放到线程池执行，等待时不阻塞事件循环
+        """
+        loop = asyncio.get_running_loop()
+        owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        waited = False
+        while True:
+            if await loop.run_in_executor(None, self._acquire, key, owner):
+                self._count('takeovers' if waited else 'leader_calls')
+                try:
+                    return await fn(*args, **kwargs), False
+                finally:
+                    # shield: 调用被取消时也要释放租约，否则其他进程要等租约过期
+                    await asyncio.shield(loop.run_in_executor(None, self._release, key, owner))
+
+            if not waited:
+                waited = True
+                self._count('waited')
+            while await self.in_flight_async(key):
+                await asyncio.sleep(self.poll_interval)
+            result = await loop.run_in_executor(None, lookup)
+            if result is not None:
+                self._count('shared_results')
+                return result, True
+
+    def ping(self):
+        """检查共享文件是否可以访问（就绪检查），不可访问时抛出 sqlite3.Error"""
+        self._connect().execute("SELECT 1 FROM inflight_leases LIMIT 1").fetchall()
+
+    def stats(self):
+        """返回跨进程合并统计信息"""
+        with self._lock:
+            return {
+                "leader_calls": self.leader_calls,
+                "waited": self.waited,
+                "shared_results": self.shared_results,
+                "takeovers": self.takeovers,
+            }
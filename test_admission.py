@@ -0,0 +1,111 @@
+"""
+测试准入控制 - 批量请求的研究方向多于令牌桶的 burst 时全部在公平队列中等待完成（不调用真实的工作流）
+"""
+
+import asyncio
+import json
+import sys
+import threading
+import time
+import uuid
+
+import asgi_backend
+import backend
+from admission import AdmissionRejected, FairQueue
+
+
+def fake_fetch(user_input, client='anonymous'):
+    """代替工作流调用：稍等片刻，让研究方向在公平队列中排队"""
+    time.sleep(0.01)
+    return {"papers": [{"title": f"{user_input} paper"}]}
+
+
+async def fake_fetch_async(user_input, client='anonymous'):
+    await asyncio.sleep(0.01)
+    return {"papers": [{"title": f"{user_input} paper"}]}
+
+
+def batch_topics(count):
+    """每次运行使用新的研究方向，不会命中缓存"""
+    run = uuid.uuid4().hex[:8]
+    return [f"batch admission {run} topic {i}" for i in range(count)]
+
+
+if __name__ == '__main__':
+    failed = 0
+
+    def check(ok, message):
+        global failed
+        failed += not ok
+        print(f"  {'✅' if ok else '❌'} {message}")
+
+    print("=" * 70)
+    print("测试准入控制")
+    print("=" * 70)
+
+    # 测试1: 不受限制的等待者不因排队数被拒绝，也不占用其他用户的排队名额
+    print("\n【测试1】bounded=False 的排队 (FairQueue.acquire):")
+    queue = FairQueue(max_concurrent=2, max_queue=4, max_per_user=2, timeout=5)
+    done = []
+
+    def topic_call(i):
+        with queue.slot('batch-user', bounded=False):
+            time.sleep(0.01)
+            done.append(i)
+
+    threads = [threading.Thread(target=topic_call, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.005)
+    try:
+        with queue.slot('other-user'):
+            pass
+        other_ok = True
+    except AdmissionRejected:
+        other_ok = False
+    for thread in threads:
+        thread.join()
+    check(len(done) == 20, f"20 个研究方向完成 {len(done)} 个")
+    check(other_ok, "其他用户的请求没有因为队列已满被拒绝")
+    check(queue.stats()['queued'] == 0 and queue.stats()['queued_unbounded'] == 0, "队列已清空")
+
+    # 测试2: Flask 模式，研究方向数超过 burst 的批量请求
+    print("\n【测试2】Flask 模式的批量请求 (POST /api/get-papers/batch):")
+    backend.fetch_papers = fake_fetch
+    burst = backend.rate_limiter.burst
+    count = burst * 10
+    user = f"test-{uuid.uuid4().hex[:8]}"
+    client = backend.app.test_client()
+    response = client.post('/api/get-papers/batch', json={"topics": batch_topics(count)}, headers={'X-User-Id': user})
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    summary = records[-1]
+    check(summary.get('ok') == count, f"{count} 个研究方向（burst={burst}）成功 {summary.get('ok')} 个")
+
+    statuses = []
+    for _ in range(burst):
+        response = client.post('/api/get-papers/batch', json={"topics": batch_topics(2)},
+                               headers={'X-User-Id': user})
+        statuses.append(response.status_code)
+    check(statuses[:burst - 1] == [200] * (burst - 1) and statuses[-1] == 429,
+          f"每个批量请求消耗一个令牌，之后的状态码 {statuses}")
+    check(response.headers.get('Retry-After') is not None, "令牌用完时整个批量请求返回429和 Retry-After")
+
+    # 测试3: 异步模式
+    print("\n【测试3】异步模式的批量请求 (asgi_backend.get_papers_batch):")
+    asgi_backend.fetch_papers = fake_fetch_async
+    scope = {'headers': [(b'x-user-id', f"test-{uuid.uuid4().hex[:8]}".encode())], 'client': ('127.0.0.1', 1)}
+
+    async def run_batch():
+        status, stream, _ = await asgi_backend.get_papers_batch(
+            scope, json.dumps({"topics": batch_topics(count)}).encode()
+        )
+        return status, [json.loads(line) async for line in stream]
+
+    status, records = asyncio.run(run_batch())
+    check(status == 200 and records[-1].get('ok') == count,
+          f"{count} 个研究方向成功 {records[-1].get('ok')} 个")
+
+    print("\n" + "=" * 70)
+    print("✅ 测试完成" if not failed else f"❌ {failed} 项失败")
+    print("=" * 70)
+    sys.exit(1 if failed else 0)
@@ -2,9 +2,21 @@
 API测试脚本 - 用于测试API响应和解析
 """
 
-import http.client
 import json
-from config import API_CONFIG
+from http_pool import ConnectionPool
+from settings import settings
+
+# 与后端使用同一套配置（config.py、环境变量和默认值）
+API_CONFIG = settings['API_CONFIG']
+
+# 多个测试用例共享连接池，第二个用例起复用已建立的连接
+pool = ConnectionPool(
+    API_CONFIG['host'],
+    API_CONFIG.get('port'),
+    timeout=API_CONFIG['timeout'],
+    max_connections=1,
+    use_tls=API_CONFIG['use_tls'],
+)
 
 def test_api(user_input):
     """测试API调用"""
@@ -32,21 +44,19 @@ def test_api(user_input):
     }
     
     try:
-        conn = http.client.HTTPSConnection(API_CONFIG['host'], timeout=API_CONFIG['timeout'])
-        conn.request(
+        res = pool.request(
             "POST", 
             API_CONFIG['endpoint'], 
             json.dumps(data), 
             headers, 
             encode_chunked=True
         )
-        res = conn.getresponse()
-        response_data = res.read()
         
         print(f"响应状态: {res.status}")
-        print(f"响应头: {dict(res.headers)}\n")
+        print(f"响应头: {res.headers}")
+        print(f"连接: {'复用' if res.reused else '新建'}，握手耗时: {res.connect_time * 1000:.0f}ms\n")
         
-        result = json.loads(response_data.decode("utf-8"))
+        result = json.loads(res.data.decode("utf-8"))
         
         print("原始响应结构:")
         print(json.dumps(result, ensure_ascii=False, indent=2)[:1000])
@@ -123,8 +133,6 @@ def test_api(user_input):
                             except:
                                 pass
         
-        conn.close()
-        
         print("\n" + "=" * 70)
         print("✅ 测试完成")
         
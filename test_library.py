@@ -0,0 +1,109 @@
+"""
+测试论文储存库 - 写缓冲遇到无法写入的请求时不影响其他用户、同步的时间戳（使用临时数据库，不调用工作流）
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+
+from library_store import LibraryStore
+from save_buffer import SaveBuffer
+
+
+class FlakyStore:
+    """包装 LibraryStore：包含 bad 用户的批次抛出指定类型的错误，模拟无法写入的数据或暂时不可用的储存库"""
+
+    def __init__(self, store, error):
+        self.store = store
+        self.error = error
+
+    def save_selections(self, selections):
+        if self.error is not None and any(user_id == 'bad' for user_id, _, _ in selections):
+            raise self.error("模拟的写入失败")
+        return self.store.save_selections(selections)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def titles(store, user_id):
+    return [paper['title'] for paper in store.list_papers(user_id)['papers']]
+
+
+if __name__ == '__main__':
+    failed = 0
+
+    def check(ok, message):
+        global failed
+        failed += not ok
+        print(f"  {'✅' if ok else '❌'} {message}")
+
+    print("=" * 70)
+    print("测试论文储存库")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = LibraryStore(os.path.join(tmp, 'library.db'))
+
+        # 测试1: 无法编码的请求在加入队列之前被拒绝
+        print("\n【测试1】坏请求不进入写缓冲 (SaveBuffer.submit):")
+        buffer = SaveBuffer(store, flush_interval=0.05, spool_path=os.path.join(tmp, 'spool1.jsonl'))
+        try:
+            buffer.submit('bad', [{'title': 'Broken \ud800 title'}])
+            rejected = False
+        except ValueError:
+            rejected = True
+        check(rejected, "包含单独代理项的标题抛出 ValueError（接口返回400）")
+        buffer.submit('good', [{'title': 'Good Paper', 'venue': ['a', 'b']}])
+        check(buffer.settle('good'), "之后的请求正常写入")
+        check(titles(store, 'good') == ['Good Paper'], f"good 的储存库 {titles(store, 'good')}")
+        buffer.close()
+
+        # 测试2: 同一批中数据无法写入的请求被丢弃，其他请求照常写入
+        print("\n【测试2】坏请求在前、好请求在后的同一批 (SaveBuffer._write):")
+        flaky = FlakyStore(store, sqlite3.IntegrityError)
+        buffer = SaveBuffer(flaky, flush_interval=0.05, spool_path=os.path.join(tmp, 'spool2.jsonl'))
+        buffer.submit('bad', [{'title': 'Poison'}], 'k1')
+        buffer.submit('good', [{'title': 'Second Paper'}], 'k2')
+        check(buffer.settle('good'), "good 的请求写入完成")
+        check(buffer.settle('bad'), "bad 的请求不再阻塞 settle")
+        check('Second Paper' in titles(store, 'good'), f"good 的储存库 {titles(store, 'good')}")
+        stats = buffer.stats()
+        check(stats.get('dropped') == 1 and stats['pending'] == 0,
+              f"丢弃 {stats.get('dropped')} 个请求，剩余 {stats['pending']} 篇论文")
+        buffer.close()
+        check(not os.path.exists(os.path.join(tmp, 'spool2.jsonl')), "关闭时没有需要保存到文件的请求")
+
+        # 测试3: 储存库暂时不可用时保留请求，恢复后写入
+        print("\n【测试3】储存库暂时不可用 (sqlite3.OperationalError):")
+        flaky = FlakyStore(store, sqlite3.OperationalError)
+        buffer = SaveBuffer(flaky, flush_interval=0.05, spool_path=os.path.join(tmp, 'spool3.jsonl'))
+        buffer.submit('bad', [{'title': 'Retried Paper'}])
+        buffer.submit('good', [{'title': 'Third Paper'}])
+        check(buffer.settle('good'), "同一批的其他请求照常写入")
+        check(not buffer.settle('bad', timeout=0.3), "失败的请求留在队列中重试")
+        flaky.error = None
+        check(buffer.settle('bad'), "储存库恢复后写入")
+        check(titles(store, 'bad') == ['Retried Paper'], f"bad 的储存库 {titles(store, 'bad')}")
+        buffer.close()
+
+        # 测试4: 同步提交的毫秒时间戳 savedAt 统一格式后保存，按保存时间排序正确
+        print("\n【测试4】同步毫秒时间戳的 savedAt (LibraryStore.sync):")
+        store.save_papers('sync', [{'title': 'Saved Today'}])
+        result = store.sync('sync', 0, [
+            {'op': 'save', 'paper': {'title': 'Saved In May', 'savedAt': 1714536000000}, 'modified_at': 1714536000000},
+            {'op': 'save', 'paper': {'title': 'Saved In June', 'savedAt': '2024-06-01T00:00:00+00:00'},
+             'modified_at': '2024-06-01T00:00:00+00:00'},
+        ])
+        check(result['applied'] == 2, f"接受 {result['applied']} 个变更")
+        papers = store.list_papers('sync')['papers']
+        saved_at = {paper['title']: paper['savedAt'] for paper in papers}
+        check(saved_at['Saved In May'] == '2024-05-01T04:00:00.000Z', f"毫秒时间戳保存为 {saved_at['Saved In May']}")
+        order = [paper['title'] for paper in papers]
+        check(order == ['Saved Today', 'Saved In June', 'Saved In May'], f"最新的在前 {order}")
+
+    print("\n" + "=" * 70)
+    print("✅ 测试完成" if not failed else f"❌ {failed} 项失败")
+    print("=" * 70)
+    sys.exit(1 if failed else 0)
@@ -3,6 +3,11 @@
 """
 
 import json
+import os
+import tempfile
+
+import replay_responses
+from json_extract import extract_papers
 
 # 你的Agent实际返回的数据
 test_content = """{
@@ -50,84 +55,122 @@ test_content = """{
 ]
 }"""
 
-print("=" * 70)
-print("测试JSON解析")
-print("=" * 70)
-
-# 测试1: 直接解析
-print("\n【测试1】直接解析JSON:")
-try:
-    parsed = json.loads(test_content)
-    if 'papers' in parsed:
-        print(f"✅ 成功！找到 {len(parsed['papers'])} 篇论文")
-        print(f"\n前3篇论文标题:")
-        for i, paper in enumerate(parsed['papers'][:3], 1):
-            print(f"  {i}. {paper['title']}")
-    else:
-        print("❌ 未找到 papers 字段")
-except Exception as e:
-    print(f"❌ 解析失败: {e}")
-
-# 测试2: 模拟API响应格式
-print("\n" + "=" * 70)
-print("【测试2】模拟完整API响应:")
-
-api_response = {
-    "code": 0,
-    "message": "Success",
-    "choices": [{
-        "delta": {
-            "role": "assistant",
-            "content": test_content
-        }
-    }]
-}
+def fixture_variants():
+    """模型输出的各种常见形态，供测试和 bench_parse.py 使用"""
+    return {
+        "纯JSON": test_content,
+        "代码块": f"以下是推荐的论文：\n```json\n{test_content}\n```\n希望对你有帮助",
+        "尾部逗号": test_content.replace(']\n}\n]', ']\n},\n]'),
+        "截断": test_content[:len(test_content) * 2 // 3],
+    }
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试JSON解析")
+    print("=" * 70)
+
+    # 测试1: 直接解析
+    print("\n【测试1】直接解析JSON:")
+    try:
+        parsed = json.loads(test_content)
+        if 'papers' in parsed:
+            print(f"✅ 成功！找到 {len(parsed['papers'])} 篇论文")
+            print(f"\n前3篇论文标题:")
+            for i, paper in enumerate(parsed['papers'][:3], 1):
+                print(f"  {i}. {paper['title']}")
+        else:
+            print("❌ 未找到 papers 字段")
+    except Exception as e:
+        print(f"❌ 解析失败: {e}")
+
+    # 测试2: 模拟API响应格式
+    print("\n" + "=" * 70)
+    print("【测试2】模拟完整API响应:")
 
-print("模拟的API响应结构:")
-print(f"  code: {api_response['code']}")
-print(f"  choices: {len(api_response['choices'])} 个")
-print(f"  content长度: {len(api_response['choices'][0]['delta']['content'])} 字符")
+    api_response = {
+        "code": 0,
+        "message": "Success",
+        "choices": [{
+            "delta": {
+                "role": "assistant",
+                "content": test_content
+            }
+        }]
+    }
 
-# 提取content
-content = api_response['choices'][0]['delta']['content'].strip()
+    print("模拟的API响应结构:")
+    print(f"  code: {api_response['code']}")
+    print(f"  choices: {len(api_response['choices'])} 个")
+    print(f"  content长度: {len(api_response['choices'][0]['delta']['content'])} 字符")
 
-# 智能提取JSON
-start = content.find('{')
-if start != -1:
-    brace_count = 0
-    json_end = -1
+    # 提取content
+    content = api_response['choices'][0]['delta']['content'].strip()
+
+    # 智能提取JSON
+    start = content.find('{')
+    if start != -1:
+        brace_count = 0
+        json_end = -1
     
-    for i in range(start, len(content)):
-        if content[i] == '{':
-            brace_count += 1
-        elif content[i] == '}':
-            brace_count -= 1
-            if brace_count == 0:
-                json_end = i + 1
-                break
+        for i in range(start, len(content)):
+            if content[i] == '{':
+                brace_count += 1
+            elif content[i] == '}':
+                brace_count -= 1
+                if brace_count == 0:
+                    json_end = i + 1
+                    break
     
-    if json_end != -1:
-        json_str = content[start:json_end]
-        print(f"\n✅ 智能提取JSON (长度: {len(json_str)})")
+        if json_end != -1:
+            json_str = content[start:json_end]
+            print(f"\n✅ 智能提取JSON (长度: {len(json_str)})")
         
-        try:
-            parsed = json.loads(json_str)
-            if 'papers' in parsed:
-                print(f"✅ 解析成功！包含 {len(parsed['papers'])} 篇论文")
+            try:
+                parsed = json.loads(json_str)
+                if 'papers' in parsed:
+                    print(f"✅ 解析成功！包含 {len(parsed['papers'])} 篇论文")
                 
-                print("\n📋 论文列表:")
-                for i, paper in enumerate(parsed['papers'], 1):
-                    print(f"\n{i}. {paper['title']}")
-                    print(f"   作者: {paper['authors']}")
-                    print(f"   年份: {paper.get('year', 'N/A')}")
-                    print(f"   会议: {paper.get('venue', 'N/A')}")
-                    if 'tags' in paper:
-                        print(f"   标签: {', '.join(paper['tags'])}")
-        except Exception as e:
-            print(f"❌ 解析失败: {e}")
-
-print("\n" + "=" * 70)
-print("✅ 测试完成")
-print("=" * 70)
+                    print("\n📋 论文列表:")
+                    for i, paper in enumerate(parsed['papers'], 1):
+                        print(f"\n{i}. {paper['title']}")
+                        print(f"   作者: {paper['authors']}")
+                        print(f"   年份: {paper.get('year', 'N/A')}")
+                        print(f"   会议: {paper.get('venue', 'N/A')}")
+                        if 'tags' in paper:
+                            print(f"   标签: {', '.join(paper['tags'])}")
+            except Exception as e:
+                print(f"❌ 解析失败: {e}")
+
+    # 测试3: 使用提取器处理代码块、尾部逗号和截断
+    print("\n" + "=" * 70)
+    print("【测试3】一遍扫描提取器 (json_extract):")
+
+    for name, text in fixture_variants().items():
+        result = extract_papers(text)
+        count = len(result['papers']) if result else 0
+        print(f"  {'✅' if count else '❌'} {name:12s} 提取到 {count} 篇论文")
+
+    # 测试4: 回放合成语料（各种响应格式和错误），检查解析结果与 expect 一致
+    print("\n" + "=" * 70)
+    print("【测试4】回放响应语料 (replay_responses):")
+
+    fd, corpus = tempfile.mkstemp(suffix='.jsonl')
+    os.close(fd)
+    try:
+        replay_responses.generate(corpus, 3)
+        report = replay_responses.run(corpus)
+    finally:
+        os.remove(corpus)
+    for fmt, stats in sorted(report['formats'].items()):
+        print(f"  {fmt:16s} {stats['ok']}/{stats['count']} 条解析出论文")
+    errors = report['errors']
+    print(f"  {'✅' if not report['failures'] else '❌'} 与 expect 不符 {len(report['failures'])} 条")
+    print(f"  {'✅' if errors['http_error'] == errors['workflow_error'] == 1 else '❌'} "
+          f"HTTP错误 {errors['http_error']} 条，工作流错误 {errors['workflow_error']} 条")
+
+    print("\n" + "=" * 70)
+    print("✅ 测试完成")
+    print("=" * 70)
 
 
@@ -0,0 +1,121 @@
+"""
+测试上游容错 - 网络错误的分类、重试和熔断（不调用真实的工作流）
+"""
+
+import asyncio
+import http.client
+import socket
+import ssl
+import sys
+
+from resilience import AdaptiveTimeout, CircuitBreaker, CircuitOpenError, RetryPolicy, UpstreamGuard, UpstreamHTTPError
+
+
+class WorkflowCodeError(Exception):
+    def __init__(self, code):
+        super().__init__(f"工作流错误 {code}")
+        self.code = code
+
+
+def make_guard(attempts=3, min_calls=4):
+    """不等待的重试（max_delay=0）和较小的熔断窗口，测试很快跑完"""
+    return UpstreamGuard(
+        AdaptiveTimeout(min_timeout=0, max_timeout=5),
+        RetryPolicy(attempts=attempts, base_delay=0, max_delay=0),
+        CircuitBreaker(failure_rate=0.5, min_calls=min_calls, window=60, open_seconds=30),
+    )
+
+
+def dns_failure(timeout):
+    raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+
+
+if __name__ == '__main__':
+    failed = 0
+
+    def check(ok, message):
+        global failed
+        failed += not ok
+        print(f"  {'✅' if ok else '❌'} {message}")
+
+    print("=" * 70)
+    print("测试上游容错")
+    print("=" * 70)
+
+    # 测试1: 哪些错误算上游的临时故障
+    print("\n【测试1】错误分类 (RetryPolicy.is_transient):")
+    policy = RetryPolicy()
+    cases = [
+        ("DNS解析失败", socket.gaierror(socket.EAI_NONAME, "Name or service not known"), True),
+        ("SSL错误", ssl.SSLError(1, "wrong version number"), True),
+        ("连接被拒绝", ConnectionRefusedError(111, "Connection refused"), True),
+        ("连接被重置", ConnectionResetError(104, "Connection reset by peer"), True),
+        ("证书校验失败", ssl.SSLCertVerificationError(1, "certificate verify failed"), False),
+        ("其他OSError", OSError(101, "Network is unreachable"), False),
+        ("权限不足", PermissionError(13, "Permission denied"), False),
+        ("文件不存在", FileNotFoundError(2, "No such file or directory"), False),
+        ("连接中途关闭", http.client.RemoteDisconnected("Remote end closed connection"), True),
+        ("响应不完整", http.client.IncompleteRead(b"{", 100), True),
+        ("超时", TimeoutError(), True),
+        ("异步超时", asyncio.TimeoutError(), True),
+        ("HTTP 503", UpstreamHTTPError(503), True),
+        ("HTTP 429", UpstreamHTTPError(429), True),
+        ("HTTP 400", UpstreamHTTPError(400), False),
+        ("服务繁忙错误码", WorkflowCodeError(11202), True),
+        ("内容审核错误码", WorkflowCodeError(10013), False),
+        ("解析失败", ValueError("bad json"), False),
+    ]
+    for name, error, expected in cases:
+        result = policy.is_transient(error)
+        check(result == expected, f"{name:10s} {'临时故障' if result else '不重试'}")
+
+    # 测试2: DNS解析失败时重试，计入熔断失败率，失败多了熔断
+    print("\n【测试2】DNS解析失败的重试和熔断 (UpstreamGuard.call):")
+    guard = make_guard()
+    attempts = []
+
+    def failing(timeout):
+        attempts.append(timeout)
+        dns_failure(timeout)
+
+    try:
+        guard.call(failing)
+    except socket.gaierror:
+        pass
+    check(len(attempts) == 3, f"尝试 {len(attempts)} 次（重试 {guard.retries} 次）")
+    check(guard.breaker.stats()['window_failures'] == 3, f"熔断窗口记录 {guard.breaker.stats()['window_failures']} 次失败")
+
+    try:
+        guard.call(failing)
+    except (socket.gaierror, CircuitOpenError):
+        pass
+    check(guard.breaker.state == CircuitBreaker.OPEN, f"连续失败后熔断器 {guard.breaker.state}")
+    try:
+        guard.call(failing)
+        rejected = False
+    except CircuitOpenError:
+        rejected = True
+    except socket.gaierror:
+        rejected = False
+    check(rejected, "熔断中直接拒绝（调用方返回过期的缓存结果或503）")
+
+    # 测试3: 异步调用同样重试
+    print("\n【测试3】异步调用 (UpstreamGuard.acall):")
+    guard = make_guard(attempts=2, min_calls=10)
+    attempts.clear()
+
+    async def failing_async(timeout):
+        attempts.append(timeout)
+        raise ssl.SSLError(1, "unexpected eof while reading")
+
+    try:
+        asyncio.run(guard.acall(failing_async))
+    except ssl.SSLError:
+        pass
+    check(len(attempts) == 2, f"SSL错误尝试 {len(attempts)} 次")
+    check(guard.breaker.stats()['window_failures'] == 2, f"熔断窗口记录 {guard.breaker.stats()['window_failures']} 次失败")
+
+    print("\n" + "=" * 70)
+    print("✅ 测试完成" if not failed else f"❌ {failed} 项失败")
+    print("=" * 70)
+    sys.exit(1 if failed else 0)
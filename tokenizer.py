@@ -0,0 +1,78 @@
+"""
+中英文分词 - 供储存库全文检索（SQLite FTS5）使用
+
+FTS5自带的 unicode61 分词器按空白和标点切词，连续的中文会被当成一个词，
+搜"学习"匹配不到"深度学习"。这里在建索引前把每个汉字（以及日文假名、韩文）
+用空格隔开，中文按单字索引；查询时把连续的中文转成短语查询（"深 度 学 习"），
+要求这些字在原文中相邻出现。英文、数字仍交给 unicode61 处理（忽略大小写和变音符号）。
+"""
+
+import re
+
+
+# 中日韩文字：每个字单独成词
+_CJK = (
+    '\u3040-\u30ff'   # 日文假名
+    '\u3400-\u4dbf'   # CJK扩展A
+    '\u4e00-\u9fff'   # CJK统一汉字
+    '\uac00-\ud7af'   # 韩文音节
+    '\uf900-\ufaff'   # CJK兼容汉字
+)
+# 只保存模式字符串，第一次使用时由 re 编译并缓存（编译这个字符集约需10毫秒，不放在导入时）
+_CJK_RUN = f'([{_CJK}]+)'
+
+# 查询中的一个词，末尾的 * 表示前缀匹配
+_QUERY_WORD = re.compile(r'[^\W_]+\*?')
+
+
+def _space_run(match):
+    return ' ' + ' '.join(match.group()) + ' '
+
+
+def segment(text):
+    """建索引用：在每个中日韩文字两侧加空格，其余文本保持不变（按连续的一段替换，比逐字替换快一倍）"""
+    if not text:
+        return ''
+    if text.isascii():
+        return text
+    return re.sub(_CJK_RUN, _space_run, text)
+
+
+def query_terms(query):
+    """
+    把用户输入拆成检索词，返回 [(词, 是否中文, 是否前缀)]
+
+    连续的中文作为一个词（之后转成短语），英文和数字按非字母数字字符切分
+    """
+    terms = []
+    for match in _QUERY_WORD.finditer(query or ''):
+        word = match.group()
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        parts = [p for p in re.split(_CJK_RUN, word) if p]
+        for i, part in enumerate(parts):
+            is_cjk = bool(re.fullmatch(_CJK_RUN, part))
+            terms.append((part, is_cjk, prefix and i == len(parts) - 1))
+    return terms
+
+
+def build_match_query(query, prefix=True):
+    """
+    把用户输入转成FTS5 MATCH表达式，没有可检索的词时返回None
+
+    - 每个词都用双引号包起来，用户输入的引号、括号、AND/OR 等不会被当成查询语法
+    - 多个词之间是AND关系
+    - prefix=True 时最后一个词按前缀匹配（边输入边搜索），任意词后加 * 也表示前缀匹配
+    """
+    terms = query_terms(query)
+    if not terms:
+        return None
+
+    clauses = []
+    for i, (word, is_cjk, is_prefix) in enumerate(terms):
+        phrase = ' '.join(word) if is_cjk else word
+        clause = '"' + phrase.replace('"', '""') + '"'
+        if is_prefix or (prefix and i == len(terms) - 1):
+            clause += '*'
+        clauses.append(clause)
+    return ' '.join(clauses)
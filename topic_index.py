@@ -0,0 +1,192 @@
+"""
+相似研究方向匹配 - 换一种说法的研究方向直接复用已有的推荐结果
+
+同一个研究兴趣有很多种写法（"机器学习 医疗诊断"、"医疗诊断中的机器学习"、
+"machine learning for medical diagnosis" / "Medical diagnosis with machine learning"），
+每种写法都会触发一次完整的工作流调用。这里为已经有推荐结果的研究方向建一个本地索引：
+- 每个研究方向转成字符n-gram特征（中文取单字和相邻两字，英文取单词和词内三字母组），
+  用特征哈希映射到固定维数的向量并归一化
+- 查询时与所有已索引的研究方向计算余弦相似度，超过阈值的最相似研究方向视为同一个
+
+有NumPy时所有向量存成一个矩阵，一次矩阵乘法算完全部相似度；没有NumPy时退化为稀疏向量逐个计算。
+NumPy在第一次加入研究方向时才导入（导入约需90毫秒，不计入启动时间）。
+只在同一种语言内匹配：中文写法和英文写法的字符特征不重合，不会被认为相似。
+"""
+
+import math
+import threading
+import zlib
+
+from tokenizer import query_terms
+
+DEFAULT_DIM = 4096
+
+_numpy = None  # load_numpy 导入的模块；没有安装时为False
+
+# 不影响研究方向含义的虚词
+_STOPWORDS = frozenset(
+    'a an and for in of on the to with using via based towards toward'.split()
+    + list('的与和及在中对于')
+)
+
+
+def load_numpy():
+    """NumPy模块，第一次调用时导入；没有安装时返回None（相似索引和个性化排序共用）"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def topic_features(topic):
+    """研究方向的特征及权重 {特征: 权重}"""
+    features = {}
+
+    def add(feature, weight=1.0):
+        features[feature] = features.get(feature, 0.0) + weight
+
+    for word, is_cjk, _ in query_terms((topic or '').casefold()):
+        if is_cjk:
+            chars = [c for c in word if c not in _STOPWORDS]
+            # 相邻两字比单字更能区分含义（"分类"与"分割"只差一个字）
+            for c in chars:
+                add(c, 0.5)
+            for i in range(len(chars) - 1):
+                add(chars[i] + chars[i + 1])
+        elif word not in _STOPWORDS:
+            # 去掉复数的 s：networks 与 network 视为同一个词
+            if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+                word = word[:-1]
+            add('w:' + word)
+            # 词内三字母组：learn/learning、diagnose/diagnosis 仍有部分特征相同
+            padded = f'#{word}#'
+            for i in range(len(padded) - 2):
+                add('g:' + padded[i:i + 3], 0.5)
+    return features
+
+
+def feature_hash(feature, dim):
+    """稳定的特征哈希（不受 PYTHONHASHSEED 影响），返回 (维度, 符号)"""
+    h = zlib.crc32(feature.encode('utf-8'))
+    return h % dim, (1.0 if h & 0x80000000 else -1.0)
+
+
+def topic_vector(topic, dim=DEFAULT_DIM):
+    """归一化的哈希特征向量（稀疏表示 {维度: 值}），没有特征时返回空字典"""
+    vector = {}
+    for feature, weight in topic_features(topic).items():
+        index, sign = feature_hash(feature, dim)
+        vector[index] = vector.get(index, 0.0) + sign * weight
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    if not norm:
+        return {}
+    return {i: v / norm for i, v in vector.items() if v}
+
+
+class TopicIndex:
+    """已有推荐结果的研究方向的相似度索引（线程安全），超出容量时淘汰最早加入的"""
+
+    def __init__(self, max_entries=512, dim=DEFAULT_DIM):
+        self.max_entries = max_entries
+        self.dim = dim
+        self._rows = {}   # 研究方向 -> 行号
+        self._topics = []  # 行号 -> 研究方向（按加入顺序）
+        self._vectors = []  # 没有NumPy时的稀疏向量
+        self._matrix = None  # 有NumPy时第一次加入研究方向时创建
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.queries = 0
+        self.matches = 0
+
+    def __len__(self):
+        return len(self._topics)
+
+    def add(self, topic):
+        """加入（或更新）一个研究方向"""
+        vector = topic_vector(topic, self.dim)
+        if not vector:
+            return
+        with self._lock:
+            if topic in self._rows:
+                self._remove(topic)
+            while len(self._topics) >= self.max_entries:
+                self._remove(self._topics[0])
+
+            np = load_numpy()
+            if np is not None and self._matrix is None:
+                self._matrix = np.zeros((16, self.dim), dtype=np.float32)
+            row = len(self._topics)
+            self._rows[topic] = row
+            self._topics.append(topic)
+            if self._matrix is not None:
+                if row == len(self._matrix):
+                    self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+                self._matrix[row] = 0.0
+                self._matrix[row, list(vector)] = list(vector.values())
+            else:
+                self._vectors.append(vector)
+
+    def remove(self, topic):
+        with self._lock:
+            self._remove(topic)
+
+    def _remove(self, topic):
+        """删除一行，后面的行整体前移以保持加入顺序（调用方需持有锁）"""
+        row = self._rows.pop(topic, None)
+        if row is None:
+            return
+        del self._topics[row]
+        if self._matrix is not None:
+            count = len(self._topics)
+            self._matrix[row:count] = self._matrix[row + 1:count + 1]
+        else:
+            del self._vectors[row]
+        for i in range(row, len(self._topics)):
+            self._rows[self._topics[i]] = i
+
+    def match(self, topic, threshold):
+        """
+        最相似的已索引研究方向，返回 (研究方向, 相似度)；相似度低于阈值时返回None
+
+        完全相同的研究方向不在这里处理（直接查缓存）
+        """
+        vector = topic_vector(topic, self.dim)
+        with self._lock:
+            self.queries += 1
+            if not vector or not self._topics:
+                return None
+
+            if self._matrix is not None:
+                np = load_numpy()
+                query = np.zeros(self.dim, dtype=np.float32)
+                query[list(vector)] = list(vector.values())
+                scores = self._matrix[:len(self._topics)] @ query
+                best = int(np.argmax(scores))
+                score = float(scores[best])
+            else:
+                best, score = 0, -1.0
+                for row, other in enumerate(self._vectors):
+                    s = sum(v * other.get(i, 0.0) for i, v in vector.items())
+                    if s > score:
+                        best, score = row, s
+
+            if score < threshold:
+                return None
+            self.matches += 1
+            return self._topics[best], round(score, 4)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "topics": len(self._topics),
+                "max_entries": self.max_entries,
+                "dim": self.dim,
+                "numpy": load_numpy() is not None,
+                "queries": self.queries,
+                "matches": self.matches,
+            }
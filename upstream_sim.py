@@ -0,0 +1,335 @@
+"""
+星火工作流模拟服务 - 离线替代 /workflow/v1/chat/completions，压测和调试时不消耗API额度
+
+可以配置：
+- 延迟：首字节延迟（--latency，± --jitter 随机抖动）
+- 错误：按比例返回工作流错误码（HTTP 200 + 非0 code）或HTTP 5xx
+- 内容格式：按权重混合纯JSON、代码块、前后带说明文字、尾部逗号、截断、无法解析的文本
+- 流式：请求体中 "stream": true 时以SSE逐段返回 delta，每段间隔 --chunk-delay 秒
+
+论文来自 expected_format.json，标题后附上研究方向，同一研究方向返回相同的论文。
+
+用法：
+    python upstream_sim.py                                # 监听 127.0.0.1:18080，延迟2秒
+    python upstream_sim.py --latency 20 --jitter 10       # 接近真实工作流的延迟
+    python upstream_sim.py --formats fenced:3,truncated:1 --error-rate 0.05
+
+后端改为调用模拟服务（config.py）：
+    API_CONFIG["host"] = "127.0.0.1"
+    API_CONFIG["port"] = 18080
+    API_CONFIG["use_tls"] = False
+
+GET /sim/stats 返回各种结果的计数。
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ENDPOINT = '/workflow/v1/chat/completions'
+
+# 模型输出的几种形态
+FORMATS = ('plain', 'fenced', 'prose', 'trailing_comma', 'truncated', 'malformed')
+
+# 工作流常见错误码
+DEFAULT_ERROR_CODES = (10013, 10014, 10019, 10110, 11200)
+
+
+def load_papers():
+    with open(os.path.join(HERE, 'expected_format.json'), encoding='utf-8') as f:
+        return json.load(f)['papers']
+
+
+def parse_weights(spec):
+    """解析 'plain:3,fenced:1' 形式的权重，省略权重时为1"""
+    weights = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, weight = item.partition(':')
+        if name not in FORMATS:
+            raise ValueError(f"未知的格式: {name}（可选: {', '.join(FORMATS)}）")
+        weights[name] = float(weight) if weight else 1.0
+    return weights
+
+
+def render_content(papers, fmt):
+    """把论文列表渲染成指定形态的模型输出文本"""
+    text = json.dumps({"papers": papers}, ensure_ascii=False, indent=2)
+    if fmt == 'plain':
+        return text
+    if fmt == 'fenced':
+        return f"```json\n{text}\n```"
+    if fmt == 'prose':
+        return f"根据您的研究方向，为您推荐以下论文：\n\n{text}\n\n希望这些论文对您的研究有帮助。"
+    if fmt == 'trailing_comma':
+        # 每个论文对象和数组的最后一项后面多一个逗号
+        return re.sub(r'(["\d\]}])(\n\s*[}\]])', r'\1,\2', text)
+    if fmt == 'truncated':
+        # 模型输出在中途被截断（通常是达到了最大token数）
+        return "```json\n" + text[:len(text) * 2 // 3]
+    if fmt == 'malformed':
+        return "抱歉，我暂时无法为这个研究方向推荐论文，请换一个更具体的描述。"
+    raise ValueError(fmt)
+
+
+class UpstreamSimulator:
+    """模拟服务的配置、随机源和统计"""
+
+    def __init__(self, latency=2.0, jitter=0.0, error_rate=0.0, error_codes=DEFAULT_ERROR_CODES,
+                 http_error_rate=0.0, formats='plain', papers=5, chunk_size=32,
+                 chunk_delay=0.02, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.http_error_rate = http_error_rate
+        self.format_weights = parse_weights(formats) if isinstance(formats, str) else dict(formats)
+        self.papers = papers
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+
+        self._templates = load_papers()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, outcome):
+        with self._lock:
+            self._stats[outcome] = self._stats.get(outcome, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def _choose_format(self):
+        names = list(self.format_weights)
+        with self._lock:
+            return self._rng.choices(names, [self.format_weights[n] for n in names])[0]
+
+    def delay(self):
+        """本次请求的首字节延迟"""
+        if not self.jitter:
+            return self.latency
+        with self._lock:
+            offset = self._rng.uniform(-self.jitter, self.jitter)
+        return max(0.0, self.latency + offset)
+
+    def papers_for(self, topic):
+        """同一研究方向返回相同的论文"""
+        papers = []
+        for i in range(self.papers):
+            template = self._templates[i % len(self._templates)]
+            suffix = f" #{i // len(self._templates) + 1}" if i >= len(self._templates) else ""
+            papers.append(dict(template, title=f"{template['title']}（{topic}）{suffix}"))
+        return papers
+
+    def respond(self, request_body):
+        """
+        决定本次请求的结果，返回 (http状态码, 结果类型, 内容)
+
+        结果类型: http_error / workflow_error / 某种内容格式
+        """
+        roll = self._random()
+        if roll < self.http_error_rate:
+            self._count('http_error')
+            return 503, 'http_error', "Service Temporarily Unavailable"
+        if roll < self.http_error_rate + self.error_rate:
+            with self._lock:
+                code = self._rng.choice(self.error_codes)
+            self._count('workflow_error')
+            return 200, 'workflow_error', code
+
+        topic = (request_body.get('parameters') or {}).get('AGENT_USER_INPUT', '')
+        fmt = self._choose_format()
+        self._count(fmt)
+        return 200, fmt, render_content(self.papers_for(topic), fmt)
+
+    def make_handler(self):
+        sim = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.path == '/sim/stats':
+                    self._send_json(200, sim.stats())
+                else:
+                    self._send_json(404, {"error": "Not Found"})
+
+            def do_POST(self):
+                body = self._read_body()
+                if self.path != ENDPOINT:
+                    self._send_json(404, {"code": 404, "message": "Not Found"})
+                    return
+                try:
+                    request_body = json.loads(body or b'{}')
+                except ValueError:
+                    self._send_json(400, {"code": 10003, "message": "invalid request body"})
+                    return
+
+                status, outcome, content = sim.respond(request_body)
+                time.sleep(sim.delay())
+
+                sid = uuid.uuid4().hex[:16]
+                if outcome == 'http_error':
+                    self._send_raw(status, content.encode('utf-8'), 'text/plain; charset=utf-8')
+                elif outcome == 'workflow_error':
+                    self._send_json(200, {"code": content, "message": f"simulated error {content}", "sid": sid})
+                elif request_body.get('stream'):
+                    self._send_stream(content, sid)
+                else:
+                    self._send_json(200, {
+                        "code": 0,
+                        "message": "Success",
+                        "id": sid,
+                        "choices": [{"delta": {"role": "assistant", "content": content}, "index": 0}],
+                    })
+
+            def _read_body(self):
+                if 'chunked' in (self.headers.get('Transfer-Encoding') or ''):
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                        if size == 0:
+                            while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                                pass
+                            return b''.join(chunks)
+                        chunks.append(self.rfile.read(size))
+                        self.rfile.readline()
+                return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            def _send_raw(self, status, data, content_type):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_json(self, status, payload):
+                self._send_raw(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                               'application/json; charset=utf-8')
+
+            def _send_stream(self, content, sid):
+                """以SSE逐段返回 choices[0].delta.content"""
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+
+                pieces = [content[i:i + sim.chunk_size] for i in range(0, len(content), sim.chunk_size)]
+                for i, piece in enumerate(pieces):
+                    chunk = {
+                        "code": 0,
+                        "message": "Success",
+                        "id": sid,
+                        "choices": [{
+                            "delta": {"role": "assistant", "content": piece},
+                            "index": 0,
+                            "finish_reason": "stop" if i == len(pieces) - 1 else None,
+                        }],
+                    }
+                    self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    if sim.chunk_delay and i < len(pieces) - 1:
+                        time.sleep(sim.chunk_delay)
+                self._write_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def make_server(self, host='127.0.0.1', port=18080):
+        server = ThreadingHTTPServer((host, port), self.make_handler())
+        server.daemon_threads = True
+        server.request_queue_size = 1024
+        return server
+
+    def start(self, host='127.0.0.1', port=0):
+        """在后台线程中启动，返回server（server.server_address[1] 为实际端口）"""
+        server = self.make_server(host, port)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def add_arguments(parser):
+    """模拟服务的命令行参数（bench_serving.py 也会用到）"""
+    parser.add_argument('-d', '--latency', type=float, default=2.0, help="首字节延迟（秒）")
+    parser.add_argument('--jitter', type=float, default=0.0, help="延迟随机抖动范围（±秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回工作流错误码的比例")
+    parser.add_argument('--error-codes', default=','.join(map(str, DEFAULT_ERROR_CODES)),
+                        help="随机选用的工作流错误码，逗号分隔")
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help="返回HTTP 503的比例")
+    parser.add_argument('--formats', default='plain',
+                        help=f"内容格式及权重，如 plain:3,fenced:1（可选: {', '.join(FORMATS)}）")
+    parser.add_argument('--papers', type=int, default=5, help="每次返回的论文数")
+    parser.add_argument('--chunk-size', type=int, default=32, help="流式响应每段的字符数")
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help="流式响应每段的间隔（秒）")
+    parser.add_argument('--seed', type=int, default=None, help="随机种子")
+
+
+def to_argv(args):
+    """把解析后的参数还原成命令行，用于在子进程中启动模拟服务"""
+    return [
+        '--latency', str(args.latency), '--jitter', str(args.jitter),
+        '--error-rate', str(args.error_rate), '--error-codes', args.error_codes,
+        '--http-error-rate', str(args.http_error_rate), '--formats', args.formats,
+        '--papers', str(args.papers), '--chunk-size', str(args.chunk_size),
+        '--chunk-delay', str(args.chunk_delay),
+    ] + (['--seed', str(args.seed)] if args.seed is not None else [])
+
+
+def from_arguments(args):
+    return UpstreamSimulator(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_codes=[int(c) for c in args.error_codes.split(',') if c.strip()],
+        http_error_rate=args.http_error_rate,
+        formats=args.formats,
+        papers=args.papers,
+        chunk_size=args.chunk_size,
+        chunk_delay=args.chunk_delay,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="星火工作流模拟服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    sim = from_arguments(args)
+    server = sim.make_server(args.host, args.port)
+    print(f"模拟工作流运行在 http://{args.host}:{args.port}{ENDPOINT}")
+    print(f"延迟 {args.latency}s ±{args.jitter}s，格式 {sim.format_weights}，"
+          f"错误率 {args.error_rate}，HTTP错误率 {args.http_error_rate}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()